@@ -13,17 +13,46 @@ WORKFLOW:
 5. Giải thích mô hình với SHAP (explain_model.py)
 
 Mỗi bước sẽ có thông báo rõ ràng về việc đang làm gì với dữ liệu.
+
+PROFILING:
+==========
+Mỗi bước và các hàm chính của nó được đo (wall time, CPU time, bộ nhớ đỉnh,
+số hàng vào/ra, xem src/profiling.py); cuối pipeline in bảng tổng hợp và ghi
+Chrome trace JSON (mở bằng chrome://tracing hoặc https://ui.perfetto.dev):
+
+    python run_pipeline.py --trace reports/pipeline_trace.json
+    python run_pipeline.py --cprofile reports/profiles      # cProfile từng bước (.prof)
+    python run_pipeline.py --sample reports/pipeline.folded # sampling profiler (flamegraph)
 """
 
 import os
 import sys
 import time
+import argparse
+import importlib
 from pathlib import Path
 
 # Thêm thư mục src vào PYTHONPATH
 BASE_DIR = Path(__file__).parent
 sys.path.insert(0, str(BASE_DIR / "src"))
 
+from profiling import Profiler, Sampler, DEFAULT_SAMPLE_INTERVAL, count_rows
+
+DEFAULT_TRACE_FILE = BASE_DIR / "reports" / "pipeline_trace.json"
+
+# Hàm được đo riêng trong từng bước: bước -> (module, [hàm])
+STAGE_FUNCTIONS = {
+    "preprocess": ("preprocess", ["load_weather_data", "add_time_columns", "aggregate_monthly",
+                                  "save_processed_data"]),
+    "feature_engineering": ("feature_engineering", ["load_daily_data", "create_yearly_features",
+                                                    "validate_features", "save_features"]),
+    "training": ("train_model", ["load_data", "prepare_train_test", "train_random_forest", "train_xgboost",
+                                 "evaluate_model", "plot_feature_importance", "compute_shap_values",
+                                 "save_model"]),
+    "evaluation": ("evaluate_model", ["load_model", "load_data", "evaluate"]),
+    "shap": ("explain_model", ["load_shap_values", "compute_shap_values", "get_feature_importance"]),
+}
+
 
 def print_header(step_number: int, title: str, description: str):
     """In tiêu đề cho mỗi bước"""
@@ -56,8 +85,38 @@ def print_error(message: str):
     print(f"❌ {message}")
 
 
-def main():
+def run_stage(profiler: Profiler, stage: str):
+    """Chạy main() của một bước trong một stage đo, các hàm chính được đo riêng."""
+    module_name, functions = STAGE_FUNCTIONS[stage]
+    with profiler.stage(stage) as span:
+        # Import (pandas, sklearn, shap...) tốn đáng kể ở lần chạy đầu: đo riêng
+        with profiler.stage(f"{stage}.import", category="import"):
+            module = importlib.import_module(module_name)
+        with profiler.instrument(module, functions):
+            result = module.main()
+        span.rows_out = count_rows(result)
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Chạy toàn bộ pipeline (có profiling)")
+    parser.add_argument("--trace", type=Path, default=DEFAULT_TRACE_FILE,
+                        help="File Chrome trace JSON")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="Không đo bộ nhớ đỉnh (tracemalloc làm chậm pipeline)")
+    parser.add_argument("--cprofile", type=Path, default=None,
+                        help="Thư mục lưu cProfile từng bước (<bước>.prof)")
+    parser.add_argument("--sample", type=Path, default=None,
+                        help="File stack dạng folded của sampling profiler")
+    parser.add_argument("--sample-interval", type=float, default=DEFAULT_SAMPLE_INTERVAL)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
     """Chạy toàn bộ pipeline"""
+    args = parse_args(argv)
+    profiler = Profiler(memory=not args.no_memory, cprofile_dir=args.cprofile)
+    sampler = Sampler(args.sample_interval).start() if args.sample else None
     
     print("\n" + "🌟"*40)
     print("   HỆ THỐNG DỰ BÁO NĂNG SUẤT CÀ PHÊ ĐẮK LẮK")
@@ -79,8 +138,7 @@ def main():
         print_info("Dữ liệu đầu vào: data/external/weather_daklak_1990_2025.csv")
         print_info("Dữ liệu đầu ra: data/processed/weather_monthly.csv")
         
-        from preprocess import main as preprocess_main
-        preprocess_main()
+        run_stage(profiler, "preprocess")
         
         print_success("Hoàn thành tiền xử lý dữ liệu thời tiết!")
         
@@ -98,8 +156,7 @@ def main():
         print_info("  - data/raw/coffee_yield_daklak.csv (năng suất cà phê thực tế)")
         print_info("Dữ liệu đầu ra: data/processed/features_yearly.csv")
         
-        from feature_engineering import main as feature_main
-        feature_main()
+        run_stage(profiler, "feature_engineering")
         
         print_success("Hoàn thành tạo đặc trưng!")
         
@@ -117,8 +174,7 @@ def main():
         print_info("Kỹ thuật: Time Series Cross-Validation")
         print_info("Mô hình đầu ra: models/coffee_model.pkl")
         
-        from train_model import main as train_main
-        train_main()
+        run_stage(profiler, "training")
         
         print_success("Hoàn thành huấn luyện mô hình!")
         
@@ -134,8 +190,7 @@ def main():
         print_info("Các chỉ số đánh giá: MAE, RMSE, R², MAPE")
         print_info("Kết quả lưu tại: data/processed/")
         
-        from evaluate_model import main as evaluate_main
-        evaluate_main()
+        run_stage(profiler, "evaluation")
         
         print_success("Hoàn thành đánh giá mô hình!")
         
@@ -151,8 +206,7 @@ def main():
         print_info("Công cụ: SHAP (SHapley Additive exPlanations)")
         print_info("Kết quả lưu tại: data/processed/feature_importance.csv")
         
-        from explain_model import main as explain_main
-        explain_main()
+        run_stage(profiler, "shap")
         
         print_success("Hoàn thành giải thích mô hình!")
         
@@ -167,6 +221,9 @@ def main():
         
         print(f"\n⏱️  Thời gian thực hiện: {elapsed_time:.2f} giây ({elapsed_time/60:.2f} phút)")
         
+        print("\n⏱️  THỜI GIAN TỪNG BƯỚC:")
+        print(profiler.report())
+        
         print("\n📊 KẾT QUẢ CUỐI CÙNG:")
         print("   ✓ Dữ liệu đã được xử lý và làm sạch")
         print("   ✓ Đặc trưng đã được tạo và tối ưu")
@@ -192,6 +249,17 @@ def main():
         import traceback
         traceback.print_exc()
         sys.exit(1)
+    
+    finally:
+        # Trace vẫn được ghi khi pipeline lỗi (span lỗi có args.error)
+        profiler.close()
+        if sampler is not None:
+            sampler.stop()
+            sampler.write(args.sample)
+            print_info(f"Sampling profile: {args.sample}")
+        if args.cprofile:
+            print_info(f"cProfile: {args.cprofile}/<bước>.prof")
+        print_info(f"Trace: {profiler.write_trace(args.trace)}")
 
 
 if __name__ == "__main__":
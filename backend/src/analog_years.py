@@ -0,0 +1,133 @@
+"""
+analog_years.py
+
+Chỉ mục "năm tương tự" (analog years) trên vector features theo mùa.
+
+Vector features của từng năm (và từng địa điểm, nếu bảng có cột `location_column`
+như "district") được chuẩn hoá (z-score), nhân trọng số theo feature rồi đưa vào
+KD-tree. Truy vấn trả về k năm gần nhất cùng năng suất thực tế của năm đó:
+
+    khoảng cách² = Σ_f w_f * ((x_f - y_f) / std_f)²
+
+Chỉ mục được dựng lúc warm-up bundle (startup + hot reload), truy vấn ~µs nên
+có thể gọi cho mọi /predict-custom.
+"""
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import KDTree
+
+DEFAULT_K = 5
+LEAF_SIZE = 16
+
+
+def parse_weights(spec: str, feature_columns: list, importance: list = None) -> np.ndarray:
+    """
+    Trọng số feature từ chuỗi cấu hình:
+    - "uniform" (mặc định): mọi feature như nhau
+    - "importance": theo feature importance của model
+    - "rain_Feb_Mar:2,SPI_MarJun:0.5": trọng số riêng (feature không nêu = 1)
+    """
+    n = len(feature_columns)
+    if not spec or spec == "uniform":
+        return np.ones(n)
+    if spec == "importance":
+        if importance is None or len(importance) != n:
+            raise ValueError("Feature importance not available for this model")
+        weights = np.asarray(importance, dtype=np.float64)
+        return weights / weights.mean()
+
+    weights = np.ones(n)
+    index = {f: i for i, f in enumerate(feature_columns)}
+    for item in spec.split(","):
+        name, _, value = item.partition(":")
+        name = name.strip()
+        if name not in index:
+            raise ValueError(f"Unknown feature in weights: {name}")
+        try:
+            weights[index[name]] = float(value)
+        except ValueError:
+            raise ValueError(f"Invalid weight for {name}: {value!r}")
+    if (weights < 0).any():
+        raise ValueError("Weights must be non-negative")
+    return weights
+
+
+class AnalogIndex:
+    """KD-tree trên features đã chuẩn hoá + trọng số."""
+
+    def __init__(self, features_df: pd.DataFrame, feature_columns: list, yield_df: pd.DataFrame = None,
+                 weights=None, location_column: str = None, labeled_only: bool = True):
+        self.feature_columns = list(feature_columns)
+        self.location_column = location_column if location_column in features_df.columns else None
+
+        df = features_df.dropna(subset=self.feature_columns)
+        keys = ["year"] + ([self.location_column] if self.location_column else [])
+        if yield_df is not None:
+            yield_keys = [k for k in keys if k in yield_df.columns]
+            df = df.merge(yield_df[yield_keys + ["yield_ton_ha"]], on=yield_keys,
+                          how="inner" if labeled_only else "left")
+        else:
+            df = df.assign(yield_ton_ha=np.nan)
+
+        if len(df) == 0:
+            raise ValueError("No rows to index (check features/yield data)")
+
+        X = df[self.feature_columns].to_numpy(dtype=np.float64)
+        self.mean = X.mean(axis=0)
+        std = X.std(axis=0)
+        self.std = np.where(std > 0, std, 1.0)
+        self.weights = np.ones(len(self.feature_columns)) if weights is None else np.asarray(weights, dtype=np.float64)
+        self._scale = np.sqrt(self.weights) / self.std
+
+        self.years = df["year"].to_numpy(dtype=int)
+        self.locations = df[self.location_column].to_numpy() if self.location_column else None
+        self.yields = df["yield_ton_ha"].to_numpy(dtype=np.float64)
+        self.X = X
+        self.tree = KDTree(self._transform(X), leaf_size=LEAF_SIZE)
+
+    def __len__(self) -> int:
+        return len(self.years)
+
+    def _transform(self, X) -> np.ndarray:
+        return (np.asarray(X, dtype=np.float64) - self.mean) * self._scale
+
+    def query(self, x, k: int = DEFAULT_K, exclude_year: int = None) -> list:
+        """
+        k năm gần nhất với vector features `x` (thứ tự feature_columns hoặc dict).
+
+        Args:
+            exclude_year: bỏ chính năm đang hỏi khỏi kết quả
+        """
+        if isinstance(x, dict):
+            x = [x[c] for c in self.feature_columns]
+        x = np.asarray(x, dtype=np.float64).reshape(1, -1)
+
+        extra = int(np.sum(self.years == exclude_year)) if exclude_year is not None else 0
+        n = min(len(self), k + extra)
+        distances, indices = self.tree.query(self._transform(x), k=n)
+
+        results = []
+        for dist, i in zip(distances[0], indices[0]):
+            if self.years[i] == exclude_year:
+                continue
+            item = {
+                "year": int(self.years[i]),
+                "distance": float(dist),
+                "yield_ton_ha": None if np.isnan(self.yields[i]) else float(self.yields[i]),
+                "features": {c: float(v) for c, v in zip(self.feature_columns, self.X[i])},
+            }
+            if self.locations is not None:
+                item["location"] = self.locations[i]
+            results.append(item)
+        return results[:k]
+
+
+def bundle_index(bundle, weights: str = "uniform") -> AnalogIndex:
+    """Chỉ mục analog của bundle (dựng lúc warm-up, trọng số khác thì cache theo version)."""
+    def compute():
+        return AnalogIndex(
+            bundle.features_df, bundle.feature_columns, bundle.yield_df,
+            weights=parse_weights(weights, bundle.feature_columns, bundle.importance)
+        )
+    return bundle.cached(("analog", weights or "uniform"), compute)
@@ -9,138 +9,192 @@ Endpoints:
 - GET /health : Health check endpoint
 - GET /weather-trend : Xu hướng thời tiết theo năm
 - POST /predict-custom : Dự báo với features tùy chỉnh
+- GET /forecast-distribution : Phân phối năng suất năm tương lai (Monte Carlo thời tiết)
+- GET /analog-years : Các năm lịch sử giống một năm nhất (kèm năng suất thực tế)
+- POST /analog-years : Năm tương tự cho bộ features tùy chỉnh
+- GET /sensitivity : Partial dependence / ICE theo feature + stress test theo kịch bản
+- GET /sensitivity/2d : Partial dependence 2-D cho một cặp feature
+- GET /live-features : Features + thống kê tháng cập nhật online từ ingest thời tiết ngày
+- POST /admin/ingest : Đẩy bản ghi thời tiết ngày vào ingest streaming (cần X-Admin-Token)
+- GET /models : Các model đang serve, routes A/B và bộ đếm theo model
+- GET /admin/models : Danh sách model trong registry (cần X-Admin-Token)
+- POST /admin/reload : Hot reload model từ registry (cần X-Admin-Token)
 """
 
 import os
-import json
-import pickle
+import time
+import asyncio
 from pathlib import Path
 from typing import Optional, List
 from contextlib import asynccontextmanager
 
 import numpy as np
 import pandas as pd
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Header, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
-# ========================
-# CẤU HÌNH ĐƯỜNG DẪN
-# ========================
-BASE_DIR = Path(__file__).parent.parent
-DATA_RAW = BASE_DIR / "data" / "raw"
-DATA_PROCESSED = BASE_DIR / "data" / "processed"
-MODELS_DIR = BASE_DIR / "models"
-
-# Model files
-MODEL_FILE = MODELS_DIR / "trained_model.pkl"
-SCALER_FILE = MODELS_DIR / "scaler.pkl"
-FEATURE_COLS_FILE = MODELS_DIR / "feature_columns.json"
-SHAP_VALUES_FILE = MODELS_DIR / "shap_values.pkl"
-
-# Data files
-FEATURES_FILE = DATA_PROCESSED / "features_yearly.csv"
-YIELD_FILE = DATA_RAW / "coffee_yield_daklak.csv"
+try:
+    from src import model_registry, sensitivity, weather_generator, analog_years, nowcast, streaming_ingest
+    from src import regions, gridded, metrics, inference_pool, micro_batch, shared_store, tracing
+    from src import response_formats
+    from src.serving import (
+        ServingBundle, ModelStore, LEGACY_VERSION,
+        build_bundle, build_store, load_feature_store, load_yield,
+    )
+    from src.feature_store import FeatureStore, to_list
+except ImportError:  # chạy trực tiếp: python src/api.py
+    import model_registry
+    import sensitivity
+    import weather_generator
+    import analog_years
+    import nowcast
+    import streaming_ingest
+    import regions
+    import gridded
+    import metrics
+    import inference_pool
+    import micro_batch
+    import shared_store
+    import tracing
+    import response_formats
+    from serving import (
+        ServingBundle, ModelStore, LEGACY_VERSION,
+        build_bundle, build_store, load_feature_store, load_yield,
+    )
+    from feature_store import FeatureStore, to_list
 
 
 # ========================
-# LOAD MODEL VÀ DATA
+# SERVING STATE
 # ========================
-def load_model():
-    """Load trained model."""
-    if not MODEL_FILE.exists():
-        raise FileNotFoundError(f"Model file not found: {MODEL_FILE}")
-    with open(MODEL_FILE, 'rb') as f:
-        return pickle.load(f)
-
-
-def load_scaler():
-    """Load fitted scaler."""
-    if not SCALER_FILE.exists():
-        return None
-    with open(SCALER_FILE, 'rb') as f:
-        return pickle.load(f)
-
-
-def load_feature_columns():
-    """Load feature column names."""
-    if not FEATURE_COLS_FILE.exists():
-        raise FileNotFoundError(f"Feature columns file not found: {FEATURE_COLS_FILE}")
-    with open(FEATURE_COLS_FILE, 'r') as f:
-        return json.load(f)
-
-
-def load_shap_values():
-    """Load SHAP values."""
-    if not SHAP_VALUES_FILE.exists():
-        return None
-    with open(SHAP_VALUES_FILE, 'rb') as f:
-        return pickle.load(f)
-
-
-def load_features():
-    """Load features data."""
-    if not FEATURES_FILE.exists():
-        raise FileNotFoundError(f"Features file not found: {FEATURES_FILE}")
-    return pd.read_csv(FEATURES_FILE)
-
-
-def load_yield():
-    """Load yield data."""
-    if not YIELD_FILE.exists():
-        return None
-    return pd.read_csv(YIELD_FILE)
-
-
-# Global variables (loaded at startup)
-model = None
-scaler = None
-feature_columns = None
-shap_data = None
-features_df = None
+# `store` giữ tất cả bundle đang serve. Bundle chỉ được thay nguyên khối
+# (xem reload_model), không bao giờ sửa tại chỗ. Handler lấy bundle MỘT lần
+# qua resolve_bundle() để cả request dùng cùng một version.
+store: ModelStore = ModelStore()
+feature_store: Optional[FeatureStore] = None   # cả bảng features, float32 (feature_store.py)
 yield_df = None
 
+ADMIN_TOKEN_ENV = "ADMIN_TOKEN"
+MODEL_PARAM_DESC = "Model: 'name' hoặc 'name:version' (mặc định: chia traffic theo MODEL_ROUTES)"
+_reload_lock = asyncio.Lock()
+
 
 def initialize():
     """Initialize model and data at startup."""
-    global model, scaler, feature_columns, shap_data, features_df, yield_df
+    global store, feature_store, yield_df
     
-    try:
-        model = load_model()
-        print("✅ Model loaded")
-    except Exception as e:
-        print(f"⚠️ Could not load model: {e}")
+    # Chế độ nhiều worker: attach file store dùng chung (mmap chỉ đọc), không
+    # unpickle model hay đọc CSV trong từng worker
+    shared_file = os.getenv(shared_store.SHARED_STORE_FILE_ENV)
+    if shared_file:
+        try:
+            store = shared_store.build_store(Path(shared_file))
+            current = store.get()
+            feature_store, yield_df = FeatureStore.from_frame(current.features_df), current.yield_df
+            print(f"✅ Shared store attached: {shared_file}")
+            _start_live_data()
+            return
+        except Exception as e:
+            print(f"⚠️ Could not attach shared store, loading models normally: {e}")
     
     try:
-        scaler = load_scaler()
-        print("✅ Scaler loaded")
+        feature_store = load_feature_store()
+        print(f"✅ Features loaded: {len(feature_store)} years × {len(feature_store.columns)} columns")
     except Exception as e:
-        print(f"⚠️ Could not load scaler: {e}")
+        print(f"⚠️ Could not load features: {e}")
     
     try:
-        feature_columns = load_feature_columns()
-        print(f"✅ Feature columns loaded: {len(feature_columns)} features")
+        yield_df = load_yield()
+        if yield_df is not None:
+            print(f"✅ Yield data loaded: {len(yield_df)} years")
     except Exception as e:
-        print(f"⚠️ Could not load feature columns: {e}")
+        print(f"⚠️ Could not load yield: {e}")
     
-    try:
-        shap_data = load_shap_values()
-        print("✅ SHAP values loaded")
-    except Exception as e:
-        print(f"⚠️ Could not load SHAP values: {e}")
+    store = build_store()
+    if store.routes:
+        print(f"✅ Model routes: {store.routes}")
     
+    _start_live_data()
+
+
+def _start_live_data():
+    """Nowcast + streaming ingest (cả khi dùng shared store: mỗi worker một nowcaster)."""
     try:
-        features_df = load_features()
-        print(f"✅ Features loaded: {len(features_df)} years")
+        season = nowcast.get_nowcaster()
+        print(f"✅ Nowcast season: {season.year} (as of {season.as_of})")
     except Exception as e:
-        print(f"⚠️ Could not load features: {e}")
+        print(f"⚠️ Nowcasting disabled: {e}")
     
     try:
-        yield_df = load_yield()
-        if yield_df is not None:
-            print(f"✅ Yield data loaded: {len(yield_df)} years")
+        ingestor = streaming_ingest.get_ingestor()
+        stream_file = os.getenv(streaming_ingest.STREAM_FILE_ENV)
+        if stream_file:
+            streaming_ingest.follow_file(ingestor, stream_file)
+            print(f"✅ Following weather stream: {stream_file}")
     except Exception as e:
-        print(f"⚠️ Could not load yield: {e}")
+        print(f"⚠️ Streaming ingest disabled: {e}")
+
+
+def resolve_bundle(model: Optional[str] = None, response: Optional[Response] = None) -> ServingBundle:
+    """
+    Chọn bundle cho request: theo `model=` nếu có, nếu không thì chia traffic.
+    Ghi header X-Model để client/load test biết model nào đã trả lời.
+    """
+    current_store = store
+    if len(current_store) == 0:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    try:
+        current = current_store.get(model) if model else current_store.route()
+    except KeyError:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Model '{model}' not loaded. Available: {current_store.keys()}"
+        )
+    if response is not None:
+        response.headers["X-Model"] = current.key
+    return current
+
+
+def resolve_region(province: str, crop: Optional[str] = None) -> "regions.Region":
+    """Vùng (tỉnh, cây trồng) được khai báo trong registry vùng, 404 nếu không có."""
+    try:
+        return regions.get_registry().find(province, crop)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+
+
+async def resolve_region_bundle(region: "regions.Region", model: Optional[str] = None,
+                                response: Optional[Response] = None) -> ServingBundle:
+    """
+    Bundle của một vùng: vùng mặc định đi qua ModelStore (chia traffic, `model=`),
+    vùng có model riêng được load lười từ registry vùng (LRU).
+    """
+    if region.uses_default_store:
+        return resolve_bundle(model, response)
+    if model:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Region '{region.key}' is served by model '{region.model}', 'model' is not supported"
+        )
+    try:
+        current = await run_in_threadpool(regions.get_registry().bundle, region)
+    except (FileNotFoundError, ValueError) as e:
+        raise HTTPException(status_code=503, detail=f"Region model unavailable: {e}")
+    if response is not None:
+        response.headers["X-Model"] = current.key
+    return current
+
+
+def check_admin_token(token: Optional[str]) -> None:
+    """Admin endpoints chỉ bật khi có biến môi trường ADMIN_TOKEN."""
+    expected = os.getenv(ADMIN_TOKEN_ENV)
+    if not expected:
+        raise HTTPException(status_code=403, detail="Admin API disabled (ADMIN_TOKEN not set)")
+    if token != expected:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
 
 
 # ========================
@@ -156,6 +210,10 @@ class CustomPredictRequest(BaseModel):
     rain_OctDec: float
     humidity_Apr_Jun: float
     SPI_MarJun: float
+    # Chỉ cần cho model "upgraded" (retrain_upgraded.py)
+    radiation_JunSep_NASA: Optional[float] = None
+    ENSO_MarJun: Optional[float] = None
+    SPEI_MarJun: Optional[float] = None
 
 
 class PredictionResponse(BaseModel):
@@ -166,6 +224,9 @@ class PredictionResponse(BaseModel):
     confidence_upper: float
     unit: str = "ton/ha"
     features_used: Optional[dict] = None
+    analog_years: Optional[List[dict]] = None
+    as_of: Optional[str] = None               # nowcast: ngày quan sát cuối cùng của mùa
+    observed_fraction: Optional[float] = None  # nowcast: tỷ lệ mùa đã quan sát
 
 
 class FeatureImportanceResponse(BaseModel):
@@ -205,6 +266,163 @@ class ScenarioPredictionResponse(BaseModel):
     confidence_note: str
 
 
+class RegionPrediction(BaseModel):
+    region: str
+    province: str
+    crop: str
+    crop_label: str
+    model: str
+    year: int
+    base_year: int
+    predicted_yield: float
+    actual_yield: Optional[float] = None
+
+
+class RegionPredictionsResponse(BaseModel):
+    year: int
+    predictions: List[RegionPrediction]
+    unit: str = "ton/ha"
+
+
+class GridAggregate(BaseModel):
+    name: str
+    area_ha: float
+    production_ton: float
+    yield_ton_ha: Optional[float] = None
+
+
+class GridAggregateResponse(BaseModel):
+    year: int
+    level: str
+    model: str
+    regions: List[GridAggregate]
+    unit: str = "ton/ha"
+
+
+class AnalogYearsResponse(BaseModel):
+    """Response for analog-year search."""
+    model: str
+    query_year: Optional[int] = None
+    weights: str
+    analogs: List[dict]   # year, distance, yield_ton_ha, features (+ location)
+
+
+class ExceedanceProbability(BaseModel):
+    """P(năng suất > ngưỡng)."""
+    threshold: float
+    probability: float
+
+
+class ForecastDistributionResponse(BaseModel):
+    """Response for Monte Carlo yield distribution."""
+    model: str
+    year: int
+    scenario: str
+    scenario_label: str
+    n_simulations: int
+    mean: float
+    std: float
+    quantiles: dict
+    exceedance: List[ExceedanceProbability]
+    histogram: dict
+    filled_features: List[str]   # features không mô phỏng được, dùng trung bình lịch sử
+    unit: str = "ton/ha"
+
+
+class FeatureSensitivity(BaseModel):
+    """Partial dependence (và ICE) của một feature."""
+    feature: str
+    grid: List[float]
+    pdp: List[float]
+    ice: Optional[List[List[float]]] = None   # [năm][điểm lưới], năm theo thứ tự `years`
+
+
+class StressScenarioResult(BaseModel):
+    """Dự báo trung bình của một kịch bản theo từng cường độ."""
+    scenario: str
+    intensities: List[float]
+    mean_yield: List[float]
+    pct_change: List[float]
+
+
+class SensitivityResponse(BaseModel):
+    """Response for sensitivity analysis."""
+    model: str
+    years: List[int]
+    baseline_yield: float
+    features: List[FeatureSensitivity]
+    scenarios: List[StressScenarioResult]
+
+
+class PartialDependence2DResponse(BaseModel):
+    """Response for 2-D partial dependence."""
+    model: str
+    feature_x: str
+    feature_y: str
+    grid_x: List[float]
+    grid_y: List[float]
+    values: List[List[float]]   # [điểm lưới x][điểm lưới y]
+
+
+class MonthlyAggregate(BaseModel):
+    """Thống kê một tháng (cột như weather_monthly.csv; None nếu chưa có ngày nào)."""
+    month: int
+    n_days: int
+    hot_days: int
+    temp_max_mean: Optional[float]
+    temp_min_mean: Optional[float]
+    rain_sum: Optional[float]
+    humidity_mean: Optional[float]
+    radiation_sum: Optional[float]
+    soil_0_7_mean: Optional[float]
+
+
+class LiveFeaturesResponse(BaseModel):
+    """Response for online features of one season."""
+    year: int
+    as_of: Optional[str]
+    days_observed: int
+    features: dict        # feature -> giá trị (None nếu cửa sổ chưa có ngày nào)
+    monthly: List[MonthlyAggregate]
+
+
+class DailyWeatherRecord(BaseModel):
+    """Một ngày thời tiết (cột như weather_daklak_1990_2025.csv)."""
+    date: str
+    temp_max: float
+    temp_min: float
+    rain: Optional[float] = None
+    humidity: Optional[float] = None
+    radiation: Optional[float] = None
+    soil_0_7: Optional[float] = None
+    soil_7_28: Optional[float] = None
+
+
+class IngestResponse(BaseModel):
+    """Response for pushed daily records."""
+    added: int
+    updated: int
+    duplicate: int
+    as_of: Optional[str]
+
+
+class ReloadRequest(BaseModel):
+    """Request body for hot reload."""
+    name: Optional[str] = None
+    version: Optional[str] = None
+    activate: bool = False
+    keep_previous: bool = False  # giữ version cũ để A/B qua model=name:version
+
+
+class ReloadResponse(BaseModel):
+    """Response for hot reload."""
+    previous: Optional[str]
+    current: str
+    feature_count: int
+    warmup_seconds: float
+    activated: bool
+
+
 # ========================
 # LIFESPAN CONTEXT MANAGER
 # ========================
@@ -216,6 +434,10 @@ async def lifespan(app: FastAPI):
     print("=" * 50)
     yield
     # Cleanup on shutdown (if needed)
+    if streaming_ingest._ingestor is not None:
+        streaming_ingest._ingestor.stop()
+    inference_pool.shutdown_pools()
+    tracing.shutdown_sink()
     print("\n👋 Shutting down API...")
 
 
@@ -230,6 +452,8 @@ app = FastAPI(
     redoc_url="/redoc",
     lifespan=lifespan
 )
+# Mỗi handler là một span "handler" (tách validate / handler / serialize trong Server-Timing)
+app.router.route_class = tracing.TracedRoute
 
 # CORS middleware cho phép frontend gọi API
 # Production: cho phép các domain cụ thể
@@ -256,6 +480,22 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Đo latency/số request theo route cho /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Trace theo request + header Server-Timing (ngoài cùng để đo cả các middleware khác)
+app.add_middleware(tracing.TracingMiddleware)
+
+
+@app.exception_handler(inference_pool.PoolSaturated)
+async def pool_saturated_handler(request: Request, exc: inference_pool.PoolSaturated):
+    """Backpressure: thread pool suy luận đầy -> 503, client thử lại sau."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(inference_pool.RETRY_AFTER_SECONDS)}
+    )
+
 
 @app.get("/")
 async def root():
@@ -270,6 +510,11 @@ async def root():
             "/feature-importance": "Feature importance scores",
             "/yield-history": "Lịch sử năng suất",
             "/weather-trend": "Xu hướng thời tiết",
+            "/analog-years": "Năm tương tự trong lịch sử",
+            "/forecast-distribution": "Phân phối năng suất (Monte Carlo)",
+            "/sensitivity": "Độ nhạy theo feature (PDP/ICE) và stress test",
+            "/live-features": "Features cập nhật online từ thời tiết ngày",
+            "/models": "Các model đang serve",
             "/health": "Health check"
         }
     }
@@ -278,174 +523,225 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check endpoint with detailed status"""
+    try:
+        current = store.get()
+    except KeyError:
+        current = None
     data_years = []
     min_year = None
     max_year = None
     
-    if features_df is not None:
-        data_years = [int(y) for y in features_df['year'].values]
+    if feature_store is not None:
+        data_years = feature_store.years.tolist()
         min_year = min(data_years) if data_years else None
         max_year = max(data_years) if data_years else None
     
     return {
-        "status": "healthy" if model is not None else "degraded",
-        "model_loaded": model is not None,
-        "model_name": "trained_model.pkl" if model is not None else None,
-        "features_loaded": features_df is not None,
-        "feature_count": len(feature_columns) if feature_columns else 0,
+        "status": "healthy" if current is not None else "degraded",
+        "model_loaded": current is not None,
+        "model_name": current.key if current is not None else None,
+        "model_loaded_at": current.loaded_at if current is not None else None,
+        "models_loaded": store.keys(),
+        "features_loaded": feature_store is not None,
+        "feature_count": len(current.feature_columns) if current is not None else 0,
         "data_years_range": f"{min_year}-{max_year}" if min_year and max_year else None,
         "total_years": len(data_years),
-        "scaler_loaded": scaler is not None,
-        "shap_loaded": shap_data is not None
+        "scaler_loaded": current is not None and current.scaler is not None,
+        "shap_loaded": current is not None and current.shap_data is not None
     }
 
 
 @app.get("/predict-year", response_model=PredictionResponse)
 async def predict_year(
-    year: int = Query(..., ge=1990, le=2025, description="Năm cần dự báo (1990-2025)")
+    response: Response,
+    year: int = Query(..., ge=1990, le=2030, description="Năm cần dự báo (1990 đến mùa hiện tại)"),
+    method: str = Query(default=nowcast.DEFAULT_METHOD, description="Nowcast: 'ensemble' hoặc 'climatology'"),
+    model: Optional[str] = Query(default=None, description=MODEL_PARAM_DESC)
 ):
     """
     Dự báo năng suất cà phê cho năm cụ thể
     
+    Với mùa đang diễn ra, trả về dự báo as-of từ features quan sát một phần
+    (phần còn lại của mùa được hoàn thiện bằng dữ liệu lịch sử).
+    
     Args:
         year: Năm cần dự báo (ví dụ: 2025)
     
     Returns:
         Dự báo năng suất (tấn/ha) và confidence interval
     """
-    if model is None:
-        raise HTTPException(status_code=503, detail="Model not loaded")
+    start = time.perf_counter()
+    with tracing.span("resolve"):
+        current = resolve_bundle(model, response)
     
-    if features_df is None:
-        raise HTTPException(status_code=503, detail="Features data not loaded")
+    try:
+        season = nowcast.get_nowcaster()
+    except FileNotFoundError:
+        season = None
     
-    # Lấy features của năm được chọn
-    year_data = features_df[features_df['year'] == year]
+    if season is not None and year == season.year:
+        try:
+            result = await inference_pool.get_pool("batch").run(season.forecast, current, method)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        store.record(current.key, time.perf_counter() - start, rows=result["n_members"])
+        return PredictionResponse(
+            year=year,
+            predicted_yield=round(result["predicted"], 4),
+            confidence_lower=round(result["lower"], 4),
+            confidence_upper=round(result["upper"], 4),
+            unit="ton/ha",
+            features_used=result["features"],
+            as_of=result["as_of"],
+            observed_fraction=result["observed_fraction"]
+        )
     
-    if len(year_data) == 0:
+    # Dự báo đã được tính sẵn khi warm-up bundle
+    if year not in current.predictions:
         raise HTTPException(
             status_code=404, 
-            detail=f"No data available for year {year}. Available years: {list(features_df['year'].values)}"
+            detail=f"No data available for year {year}. Available years: {current.years}"
         )
     
-    # Prepare features
-    X = year_data[feature_columns].values
-    
-    # Predict
-    predicted = model.predict(X)[0]
+    predicted = current.predictions[year]
+    store.record(current.key, time.perf_counter() - start)
     
     # Confidence interval (±10% cho simplicity, có thể tính từ residuals)
     ci_margin = predicted * 0.10
     
-    # Lấy features đã dùng
-    features_used = {col: float(year_data[col].values[0]) for col in feature_columns}
-    
     return PredictionResponse(
         year=year,
         predicted_yield=round(predicted, 4),
         confidence_lower=round(predicted - ci_margin, 4),
         confidence_upper=round(predicted + ci_margin, 4),
         unit="ton/ha",
-        features_used=features_used
+        features_used=current.features_by_year[year]
     )
 
 
 @app.post("/predict-custom", response_model=PredictionResponse)
-async def predict_custom(request: CustomPredictRequest):
+async def predict_custom(
+    request: CustomPredictRequest,
+    response: Response,
+    model: Optional[str] = Query(default=None, description=MODEL_PARAM_DESC)
+):
     """
     Dự báo với features tùy chỉnh
     
     Cho phép người dùng nhập các giá trị features để mô phỏng kịch bản
     """
-    if model is None:
-        raise HTTPException(status_code=503, detail="Model not loaded")
+    start = time.perf_counter()
+    with tracing.span("resolve"):
+        current = resolve_bundle(model, response)
     
-    # Prepare features
-    X = np.array([[
-        request.rain_Feb_Mar,
-        request.soil_Apr_Jun,
-        request.temp_max_MayJun,
-        request.days_over_33,
-        request.radiation_JunSep,
-        request.rain_OctDec,
-        request.humidity_Apr_Jun,
-        request.SPI_MarJun
-    ]])
-    
-    # Predict
-    predicted = model.predict(X)[0]
+    # Prepare features (theo đúng thứ tự cột của model)
+    values = request.model_dump()
+    missing = [col for col in current.feature_columns if values.get(col) is None]
+    if missing:
+        raise HTTPException(status_code=422, detail=f"Missing features for model {current.key}: {missing}")
+    X = np.array([[values[col] for col in current.feature_columns]])
+    
+    # Predict (gộp với request đồng thời khác, chạy trong thread pool)
+    predicted = float((await micro_batch.predict(current, X))[0])
+    store.record(current.key, time.perf_counter() - start)
     
     # Confidence interval
     ci_margin = predicted * 0.10
     
+    # 3 năm lịch sử giống kịch bản nhất (chỉ mục dựng sẵn lúc warm-up)
+    try:
+        with tracing.span("analogs"):
+            analogs = analog_years.bundle_index(current).query(X[0], k=3)
+    except ValueError:
+        analogs = None
+    
     return PredictionResponse(
         year=0,  # Custom scenario, no specific year
         predicted_yield=round(predicted, 4),
         confidence_lower=round(predicted - ci_margin, 4),
         confidence_upper=round(predicted + ci_margin, 4),
         unit="ton/ha",
-        features_used=request.dict()
+        features_used={col: values[col] for col in current.feature_columns},
+        analog_years=analogs
     )
 
 
 @app.get("/feature-importance", response_model=FeatureImportanceResponse)
-async def get_feature_importance():
+async def get_feature_importance(
+    response: Response,
+    model: Optional[str] = Query(default=None, description=MODEL_PARAM_DESC)
+):
     """
     Lấy SHAP feature importance
     
     Returns:
         Danh sách features và importance scores
     """
-    if model is None:
-        raise HTTPException(status_code=503, detail="Model not loaded")
-    
-    if feature_columns is None:
-        raise HTTPException(status_code=503, detail="Feature columns not loaded")
-    
-    # Feature importance từ model
-    if hasattr(model, 'feature_importances_'):
-        importance = [float(x) for x in model.feature_importances_]
-    else:
-        importance = [1.0 / len(feature_columns)] * len(feature_columns)
-    
-    # SHAP mean absolute values
-    shap_mean_abs = None
-    if shap_data is not None and 'shap_values' in shap_data:
-        shap_values = shap_data['shap_values']
-        shap_mean_abs = [float(x) for x in np.abs(shap_values).mean(axis=0)]
+    current = resolve_bundle(model, response)
     
     return FeatureImportanceResponse(
-        features=feature_columns,
-        importance_scores=importance,
-        shap_mean_abs=shap_mean_abs
+        features=current.feature_columns,
+        importance_scores=current.importance,
+        shap_mean_abs=current.shap_mean_abs
     )
 
 
+def _response_format(fmt: Optional[str], accept: Optional[str]) -> str:
+    """Định dạng response theo ?format= / header Accept, 406 nếu không hỗ trợ."""
+    try:
+        return response_formats.negotiate(fmt, accept)
+    except ValueError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+
+
+def _encoded_response(columns: dict, fmt: str, headers: dict = None) -> Optional[Response]:
+    """Response mã hoá sẵn (orjson/msgpack/arrow); None = để FastAPI serialize JSON như cũ."""
+    if not response_formats.can_encode(fmt):
+        return None
+    with tracing.span("encode", format=fmt):
+        return response_formats.response(columns, fmt, headers)
+
+
+def _yield_history_columns(bundle: ServingBundle) -> dict:
+    """Các cột của /yield-history dạng mảng (tính một lần theo model version)."""
+    def compute():
+        return {
+            "years": np.asarray(bundle.years, dtype=np.int32),
+            "actual_yields": np.array([bundle.actual_yields.get(y, np.nan) for y in bundle.years], dtype=np.float64),
+            "predicted_yields": np.array([round(bundle.predictions[y], 4) for y in bundle.years], dtype=np.float64),
+        }
+    return bundle.cached("yield-history", compute)
+
+
 @app.get("/yield-history", response_model=YieldHistoryResponse)
-async def get_yield_history():
+async def get_yield_history(
+    response: Response,
+    model: Optional[str] = Query(default=None, description=MODEL_PARAM_DESC),
+    format: Optional[str] = Query(default=None, description=response_formats.FORMAT_PARAM_DESC),
+    accept: Optional[str] = Header(default=None)
+):
     """
     Lấy lịch sử năng suất các năm
     
     Returns:
-        Danh sách năm, năng suất thực tế và dự báo
+        Danh sách năm, năng suất thực tế và dự báo (JSON, MessagePack hoặc Arrow)
     """
-    if model is None or features_df is None:
-        raise HTTPException(status_code=503, detail="Model or features not loaded")
+    start = time.perf_counter()
+    fmt = _response_format(format, accept)
+    with tracing.span("resolve"):
+        current = resolve_bundle(model, response)
     
-    # Get all years with features
-    years = [int(y) for y in features_df['year'].values]
+    encoded = _encoded_response(_yield_history_columns(current), fmt, {"X-Model": current.key})
+    if encoded is not None:
+        store.record(current.key, time.perf_counter() - start, rows=len(current.years))
+        return encoded
     
-    # Predict for all years
-    X = features_df[feature_columns].values
-    predicted_yields = [round(float(p), 4) for p in model.predict(X)]
+    years = current.years
+    predicted_yields = [round(current.predictions[y], 4) for y in years]
+    store.record(current.key, time.perf_counter() - start, rows=len(years))
     
     # Get actual yields (only for years with data)
-    actual_yields = []
-    if yield_df is not None:
-        yield_dict = {int(k): float(v) for k, v in zip(yield_df['year'], yield_df['yield_ton_ha'])}
-        actual_yields = [yield_dict.get(y, None) for y in years]
-    else:
-        actual_yields = [None] * len(years)
+    actual_yields = [current.actual_yields.get(y) for y in years]
     
     return YieldHistoryResponse(
         years=years,
@@ -455,33 +751,53 @@ async def get_yield_history():
 
 
 @app.get("/weather-trend", response_model=WeatherTrendResponse)
-async def get_weather_trend():
+async def get_weather_trend(
+    format: Optional[str] = Query(default=None, description=response_formats.FORMAT_PARAM_DESC),
+    accept: Optional[str] = Header(default=None)
+):
     """
     Lấy xu hướng thời tiết theo năm
     
     Returns:
-        Các chỉ số thời tiết quan trọng theo năm
+        Các chỉ số thời tiết quan trọng theo năm (JSON, MessagePack hoặc Arrow)
     """
-    if features_df is None:
+    fmt = _response_format(format, accept)
+    current = feature_store
+    if current is None:
         raise HTTPException(status_code=503, detail="Features data not loaded")
     
-    return WeatherTrendResponse(
-        years=[int(y) for y in features_df['year'].values],
-        rain_Feb_Mar=[float(x) for x in features_df['rain_Feb_Mar'].values],
-        temp_max_MayJun=[float(x) for x in features_df['temp_max_MayJun'].values],
-        days_over_33=[float(x) for x in features_df['days_over_33'].values],
-        SPI_MarJun=[float(x) for x in features_df['SPI_MarJun'].values]
-    )
+    columns = current.cached("weather-trend-columns", lambda: {
+        "years": current.years,
+        **{name: np.ascontiguousarray(current.column(name)) for name in WeatherTrendResponse.model_fields
+           if name != "years"}
+    })
+    encoded = _encoded_response(columns, fmt)
+    if encoded is not None:
+        return encoded
+    
+    # Bảng features không đổi trong suốt vòng đời store: dựng response một lần
+    def build():
+        return WeatherTrendResponse(
+            years=current.years.tolist(),
+            rain_Feb_Mar=to_list(current.column('rain_Feb_Mar')),
+            temp_max_MayJun=to_list(current.column('temp_max_MayJun')),
+            days_over_33=to_list(current.column('days_over_33')),
+            SPI_MarJun=to_list(current.column('SPI_MarJun'))
+        )
+    return current.cached("weather-trend", build)
 
 
 @app.get("/predict-scenario", response_model=ScenarioPredictionResponse)
 async def predict_scenario(
-    province: str = Query(default="Đắk Lắk", description="Tỉnh/thành phố"),
+    response: Response,
+    province: str = Query(default=regions.DEFAULT_PROVINCE, description="Tỉnh/thành phố"),
     year: int = Query(..., ge=2024, le=2030, description="Năm dự báo (2024-2030)"),
-    scenario: str = Query(default="normal", description="Kịch bản thời tiết")
+    scenario: str = Query(default="normal", description="Kịch bản thời tiết"),
+    crop: Optional[str] = Query(default=None, description="Cây trồng (bắt buộc nếu tỉnh có nhiều cây trồng)"),
+    model: Optional[str] = Query(default=None, description=MODEL_PARAM_DESC)
 ):
     """
-    Dự báo năng suất cà phê theo kịch bản thời tiết
+    Dự báo năng suất theo kịch bản thời tiết cho một vùng (tỉnh, cây trồng)
     
     Kịch bản hỗ trợ:
     - normal: Thời tiết bình thường (baseline)
@@ -491,11 +807,10 @@ async def predict_scenario(
     - severe_drought: Hạn hán nghiêm trọng (-15%)
     - major_storm: Bão lớn (-12%)
     """
-    if model is None:
-        raise HTTPException(status_code=503, detail="Model not loaded")
-    
-    if features_df is None:
-        raise HTTPException(status_code=503, detail="Features data not loaded")
+    start = time.perf_counter()
+    with tracing.span("resolve", province=province):
+        region = resolve_region(province, crop)
+        current = await resolve_region_bundle(region, model, response)
     
     # Scenario multipliers and labels
     scenario_config = {
@@ -515,19 +830,11 @@ async def predict_scenario(
     
     # Use the most recent year's features as baseline
     # For future years, use the last available year's data
-    available_years = features_df['year'].values
-    base_year = year if year in available_years else int(available_years[-1])
-    year_data = features_df[features_df['year'] == base_year]
-    
-    if len(year_data) == 0:
-        raise HTTPException(
-            status_code=404, 
-            detail=f"No data available for base year {base_year}"
-        )
-    
-    # Prepare features and predict
-    X = year_data[feature_columns].values
-    base_prediction = model.predict(X)[0]
+    with tracing.span("predict", scenario=scenario):
+        available_years = current.years
+        base_year = year if year in current.predictions else int(available_years[-1])
+        base_prediction = current.predictions[base_year]
+    store.record(current.key, time.perf_counter() - start)
     
     # Apply scenario multiplier
     config = scenario_config[scenario]
@@ -549,8 +856,8 @@ async def predict_scenario(
         confidence_note = f"Dự báo dựa trên dữ liệu thực tế năm {year}, áp dụng kịch bản {scenario}"
     
     return ScenarioPredictionResponse(
-        crop="Cà phê Robusta",
-        province=province,
+        crop=region.crop_label or region.crop,
+        province=region.province,
         year=year,
         scenario=scenario,
         scenario_label=config["label"],
@@ -562,15 +869,54 @@ async def predict_scenario(
     )
 
 
+# ========================
+# REGIONS: NHIỀU TỈNH / CÂY TRỒNG
+# ========================
+@app.get("/regions")
+async def list_regions():
+    """
+    Các vùng (tỉnh, cây trồng) được serve và bundle vùng đang nằm trong bộ nhớ
+    """
+    return regions.get_registry().describe()
+
+
+@app.get("/predict-regions", response_model=RegionPredictionsResponse)
+async def predict_all_regions(
+    year: int = Query(..., ge=1990, le=2030, description="Năm dự báo"),
+    crop: Optional[str] = Query(default=None, description="Chỉ dự báo cho một cây trồng")
+):
+    """
+    Dự báo năng suất một năm cho tất cả vùng trong một request
+
+    Các vùng dùng chung model được gom thành một lần predict. Năm chưa có dữ
+    liệu dùng features của năm gần nhất.
+    """
+    start = time.perf_counter()
+    registry = regions.get_registry()
+    selected = [r for r in registry.regions.values()
+                if crop is None or regions.slugify(r.crop) == regions.slugify(crop)]
+    if not selected:
+        raise HTTPException(status_code=404, detail=f"No region serves crop '{crop}'")
+
+    items = [(region, await resolve_region_bundle(region)) for region in selected]
+    predictions = await inference_pool.get_pool("batch").run(regions.predict_regions, items, year)
+
+    elapsed = time.perf_counter() - start
+    served = store.keys()
+    for key in {bundle.key for _, bundle in items if bundle.key in served}:
+        store.record(key, elapsed, rows=sum(1 for _, b in items if b.key == key))
+    return RegionPredictionsResponse(year=year, predictions=[RegionPrediction(**p) for p in predictions])
+
+
 @app.get("/years")
 async def get_available_years():
     """
     Lấy danh sách các năm có sẵn trong dữ liệu
     """
-    if features_df is None:
+    if feature_store is None:
         raise HTTPException(status_code=503, detail="Features data not loaded")
     
-    years = [int(y) for y in features_df['year'].values]
+    years = feature_store.years.tolist()
     
     # Check which years have actual yield data
     years_with_yield = []
@@ -585,6 +931,472 @@ async def get_available_years():
     }
 
 
+# ========================
+# GRIDDED: BẢN ĐỒ NĂNG SUẤT THEO Ô
+# ========================
+def _get_grid() -> "gridded.YieldGrid":
+    try:
+        return gridded.get_grid()
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+async def _grid_yields(year: int, model: Optional[str], response: Response):
+    """(bundle, lưới, năng suất (cells,) của năm) — dự báo cả lưới tính một lần cho mỗi bundle."""
+    current = resolve_bundle(model, response)
+    grid = _get_grid()
+    try:
+        position = grid.year_position(year)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    start = time.perf_counter()
+    try:
+        yields = await inference_pool.get_pool("batch").run_cached(gridded.grid_predictions, current, grid)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    store.record(current.key, time.perf_counter() - start, rows=grid.n_cells)
+    return current, grid, yields[:, position]
+
+
+def _binary(array: np.ndarray, headers: dict) -> Response:
+    data = np.ascontiguousarray(array, dtype="<f4")
+    headers = {"X-Grid-Shape": ",".join(str(n) for n in data.shape), "X-Grid-Dtype": "<f4", **headers}
+    return Response(content=data.tobytes(), media_type="application/octet-stream", headers=headers)
+
+
+@app.get("/grid")
+async def get_grid_info():
+    """
+    Thông tin lưới: số ô, năm, features, biên toạ độ, huyện
+    """
+    return _get_grid().describe()
+
+
+@app.get("/grid/cells")
+async def get_grid_cells():
+    """
+    Toạ độ các ô dạng nhị phân: float32 little-endian (cells, 2) = [lat, lon]
+    """
+    grid = _get_grid()
+    return _binary(np.column_stack([grid.lat, grid.lon]), {"Cache-Control": "public, max-age=86400"})
+
+
+@app.get("/grid/yield")
+async def get_grid_yield(
+    response: Response,
+    year: int = Query(..., description="Năm"),
+    model: Optional[str] = Query(default=None, description=MODEL_PARAM_DESC)
+):
+    """
+    Năng suất dự báo của từng ô dạng nhị phân: float32 little-endian (cells,),
+    cùng thứ tự với /grid/cells
+    """
+    current, grid, yields = await _grid_yields(year, model, response)
+    return _binary(yields, {"X-Model": current.key, "X-Grid-Year": str(year)})
+
+
+@app.get("/grid/aggregate", response_model=GridAggregateResponse)
+async def get_grid_aggregate(
+    response: Response,
+    year: int = Query(..., description="Năm"),
+    level: str = Query(default="district", description="Mức tổng hợp: district hoặc province"),
+    model: Optional[str] = Query(default=None, description=MODEL_PARAM_DESC)
+):
+    """
+    Năng suất theo huyện/tỉnh từ dự báo lưới, trọng số theo diện tích trồng
+    """
+    if level not in gridded.AGGREGATE_LEVELS:
+        raise HTTPException(status_code=400, detail=f"Invalid level. Available: {list(gridded.AGGREGATE_LEVELS)}")
+    current, grid, yields = await _grid_yields(year, model, response)
+    table = gridded.aggregate(yields, grid, level)
+    return GridAggregateResponse(
+        year=year,
+        level=level,
+        model=current.key,
+        regions=[
+            GridAggregate(name=str(row[level]), area_ha=float(row["area_ha"]),
+                          production_ton=round(float(row["production_ton"]), 2),
+                          yield_ton_ha=_clean(row["yield_ton_ha"]))
+            for row in table.to_dict("records")
+        ]
+    )
+
+
+# ========================
+# ANALOG YEARS
+# ========================
+ANALOG_WEIGHTS_DESC = "'uniform', 'importance' hoặc 'feature:weight,...'"
+
+
+def _analog_index(bundle: ServingBundle, weights: str):
+    try:
+        return analog_years.bundle_index(bundle, weights)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/analog-years", response_model=AnalogYearsResponse)
+async def get_analog_years(
+    response: Response,
+    year: int = Query(..., description="Năm cần tìm năm tương tự"),
+    k: int = Query(default=analog_years.DEFAULT_K, ge=1, le=20),
+    weights: str = Query(default="uniform", description=ANALOG_WEIGHTS_DESC),
+    model: Optional[str] = Query(default=None, description=MODEL_PARAM_DESC)
+):
+    """
+    Những năm trong lịch sử có điều kiện thời tiết giống năm `year` nhất
+    """
+    current = resolve_bundle(model, response)
+    if year not in current.feature_store:
+        raise HTTPException(status_code=404, detail=f"No features for year {year}")
+    
+    index = _analog_index(current, weights)
+    x = current.input_row(year)
+    return AnalogYearsResponse(
+        model=current.key,
+        query_year=year,
+        weights=weights,
+        analogs=index.query(x, k=k, exclude_year=year)
+    )
+
+
+@app.post("/analog-years", response_model=AnalogYearsResponse)
+async def post_analog_years(
+    request: CustomPredictRequest,
+    response: Response,
+    k: int = Query(default=analog_years.DEFAULT_K, ge=1, le=20),
+    weights: str = Query(default="uniform", description=ANALOG_WEIGHTS_DESC),
+    model: Optional[str] = Query(default=None, description=MODEL_PARAM_DESC)
+):
+    """
+    Những năm trong lịch sử giống bộ features tùy chỉnh nhất
+    """
+    current = resolve_bundle(model, response)
+    values = request.model_dump()
+    missing = [col for col in current.feature_columns if values.get(col) is None]
+    if missing:
+        raise HTTPException(status_code=422, detail=f"Missing features for model {current.key}: {missing}")
+    
+    index = _analog_index(current, weights)
+    return AnalogYearsResponse(
+        model=current.key,
+        weights=weights,
+        analogs=index.query(values, k=k)
+    )
+
+
+# ========================
+# MONTE CARLO: PHÂN PHỐI NĂNG SUẤT
+# ========================
+def simulate_yields(bundle: ServingBundle, year: int, scenario: str, n_sims: int) -> dict:
+    """Mô phỏng n_sims mùa và predict theo batch (cache theo model version)."""
+    def compute():
+        generator = weather_generator.get_generator()
+        fill_values = dict(zip(bundle.feature_columns, bundle.input_mean().tolist()))
+        X, filled = generator.simulate_features(
+            bundle.feature_columns, n_sims=n_sims, target_year=year,
+            scenario=scenario, seed=year, fill_values=fill_values
+        )
+        return {"samples": bundle.predict(X), "filled": filled}
+    return bundle.cached(("forecast", year, scenario, n_sims), compute)
+
+
+@app.get("/forecast-distribution", response_model=ForecastDistributionResponse)
+async def forecast_distribution(
+    response: Response,
+    year: int = Query(..., ge=2024, le=2030, description="Năm dự báo (2024-2030)"),
+    scenario: str = Query(default="normal", description="Kịch bản thời tiết"),
+    n_sims: int = Query(default=weather_generator.DEFAULT_SIMULATIONS, ge=100, le=50000,
+                        description="Số mùa mô phỏng"),
+    thresholds: Optional[str] = Query(default=None, description="Ngưỡng năng suất, ví dụ '2.5,3.0'"),
+    model: Optional[str] = Query(default=None, description=MODEL_PARAM_DESC)
+):
+    """
+    Phân phối năng suất dự báo từ thời tiết mô phỏng (block bootstrap 1990-2025)
+    
+    Thay vì lặp lại features của năm cuối, hàng nghìn mùa giả lập được đưa qua
+    model để lấy quantile và xác suất vượt ngưỡng.
+    """
+    start = time.perf_counter()
+    current = resolve_bundle(model, response)
+    
+    if scenario not in weather_generator.WEATHER_SCENARIOS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid scenario. Available: {list(weather_generator.WEATHER_SCENARIOS)}"
+        )
+    try:
+        levels = [float(t) for t in thresholds.split(",")] if thresholds else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="thresholds must be comma-separated numbers")
+    
+    try:
+        result = await inference_pool.get_pool("batch").run_cached(simulate_yields, current, year, scenario, n_sims)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    store.record(current.key, time.perf_counter() - start, rows=n_sims)
+    
+    dist = weather_generator.yield_distribution(result["samples"], thresholds=levels)
+    
+    return ForecastDistributionResponse(
+        model=current.key,
+        year=year,
+        scenario=scenario,
+        scenario_label=weather_generator.WEATHER_SCENARIOS[scenario]["label"],
+        n_simulations=n_sims,
+        mean=round(dist["mean"], 4),
+        std=round(dist["std"], 4),
+        quantiles={k: round(v, 4) for k, v in dist["quantiles"].items()},
+        exceedance=[
+            ExceedanceProbability(threshold=t, probability=round(p, 4))
+            for t, p in dist["exceedance"].items()
+        ],
+        histogram=dist["histogram"],
+        filled_features=result["filled"]
+    )
+
+
+# ========================
+# SENSITIVITY: PDP / ICE / STRESS TEST
+# ========================
+def _round_list(values, digits=4):
+    return [round(float(v), digits) for v in values]
+
+
+@app.get("/sensitivity", response_model=SensitivityResponse)
+async def get_sensitivity(
+    response: Response,
+    grid_size: int = Query(default=sensitivity.DEFAULT_GRID_SIZE, ge=5, le=50, description="Số điểm lưới mỗi feature"),
+    ice: bool = Query(default=False, description="Trả về ICE cho từng năm"),
+    model: Optional[str] = Query(default=None, description=MODEL_PARAM_DESC)
+):
+    """
+    Độ nhạy của dự báo theo từng feature và theo các kịch bản khí hậu cực đoan
+    
+    Tính một lần cho mỗi model version (và grid_size), các request sau lấy từ cache.
+    """
+    start = time.perf_counter()
+    current = resolve_bundle(model, response)
+    
+    pool = inference_pool.get_pool("batch")
+    ice_data = await pool.run_cached(sensitivity.bundle_ice, current, grid_size)
+    stress = await pool.run_cached(sensitivity.bundle_stress, current)
+    store.record(current.key, time.perf_counter() - start, rows=len(current.years))
+    
+    features = [
+        FeatureSensitivity(
+            feature=feature,
+            grid=_round_list(ice_data["grids"][i]),
+            pdp=_round_list(ice_data["pdp"][i]),
+            ice=[_round_list(curve) for curve in ice_data["ice"][i].T] if ice else None
+        )
+        for i, feature in enumerate(current.feature_columns)
+    ]
+    
+    baseline = float(stress["baseline"].mean())
+    scenario_means = stress["predictions"].mean(axis=0)   # (kịch bản, cường độ)
+    scenarios = [
+        StressScenarioResult(
+            scenario=name,
+            intensities=stress["intensities"],
+            mean_yield=_round_list(scenario_means[s]),
+            pct_change=_round_list((scenario_means[s] - baseline) / baseline * 100, 2)
+        )
+        for s, name in enumerate(stress["scenarios"])
+    ]
+    
+    return SensitivityResponse(
+        model=current.key,
+        years=ice_data["years"],
+        baseline_yield=round(baseline, 4),
+        features=features,
+        scenarios=scenarios
+    )
+
+
+@app.get("/sensitivity/2d", response_model=PartialDependence2DResponse)
+async def get_sensitivity_2d(
+    response: Response,
+    feature_x: str = Query(..., description="Feature trục x"),
+    feature_y: str = Query(..., description="Feature trục y"),
+    grid_size: int = Query(default=15, ge=5, le=30, description="Số điểm lưới mỗi trục"),
+    model: Optional[str] = Query(default=None, description=MODEL_PARAM_DESC)
+):
+    """
+    Partial dependence 2-D: dự báo trung bình khi thay đổi đồng thời hai feature
+    """
+    start = time.perf_counter()
+    current = resolve_bundle(model, response)
+    
+    if feature_x == feature_y:
+        raise HTTPException(status_code=400, detail="feature_x and feature_y must differ")
+    try:
+        result = await inference_pool.get_pool("batch").run_cached(
+            sensitivity.bundle_pd_2d, current, [(feature_x, feature_y)], grid_size
+        )
+    except KeyError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown feature. Available: {current.feature_columns}"
+        )
+    store.record(current.key, time.perf_counter() - start, rows=grid_size * grid_size)
+    
+    i = current.feature_columns.index(feature_x)
+    j = current.feature_columns.index(feature_y)
+    return PartialDependence2DResponse(
+        model=current.key,
+        feature_x=feature_x,
+        feature_y=feature_y,
+        grid_x=_round_list(result["grids"][i]),
+        grid_y=_round_list(result["grids"][j]),
+        values=[_round_list(row) for row in result["pd"][0]]
+    )
+
+
+# ========================
+# STREAMING INGEST: FEATURES ONLINE
+# ========================
+def _clean(value):
+    return None if value is None or np.isnan(value) else round(float(value), 4)
+
+
+@app.get("/live-features", response_model=LiveFeaturesResponse)
+async def get_live_features(
+    year: Optional[int] = Query(default=None, description="Năm (mặc định: năm của ngày mới nhất)")
+):
+    """
+    Features theo cửa sổ mùa + thống kê tháng của một năm, đọc trực tiếp từ
+    thống kê online (không chạy lại feature engineering)
+    """
+    try:
+        ingestor = streaming_ingest.get_ingestor()
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    aggregates = ingestor.aggregates
+    if year is None:
+        year = aggregates.as_of.year
+    try:
+        snapshot = aggregates.snapshot(year)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    
+    monthly = [
+        MonthlyAggregate(**{k: (int(v) if k in ("month", "n_days", "hot_days") else _clean(v))
+                            for k, v in row.items() if k != "year"})
+        for row in snapshot["monthly"].to_dict("records")
+    ]
+    return LiveFeaturesResponse(
+        year=snapshot["year"],
+        as_of=snapshot["as_of"],
+        days_observed=snapshot["days_observed"],
+        features={k: _clean(v) for k, v in snapshot["features"].items()},
+        monthly=monthly
+    )
+
+
+@app.post("/admin/ingest", response_model=IngestResponse)
+async def ingest_daily(records: List[DailyWeatherRecord], x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Đẩy bản ghi thời tiết ngày vào ingest streaming
+    
+    Ngày mới được cộng vào thống kê online (và nowcaster); ngày đã có với giá
+    trị khác được coi là bản sửa, giống hệt thì bỏ qua.
+    """
+    check_admin_token(x_admin_token)
+    try:
+        ingestor = streaming_ingest.get_ingestor()
+        parsed = [streaming_ingest.parse_record(r.model_dump()) for r in records]
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    counts = await run_in_threadpool(ingestor.run, parsed)
+    as_of = ingestor.aggregates.as_of
+    return IngestResponse(**counts, as_of=as_of.date().isoformat() if as_of is not None else None)
+
+
+# ========================
+# METRICS
+# ========================
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Metrics dạng Prometheus text exposition: latency theo route, thời gian
+    inference, tỉ lệ cache hit, thời gian load model, request đang xử lý, RSS
+    """
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+# ========================
+# ADMIN: MODEL REGISTRY + HOT RELOAD
+# ========================
+@app.get("/models")
+async def list_serving_models():
+    """
+    Các model đang serve, trọng số chia traffic và bộ đếm theo model
+    """
+    return store.describe()
+
+
+@app.get("/admin/models")
+async def list_registry_models(x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Liệt kê các model/version trong registry và các bundle đang serve
+    """
+    check_admin_token(x_admin_token)
+    
+    models = {}
+    for name in model_registry.list_models():
+        models[name] = {
+            "active_version": model_registry.get_active_version(name),
+            "versions": model_registry.list_versions(name),
+        }
+    
+    return {
+        "serving": store.keys(),
+        "models": models
+    }
+
+
+@app.post("/admin/reload", response_model=ReloadResponse)
+async def reload_model(request: ReloadRequest, x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Hot reload model từ registry, không cần restart process
+    
+    Bundle mới được load, kiểm tra hash và warm-up đầy đủ trong thread riêng.
+    Chỉ khi thành công mới được đưa vào store; nếu lỗi, bundle cũ vẫn serve.
+    """
+    check_admin_token(x_admin_token)
+    
+    async with _reload_lock:
+        try:
+            new_bundle = await run_in_threadpool(build_bundle, request.name, request.version)
+        except FileNotFoundError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        
+        if request.activate and new_bundle.version != LEGACY_VERSION:
+            model_registry.set_active_version(new_bundle.name, new_bundle.version)
+        
+        # Atomic swap: store thay dict nội bộ bằng một phép gán
+        previous = store.add(new_bundle, keep_previous=request.keep_previous)
+        # Bundle vùng cùng model load lại theo version mới ở lần hỏi sau
+        regions.get_registry().invalidate(new_bundle.name)
+    
+    print(f"🔄 Model reloaded: {previous} → {new_bundle.key}")
+    
+    return ReloadResponse(
+        previous=previous,
+        current=new_bundle.key,
+        feature_count=len(new_bundle.feature_columns),
+        warmup_seconds=round(new_bundle.load_seconds, 4),
+        activated=request.activate
+    )
+
+
 # ========================
 # MAIN
 # ========================
@@ -0,0 +1,297 @@
+"""
+benchmark_api.py
+
+Benchmark tải/latency cho API, lặp lại được giữa các commit.
+
+Mỗi endpoint được gọi với nhiều mức concurrency, theo hai chế độ:
+- inprocess: httpx.ASGITransport gọi thẳng app (đo riêng phần xử lý của app)
+- uvicorn:   qua HTTP tới một uvicorn chạy trong process (thêm phần mạng/serialize)
+
+Kết quả: throughput (req/s), latency p50/p95/p99, lỗi, thời gian trung bình
+từng phase phía server (header Server-Timing, xem tracing.py) và bộ nhớ cấp
+phát mỗi request (tracemalloc, chạy tuần tự riêng ở chế độ inprocess). Kết quả được lưu
+JSON (kèm commit git) để so sánh:
+
+    python src/benchmark_api.py --concurrency 1,8,32 --requests 400
+    python src/benchmark_api.py --compare reports/benchmarks/api-<commit>.json
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import platform
+import argparse
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+try:
+    from src import api, benchmark_results
+    from src.benchmark_results import git_commit
+except ImportError:  # chạy trực tiếp từ thư mục src/
+    import api
+    import benchmark_results
+    from benchmark_results import git_commit
+
+# ========================
+# CẤU HÌNH
+# ========================
+MODES = ("inprocess", "uvicorn")
+DEFAULT_CONCURRENCY = (1, 8, 32)
+DEFAULT_REQUESTS = 400
+WARMUP_REQUESTS = 20
+ALLOCATION_REQUESTS = 50
+REGRESSION_THRESHOLD = benchmark_results.REGRESSION_THRESHOLD
+
+
+def endpoints(current=None) -> dict:
+    """
+    Các endpoint được benchmark: tên -> (method, path, params, body).
+    Body của /predict-custom lấy từ features năm gần nhất của model đang serve.
+    """
+    current = current or api.store.get()
+    last_year = int(current.years[-1])
+    row = current.features_by_year[last_year]
+    required = [n for n, f in api.CustomPredictRequest.model_fields.items() if f.is_required()]
+    custom = {name: float(row.get(name, 0.0)) for name in required}
+    custom.update({name: float(row[name]) for name in current.feature_columns if name in row})
+    return {
+        "predict-year": ("GET", "/predict-year", {"year": last_year}, None),
+        "predict-custom": ("POST", "/predict-custom", None, custom),
+        "predict-scenario": ("GET", "/predict-scenario", {"year": last_year + 1, "scenario": "el_nino"}, None),
+        "yield-history": ("GET", "/yield-history", None, None),
+        "feature-importance": ("GET", "/feature-importance", None, None),
+    }
+
+
+# ========================
+# ĐO
+# ========================
+def parse_server_timing(header: str) -> dict:
+    """"a;dur=1.2, b;dur=0.3" -> {"a": 1.2, "b": 0.3} (ms, cộng dồn nếu trùng tên)."""
+    phases = {}
+    for metric in (header or "").split(","):
+        name, *params = [part.strip() for part in metric.split(";")]
+        for param in params:
+            key, _, value = param.partition("=")
+            if name and key.strip() == "dur":
+                try:
+                    phases[name] = phases.get(name, 0.0) + float(value)
+                except ValueError:
+                    pass
+    return phases
+
+
+async def _send(client: httpx.AsyncClient, spec):
+    """Gửi một request, trả về (status, phases Server-Timing)."""
+    method, path, params, body = spec
+    response = await client.request(method, path, params=params, json=body)
+    return response.status_code, parse_server_timing(response.headers.get("server-timing"))
+
+
+async def drive(client: httpx.AsyncClient, spec, requests: int, concurrency: int) -> dict:
+    """Gửi `requests` request với `concurrency` worker, trả về latency từng request."""
+    latencies = np.empty(requests)
+    errors = {}
+    phases = {}
+    counter = iter(range(requests))
+
+    async def worker():
+        for i in counter:
+            start = time.perf_counter()
+            status, timing = await _send(client, spec)
+            latencies[i] = time.perf_counter() - start
+            if status >= 400:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+            for name, ms in timing.items():
+                phases.setdefault(name, []).append(ms)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {"latencies": latencies, "elapsed": time.perf_counter() - start, "errors": errors, "phases": phases}
+
+
+def summarize(run: dict) -> dict:
+    latencies = run["latencies"] * 1000
+    return {
+        "requests": int(len(latencies)),
+        "throughput_rps": round(len(latencies) / run["elapsed"], 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "max_ms": round(float(latencies.max()), 3),
+        "errors": run["errors"],
+        "phases_ms": {name: round(float(np.mean(values)), 3) for name, values in run.get("phases", {}).items()},
+    }
+
+
+async def measure_allocations(client: httpx.AsyncClient, spec, requests: int = ALLOCATION_REQUESTS) -> dict:
+    """
+    Bộ nhớ cấp phát mỗi request (tuần tự, tracemalloc): đỉnh trung bình (KiB)
+    và số block còn giữ lại sau mỗi request (> 0 kéo dài = rò rỉ).
+    """
+    await _send(client, spec)
+    tracemalloc.start()
+    try:
+        peaks = []
+        blocks_before = sys.getallocatedblocks()
+        for _ in range(requests):
+            base, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            await _send(client, spec)
+            peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        retained = (sys.getallocatedblocks() - blocks_before) / requests
+    finally:
+        tracemalloc.stop()
+    return {"alloc_peak_kib": round(float(np.mean(peaks)) / 1024, 1), "retained_blocks": round(retained, 2)}
+
+
+async def benchmark_client(client: httpx.AsyncClient, specs: dict, concurrency=DEFAULT_CONCURRENCY,
+                           requests: int = DEFAULT_REQUESTS, warmup: int = WARMUP_REQUESTS,
+                           allocations: bool = False) -> dict:
+    """Benchmark mọi endpoint trong `specs` với từng mức concurrency."""
+    results = {}
+    for name, spec in specs.items():
+        await drive(client, spec, warmup, 1)
+        results[name] = {f"c{c}": summarize(await drive(client, spec, requests, c)) for c in concurrency}
+        if allocations:
+            results[name]["allocations"] = await measure_allocations(client, spec)
+    return results
+
+
+@contextmanager
+def local_server(app=None):
+    """uvicorn chạy trong thread (cổng ngẫu nhiên), trả về base URL."""
+    import uvicorn
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    config = uvicorn.Config(app or api.app, lifespan="off", log_level="warning", access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    try:
+        deadline = time.time() + 10
+        while not server.started:
+            if time.time() > deadline or not thread.is_alive():
+                raise RuntimeError("uvicorn did not start")
+            time.sleep(0.01)
+        yield f"http://127.0.0.1:{sock.getsockname()[1]}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+        sock.close()
+
+
+async def run_benchmark(modes=MODES, names: list = None, concurrency=DEFAULT_CONCURRENCY,
+                        requests: int = DEFAULT_REQUESTS, warmup: int = WARMUP_REQUESTS) -> dict:
+    """Chạy benchmark trên app đang load (api.store phải có model)."""
+    specs = endpoints()
+    if names:
+        unknown = set(names) - set(specs)
+        if unknown:
+            raise ValueError(f"Unknown endpoints: {sorted(unknown)}. Available: {list(specs)}")
+        specs = {n: specs[n] for n in names}
+
+    limits = httpx.Limits(max_connections=max(concurrency), max_keepalive_connections=max(concurrency))
+    results = {}
+    for mode in modes:
+        if mode == "inprocess":
+            transport = httpx.ASGITransport(app=api.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                results[mode] = await benchmark_client(client, specs, concurrency, requests, warmup, True)
+        elif mode == "uvicorn":
+            with local_server() as base_url:
+                async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+                    results[mode] = await benchmark_client(client, specs, concurrency, requests, warmup)
+        else:
+            raise ValueError(f"Invalid mode: {mode}. Available: {list(MODES)}")
+
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "model": api.store.get().key,
+        "config": {"concurrency": list(concurrency), "requests": requests, "warmup": warmup},
+        "results": results,
+    }
+
+
+# ========================
+# LƯU + SO SÁNH
+# ========================
+def save_results(report: dict, output: Path = None) -> Path:
+    return benchmark_results.save_results(report, "api", output)
+
+
+def compare(current: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> list:
+    """
+    So sánh p50/p99 với baseline. Trả về các dòng (mode, endpoint, concurrency,
+    metric, baseline, current, tỉ lệ, regression).
+    """
+    return benchmark_results.compare(current, baseline, ("mode", "endpoint", "concurrency"),
+                                     ("p50_ms", "p99_ms"), threshold)
+
+
+def print_report(report: dict) -> None:
+    for mode, endpoints_ in report["results"].items():
+        print(f"\n📊 {mode} ({report['model']}, commit {report['commit']})")
+        print(f"   {'endpoint':<20}{'conc':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  errors")
+        for name, levels in endpoints_.items():
+            for level, stats in levels.items():
+                if level == "allocations":
+                    print(f"   {name:<20}{'':>6}  alloc peak {stats['alloc_peak_kib']} KiB/req, "
+                          f"retained {stats['retained_blocks']} blocks/req")
+                    continue
+                print(f"   {name:<20}{level[1:]:>6}{stats['throughput_rps']:>10}{stats['p50_ms']:>10}"
+                      f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}  {stats['errors'] or ''}")
+                if stats.get("phases_ms"):
+                    print(f"   {'':<26}server: " + ", ".join(f"{k} {v}" for k, v in stats["phases_ms"].items()))
+
+
+# ========================
+# MAIN
+# ========================
+def main():
+    parser = argparse.ArgumentParser(description="API load/latency benchmark")
+    parser.add_argument("--mode", choices=MODES + ("both",), default="both")
+    parser.add_argument("--concurrency", default=",".join(str(c) for c in DEFAULT_CONCURRENCY))
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS)
+    parser.add_argument("--endpoints", default=None, help="Danh sách endpoint, cách nhau bởi dấu phẩy")
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--compare", type=Path, default=None, help="File JSON baseline để so sánh")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("⏱️  API BENCHMARK")
+    print("=" * 60)
+    api.initialize()
+    if len(api.store) == 0:
+        raise SystemExit("❌ No model loaded, train or register a model first")
+
+    modes = MODES if args.mode == "both" else (args.mode,)
+    concurrency = tuple(int(c) for c in args.concurrency.split(","))
+    names = args.endpoints.split(",") if args.endpoints else None
+    report = asyncio.run(run_benchmark(modes, names, concurrency, args.requests))
+
+    print_report(report)
+    output = save_results(report, args.output)
+    print(f"\n💾 Saved: {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            benchmark_results.check_regressions(compare(report, json.load(f)), unit=" ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+benchmark_features.py
+
+Micro-benchmark cho tiền xử lý và feature engineering khi dữ liệu lớn dần:
+từ 1 điểm × 36 năm (dữ liệu hiện tại) tới 1.000 điểm × 70 năm.
+
+Dữ liệu thời tiết ngày được sinh giả lập (mùa vụ + nhiễu, cùng cột với
+data/external/weather_daklak_1990_2025.csv), từng điểm một để bộ nhớ không
+tăng theo số điểm. Các hàm hiện chạy theo từng điểm nên mỗi điểm là một lần gọi:
+
+- preprocess.aggregate_monthly
+- feature_engineering.create_yearly_features (và bản vectorized _fast)
+- upgrade_features.calculate_spei
+
+Mỗi (hàm, quy mô): thời gian (median/min qua nhiều lần lặp, chỉ tính phần gọi
+hàm) và bộ nhớ đỉnh mỗi lần gọi (tracemalloc, chạy riêng để không làm sai thời
+gian). Kết quả lưu JSON (kèm commit git) cạnh benchmark API để so sánh:
+
+    python src/benchmark_features.py --scales small,medium
+    python src/benchmark_features.py --scales 100x70 --compare reports/benchmarks/features-<commit>.json
+"""
+
+import io
+import os
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    from src import preprocess, feature_engineering, upgrade_features, benchmark_results
+    from src.benchmark_results import git_commit
+except ImportError:  # chạy trực tiếp từ thư mục src/
+    import preprocess
+    import feature_engineering
+    import upgrade_features
+    import benchmark_results
+    from benchmark_results import git_commit
+
+# ========================
+# CẤU HÌNH
+# ========================
+START_YEAR = 1990
+# Tên quy mô -> (số điểm, số năm)
+SCALES = {
+    "small": (1, 36),
+    "medium": (10, 70),
+    "large": (100, 70),
+    "xlarge": (1000, 70),
+}
+DEFAULT_SCALES = ("small", "medium")
+DEFAULT_REPEATS = 3
+MEMORY_POINTS = 3               # số điểm đo bộ nhớ đỉnh (mỗi lần gọi)
+REGRESSION_THRESHOLD = benchmark_results.REGRESSION_THRESHOLD
+
+
+# ========================
+# DỮ LIỆU GIẢ LẬP
+# ========================
+def parse_scale(scale: str) -> tuple:
+    """'medium' hoặc '<điểm>x<năm>' (ví dụ 100x70) -> (điểm, năm)."""
+    if scale in SCALES:
+        return SCALES[scale]
+    try:
+        points, years = (int(v) for v in scale.lower().split("x"))
+    except ValueError:
+        raise ValueError(f"Invalid scale: {scale}. Use {list(SCALES)} or '<points>x<years>'")
+    if points < 1 or years < 2:
+        raise ValueError("Scale needs >= 1 point and >= 2 years")
+    return points, years
+
+
+def synthetic_daily(n_years: int, seed: int = 0, start_year: int = START_YEAR) -> pd.DataFrame:
+    """
+    Thời tiết ngày giả lập cho một điểm: chu kỳ mùa (mùa mưa T5-T10) + nhiễu,
+    cùng cột và khoảng giá trị với dữ liệu Đắk Lắk.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(f"{start_year}-01-01", f"{start_year + n_years - 1}-12-31", freq="D")
+    n = len(dates)
+    phase = 2 * np.pi * (dates.dayofyear.to_numpy() - 1) / 365.25
+    wet = np.clip(np.sin(phase - 2.0), 0, None)         # ~0 mùa khô, ~1 giữa mùa mưa
+    offset = rng.normal(0, 0.8)                          # khác biệt khí hậu giữa các điểm
+
+    temp_max = 30 + offset + 3 * np.sin(phase - 1.2) + rng.normal(0, 1.5, n)
+    temp_min = temp_max - 9 - 2 * wet + rng.normal(0, 1.0, n)
+    rain = rng.gamma(0.6, 8 + 12 * wet, n) * (rng.random(n) < 0.15 + 0.6 * wet)
+    soil = np.clip(0.2 + 0.15 * wet + rng.normal(0, 0.02, n), 0.05, 0.5)
+    return pd.DataFrame({
+        "date": dates,
+        "temp_max": temp_max.round(1),
+        "temp_min": temp_min.round(1),
+        "rain": rain.round(1),
+        "humidity": np.clip(65 + 20 * wet + rng.normal(0, 5, n), 30, 100).round(),
+        "radiation": np.clip(20 - 5 * wet + rng.normal(0, 2, n), 2, 30).round(2),
+        "soil_0_7": soil,
+        "soil_7_28": np.clip(soil + 0.05, 0.05, 0.55),
+    })
+
+
+# ========================
+# CÁC HÀM ĐƯỢC ĐO
+# ========================
+@contextmanager
+def _patched(module, **values):
+    """Tạm đổi hằng số module (đường dẫn file, khoảng năm), khôi phục khi xong."""
+    originals = {name: getattr(module, name) for name in values}
+    for name, value in values.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in originals.items():
+            setattr(module, name, value)
+
+
+def _daily_input(daily: pd.DataFrame, n_years: int, workdir: Path):
+    with redirect_stdout(io.StringIO()):
+        return preprocess.add_time_columns(daily)
+
+
+def _spei_input(daily: pd.DataFrame, n_years: int, workdir: Path):
+    # calculate_spei đọc bảng tháng từ đĩa trong khoảng START_YEAR..END_YEAR của module
+    with redirect_stdout(io.StringIO()):
+        monthly = preprocess.aggregate_monthly(preprocess.add_time_columns(daily))
+    path = workdir / "weather_monthly.csv"
+    monthly.to_csv(path, index=False)
+    return path, START_YEAR + n_years - 1
+
+
+def _run_spei(value):
+    path, end_year = value
+    with _patched(upgrade_features, WEATHER_MONTHLY_FILE=path, START_YEAR=START_YEAR, END_YEAR=end_year):
+        return upgrade_features.calculate_spei(None)
+
+
+# Tên -> (chuẩn bị input từ dữ liệu ngày (không tính giờ), hàm được đo)
+FUNCTIONS = {
+    "aggregate_monthly": (_daily_input, preprocess.aggregate_monthly),
+    "create_yearly_features": (_daily_input, feature_engineering.create_yearly_features),
+    "create_yearly_features_fast": (_daily_input, feature_engineering.create_yearly_features_fast),
+    "calculate_spei": (_spei_input, _run_spei),
+}
+
+
+# ========================
+# ĐO
+# ========================
+def _inputs(prepare, points: int, n_years: int, workdir: Path):
+    """Input từng điểm (sinh lần lượt, seed = chỉ số điểm)."""
+    for point in range(points):
+        point_dir = workdir / f"p{point}"
+        point_dir.mkdir(exist_ok=True)
+        yield prepare(synthetic_daily(n_years, seed=point), n_years, point_dir)
+
+
+def time_function(name: str, points: int, n_years: int, repeats: int = DEFAULT_REPEATS) -> dict:
+    """Tổng thời gian gọi hàm `name` cho mọi điểm, lặp `repeats` lần."""
+    prepare, func = FUNCTIONS[name]
+    totals = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for _ in range(repeats):
+            total = 0.0
+            for value in _inputs(prepare, points, n_years, Path(workdir)):
+                with redirect_stdout(io.StringIO()):
+                    start = time.perf_counter()
+                    func(value)
+                    total += time.perf_counter() - start
+            totals.append(total)
+    totals = np.array(totals)
+    days = points * len(pd.date_range(f"{START_YEAR}-01-01", f"{START_YEAR + n_years - 1}-12-31"))
+    return {
+        "points": points,
+        "years": n_years,
+        "repeats": repeats,
+        "median_s": round(float(np.median(totals)), 6),
+        "min_s": round(float(totals.min()), 6),
+        "per_point_ms": round(float(np.median(totals)) / points * 1000, 3),
+        "daily_rows_per_s": round(days / float(np.median(totals)), 1),
+    }
+
+
+def measure_memory(name: str, n_years: int, points: int = MEMORY_POINTS) -> dict:
+    """Bộ nhớ đỉnh (tracemalloc) của một lần gọi, lớn nhất qua `points` điểm."""
+    prepare, func = FUNCTIONS[name]
+    peaks = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for value in _inputs(prepare, points, n_years, Path(workdir)):
+            tracemalloc.start()
+            try:
+                base, _ = tracemalloc.get_traced_memory()
+                with redirect_stdout(io.StringIO()):
+                    func(value)
+                peaks.append(tracemalloc.get_traced_memory()[1] - base)
+            finally:
+                tracemalloc.stop()
+    return {"peak_mib_per_call": round(max(peaks) / 2 ** 20, 3)}
+
+
+def run_benchmark(scales=DEFAULT_SCALES, names: list = None, repeats: int = DEFAULT_REPEATS) -> dict:
+    """Đo mọi hàm trong `names` ở từng quy mô."""
+    names = list(names or FUNCTIONS)
+    unknown = set(names) - set(FUNCTIONS)
+    if unknown:
+        raise ValueError(f"Unknown functions: {sorted(unknown)}. Available: {list(FUNCTIONS)}")
+
+    results = {}
+    for name in names:
+        results[name] = {}
+        for scale in scales:
+            points, n_years = parse_scale(scale)
+            stats = time_function(name, points, n_years, repeats)
+            stats.update(measure_memory(name, n_years, min(points, MEMORY_POINTS)))
+            results[name][scale] = stats
+
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {"scales": {s: list(parse_scale(s)) for s in scales}, "repeats": repeats},
+        "results": results,
+    }
+
+
+# ========================
+# LƯU + SO SÁNH
+# ========================
+def save_results(report: dict, output: Path = None) -> Path:
+    return benchmark_results.save_results(report, "features", output)
+
+
+def compare(current: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> list:
+    """
+    So sánh thời gian median và bộ nhớ đỉnh với baseline. Trả về các dòng
+    (hàm, quy mô, metric, baseline, current, tỉ lệ, regression).
+    """
+    return benchmark_results.compare(current, baseline, ("function", "scale"),
+                                     ("median_s", "peak_mib_per_call"), threshold)
+
+
+def print_report(report: dict) -> None:
+    print(f"\n📊 Feature benchmark (commit {report['commit']})")
+    print(f"   {'function':<30}{'scale':>10}{'points×years':>14}{'median s':>11}{'ms/point':>10}{'peak MiB':>10}")
+    for name, scales in report["results"].items():
+        for scale, stats in scales.items():
+            shape = f"{stats['points']}×{stats['years']}"
+            print(f"   {name:<30}{scale:>10}{shape:>14}{stats['median_s']:>11.3f}"
+                  f"{stats['per_point_ms']:>10.1f}{stats['peak_mib_per_call']:>10.1f}")
+
+
+# ========================
+# MAIN
+# ========================
+def main():
+    parser = argparse.ArgumentParser(description="Feature engineering / preprocessing micro-benchmarks")
+    parser.add_argument("--scales", default=",".join(DEFAULT_SCALES),
+                        help=f"Quy mô, cách nhau bởi dấu phẩy: {list(SCALES)} hoặc <điểm>x<năm>")
+    parser.add_argument("--functions", default=None, help="Danh sách hàm, cách nhau bởi dấu phẩy")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--compare", type=Path, default=None, help="File JSON baseline để so sánh")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("⏱️  FEATURE BENCHMARK")
+    print("=" * 60)
+
+    scales = args.scales.split(",")
+    names = args.functions.split(",") if args.functions else None
+    report = run_benchmark(scales, names, args.repeats)
+
+    print_report(report)
+    output = save_results(report, args.output)
+    print(f"\n💾 Saved: {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            benchmark_results.check_regressions(compare(report, json.load(f)))
+
+
+if __name__ == "__main__":
+    main()
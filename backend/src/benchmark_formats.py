@@ -0,0 +1,220 @@
+"""
+benchmark_formats.py
+
+So sánh kích thước payload và thời gian mã hoá của các định dạng response
+(response_formats.py) với đường JSON hiện tại của API, trên các bảng dạng cột:
+
+- yield-history: 36 năm × (năm, thực tế, dự báo), như /yield-history
+- weather-trend: bảng features thật (năm + 4 cột float32), như /weather-trend
+- daily:         thời tiết ngày 70 năm (~25.000 hàng × 6 cột)
+- grid:          năng suất theo ô (100.000 ô × lat/lon/yield float32)
+
+Định dạng:
+- json-current: list Python -> model pydantic -> model_dump -> json.dumps
+                (như handler hiện tại + JSONResponse của FastAPI)
+- json (orjson), msgpack, arrow: response_formats.encode trên mảng numpy
+
+    python src/benchmark_formats.py
+    python src/benchmark_formats.py --payloads daily,grid --repeats 20
+"""
+
+import json
+import gzip
+import time
+import argparse
+import platform
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from pydantic import create_model
+
+try:
+    from src import response_formats, serving, benchmark_results
+    from src.benchmark_features import synthetic_daily
+    from src.benchmark_results import git_commit
+except ImportError:  # chạy trực tiếp từ thư mục src/
+    import response_formats
+    import serving
+    import benchmark_results
+    from benchmark_features import synthetic_daily
+    from benchmark_results import git_commit
+
+# ========================
+# CẤU HÌNH
+# ========================
+CURRENT_JSON = "json-current"
+ENCODERS = (CURRENT_JSON,) + tuple(response_formats.FORMATS)
+DEFAULT_REPEATS = 10
+MIN_TIME = 0.05           # giây tối thiểu mỗi lần đo (lặp lại payload nhỏ nhiều lần)
+GRID_CELLS = 100_000
+
+
+# ========================
+# PAYLOAD
+# ========================
+def _yield_history() -> dict:
+    rng = np.random.default_rng(0)
+    years = np.arange(1990, 2026, dtype=np.int32)
+    actual = np.round(rng.normal(2.8, 0.3, len(years)), 2)
+    actual[-2:] = np.nan                                  # năm chưa có số liệu thực tế
+    return {"years": years, "actual_yields": actual, "predicted_yields": np.round(rng.normal(2.8, 0.3, len(years)), 4)}
+
+
+def _weather_trend() -> dict:
+    store = serving.load_feature_store()
+    columns = ("rain_Feb_Mar", "temp_max_MayJun", "days_over_33", "SPI_MarJun")
+    return {"years": store.years, **{name: np.ascontiguousarray(store.column(name)) for name in columns}}
+
+
+def _daily() -> dict:
+    df = synthetic_daily(70)
+    days = (df["date"].to_numpy().astype("datetime64[D]").astype(np.int64)).astype(np.int32)   # ngày từ 1970-01-01
+    return {"day": days, **{c: df[c].to_numpy(dtype=np.float32)
+                            for c in ("temp_max", "temp_min", "rain", "humidity", "radiation")}}
+
+
+def _grid() -> dict:
+    rng = np.random.default_rng(0)
+    return {
+        "lat": rng.uniform(12.2, 13.4, GRID_CELLS).astype(np.float32),
+        "lon": rng.uniform(107.5, 108.9, GRID_CELLS).astype(np.float32),
+        "yield_ton_ha": rng.normal(2.8, 0.4, GRID_CELLS).astype(np.float32),
+    }
+
+
+PAYLOADS = {
+    "yield-history": _yield_history,
+    "weather-trend": _weather_trend,
+    "daily": _daily,
+    "grid": _grid,
+}
+
+
+# ========================
+# ĐO
+# ========================
+def current_json(columns: dict) -> bytes:
+    """Đường JSON hiện tại: list comprehension -> pydantic -> model_dump -> json.dumps."""
+    fields = {}
+    values = {}
+    for name, array in columns.items():
+        if np.issubdtype(array.dtype, np.integer):
+            fields[name] = (List[int], ...)
+            values[name] = [int(x) for x in array]
+        else:
+            fields[name] = (List[Optional[float]], ...)
+            values[name] = [None if x != x else float(x) for x in array]
+    model = _model(tuple(fields.items()))
+    content = model(**values).model_dump(mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+_models = {}
+
+
+def _model(fields: tuple):
+    if fields not in _models:
+        _models[fields] = create_model("Payload", **dict(fields))
+    return _models[fields]
+
+
+def encode(columns: dict, encoder: str):
+    if encoder == CURRENT_JSON:
+        return current_json(columns)
+    return response_formats.encode(columns, encoder)
+
+
+def time_encoder(columns: dict, encoder: str, repeats: int = DEFAULT_REPEATS) -> dict:
+    """Thời gian mã hoá (median/min mỗi lần gọi) và kích thước payload."""
+    body = bytes(memoryview(encode(columns, encoder)))
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            encode(columns, encoder)
+        if time.perf_counter() - start >= MIN_TIME or loops >= 1 << 16:
+            break
+        loops *= 2
+
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(loops):
+            encode(columns, encoder)
+        samples.append((time.perf_counter() - start) / loops)
+    return {
+        "median_us": round(float(np.median(samples)) * 1e6, 2),
+        "min_us": round(float(np.min(samples)) * 1e6, 2),
+        "bytes": len(body),
+        "gzip_bytes": len(gzip.compress(body, compresslevel=6)),
+    }
+
+
+def run_benchmark(names: list = None, encoders=ENCODERS, repeats: int = DEFAULT_REPEATS) -> dict:
+    names = names or list(PAYLOADS)
+    unknown = set(names) - set(PAYLOADS)
+    if unknown:
+        raise ValueError(f"Unknown payloads: {sorted(unknown)}. Available: {list(PAYLOADS)}")
+    results = {}
+    for name in names:
+        columns = PAYLOADS[name]()
+        results[name] = {"rows": int(len(next(iter(columns.values())))), "columns": len(columns)}
+        for encoder in encoders:
+            if encoder != CURRENT_JSON and not response_formats.can_encode(encoder):
+                continue
+            results[name][encoder] = time_encoder(columns, encoder, repeats)
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {"repeats": repeats},
+        "results": results,
+    }
+
+
+def save_results(report: dict, output: Path = None) -> Path:
+    return benchmark_results.save_results(report, "formats", output)
+
+
+def print_report(report: dict) -> None:
+    print(f"\n📊 Response format benchmark (commit {report['commit']})")
+    print(f"   {'payload':<16}{'rows':>8}{'format':>14}{'encode µs':>12}{'x faster':>10}{'bytes':>11}{'gzip':>10}")
+    for name, stats in report["results"].items():
+        baseline = stats.get(CURRENT_JSON)
+        for encoder in ENCODERS:
+            if encoder not in stats:
+                continue
+            row = stats[encoder]
+            speedup = f"{baseline['median_us'] / row['median_us']:.1f}" if baseline and row["median_us"] else "-"
+            print(f"   {name:<16}{stats['rows']:>8}{encoder:>14}{row['median_us']:>12}{speedup:>10}"
+                  f"{row['bytes']:>11}{row['gzip_bytes']:>10}")
+
+
+# ========================
+# MAIN
+# ========================
+def main():
+    parser = argparse.ArgumentParser(description="Payload size / encode time per response format")
+    parser.add_argument("--payloads", default=None, help=f"Danh sách payload, cách nhau bởi dấu phẩy: {list(PAYLOADS)}")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("⏱️  RESPONSE FORMAT BENCHMARK")
+    print("=" * 60)
+    missing = [response_formats.PACKAGES[f] for f in response_formats.FORMATS if not response_formats.can_encode(f)]
+    if missing:
+        print(f"⚠️ Not installed (skipped): {', '.join(missing)}")
+
+    names = args.payloads.split(",") if args.payloads else None
+    report = run_benchmark(names, repeats=args.repeats)
+    print_report(report)
+    output = save_results(report, args.output)
+    print(f"\n💾 Saved: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+benchmark_results.py
+
+Phần dùng chung của các benchmark (benchmark_api, benchmark_features,
+benchmark_formats): commit git, lưu kết quả JSON vào reports/benchmarks/ và so
+sánh với một lần chạy trước (baseline) theo cùng một quy tắc regression.
+
+Kết quả của mọi benchmark có dạng {"commit", ..., "results": {...}}, trong đó
+"results" là dict lồng nhau tới dict số liệu của từng phép đo.
+"""
+
+import sys
+import json
+import subprocess
+from pathlib import Path
+
+# ========================
+# CẤU HÌNH
+# ========================
+BASE_DIR = Path(__file__).parent.parent
+RESULTS_DIR = BASE_DIR / "reports" / "benchmarks"
+REGRESSION_THRESHOLD = 0.20   # chậm hơn 20% so với baseline -> regression
+ROW_FIELDS = ("metric", "baseline", "current", "ratio", "regression")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(report: dict, prefix: str, output: Path = None) -> Path:
+    """Ghi report ra `output` (mặc định reports/benchmarks/<prefix>-<commit>.json)."""
+    output = Path(output or RESULTS_DIR / f"{prefix}-{report['commit']}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    return output
+
+
+def compare(current: dict, baseline: dict, levels: tuple, metrics: tuple,
+            threshold: float = REGRESSION_THRESHOLD) -> list:
+    """
+    So sánh các `metrics` của current với baseline theo từng phép đo.
+
+    Args:
+        levels: tên các tầng khoá của "results" (ví dụ ("function", "scale"))
+
+    Returns:
+        Dòng {<levels>..., metric, baseline, current, ratio, regression}; phép đo
+        hoặc metric không có ở cả hai bên bị bỏ qua
+    """
+    rows = []
+
+    def walk(new, old, keys):
+        if len(keys) == len(levels):
+            for metric in metrics:
+                if metric not in new or metric not in old:
+                    continue
+                ratio = new[metric] / old[metric] if old[metric] else float("inf")
+                rows.append({**dict(zip(levels, keys)), "metric": metric, "baseline": old[metric],
+                             "current": new[metric], "ratio": round(ratio, 3),
+                             "regression": ratio > 1 + threshold})
+            return
+        for key, value in new.items():
+            if isinstance(value, dict) and isinstance(old.get(key), dict):
+                walk(value, old[key], keys + (key,))
+
+    walk(current["results"], baseline.get("results", {}), ())
+    return rows
+
+
+def check_regressions(rows: list, unit: str = "") -> None:
+    """In các regression; có regression thì thoát mã 1 (dùng cho --compare)."""
+    regressions = [r for r in rows if r["regression"]]
+    for r in regressions:
+        where = " ".join(str(v) for k, v in r.items() if k not in ROW_FIELDS)
+        print(f"   ⚠️ {where} {r['metric']}: {r['baseline']} -> {r['current']}{unit} (x{r['ratio']})")
+    print(f"{'❌' if regressions else '✅'} {len(regressions)} regressions / {len(rows)} comparisons")
+    if regressions:
+        sys.exit(1)
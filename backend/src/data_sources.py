@@ -0,0 +1,469 @@
+"""
+data_sources.py
+
+Lớp HTTP async dùng chung cho mọi nguồn dữ liệu bên ngoài (Open-Meteo,
+NASA POWER, NOAA ONI).
+
+- Một httpx.AsyncClient cho cả lần refresh: connection pooling + keep-alive
+- Giới hạn theo host: số request đồng thời (semaphore) và tốc độ (token bucket)
+- Retry với exponential backoff + full jitter cho lỗi mạng, 429 và 5xx
+  (tôn trọng header Retry-After)
+- Cache response theo (url, params) với TTL
+- Adapter theo nguồn: chỉ khai báo request cần gửi và cách parse payload;
+  đăng ký bằng @register_adapter, base_url ghi đè được (test dùng server local)
+
+    results = fetch_sources(["open_meteo", "nasa_power", "noaa_oni"], 1990, 2024)
+
+Các nguồn được fetch đồng thời; lỗi của một nguồn không làm hỏng nguồn khác.
+"""
+
+import asyncio
+import random
+import time
+from abc import ABC, abstractmethod
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+import httpx
+
+# ========================
+# CẤU HÌNH
+# ========================
+LATITUDE = 12.71
+LONGITUDE = 108.23
+TIMEZONE = "Asia/Bangkok"
+
+TIMEOUT = 120.0
+MAX_CONNECTIONS = 16
+MAX_RETRIES = 3
+BACKOFF_BASE = 1.0      # giây; lần thử k chờ ngẫu nhiên trong [0, min(cap, base * 2^k)]
+BACKOFF_CAP = 30.0
+DEFAULT_TTL = 6 * 3600  # giây
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Giới hạn theo host: số request đồng thời, tốc độ (request/giây), burst
+HOST_POLICIES = {
+    "archive-api.open-meteo.com": {"concurrency": 4, "rate": 5.0, "burst": 5},
+    "power.larc.nasa.gov": {"concurrency": 2, "rate": 1.0, "burst": 2},
+    "www.cpc.ncep.noaa.gov": {"concurrency": 1, "rate": 1.0, "burst": 1},
+}
+DEFAULT_POLICY = {"concurrency": 4, "rate": 10.0, "burst": 10}
+
+
+class SourceError(Exception):
+    """Không lấy được dữ liệu từ nguồn sau khi đã retry."""
+
+
+# ========================
+# RATE LIMIT + CACHE
+# ========================
+class RateLimiter:
+    """Token bucket async: tối đa `rate` request/giây, cho phép burst `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1, clock=time.monotonic):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.clock = clock
+        self.tokens = float(self.burst)
+        self.updated = clock()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            wait = (1 - self.tokens) / self.rate
+            await asyncio.sleep(wait)
+            self.tokens = 0.0
+            self.updated = self.clock()
+
+
+class TTLCache:
+    """Cache payload theo key, mỗi mục hết hạn sau `ttl` giây."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._items = {}
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if self.clock() >= expires:
+            del self._items[key]
+            return None
+        return value
+
+    def set(self, key, value, ttl: float) -> None:
+        if ttl > 0:
+            self._items[key] = (self.clock() + ttl, value)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+# Cache dùng chung trong process: refresh lặp lại không gọi lại API
+_response_cache = TTLCache()
+
+
+# ========================
+# CLIENT
+# ========================
+class SourceClient:
+    """
+    httpx.AsyncClient dùng chung + giới hạn theo host + retry + cache.
+
+    Dùng như async context manager:
+
+        async with SourceClient() as client:
+            payload = await client.get(url, params)
+    """
+
+    def __init__(self, policies: dict = None, max_retries: int = MAX_RETRIES,
+                 backoff_base: float = BACKOFF_BASE, backoff_cap: float = BACKOFF_CAP,
+                 timeout: float = TIMEOUT, cache: TTLCache = None, transport=None):
+        self.policies = {**HOST_POLICIES, **(policies or {})}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.cache = _response_cache if cache is None else cache
+        self.stats = {"requests": 0, "retries": 0, "cache_hits": 0}
+        self._hosts = {}
+        self._client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+            transport=transport,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+    def _host(self, url: str):
+        """(semaphore, rate limiter) của host, tạo lần đầu gặp."""
+        host = urlsplit(url).netloc
+        if host not in self._hosts:
+            policy = {**DEFAULT_POLICY, **self.policies.get(host, {})}
+            self._hosts[host] = (asyncio.Semaphore(policy["concurrency"]),
+                                 RateLimiter(policy["rate"], policy["burst"]))
+        return self._hosts[host]
+
+    def _backoff(self, attempt: int, response: httpx.Response = None) -> float:
+        if response is not None and "Retry-After" in response.headers:
+            try:
+                return min(self.backoff_cap, float(response.headers["Retry-After"]))
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    async def get(self, url: str, params: dict = None, kind: str = "json", ttl: float = DEFAULT_TTL):
+        """
+        GET với cache/giới hạn/retry.
+
+        Args:
+            kind: "json" (trả dict) hoặc "text"
+
+        Raises:
+            SourceError: hết lượt retry hoặc lỗi không retry được (4xx)
+        """
+        key = (url, tuple(sorted((params or {}).items())), kind)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            return cached
+
+        semaphore, limiter = self._host(url)
+        for attempt in range(self.max_retries + 1):
+            response = None
+            async with semaphore:
+                await limiter.acquire()
+                self.stats["requests"] += 1
+                try:
+                    response = await self._client.get(url, params=params)
+                    error = None if response.status_code < 400 else f"HTTP {response.status_code}"
+                except httpx.TransportError as e:
+                    error = f"{type(e).__name__}: {e}"
+
+            if error is None:
+                payload = response.json() if kind == "json" else response.text
+                self.cache.set(key, payload, ttl)
+                return payload
+            if response is not None and response.status_code not in RETRY_STATUS:
+                raise SourceError(f"{url}: {error}")
+            if attempt == self.max_retries:
+                raise SourceError(f"{url}: {error} (after {attempt + 1} attempts)")
+
+            self.stats["retries"] += 1
+            await asyncio.sleep(self._backoff(attempt, response))
+
+
+# ========================
+# ADAPTERS
+# ========================
+ADAPTERS = {}
+
+
+def register_adapter(cls):
+    """Đăng ký adapter theo `cls.name`."""
+    ADAPTERS[cls.name] = cls
+    return cls
+
+
+def get_adapter(name: str, **options):
+    if name not in ADAPTERS:
+        raise KeyError(f"Unknown source: {name}. Available: {sorted(ADAPTERS)}")
+    return ADAPTERS[name](**options)
+
+
+class SourceAdapter(ABC):
+    """
+    Một nguồn dữ liệu: danh sách request cho khoảng năm + cách parse payload.
+
+    Subclass khai báo name, base_url, kind ("json"/"text") và cài đặt
+    build_requests() / parse(). allow_partial=True: chunk lỗi bị bỏ qua
+    (kèm cảnh báo) thay vì làm hỏng cả nguồn.
+    """
+
+    name = None
+    base_url = None
+    kind = "json"
+    ttl = DEFAULT_TTL
+    allow_partial = False
+
+    def __init__(self, base_url: str = None, **options):
+        if base_url is not None:
+            self.base_url = base_url
+        self.options = options
+
+    @abstractmethod
+    def build_requests(self, start_year: int, end_year: int) -> list:
+        """Danh sách params (mỗi phần tử là một request tới base_url)."""
+
+    @abstractmethod
+    def parse(self, payloads: list, start_year: int, end_year: int) -> pd.DataFrame:
+        """Payload (theo thứ tự build_requests) -> bảng dữ liệu."""
+
+    async def fetch_payloads(self, client: SourceClient, start_year: int, end_year: int) -> list:
+        """Payload thô của mọi request (chunk lỗi bị bỏ nếu allow_partial)."""
+        requests = self.build_requests(start_year, end_year)
+        payloads = await asyncio.gather(
+            *(client.get(self.base_url, params, kind=self.kind, ttl=self.ttl) for params in requests),
+            return_exceptions=True
+        )
+        errors = [p for p in payloads if isinstance(p, Exception)]
+        if errors and (not self.allow_partial or len(errors) == len(payloads)):
+            raise errors[0]
+        for error in errors:
+            print(f"   ⚠️ {self.name}: bỏ qua chunk lỗi ({error})")
+        return [p for p in payloads if not isinstance(p, Exception)]
+
+    async def fetch(self, client: SourceClient, start_year: int, end_year: int) -> pd.DataFrame:
+        payloads = await self.fetch_payloads(client, start_year, end_year)
+        return self.parse(payloads, start_year, end_year)
+
+
+@register_adapter
+class OpenMeteoArchive(SourceAdapter):
+    """Thời tiết ngày từ Open-Meteo Archive, một request mỗi năm."""
+
+    name = "open_meteo"
+    base_url = "https://archive-api.open-meteo.com/v1/archive"
+    allow_partial = True
+
+    DAILY_VARIABLES = ["temperature_2m_max", "temperature_2m_min", "precipitation_sum",
+                       "relative_humidity_2m_mean", "shortwave_radiation_sum"]
+    HOURLY_VARIABLES = ["soil_moisture_0_to_7cm", "soil_moisture_7_to_28cm"]
+    COLUMNS = {
+        "temperature_2m_max": "temp_max",
+        "temperature_2m_min": "temp_min",
+        "precipitation_sum": "rain",
+        "relative_humidity_2m_mean": "humidity",
+        "shortwave_radiation_sum": "radiation",
+        "soil_moisture_0_to_7cm": "soil_0_7",
+        "soil_moisture_7_to_28cm": "soil_7_28",
+    }
+
+    def build_requests(self, start_year: int, end_year: int) -> list:
+        end_date = self.options.get("end_date")
+        requests = []
+        for year in range(start_year, end_year + 1):
+            requests.append({
+                "latitude": self.options.get("latitude", LATITUDE),
+                "longitude": self.options.get("longitude", LONGITUDE),
+                "start_date": f"{year}-01-01",
+                # Năm cuối dùng end_date (dữ liệu chưa đủ năm)
+                "end_date": end_date if end_date and year == end_year else f"{year}-12-31",
+                "daily": ",".join(self.options.get("daily_variables", self.DAILY_VARIABLES)),
+                "hourly": ",".join(self.options.get("hourly_variables", self.HOURLY_VARIABLES)),
+                "timezone": self.options.get("timezone", TIMEZONE),
+            })
+        return requests
+
+    def parse(self, payloads: list, start_year: int, end_year: int) -> pd.DataFrame:
+        daily_chunks, hourly_chunks = [], []
+        for data in payloads:
+            if "daily" in data:
+                daily_chunks.append(pd.DataFrame(data["daily"]))
+            if "hourly" in data:
+                # Soil moisture chỉ có theo giờ -> trung bình theo ngày
+                hourly = pd.DataFrame(data["hourly"])
+                hourly["date"] = pd.to_datetime(hourly.pop("time")).dt.normalize()
+                hourly_chunks.append(hourly.groupby("date").mean().reset_index())
+
+        daily = pd.concat(daily_chunks, ignore_index=True).rename(columns={"time": "date"})
+        daily["date"] = pd.to_datetime(daily["date"])
+        if hourly_chunks:
+            daily = daily.merge(pd.concat(hourly_chunks, ignore_index=True), on="date", how="left")
+        return daily.rename(columns=self.COLUMNS).sort_values("date").reset_index(drop=True)
+
+
+@register_adapter
+class NasaPowerRadiation(SourceAdapter):
+    """Bức xạ ALLSKY_SFC_SW_DWN (MJ/m²/ngày) từ NASA POWER, tổng T6-9 theo năm."""
+
+    name = "nasa_power"
+    base_url = "https://power.larc.nasa.gov/api/temporal/daily/point"
+    CHUNK_YEARS = 10
+    MISSING = -999
+
+    def build_requests(self, start_year: int, end_year: int) -> list:
+        chunk = self.options.get("chunk_years", self.CHUNK_YEARS)
+        return [{
+            "parameters": "ALLSKY_SFC_SW_DWN",
+            "community": "AG",
+            "longitude": self.options.get("longitude", LONGITUDE),
+            "latitude": self.options.get("latitude", LATITUDE),
+            "start": f"{year}0101",
+            "end": f"{min(year + chunk - 1, end_year)}1231",
+            "format": "JSON",
+        } for year in range(start_year, end_year + 1, chunk)]
+
+    def parse(self, payloads: list, start_year: int, end_year: int) -> pd.DataFrame:
+        values = {}
+        for data in payloads:
+            values.update(data["properties"]["parameter"]["ALLSKY_SFC_SW_DWN"])
+        df = pd.DataFrame({"date": pd.to_datetime(list(values), format="%Y%m%d"),
+                           "radiation_nasa": list(values.values())})
+        df["radiation_nasa"] = df["radiation_nasa"].replace(self.MISSING, np.nan)
+
+        summer = df[df["date"].dt.month.between(6, 9)]
+        radiation = summer.groupby(summer["date"].dt.year)["radiation_nasa"].sum()
+        return radiation.rename("radiation_JunSep_NASA").rename_axis("year").reset_index()
+
+
+@register_adapter
+class NoaaOni(SourceAdapter):
+    """
+    ENSO ONI từ NOAA CPC (oni.ascii.txt: mỗi dòng `SEAS YR TOTAL ANOM`).
+    ENSO_MarJun = trung bình anomaly của mùa MAM và AMJ.
+    """
+
+    name = "noaa_oni"
+    base_url = "https://www.cpc.ncep.noaa.gov/data/indices/oni.ascii.txt"
+    kind = "text"
+    SEASONS = ("MAM", "AMJ")
+    MISSING = -99.9
+
+    def build_requests(self, start_year: int, end_year: int) -> list:
+        return [{}]
+
+    def parse(self, payloads: list, start_year: int, end_year: int) -> pd.DataFrame:
+        records = []
+        for line in payloads[0].strip().splitlines()[1:]:   # bỏ header
+            parts = line.split()
+            if len(parts) < 4 or parts[0] not in self.SEASONS:
+                continue
+            try:
+                anomaly = float(parts[3])
+                records.append({"year": int(parts[1]),
+                                "anomaly": np.nan if anomaly == self.MISSING else anomaly})
+            except ValueError:
+                continue
+        if not records:
+            raise SourceError("No valid ENSO data parsed")
+
+        oni = pd.DataFrame(records).groupby("year")["anomaly"].mean()
+        oni = oni[(oni.index >= start_year) & (oni.index <= end_year)]
+        return oni.rename("ENSO_MarJun").rename_axis("year").reset_index()
+
+
+# ========================
+# REFRESH NHIỀU NGUỒN
+# ========================
+def resolve_adapters(sources) -> dict:
+    """Tên nguồn / adapter / dict tên -> adapter -> dict tên -> adapter."""
+    if isinstance(sources, dict):
+        return sources
+    adapters = {}
+    for source in sources:
+        adapter = get_adapter(source) if isinstance(source, str) else source
+        adapters[adapter.name] = adapter
+    return adapters
+
+
+async def refresh_sources(sources, start_year: int, end_year: int, client: SourceClient = None) -> dict:
+    """
+    Fetch đồng thời nhiều nguồn qua MỘT client.
+
+    Returns:
+        Dict tên nguồn -> DataFrame, hoặc Exception nếu nguồn đó lỗi
+    """
+    adapters = resolve_adapters(sources)
+    owned = client is None
+    client = client or SourceClient()
+    try:
+        results = await asyncio.gather(
+            *(adapter.fetch(client, start_year, end_year) for adapter in adapters.values()),
+            return_exceptions=True
+        )
+    finally:
+        if owned:
+            await client.close()
+    return dict(zip(adapters, results))
+
+
+def fetch_sources(sources, start_year: int, end_year: int, **client_options) -> dict:
+    """Bản đồng bộ của refresh_sources() cho script (mỗi lần gọi một event loop)."""
+    async def run():
+        async with SourceClient(**client_options) as client:
+            return await refresh_sources(sources, start_year, end_year, client)
+    return asyncio.run(run())
+
+
+def fetch_source(source, start_year: int, end_year: int, **client_options) -> pd.DataFrame:
+    """Fetch một nguồn; lỗi được raise lại."""
+    adapter = get_adapter(source) if isinstance(source, str) else source
+    result = fetch_sources([adapter], start_year, end_year, **client_options)[adapter.name]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def main():
+    """Refresh đồng thời mọi nguồn đã đăng ký và in tóm tắt."""
+    start = time.perf_counter()
+    results = fetch_sources(list(ADAPTERS), 1990, 2024)
+    print(f"\n📡 Refresh {len(results)} nguồn trong {time.perf_counter() - start:.1f}s")
+    for name, result in results.items():
+        if isinstance(result, Exception):
+            print(f"   ❌ {name}: {result}")
+        else:
+            print(f"   ✅ {name}: {len(result):,} dòng, cột {list(result.columns)}")
+
+
+if __name__ == "__main__":
+    main()
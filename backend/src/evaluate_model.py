@@ -184,5 +184,10 @@ def print_evaluation_report():
     return metrics
 
 
+def main():
+    """Entry point (dùng bởi run_pipeline.py)."""
+    return print_evaluation_report()
+
+
 if __name__ == "__main__":
-    print_evaluation_report()
+    main()
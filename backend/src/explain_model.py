@@ -239,8 +239,13 @@ def print_feature_importance():
     return importance
 
 
+def main():
+    """Entry point (dùng bởi run_pipeline.py)."""
+    return print_feature_importance()
+
+
 if __name__ == "__main__":
-    print_feature_importance()
+    main()
     
     # Create plots
     print("\n📊 Creating SHAP plots...")
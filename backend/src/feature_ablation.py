@@ -0,0 +1,371 @@
+"""
+feature_ablation.py
+
+Ablation bộ features cho mô hình dự báo năng suất (walk-forward validation).
+
+Thay cho việc sửa tay danh sách features trong retrain_upgraded.compare_models(),
+module này đánh giá tự động các tập con cột của features_yearly_upgraded.csv:
+
+- leave_one_out:   bỏ từng feature khỏi tập gốc
+- add_one:         thêm từng feature ứng viên vào tập gốc
+- forward:         greedy forward selection (thêm feature tốt nhất mỗi bước)
+- backward:        greedy backward elimination (bỏ feature tệ nhất mỗi bước)
+
+Các tập con được đánh giá song song trên nhiều core (ProcessPoolExecutor);
+tập con trùng nhau giữa các chiến lược chỉ được train một lần nhờ cache
+(trong bộ nhớ + file JSON, khoá theo dữ liệu, model và tập cột).
+
+Chạy:
+    python src/feature_ablation.py --strategies loo,forward --n-jobs 8
+"""
+
+import os
+import json
+import hashlib
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.preprocessing import StandardScaler
+
+# ========================
+# CẤU HÌNH
+# ========================
+BASE_DIR = Path(__file__).parent.parent
+DATA_PROCESSED = BASE_DIR / "data" / "processed"
+DATA_RAW = BASE_DIR / "data" / "raw"
+
+FEATURES_UPGRADED = DATA_PROCESSED / "features_yearly_upgraded.csv"
+YIELD_FILE = DATA_RAW / "coffee_yield_daklak.csv"
+
+ABLATION_CSV = DATA_PROCESSED / "feature_ablation.csv"
+ABLATION_CACHE = DATA_PROCESSED / "feature_ablation_cache.json"
+
+TARGET = "yield_ton_ha"
+NON_FEATURE_COLUMNS = {"year", TARGET}
+PROVENANCE_PREFIX = "src_"   # cột provenance của upgrade_features (source_store.PROVENANCE_PREFIX)
+
+# Walk-forward giống retrain_upgraded.walk_forward_validation
+TEST_YEARS = list(range(2018, 2025))
+MIN_TRAIN_YEARS = 3
+
+# Tập gốc = features của model ban đầu
+BASE_FEATURES = [
+    'rain_Feb_Mar', 'soil_Apr_Jun', 'temp_max_MayJun',
+    'days_over_33', 'radiation_JunSep', 'rain_OctDec',
+    'humidity_Apr_Jun', 'SPI_MarJun'
+]
+
+STRATEGIES = ("loo", "add_one", "forward", "backward")
+
+XGB_PARAMS = {
+    'n_estimators': 500,
+    'learning_rate': 0.05,
+    'max_depth': 4,
+    'min_child_weight': 2,
+    'subsample': 0.8,
+    'colsample_bytree': 0.8,
+    'random_state': 42,
+    'verbosity': 0,
+    'n_jobs': 1,   # song song theo tập con, không song song trong từng model
+}
+
+
+def default_estimator():
+    """XGBoost cùng tham số với retrain_upgraded.walk_forward_validation."""
+    from xgboost import XGBRegressor
+    return XGBRegressor(**XGB_PARAMS)
+
+
+def load_data(features_file=FEATURES_UPGRADED, yield_file=YIELD_FILE) -> pd.DataFrame:
+    """Features theo năm + yield (chỉ các năm có yield)."""
+    features = pd.read_csv(features_file)
+    yields = pd.read_csv(yield_file)
+    return features.merge(yields[['year', TARGET]], on='year', how='inner')
+
+
+def candidate_features(df: pd.DataFrame) -> list:
+    """Các cột số có thể dùng làm feature (không NaN)."""
+    numeric = df.select_dtypes(include=[np.number]).columns
+    return [c for c in numeric if c not in NON_FEATURE_COLUMNS and not c.startswith(PROVENANCE_PREFIX)
+            and df[c].notna().all()]
+
+
+# ========================
+# ĐÁNH GIÁ MỘT TẬP CON
+# ========================
+# Dữ liệu dùng chung trong mỗi worker process (set bởi _init_worker)
+_WORKER = {}
+
+
+def _init_worker(X, y, folds, estimator):
+    _WORKER.update(X=X, y=y, folds=folds, estimator=estimator)
+
+
+def _evaluate(columns: tuple) -> dict:
+    """Walk-forward trên các cột `columns` (chỉ số cột trong X)."""
+    X, y, folds, estimator = _WORKER["X"], _WORKER["y"], _WORKER["folds"], _WORKER["estimator"]
+    X_sub = X[:, list(columns)]
+
+    pct_errors, sq_errors = [], []
+    for train_idx, test_idx in folds:
+        scaler = StandardScaler()
+        X_train = scaler.fit_transform(X_sub[train_idx])
+        X_test = scaler.transform(X_sub[test_idx])
+
+        model = clone(estimator)
+        model.fit(X_train, y[train_idx])
+        y_pred = model.predict(X_test)
+        y_true = y[test_idx]
+
+        pct_errors.extend(np.abs(y_pred - y_true) / y_true * 100)
+        sq_errors.extend((y_pred - y_true) ** 2)
+
+    return {
+        "mape": float(np.mean(pct_errors)),
+        "max_error": float(np.max(pct_errors)),
+        "rmse": float(np.sqrt(np.mean(sq_errors))),
+    }
+
+
+class AblationRunner:
+    """
+    Đánh giá nhiều tập features dưới walk-forward validation.
+
+    Tất cả tập con dùng chung một ma trận X và các fold đã tính sẵn; mỗi
+    tập con chỉ được train một lần (cache theo frozenset tên cột).
+    """
+
+    def __init__(self, df: pd.DataFrame, features: list = None, estimator=None,
+                 test_years=TEST_YEARS, min_train_years: int = MIN_TRAIN_YEARS,
+                 n_jobs: int = None, cache_file=None):
+        df = df.sort_values('year').reset_index(drop=True)
+        self.features = list(features) if features is not None else candidate_features(df)
+        self.estimator = estimator if estimator is not None else default_estimator()
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        self.cache_file = Path(cache_file) if cache_file is not None else None
+
+        self.X = df[self.features].to_numpy(dtype=np.float64)
+        self.y = df[TARGET].to_numpy(dtype=np.float64)
+        years = df['year'].to_numpy()
+        self.folds = []
+        for test_year in test_years:
+            train_idx = np.flatnonzero(years < test_year)
+            test_idx = np.flatnonzero(years == test_year)
+            if len(train_idx) >= min_train_years and len(test_idx) > 0:
+                self.folds.append((train_idx, test_idx))
+        if not self.folds:
+            raise ValueError("No walk-forward folds: not enough years with yield data")
+
+        self._fingerprint = self._make_fingerprint()
+        self._cache = self._load_cache()
+        self.n_trained = 0
+
+    # ------------------------
+    # Cache
+    # ------------------------
+    def _make_fingerprint(self) -> str:
+        """Khoá cache: dữ liệu + model + folds (đổi bất kỳ thứ gì -> cache mới)."""
+        digest = hashlib.sha256()
+        digest.update(self.X.tobytes())
+        digest.update(self.y.tobytes())
+        digest.update(json.dumps(self.features).encode())
+        digest.update(repr(self.estimator).encode())
+        for train_idx, test_idx in self.folds:
+            digest.update(train_idx.tobytes() + test_idx.tobytes())
+        return digest.hexdigest()[:16]
+
+    @staticmethod
+    def _subset_key(subset) -> str:
+        return "|".join(sorted(subset))
+
+    def _load_cache(self) -> dict:
+        if self.cache_file is None or not self.cache_file.exists():
+            return {}
+        with open(self.cache_file, 'r') as f:
+            stored = json.load(f)
+        return stored.get(self._fingerprint, {})
+
+    def _save_cache(self) -> None:
+        if self.cache_file is None:
+            return
+        stored = {}
+        if self.cache_file.exists():
+            with open(self.cache_file, 'r') as f:
+                stored = json.load(f)
+        stored[self._fingerprint] = self._cache
+        tmp = self.cache_file.with_name(f".{self.cache_file.name}.tmp-{os.getpid()}")
+        with open(tmp, 'w') as f:
+            json.dump(stored, f, indent=1)
+        os.replace(tmp, self.cache_file)
+
+    # ------------------------
+    # Đánh giá
+    # ------------------------
+    def evaluate_many(self, subsets: list) -> list:
+        """
+        Đánh giá danh sách tập features, trả về metrics theo đúng thứ tự.
+        Tập con đã có trong cache (hoặc trùng trong cùng batch) không train lại.
+        """
+        keys = [self._subset_key(s) for s in subsets]
+        for subset in subsets:
+            missing = set(subset) - set(self.features)
+            if missing:
+                raise ValueError(f"Unknown features: {sorted(missing)}")
+            if not subset:
+                raise ValueError("Feature subset must not be empty")
+
+        pending = list(dict.fromkeys(k for k in keys if k not in self._cache))
+        if pending:
+            index = {name: i for i, name in enumerate(self.features)}
+            jobs = [tuple(index[name] for name in key.split("|")) for key in pending]
+            init_args = (self.X, self.y, self.folds, self.estimator)
+
+            if self.n_jobs > 1 and len(jobs) > 1:
+                with ProcessPoolExecutor(max_workers=min(self.n_jobs, len(jobs)),
+                                         initializer=_init_worker, initargs=init_args) as pool:
+                    results = list(pool.map(_evaluate, jobs))
+            else:
+                _init_worker(*init_args)
+                results = [_evaluate(job) for job in jobs]
+
+            self._cache.update(zip(pending, results))
+            self.n_trained += len(pending)
+            self._save_cache()
+
+        return [dict(self._cache[k]) for k in keys]
+
+    def evaluate(self, subset) -> dict:
+        return self.evaluate_many([list(subset)])[0]
+
+    # ------------------------
+    # Chiến lược
+    # ------------------------
+    def _rows(self, strategy, step, subsets, changes, baseline=None) -> list:
+        rows = []
+        for subset, change, metrics in zip(subsets, changes, self.evaluate_many(subsets)):
+            row = {
+                "strategy": strategy,
+                "step": step,
+                "change": change,
+                "n_features": len(subset),
+                **metrics,
+                "features": ",".join(subset),
+            }
+            if baseline is not None:
+                row["delta_mape"] = metrics["mape"] - baseline["mape"]
+            rows.append(row)
+        return rows
+
+    def leave_one_out(self, base: list) -> list:
+        """Bỏ từng feature khỏi `base`. delta_mape > 0 nghĩa là feature đó có ích."""
+        baseline = self.evaluate(base)
+        subsets = [[f for f in base if f != drop] for drop in base]
+        return self._rows("loo", 1, subsets, [f"-{f}" for f in base], baseline)
+
+    def add_one(self, base: list, candidates: list = None) -> list:
+        """Thêm từng feature ứng viên vào `base`. delta_mape < 0 nghĩa là nên thêm."""
+        baseline = self.evaluate(base)
+        candidates = [f for f in (candidates or self.features) if f not in base]
+        subsets = [list(base) + [f] for f in candidates]
+        return self._rows("add_one", 1, subsets, [f"+{f}" for f in candidates], baseline)
+
+    def forward(self, candidates: list = None, max_features: int = None) -> list:
+        """Greedy forward selection, dừng khi không còn cải thiện MAPE."""
+        remaining = list(candidates or self.features)
+        max_features = max_features or len(remaining)
+        selected, best, history = [], None, []
+
+        for step in range(1, max_features + 1):
+            if not remaining:
+                break
+            subsets = [selected + [f] for f in remaining]
+            rows = self._rows("forward", step, subsets, [f"+{f}" for f in remaining])
+            winner = min(rows, key=lambda r: r["mape"])
+            if best is not None and winner["mape"] >= best["mape"]:
+                break
+            winner["delta_mape"] = winner["mape"] - best["mape"] if best else np.nan
+            history.append(winner)
+            best = winner
+            added = winner["change"][1:]
+            selected.append(added)
+            remaining.remove(added)
+        return history
+
+    def backward(self, base: list = None, min_features: int = 1) -> list:
+        """Greedy backward elimination, dừng khi bỏ thêm feature làm MAPE tệ hơn."""
+        selected = list(base or self.features)
+        best = self.evaluate(selected)
+        history = []
+
+        for step in range(1, len(selected)):
+            if len(selected) <= min_features:
+                break
+            subsets = [[f for f in selected if f != drop] for drop in selected]
+            rows = self._rows("backward", step, subsets, [f"-{f}" for f in selected], best)
+            winner = min(rows, key=lambda r: r["mape"])
+            if winner["mape"] > best["mape"]:
+                break
+            history.append(winner)
+            best = winner
+            selected.remove(winner["change"][1:])
+        return history
+
+    def run(self, strategies=STRATEGIES, base: list = None) -> pd.DataFrame:
+        """Chạy các chiến lược và trả về bảng xếp hạng theo MAPE."""
+        base = [f for f in (base or BASE_FEATURES) if f in self.features] or self.features
+        rows = self._rows("baseline", 0, [base], ["(base)"])
+        for strategy in strategies:
+            if strategy == "loo":
+                rows += self.leave_one_out(base)
+            elif strategy == "add_one":
+                rows += self.add_one(base)
+            elif strategy == "forward":
+                rows += self.forward()
+            elif strategy == "backward":
+                rows += self.backward()
+            else:
+                raise ValueError(f"Unknown strategy: {strategy} (expected one of {STRATEGIES})")
+
+        table = pd.DataFrame(rows)
+        table = table.sort_values(["mape", "n_features"], kind="stable").reset_index(drop=True)
+        table.insert(0, "rank", np.arange(1, len(table) + 1))
+        return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Feature-set ablation (walk-forward)")
+    parser.add_argument("--features-file", default=str(FEATURES_UPGRADED))
+    parser.add_argument("--yield-file", default=str(YIELD_FILE))
+    parser.add_argument("--strategies", default=",".join(STRATEGIES))
+    parser.add_argument("--n-jobs", type=int, default=None)
+    parser.add_argument("--output", default=str(ABLATION_CSV))
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("🧪 FEATURE ABLATION (WALK-FORWARD)")
+    print("=" * 80)
+
+    df = load_data(args.features_file, args.yield_file)
+    runner = AblationRunner(df, n_jobs=args.n_jobs,
+                            cache_file=None if args.no_cache else ABLATION_CACHE)
+    print(f"\n   Features: {len(runner.features)} | Folds: {len(runner.folds)} | Workers: {runner.n_jobs}")
+
+    table = runner.run([s.strip() for s in args.strategies.split(",") if s.strip()])
+    table.to_csv(args.output, index=False)
+
+    print(f"\n   Models trained: {runner.n_trained} (còn lại lấy từ cache)")
+    print(f"\n{'Rank':<6}{'Strategy':<10}{'Change':<28}{'#':>3}{'MAPE':>9}{'Max':>9}")
+    print("-" * 65)
+    for _, row in table.head(20).iterrows():
+        print(f"{row['rank']:<6}{row['strategy']:<10}{row['change']:<28}"
+              f"{row['n_features']:>3}{row['mape']:>8.2f}%{row['max_error']:>8.2f}%")
+    print(f"\n✅ Saved: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -311,10 +311,154 @@ def create_yearly_features(daily: pd.DataFrame) -> pd.DataFrame:
     
     # 10. Tính anomalies
     features = calc_anomalies(features)
-    
+
     return features
 
 
+# ============================================================
+# FEATURE ENGINE VECTORIZED (TỪ THỐNG KÊ THÁNG)
+# ============================================================
+# Mọi feature ở trên chỉ cần tổng + số ngày theo (năm, tháng) của từng biến,
+# cộng số ngày nóng > 33°C. Từ các mảng (..., 12) này, features của hàng nghìn
+# mùa giả lập (weather_generator.py) được tính bằng vài phép numpy.
+MONTHLY_STAT_VARIABLES = ["temp_max", "temp_min", "temp_avg", "rain", "humidity", "radiation", "soil_0_7"]
+HOT_DAY_THRESHOLD = 33
+
+# Cột (thứ tự giống features_yearly.csv) -> (biến, tháng, phép gộp)
+FEATURE_WINDOWS = {
+    "rain_Feb_Mar": ("rain", [2, 3], "sum"),
+    "soil_Apr_Jun": ("soil_0_7", [4, 5, 6], "mean"),
+    "temp_max_MayJun": ("temp_max", [5, 6], "mean"),
+    "days_over_33": ("hot_days", [5, 6], "count"),
+    "radiation_JunSep": ("radiation", [6, 7, 8, 9], "sum"),
+    "temp_JunSep": ("temp_avg", [6, 7, 8, 9], "mean"),
+    "rain_OctDec": ("rain", [10, 11, 12], "sum"),
+    "humidity_Apr_Jun": ("humidity", [4, 5, 6], "mean"),
+}
+SPI_MONTHS = [3, 4, 5, 6]
+ANOMALY_COLUMNS = ["rain_Feb_Mar", "soil_Apr_Jun", "temp_max_MayJun", "radiation_JunSep", "rain_OctDec"]
+FEATURE_COLUMNS_ALL = list(FEATURE_WINDOWS) + ["SPI_MarJun"] + [f"{c}_anomaly" for c in ANOMALY_COLUMNS]
+
+
+def monthly_stats(daily: pd.DataFrame):
+    """
+    Tổng hợp dữ liệu ngày thành mảng (n_years, 12) cho từng biến.
+
+    Returns:
+        (years, stats) với stats[f"{var}_sum"], stats[f"{var}_count"]
+        và stats["hot_days"] (số ngày temp_max > 33°C)
+    """
+    daily = daily.assign(
+        year=daily["date"].dt.year if "year" not in daily else daily["year"],
+        month=daily["date"].dt.month if "month" not in daily else daily["month"],
+        temp_avg=(daily["temp_max"] + daily["temp_min"]) / 2,
+        hot_days=(daily["temp_max"] > HOT_DAY_THRESHOLD).astype(float),
+    )
+    years = np.sort(daily["year"].unique())
+    full_index = pd.MultiIndex.from_product([years, range(1, 13)], names=["year", "month"])
+    grouped = daily.groupby(["year", "month"])
+
+    def _to_array(series):
+        return series.reindex(full_index, fill_value=0).to_numpy(dtype=np.float64).reshape(len(years), 12)
+
+    stats = {}
+    for var in MONTHLY_STAT_VARIABLES:
+        stats[f"{var}_sum"] = _to_array(grouped[var].sum())
+        stats[f"{var}_count"] = _to_array(grouped[var].count())
+    stats["hot_days"] = _to_array(grouped["hot_days"].sum())
+    return years, stats
+
+
+def _window(stats: dict, var: str, months: list, how: str) -> np.ndarray:
+    idx = [m - 1 for m in months]
+    if how == "count":
+        return stats[var][..., idx].sum(axis=-1)
+    total = stats[f"{var}_sum"][..., idx].sum(axis=-1)
+    count = stats[f"{var}_count"][..., idx].sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        value = total / count if how == "mean" else total
+    return np.where(count > 0, value, np.nan)
+
+
+def feature_reference(years, stats: dict, reference_years: tuple = (1990, 2020)) -> dict:
+    """
+    Tham số chuẩn hoá lấy từ lịch sử: mean/std mưa T3-6 cho SPI (mọi năm,
+    như calc_spi) và mean/std từng cột cho anomaly (1990-2020, như calc_anomalies).
+    """
+    years = np.asarray(years)
+    rain_spi = _window(stats, "rain", SPI_MONTHS, "sum")
+    reference = {"spi": (np.nanmean(rain_spi), np.nanstd(rain_spi, ddof=1))}
+
+    in_ref = (years >= reference_years[0]) & (years <= reference_years[1])
+    for col in ANOMALY_COLUMNS:
+        values = _window(stats, *FEATURE_WINDOWS[col])[in_ref]
+        reference[col] = (np.nanmean(values), np.nanstd(values, ddof=1))
+    return reference
+
+
+def features_from_monthly(stats: dict, reference: dict) -> dict:
+    """
+    Tính tất cả features từ thống kê tháng, vectorized theo mọi trục phía trước
+    (ví dụ (n_years, 12) -> (n_years,), (n_sims, 12) -> (n_sims,)).
+
+    Returns:
+        Dict tên feature -> mảng, cột giống create_yearly_features()
+    """
+    features = {col: _window(stats, *spec) for col, spec in FEATURE_WINDOWS.items()}
+
+    mean, std = reference["spi"]
+    features["SPI_MarJun"] = (_window(stats, "rain", SPI_MONTHS, "sum") - mean) / std
+
+    for col in ANOMALY_COLUMNS:
+        mean, std = reference[col]
+        features[f"{col}_anomaly"] = (features[col] - mean) / std
+    return features
+
+
+class SeasonStats:
+    """
+    Bản online của monthly_stats() cho MỘT mùa (năm): mỗi ngày mới cập nhật
+    tổng/số ngày của tháng tương ứng trong O(1).
+    """
+
+    def __init__(self, year: int, stats: dict = None, as_of=None):
+        self.year = int(year)
+        self.stats = {k: np.array(v, dtype=np.float64) for k, v in stats.items()} if stats else {
+            **{f"{var}_{kind}": np.zeros(12) for var in MONTHLY_STAT_VARIABLES for kind in ("sum", "count")},
+            "hot_days": np.zeros(12),
+        }
+        self.as_of = pd.Timestamp(as_of) if as_of is not None else None
+
+    def add_day(self, date, record: dict, sign: int = 1) -> None:
+        """Thêm một ngày (record có các cột như file thời tiết ngày); sign=-1 để gỡ."""
+        date = pd.Timestamp(date)
+        if date.year != self.year:
+            raise ValueError(f"Day {date.date()} does not belong to season {self.year}")
+        m = date.month - 1
+        values = dict(record)
+        values["temp_avg"] = (values["temp_max"] + values["temp_min"]) / 2
+        for var in MONTHLY_STAT_VARIABLES:
+            value = values.get(var)
+            if value is not None and not np.isnan(value):
+                self.stats[f"{var}_sum"][m] += sign * value
+                self.stats[f"{var}_count"][m] += sign
+        if values["temp_max"] > HOT_DAY_THRESHOLD:
+            self.stats["hot_days"][m] += sign
+        if sign > 0 and (self.as_of is None or date > self.as_of):
+            self.as_of = date
+
+    def remove_day(self, date, record: dict) -> None:
+        """Gỡ một ngày đã thêm (dùng khi nguồn gửi lại bản sửa của ngày đó)."""
+        self.add_day(date, record, sign=-1)
+
+
+def create_yearly_features_fast(daily: pd.DataFrame) -> pd.DataFrame:
+    """Bản vectorized của create_yearly_features() (cùng cột, cùng giá trị)."""
+    years, stats = monthly_stats(daily)
+    features = features_from_monthly(stats, feature_reference(years, stats))
+    return pd.DataFrame({"year": years.astype(int), **features})
+
+
 def validate_features(features: pd.DataFrame) -> None:
     """
     Kiểm tra tính hợp lệ của features.
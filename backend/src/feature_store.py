@@ -0,0 +1,141 @@
+"""
+feature_store.py
+
+Bảng features dạng số gọn cho serving: MỘT ma trận float32 liên tục
+(năm × cột), mảng năm, và mảng chỉ mục năm -> hàng. Mọi thứ trả ra (hàng theo
+năm, cột, cả ma trận) là view chỉ đọc, không copy, không tạo DataFrame mỗi request.
+
+- API giữ một FeatureStore cho cả bảng features (weather-trend, /years)
+- Mỗi ServingBundle giữ bản select(feature_columns) theo đúng thứ tự cột của
+  model (tra năm -> hàng, features theo năm trả ra JSON)
+- Chỉ dùng để hiển thị / tra cứu: predict chạy trên ma trận float64
+  (ServingBundle.inputs), vì threshold của pipeline đã gộp scaler là float64
+  và float32 có thể đưa một năm sang nhánh khác của split
+- Giá trị trả ra JSON dùng dạng thập phân ngắn nhất của float32
+  (28.718033 thay vì 28.718032836914062)
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+def _readonly(array: np.ndarray) -> np.ndarray:
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+def to_list(values) -> list:
+    """Mảng float32 -> list float Python, giữ dạng thập phân ngắn nhất của float32."""
+    return [float(s) for s in np.asarray(values, dtype=np.float32).astype(str)]
+
+
+class FeatureStore:
+    """
+    Ma trận features float32 chỉ đọc, tra hàng theo năm bằng mảng chỉ mục.
+    Không được sửa sau khi tạo; kết quả tính từ store (mean, select, response
+    dựng sẵn) được cache trên chính store.
+    """
+
+    def __init__(self, years, columns, matrix):
+        years = np.asarray(years, dtype=np.int64)
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)   # không copy nếu đã đúng kiểu
+        if matrix.ndim != 2 or matrix.shape != (len(years), len(columns)):
+            raise ValueError(f"Matrix shape {matrix.shape} does not match {len(years)} years x {len(columns)} columns")
+        if len(years) == 0:
+            raise ValueError("Feature store needs at least one year")
+        if len(np.unique(years)) != len(years):
+            raise ValueError("Duplicate years in feature store")
+
+        self.columns = tuple(columns)
+        self.years = _readonly(years)
+        self.matrix = _readonly(matrix)
+        self._column_index = {name: i for i, name in enumerate(self.columns)}
+
+        # Chỉ mục năm -> hàng: mảng theo (năm - năm đầu), -1 = không có
+        self._first_year = int(years.min())
+        index = np.full(int(years.max()) - self._first_year + 1, -1, dtype=np.int32)
+        index[years - self._first_year] = np.arange(len(years), dtype=np.int32)
+        self._row_index = _readonly(index)
+
+        self.cache = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, columns: list = None) -> "FeatureStore":
+        """Từ DataFrame có cột `year`; mặc định lấy mọi cột số còn lại."""
+        if columns is None:
+            columns = [c for c in df.columns if c != "year" and pd.api.types.is_numeric_dtype(df[c])]
+        missing = [c for c in columns if c not in df.columns]
+        if missing:
+            raise ValueError(f"Features file is missing model columns: {missing}")
+        return cls(df["year"].to_numpy(dtype=np.int64), columns, df[list(columns)].to_numpy(dtype=np.float32))
+
+    def __len__(self) -> int:
+        return len(self.years)
+
+    def __contains__(self, year) -> bool:
+        try:
+            self.row_of(year)
+        except KeyError:
+            return False
+        return True
+
+    def cached(self, key, compute):
+        with self._lock:
+            if key in self.cache:
+                return self.cache[key]
+        value = compute()
+        with self._lock:
+            return self.cache.setdefault(key, value)
+
+    # ------------------------
+    # Tra cứu (view, không copy)
+    # ------------------------
+    def row_of(self, year) -> int:
+        """Chỉ số hàng của năm, KeyError nếu không có."""
+        offset = int(year) - self._first_year
+        if 0 <= offset < len(self._row_index):
+            row = int(self._row_index[offset])
+            if row >= 0:
+                return row
+        raise KeyError(year)
+
+    def row(self, year) -> np.ndarray:
+        """Vector features của một năm (view chỉ đọc, thứ tự = columns)."""
+        return self.matrix[self.row_of(year)]
+
+    def rows(self, years) -> np.ndarray:
+        """Ma trận features của nhiều năm (chọn theo chỉ mục nên là bản copy)."""
+        return self.matrix[[self.row_of(y) for y in years]]
+
+    def column(self, name: str) -> np.ndarray:
+        """Chuỗi theo năm của một cột (view chỉ đọc có stride)."""
+        try:
+            return self.matrix[:, self._column_index[name]]
+        except KeyError:
+            raise KeyError(f"Unknown feature column: {name}") from None
+
+    def select(self, columns) -> "FeatureStore":
+        """Store con theo thứ tự `columns` (một ma trận liên tục, cache theo danh sách cột)."""
+        columns = tuple(columns)
+        if columns == self.columns:
+            return self
+
+        def compute():
+            missing = [c for c in columns if c not in self._column_index]
+            if missing:
+                raise ValueError(f"Features file is missing model columns: {missing}")
+            matrix = self.matrix[:, [self._column_index[c] for c in columns]]
+            return FeatureStore(self.years, columns, matrix)
+        return self.cached(("select", columns), compute)
+
+    def mean(self) -> np.ndarray:
+        """Trung bình từng cột (float64, bỏ NaN)."""
+        return self.cached("mean", lambda: _readonly(np.nanmean(self.matrix, axis=0, dtype=np.float64)))
+
+    def as_dict(self, year) -> dict:
+        """{cột: giá trị} của một năm, dạng gửi ra JSON."""
+        return dict(zip(self.columns, to_list(self.row(year))))
@@ -5,16 +5,19 @@ Thu thập dữ liệu thời tiết 30 năm cho dự án dự báo năng suất
 Sử dụng Open-Meteo Archive API.
 
 Chức năng:
-- Kết nối Open-Meteo Archive API
+- Kết nối Open-Meteo Archive API (qua client async dùng chung trong data_sources.py)
 - Lấy dữ liệu nhiệt độ, lượng mưa, độ ẩm, soil moisture theo ngày
 - Lưu vào thư mục data/external/
 """
 
 import os
-import requests
 import pandas as pd
-from datetime import datetime
-import time
+
+try:
+    from src import data_sources, source_store
+except ImportError:  # chạy trực tiếp: python src/fetch_weather.py
+    import data_sources
+    import source_store
 
 # ========================
 # CẤU HÌNH
@@ -48,124 +51,34 @@ OUTPUT_FILE = os.path.join(OUTPUT_DIR, "weather_daklak_1990_2025.csv")  # Cập
 API_URL = "https://archive-api.open-meteo.com/v1/archive"
 
 
-def fetch_weather_chunk(start_date: str, end_date: str, max_retries: int = 3) -> dict:
-    """
-    Fetch một chunk dữ liệu thời tiết từ Open-Meteo Archive API.
-    API có giới hạn, cần chia nhỏ request.
-    """
-    params = {
-        "latitude": LATITUDE,
-        "longitude": LONGITUDE,
-        "start_date": start_date,
-        "end_date": end_date,
-        "daily": ",".join(DAILY_VARIABLES),
-        "hourly": ",".join(HOURLY_VARIABLES),
-        "timezone": TIMEZONE
-    }
-    
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(API_URL, params=params, timeout=120)
-            response.raise_for_status()
-            return response.json()
-            
-        except requests.exceptions.RequestException as e:
-            print(f"   ⚠️ Lỗi: {e}")
-            if attempt < max_retries - 1:
-                wait_time = (attempt + 1) * 5
-                print(f"   ⏳ Đợi {wait_time} giây...")
-                time.sleep(wait_time)
-            else:
-                raise Exception(f"❌ Không thể fetch dữ liệu: {e}")
-    
-    return None
-
-
-def fetch_weather_data_in_chunks():
+def fetch_weather_data() -> pd.DataFrame:
     """
-    Fetch dữ liệu theo từng năm để tránh giới hạn API.
+    Fetch dữ liệu theo từng năm (giới hạn API) qua data_sources: các năm được
+    fetch đồng thời trong giới hạn của host, năm lỗi được retry rồi bỏ qua.
+    Lần fetch thành công được lưu vào kho nguồn; API lỗi thì dùng snapshot gần nhất.
     """
-    all_daily_data = []
-    all_hourly_data = []
-    
     start_year = int(START_DATE[:4])
     end_year = int(END_DATE[:4])
     
     print(f"\n📅 Sẽ fetch dữ liệu từ {start_year} đến {end_year} ({end_year - start_year + 1} năm)")
     
-    for year in range(start_year, end_year + 1):
-        chunk_start = f"{year}-01-01"
-        # Với năm cuối, sử dụng END_DATE thay vì 12-31
-        if year == end_year:
-            chunk_end = END_DATE
-        else:
-            chunk_end = f"{year}-12-31"
-        
-        print(f"   📡 Năm {year}...", end=" ", flush=True)
-        
-        try:
-            data = fetch_weather_chunk(chunk_start, chunk_end)
-            
-            # Lấy daily data
-            if "daily" in data:
-                daily_df = pd.DataFrame(data["daily"])
-                all_daily_data.append(daily_df)
-            
-            # Lấy hourly data và aggregate theo ngày
-            if "hourly" in data:
-                hourly_df = pd.DataFrame(data["hourly"])
-                hourly_df["time"] = pd.to_datetime(hourly_df["time"])
-                hourly_df["date"] = hourly_df["time"].dt.date
-                
-                # Aggregate hourly -> daily (mean)
-                hourly_agg = hourly_df.groupby("date").agg({
-                    "soil_moisture_0_to_7cm": "mean",
-                    "soil_moisture_7_to_28cm": "mean"
-                }).reset_index()
-                hourly_agg["date"] = pd.to_datetime(hourly_agg["date"])
-                all_hourly_data.append(hourly_agg)
-            
-            print("✅")
-            
-            # Delay nhỏ giữa các requests
-            time.sleep(0.5)
-            
-        except Exception as e:
-            print(f"❌ {e}")
-            continue
-    
-    return all_daily_data, all_hourly_data
-
-
-def combine_and_process_data(daily_chunks, hourly_chunks):
-    """
-    Ghép các chunks và tạo DataFrame hoàn chỉnh.
-    """
-    # Ghép daily data
-    daily_df = pd.concat(daily_chunks, ignore_index=True)
-    daily_df["time"] = pd.to_datetime(daily_df["time"])
-    daily_df = daily_df.rename(columns={"time": "date"})
-    
-    # Ghép hourly aggregated data
-    hourly_df = pd.concat(hourly_chunks, ignore_index=True)
-    
-    # Merge daily và hourly
-    df = pd.merge(daily_df, hourly_df, on="date", how="left")
-    
-    # Đổi tên cột cho đẹp
-    df = df.rename(columns={
-        "temperature_2m_max": "temp_max",
-        "temperature_2m_min": "temp_min",
-        "precipitation_sum": "rain",
-        "relative_humidity_2m_mean": "humidity",
-        "shortwave_radiation_sum": "radiation",
-        "soil_moisture_0_to_7cm": "soil_0_7",
-        "soil_moisture_7_to_28cm": "soil_7_28"
-    })
-    
-    # Sắp xếp theo ngày
-    df = df.sort_values("date").reset_index(drop=True)
-    
+    adapter = data_sources.get_adapter(
+        "open_meteo",
+        base_url=API_URL,
+        latitude=LATITUDE,
+        longitude=LONGITUDE,
+        end_date=END_DATE,
+        daily_variables=DAILY_VARIABLES,
+        hourly_variables=HOURLY_VARIABLES,
+        timezone=TIMEZONE
+    )
+    result = source_store.fetch_with_store([adapter], start_year, end_year)["open_meteo"]
+    if isinstance(result, Exception):
+        raise result
+    df, provenance = result
+    if provenance["status"] != "live":
+        print(f"   ⚠️ Fetch lỗi, dùng snapshot open_meteo/{provenance['version']} "
+              f"(fetch lúc {provenance['fetched_at'][:10]}): {provenance.get('error')}")
     return df
 
 
@@ -216,13 +129,9 @@ def main():
     print(f"🌡 Biến DAILY: {', '.join(DAILY_VARIABLES)}")
     print(f"💧 Biến HOURLY (aggregate): {', '.join(HOURLY_VARIABLES)}")
     
-    # Fetch dữ liệu theo chunks
+    # Fetch dữ liệu theo chunks (đồng thời) và ghép daily + hourly
     print("\n" + "-" * 60)
-    daily_chunks, hourly_chunks = fetch_weather_data_in_chunks()
-    
-    # Ghép và xử lý
-    print("\n🔄 Đang ghép và xử lý dữ liệu...")
-    df = combine_and_process_data(daily_chunks, hourly_chunks)
+    df = fetch_weather_data()
     
     # Validate
     validate_data(df)
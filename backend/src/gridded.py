@@ -0,0 +1,267 @@
+"""
+gridded.py
+
+Dự báo năng suất theo lưới (lat/lon) thay vì một con số cho cả tỉnh.
+
+Features của lưới được lưu thành mảng dày X[cell, year, feature] (float32) trong
+một file .npz, kèm toạ độ ô, diện tích trồng (area_ha) và huyện của từng ô:
+
+    data/processed/features_grid.npz   (đổi bằng biến môi trường GRID_FILE)
+
+- build_grid(): thời tiết ngày của từng ô -> mảng features, vectorized theo
+  (ô, năm) bằng features_from_monthly() (mỗi ô có khí hậu chuẩn riêng cho
+  SPI/anomaly)
+- predict_grid(): MỘT lần predict cho mỗi năm trên toàn bộ ô
+- aggregate(): năng suất trung bình theo huyện/tỉnh, trọng số là diện tích
+"""
+
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    from src import feature_engineering as fe
+except ImportError:  # chạy trực tiếp từ thư mục src/
+    import feature_engineering as fe
+
+# ========================
+# CẤU HÌNH
+# ========================
+BASE_DIR = Path(__file__).parent.parent
+GRID_FILE = Path(os.getenv("GRID_FILE", BASE_DIR / "data" / "processed" / "features_grid.npz"))
+GRID_DTYPE = np.float32
+AGGREGATE_LEVELS = ("district", "province")
+
+
+@dataclass
+class YieldGrid:
+    """Lưới features: X[cell, year, feature]. Coi như read-only sau khi tạo."""
+    lat: np.ndarray              # (cells,)
+    lon: np.ndarray              # (cells,)
+    years: np.ndarray            # (years,)
+    feature_columns: list
+    X: np.ndarray                # (cells, years, features), float32
+    area_ha: np.ndarray          # (cells,) diện tích trồng, trọng số khi tổng hợp
+    district: np.ndarray         # (cells,) tên huyện
+    province: str = ""
+    token: str = ""              # định danh nội dung (cache dự báo theo bundle)
+    _year_index: dict = field(default_factory=dict, repr=False)
+
+    def __post_init__(self):
+        self.X = np.ascontiguousarray(self.X, dtype=GRID_DTYPE)
+        expected = (len(self.lat), len(self.years), len(self.feature_columns))
+        if self.X.shape != expected:
+            raise ValueError(f"Grid array has shape {self.X.shape}, expected {expected}")
+        self._year_index = {int(y): i for i, y in enumerate(self.years)}
+
+    @property
+    def n_cells(self) -> int:
+        return len(self.lat)
+
+    def year_position(self, year: int) -> int:
+        if year not in self._year_index:
+            raise KeyError(f"Year {year} not in grid ({int(self.years[0])}-{int(self.years[-1])})")
+        return self._year_index[year]
+
+    def year_slice(self, year: int, columns: list) -> np.ndarray:
+        """Ma trận (cells, len(columns)) của một năm, theo thứ tự cột model."""
+        position = self.year_position(year)
+        missing = [c for c in columns if c not in self.feature_columns]
+        if missing:
+            raise ValueError(f"Grid is missing model columns: {missing}")
+        index = [self.feature_columns.index(c) for c in columns]
+        return self.X[:, position, index]
+
+    def describe(self) -> dict:
+        return {
+            "province": self.province,
+            "cells": self.n_cells,
+            "years": [int(y) for y in self.years],
+            "features": list(self.feature_columns),
+            "districts": sorted(set(self.district.tolist())),
+            "bounds": {
+                "lat_min": float(self.lat.min()), "lat_max": float(self.lat.max()),
+                "lon_min": float(self.lon.min()), "lon_max": float(self.lon.max()),
+            },
+            "area_ha": float(self.area_ha.sum()),
+            "dtype": np.dtype(GRID_DTYPE).str,
+        }
+
+
+# ========================
+# DỰNG LƯỚI TỪ THỜI TIẾT NGÀY
+# ========================
+def _cell_reference(stats: dict, years: np.ndarray, reference_years: tuple = (1990, 2020)) -> dict:
+    """Như feature_reference() nhưng riêng từng ô (mean/std theo trục năm)."""
+    rain_spi = fe._window(stats, "rain", fe.SPI_MONTHS, "sum")
+    reference = {"spi": (np.nanmean(rain_spi, axis=1, keepdims=True),
+                         np.nanstd(rain_spi, axis=1, ddof=1, keepdims=True))}
+    in_ref = (years >= reference_years[0]) & (years <= reference_years[1])
+    for col in fe.ANOMALY_COLUMNS:
+        values = fe._window(stats, *fe.FEATURE_WINDOWS[col])[:, in_ref]
+        reference[col] = (np.nanmean(values, axis=1, keepdims=True),
+                          np.nanstd(values, axis=1, ddof=1, keepdims=True))
+    return reference
+
+
+def build_grid(daily_by_cell: list, cells: pd.DataFrame, province: str = "") -> YieldGrid:
+    """
+    Dựng lưới features từ thời tiết ngày của từng ô.
+
+    Args:
+        daily_by_cell: danh sách DataFrame thời tiết ngày (cùng thứ tự với cells)
+        cells: bảng ô với cột lat, lon, area_ha, district
+
+    Returns:
+        YieldGrid trên các năm chung của mọi ô
+    """
+    if len(daily_by_cell) != len(cells):
+        raise ValueError("daily_by_cell and cells must have the same length")
+
+    per_cell = [fe.monthly_stats(daily) for daily in daily_by_cell]
+    years = per_cell[0][0]
+    for cell_years, _ in per_cell[1:]:
+        years = np.intersect1d(years, cell_years)
+    if len(years) == 0:
+        raise ValueError("Cells have no year in common")
+
+    # stats[var]: (cells, years, 12)
+    stats = {
+        key: np.stack([cell_stats[key][np.searchsorted(cell_years, years)]
+                       for cell_years, cell_stats in per_cell])
+        for key in per_cell[0][1]
+    }
+    features = fe.features_from_monthly(stats, _cell_reference(stats, years))
+    columns = list(features)
+    X = np.stack([features[c] for c in columns], axis=-1)
+
+    return YieldGrid(
+        lat=cells["lat"].to_numpy(dtype=np.float64),
+        lon=cells["lon"].to_numpy(dtype=np.float64),
+        years=years.astype(int),
+        feature_columns=columns,
+        X=X,
+        area_ha=cells["area_ha"].to_numpy(dtype=np.float64),
+        district=cells["district"].astype(str).to_numpy(),
+        province=province,
+    )
+
+
+def save_grid(grid: YieldGrid, filepath: Path = GRID_FILE) -> None:
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(
+        filepath, lat=grid.lat, lon=grid.lon, years=grid.years, X=grid.X, area_ha=grid.area_ha,
+        district=grid.district.astype(str), feature_columns=np.array(grid.feature_columns),
+        province=np.array(grid.province),
+    )
+
+
+def load_grid(filepath: Path = GRID_FILE) -> YieldGrid:
+    filepath = Path(filepath)
+    if not filepath.exists():
+        raise FileNotFoundError(f"Grid file not found: {filepath}")
+    with np.load(filepath, allow_pickle=False) as data:
+        return YieldGrid(
+            lat=data["lat"], lon=data["lon"], years=data["years"].astype(int),
+            feature_columns=[str(c) for c in data["feature_columns"]], X=data["X"],
+            area_ha=data["area_ha"], district=data["district"], province=str(data["province"]),
+            token=f"{filepath}:{filepath.stat().st_mtime_ns}",
+        )
+
+
+# Lưới dùng chung, load lại khi file đổi (giống serving.load_table)
+_grid_cache = {}
+_grid_lock = threading.Lock()
+
+
+def get_grid(filepath: Path = None) -> YieldGrid:
+    filepath = Path(filepath or GRID_FILE)
+    if not filepath.exists():
+        raise FileNotFoundError(f"Grid file not found: {filepath}")
+    key = (str(filepath), filepath.stat().st_mtime_ns)
+    with _grid_lock:
+        if key not in _grid_cache:
+            _grid_cache.clear()
+            _grid_cache[key] = load_grid(filepath)
+        return _grid_cache[key]
+
+
+# ========================
+# DỰ BÁO + TỔNG HỢP
+# ========================
+def predict_grid(bundle, grid: YieldGrid, years=None) -> np.ndarray:
+    """
+    Năng suất dự báo (cells, years) float32: mỗi năm MỘT lần bundle.predict
+    trên toàn bộ ô.
+    """
+    years = grid.years if years is None else years
+    out = np.empty((grid.n_cells, len(years)), dtype=GRID_DTYPE)
+    for j, year in enumerate(years):
+        out[:, j] = bundle.predict(grid.year_slice(int(year), bundle.feature_columns))
+    return out
+
+
+def grid_predictions(bundle, grid: YieldGrid) -> np.ndarray:
+    """predict_grid() cho mọi năm, tính một lần cho mỗi (bundle, lưới)."""
+    return bundle.cached(("grid", grid.token or id(grid)), lambda: predict_grid(bundle, grid))
+
+
+def aggregate(yields: np.ndarray, grid: YieldGrid, level: str = "district") -> pd.DataFrame:
+    """
+    Năng suất trung bình theo vùng, trọng số diện tích. Ô không có diện tích
+    (0 hoặc NaN) hoặc không có năng suất (NaN) bị bỏ qua.
+
+    Returns:
+        DataFrame: <level>, area_ha, production_ton, yield_ton_ha
+    """
+    if level not in AGGREGATE_LEVELS:
+        raise ValueError(f"Invalid level: {level}. Available: {list(AGGREGATE_LEVELS)}")
+    yields = np.asarray(yields, dtype=np.float64)
+    if level == "province":
+        labels, codes = np.array([grid.province]), np.zeros(grid.n_cells, dtype=int)
+    else:
+        labels, codes = np.unique(grid.district, return_inverse=True)
+
+    cell_area = np.asarray(grid.area_ha, dtype=np.float64)
+    cell_area = np.where(np.isfinite(cell_area) & np.isfinite(yields), cell_area, 0.0)
+    area = np.bincount(codes, weights=cell_area, minlength=len(labels))
+    production = np.bincount(codes, weights=cell_area * np.nan_to_num(yields), minlength=len(labels))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_yield = np.where(area > 0, production / area, np.nan)
+    return pd.DataFrame({level: labels, "area_ha": area, "production_ton": production,
+                         "yield_ton_ha": mean_yield})
+
+
+# ========================
+# MAIN
+# ========================
+def main():
+    """
+    Dựng lưới từ thư mục thời tiết ngày theo ô:
+
+        <dir>/cells.csv          # cell_id, lat, lon, district, area_ha
+        <dir>/<cell_id>.csv      # cùng cột với file thời tiết ngày
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build gridded features")
+    parser.add_argument("weather_dir", type=Path)
+    parser.add_argument("--province", default="Đắk Lắk")
+    parser.add_argument("--output", type=Path, default=GRID_FILE)
+    args = parser.parse_args()
+
+    cells = pd.read_csv(args.weather_dir / "cells.csv")
+    daily = [fe.load_daily_data(args.weather_dir / f"{cell_id}.csv") for cell_id in cells["cell_id"]]
+    grid = build_grid(daily, cells, args.province)
+    save_grid(grid, args.output)
+    print(f"✅ Grid: {grid.n_cells} cells × {len(grid.years)} years × {len(grid.feature_columns)} features")
+    print(f"💾 Saved: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
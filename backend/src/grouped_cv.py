@@ -0,0 +1,203 @@
+"""
+grouped_cv.py
+
+Cross-validation theo nhóm cho dữ liệu panel (vùng × năm, xem panel.py).
+
+Khi có nhiều vùng, giữ lại một năm (LOYO) vẫn để lọt thông tin qua các vùng
+khác cùng năm (cùng thời tiết), và giữ lại một vùng vẫn để lọt qua cùng vùng
+ở các năm khác. Các kiểu chia:
+
+- loro:    leave-one-region-out
+- loyo:    leave-one-year-out
+- blocked: mỗi fold = (một vùng × một khối năm liên tiếp); train bỏ mọi hàng
+           cùng vùng HOẶC cùng khối năm với tập test (chỉ có một vùng: chỉ
+           bỏ khối năm)
+
+Ma trận features được dựng MỘT lần (float32 liên tục, kiểu mà cây sklearn
+dùng bên trong nên fit không phải chuyển kiểu lại) và dùng chung cho mọi fold;
+các fold được train song song (ProcessPoolExecutor), mỗi worker nhận ma trận
+một lần qua initializer.
+
+Chạy:
+    python src/grouped_cv.py --scheme blocked --year-block 2 --n-jobs 4
+"""
+
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestRegressor
+
+try:
+    from src import panel
+except ImportError:  # chạy trực tiếp từ thư mục src/
+    import panel
+
+# ========================
+# CẤU HÌNH
+# ========================
+SCHEMES = ("loro", "loyo", "blocked")
+
+# Giống train_model.train_random_forest, n_jobs=1 vì đã song song theo fold
+RF_PARAMS = {
+    'n_estimators': 500,
+    'random_state': 42,
+    'n_jobs': 1,
+}
+
+FEATURE_COLUMNS = [
+    "rain_Feb_Mar", "soil_Apr_Jun", "temp_max_MayJun", "days_over_33",
+    "radiation_JunSep", "rain_OctDec", "humidity_Apr_Jun", "SPI_MarJun",
+]
+
+
+def default_estimator():
+    return RandomForestRegressor(**RF_PARAMS)
+
+
+# ========================
+# CHIA FOLD THEO NHÓM
+# ========================
+def _year_blocks(years: np.ndarray, year_block: int) -> np.ndarray:
+    """Chỉ số khối năm liên tiếp (year_block năm một khối) của từng hàng."""
+    distinct = np.unique(years)
+    return np.searchsorted(distinct, years) // year_block
+
+
+def grouped_splits(regions, years, scheme: str = "blocked", year_block: int = 1) -> list:
+    """
+    Danh sách fold (tên, train_idx, test_idx) theo kiểu chia `scheme`.
+    Fold không có hàng train/test bị bỏ qua.
+    """
+    regions = np.asarray(regions)
+    years = np.asarray(years)
+    if scheme not in SCHEMES:
+        raise ValueError(f"Invalid scheme: {scheme}. Available: {list(SCHEMES)}")
+    if year_block < 1:
+        raise ValueError("year_block must be >= 1")
+
+    folds = []
+    if scheme == "loro":
+        for region in np.unique(regions):
+            test = regions == region
+            folds.append((str(region), np.flatnonzero(~test), np.flatnonzero(test)))
+    elif scheme == "loyo":
+        for year in np.unique(years):
+            test = years == year
+            folds.append((str(year), np.flatnonzero(~test), np.flatnonzero(test)))
+    else:
+        blocks = _year_blocks(years, year_block)
+        single_region = len(np.unique(regions)) == 1
+        for region in np.unique(regions):
+            for block in np.unique(blocks):
+                in_block = blocks == block
+                test = (regions == region) & in_block
+                train = ~in_block if single_region else (regions != region) & ~in_block
+                block_years = years[in_block]
+                name = f"{region}|{block_years.min()}-{block_years.max()}"
+                folds.append((name, np.flatnonzero(train), np.flatnonzero(test)))
+
+    return [f for f in folds if len(f[1]) > 0 and len(f[2]) > 0]
+
+
+# ========================
+# TRAIN CÁC FOLD SONG SONG
+# ========================
+# Dữ liệu dùng chung trong mỗi worker process (set bởi _init_worker)
+_WORKER = {}
+
+
+def _init_worker(X, y, folds, estimator):
+    _WORKER.update(X=X, y=y, folds=folds, estimator=estimator)
+
+
+def _fit_fold(i: int) -> np.ndarray:
+    """Train fold i trên ma trận features dùng chung, trả về dự báo tập test."""
+    X, y, folds, estimator = _WORKER["X"], _WORKER["y"], _WORKER["folds"], _WORKER["estimator"]
+    _, train_idx, test_idx = folds[i]
+    model = clone(estimator)
+    model.fit(X[train_idx], y[train_idx])
+    return np.asarray(model.predict(X[test_idx]), dtype=np.float64)
+
+
+def cross_validate(dataset, columns: list = None, scheme: str = "blocked", year_block: int = 1,
+                   estimator=None, n_jobs: int = None) -> dict:
+    """
+    Grouped CV trên một PanelDataset.
+
+    Returns:
+        Dict: folds (DataFrame metrics từng fold), predictions (DataFrame dự báo
+        out-of-fold theo hàng), mape, rmse
+    """
+    columns = list(columns or FEATURE_COLUMNS)
+    estimator = estimator if estimator is not None else default_estimator()
+    n_jobs = n_jobs or os.cpu_count() or 1
+
+    X = np.ascontiguousarray(dataset.matrix(columns), dtype=np.float32)
+    y = dataset.target
+    folds = grouped_splits(dataset.regions, dataset.years, scheme, year_block)
+    if not folds:
+        raise ValueError(f"No folds for scheme '{scheme}'")
+
+    init_args = (X, y, folds, estimator)
+    if n_jobs > 1 and len(folds) > 1:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(folds)),
+                                 initializer=_init_worker, initargs=init_args) as pool:
+            predictions = list(pool.map(_fit_fold, range(len(folds))))
+    else:
+        _init_worker(*init_args)
+        predictions = [_fit_fold(i) for i in range(len(folds))]
+
+    rows, oof = [], []
+    for (name, train_idx, test_idx), y_pred in zip(folds, predictions):
+        y_true = y[test_idx]
+        pct = np.abs(y_pred - y_true) / y_true * 100
+        rows.append({
+            "fold": name,
+            "n_train": len(train_idx),
+            "n_test": len(test_idx),
+            "mape": float(pct.mean()),
+            "rmse": float(np.sqrt(np.mean((y_pred - y_true) ** 2))),
+        })
+        oof.append(pd.DataFrame({
+            "fold": name, "region": dataset.regions[test_idx], "year": dataset.years[test_idx],
+            "actual": y_true, "predicted": y_pred,
+        }))
+
+    oof = pd.concat(oof, ignore_index=True)
+    errors = oof["predicted"] - oof["actual"]
+    return {
+        "folds": pd.DataFrame(rows),
+        "predictions": oof,
+        "mape": float((errors.abs() / oof["actual"] * 100).mean()),
+        "rmse": float(np.sqrt((errors ** 2).mean())),
+    }
+
+
+# ========================
+# MAIN
+# ========================
+def main():
+    parser = argparse.ArgumentParser(description="Grouped cross-validation over regions and years")
+    parser.add_argument("--scheme", choices=SCHEMES, default="blocked")
+    parser.add_argument("--year-block", type=int, default=1)
+    parser.add_argument("--n-jobs", type=int, default=None)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"🔬 GROUPED CV ({args.scheme}, year_block={args.year_block})")
+    print("=" * 60)
+
+    dataset = panel.load_panel()
+    print(f"📂 Panel: {len(dataset)} hàng, {len(set(dataset.regions))} vùng, {len(set(dataset.years))} năm")
+
+    result = cross_validate(dataset, scheme=args.scheme, year_block=args.year_block, n_jobs=args.n_jobs)
+    print(result["folds"].to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+    print(f"\n📊 MAPE: {result['mape']:.2f}% | RMSE: {result['rmse']:.4f} ({len(result['folds'])} folds)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+"""
+inference_pipeline.py
+
+Pipeline suy luận hợp nhất (scaler + model) cho API.
+
+Khi export, ensemble cây (XGBoost, CatBoost, RandomForest/DecisionTree/
+GradientBoosting của sklearn) được "biên dịch" thành các mảng numpy phẳng.
+Nếu model được train trên input đã scale, phép biến đổi của scaler được gộp
+thẳng vào threshold của từng split:
+
+    (x - mean) / scale < t   <=>   x < t * scale + mean      (scale > 0)
+
+Nhờ vậy khi serve, model nhận trực tiếp features gốc: không tốn chi phí
+chuẩn hoá cho mỗi request và không thể quên/áp sai scaler so với lúc train.
+
+Lưu ý: scaler được gộp có thể làm kết quả lệch model gốc khi giá trị
+nằm sát threshold trong phạm vi sai số float32 (không đáng kể với dữ liệu thật).
+"""
+
+import os
+import json
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+PIPELINE_FORMAT_VERSION = 1
+
+
+class FusedTreePipeline:
+    """
+    Ensemble cây dạng mảng phẳng: mỗi node có feature, threshold, con trái/phải.
+
+    Node lá có feature = -1 và trỏ về chính nó, nên duyệt đủ `max_depth`
+    bước là mọi mẫu đều dừng ở lá. Dự báo = base_score + tree_scale * Σ leaf.
+    """
+
+    ARRAYS = ("feature", "threshold", "left", "right", "default_left", "value", "roots")
+
+    def __init__(self, feature, threshold, left, right, default_left, value, roots,
+                 base_score, tree_scale, max_depth, strict, feature_columns,
+                 scaler_folded=False, input_float32=True, source=""):
+        self.feature = np.ascontiguousarray(feature, dtype=np.int32)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.left = np.ascontiguousarray(left, dtype=np.int32)
+        self.right = np.ascontiguousarray(right, dtype=np.int32)
+        self.default_left = np.ascontiguousarray(default_left, dtype=bool)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.int32)
+        self.base_score = float(base_score)
+        self.tree_scale = float(tree_scale)
+        self.max_depth = int(max_depth)
+        self.strict = bool(strict)            # True: đi trái khi x < t (XGBoost); False: x <= t
+        self.feature_columns = list(feature_columns)
+        self.scaler_folded = bool(scaler_folded)
+        self.input_float32 = bool(input_float32)
+        self.source = source
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    def predict(self, X) -> np.ndarray:
+        """Dự báo trên features GỐC (không scale), thứ tự cột = feature_columns."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != len(self.feature_columns):
+            raise ValueError(f"Expected {len(self.feature_columns)} features, got {X.shape[1]}")
+        if self.input_float32 and not self.scaler_folded:
+            # Model gốc so sánh trên float32 → làm tròn y hệt để kết quả khớp tuyệt đối
+            X = X.astype(np.float32).astype(np.float64)
+
+        n_rows = X.shape[0]
+        rows = np.arange(n_rows)[:, None]
+        node = np.broadcast_to(self.roots, (n_rows, self.n_trees)).copy()
+
+        for _ in range(self.max_depth):
+            feat = self.feature[node]
+            x = X[rows, np.maximum(feat, 0)]
+            thr = self.threshold[node]
+            go_left = (x < thr) if self.strict else (x <= thr)
+            go_left = np.where(np.isnan(x), self.default_left[node], go_left)
+            node = np.where(go_left, self.left[node], self.right[node])
+
+        return self.base_score + self.tree_scale * self.value[node].sum(axis=1)
+
+    # ========================
+    # LƯU / LOAD (.npz, không dùng pickle)
+    # ========================
+    def meta(self) -> dict:
+        return {
+            "format_version": PIPELINE_FORMAT_VERSION,
+            "base_score": self.base_score,
+            "tree_scale": self.tree_scale,
+            "max_depth": self.max_depth,
+            "strict": self.strict,
+            "feature_columns": self.feature_columns,
+            "scaler_folded": self.scaler_folded,
+            "input_float32": self.input_float32,
+            "source": self.source,
+        }
+
+    def save(self, filepath: Path) -> None:
+        """Lưu pipeline ra file .npz."""
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        with open(filepath, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(self.meta())), **arrays)
+
+    @classmethod
+    def from_arrays(cls, arrays: dict, meta: dict) -> "FusedTreePipeline":
+        if meta.get("format_version") != PIPELINE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported pipeline format: {meta.get('format_version')}")
+        return cls(
+            **{name: arrays[name] for name in cls.ARRAYS},
+            base_score=meta["base_score"],
+            tree_scale=meta["tree_scale"],
+            max_depth=meta["max_depth"],
+            strict=meta["strict"],
+            feature_columns=meta["feature_columns"],
+            scaler_folded=meta["scaler_folded"],
+            input_float32=meta["input_float32"],
+            source=meta["source"],
+        )
+
+    @classmethod
+    def load(cls, filepath: Path) -> "FusedTreePipeline":
+        """Load pipeline từ file .npz."""
+        with np.load(filepath, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            arrays = {name: data[name] for name in cls.ARRAYS}
+        return cls.from_arrays(arrays, meta)
+
+
+# ========================
+# GỘP SCALER VÀO THRESHOLD
+# ========================
+def scaler_affine(scaler, n_features: int):
+    """
+    Biểu diễn scaler dưới dạng x' = a * x + b (theo từng cột).
+    Hỗ trợ StandardScaler, MinMaxScaler, RobustScaler, MaxAbsScaler.
+    """
+    name = type(scaler).__name__
+    ones, zeros = np.ones(n_features), np.zeros(n_features)
+
+    if name == "StandardScaler":
+        mean = scaler.mean_ if getattr(scaler, "mean_", None) is not None else zeros
+        scale = scaler.scale_ if getattr(scaler, "scale_", None) is not None else ones
+        return 1.0 / scale, -mean / scale
+    if name == "MinMaxScaler":
+        return np.asarray(scaler.scale_), np.asarray(scaler.min_)
+    if name == "RobustScaler":
+        center = scaler.center_ if getattr(scaler, "center_", None) is not None else zeros
+        scale = scaler.scale_ if getattr(scaler, "scale_", None) is not None else ones
+        return 1.0 / scale, -center / scale
+    if name == "MaxAbsScaler":
+        return 1.0 / scaler.scale_, zeros
+    raise ValueError(f"Cannot fold scaler of type {name}")
+
+
+def fold_scaler(pipeline: FusedTreePipeline, scaler) -> FusedTreePipeline:
+    """Chuyển threshold từ không gian đã scale về không gian features gốc."""
+    a, b = scaler_affine(scaler, len(pipeline.feature_columns))
+    if np.any(a <= 0):
+        raise ValueError("Scaler with non-positive scale cannot be folded")
+
+    internal = pipeline.feature >= 0
+    feat = pipeline.feature[internal]
+    threshold = pipeline.threshold.copy()
+    threshold[internal] = (pipeline.threshold[internal] - b[feat]) / a[feat]
+
+    pipeline.threshold = threshold
+    pipeline.scaler_folded = True
+    return pipeline
+
+
+# ========================
+# CONVERTERS
+# ========================
+class _TreeBuilder:
+    """Gom các cây vào các mảng node dùng chung."""
+
+    def __init__(self):
+        self.feature, self.threshold, self.left, self.right = [], [], [], []
+        self.default_left, self.value, self.roots = [], [], []
+        self.max_depth = 0
+        self.n_nodes = 0
+
+    def add_tree(self, feature, threshold, left, right, default_left, value):
+        """Thêm một cây (chỉ số node cục bộ, lá có left == -1)."""
+        offset = self.n_nodes
+        n = len(feature)
+        self.n_nodes += n
+        local = np.arange(n)
+        is_leaf = np.asarray(left) < 0
+
+        self.roots.append(offset)
+        self.feature.append(np.where(is_leaf, -1, feature))
+        self.threshold.append(np.where(is_leaf, 0.0, threshold))
+        self.left.append(np.where(is_leaf, local, left) + offset)
+        self.right.append(np.where(is_leaf, local, right) + offset)
+        self.default_left.append(np.asarray(default_left, dtype=bool))
+        self.value.append(np.where(is_leaf, value, 0.0))
+        self.max_depth = max(self.max_depth, _tree_depth(np.asarray(left), np.asarray(right)))
+
+    def build(self, **kwargs) -> FusedTreePipeline:
+        cat = lambda parts: np.concatenate(parts) if parts else np.zeros(0)
+        return FusedTreePipeline(
+            feature=cat(self.feature), threshold=cat(self.threshold),
+            left=cat(self.left), right=cat(self.right),
+            default_left=cat(self.default_left), value=cat(self.value),
+            roots=np.asarray(self.roots), max_depth=self.max_depth, **kwargs
+        )
+
+
+def _tree_depth(left: np.ndarray, right: np.ndarray) -> int:
+    """Độ sâu lớn nhất của cây (root = node 0)."""
+    depth, frontier = 0, [0]
+    while True:
+        children = [c for n in frontier for c in (left[n], right[n]) if c >= 0]
+        if not children:
+            return depth
+        depth += 1
+        frontier = children
+
+
+def _from_sklearn(model, feature_columns) -> FusedTreePipeline:
+    """DecisionTree / RandomForest / ExtraTrees / GradientBoosting của sklearn."""
+    name = type(model).__name__
+    builder = _TreeBuilder()
+    base_score, tree_scale = 0.0, 1.0
+
+    if name == "DecisionTreeRegressor":
+        estimators = [model]
+    elif name in ("RandomForestRegressor", "ExtraTreesRegressor"):
+        estimators = list(model.estimators_)
+        tree_scale = 1.0 / len(estimators)
+    elif name == "GradientBoostingRegressor":
+        if model.init_ == "zero":
+            base_score = 0.0
+        elif hasattr(model.init_, "constant_"):
+            base_score = float(np.ravel(model.init_.constant_)[0])
+        else:
+            raise ValueError("GradientBoostingRegressor with custom init is not supported")
+        estimators = list(model.estimators_[:, 0])
+        tree_scale = model.learning_rate
+    else:
+        raise ValueError(f"Unsupported sklearn model: {name}")
+
+    for est in estimators:
+        tree = est.tree_
+        default_left = getattr(tree, "missing_go_to_left", np.ones(tree.node_count, dtype=bool))
+        builder.add_tree(
+            feature=tree.feature, threshold=tree.threshold,
+            left=tree.children_left, right=tree.children_right,
+            default_left=default_left, value=tree.value[:, 0, 0],
+        )
+
+    return builder.build(base_score=base_score, tree_scale=tree_scale, strict=False,
+                         feature_columns=feature_columns, input_float32=True, source=name)
+
+
+def _parse_xgb_float(value) -> float:
+    """base_score trong JSON của XGBoost: '2.3E0' hoặc '[2.3E0]' (bản mới)."""
+    return float(str(value).strip("[]").split(",")[0])
+
+
+def _from_xgboost(model, feature_columns) -> FusedTreePipeline:
+    """XGBRegressor / Booster (gbtree, objective hồi quy link identity)."""
+    booster = model.get_booster() if hasattr(model, "get_booster") else model
+    dump = json.loads(bytes(booster.save_raw(raw_format="json")))
+    learner = dump["learner"]
+
+    objective = learner["objective"]["name"]
+    if objective not in ("reg:squarederror", "reg:absoluteerror", "reg:pseudohubererror"):
+        raise ValueError(f"Unsupported XGBoost objective: {objective}")
+    gbm = learner["gradient_booster"]
+    if gbm["name"] != "gbtree":
+        raise ValueError(f"Unsupported XGBoost booster: {gbm['name']}")
+
+    builder = _TreeBuilder()
+    for tree in gbm["model"]["trees"]:
+        if any(int(t) != 0 for t in tree.get("split_type", [])):
+            raise ValueError("Categorical XGBoost splits are not supported")
+        # Với node lá, split_conditions chứa giá trị lá
+        builder.add_tree(
+            feature=np.asarray(tree["split_indices"]),
+            threshold=np.asarray(tree["split_conditions"], dtype=np.float64),
+            left=np.asarray(tree["left_children"]),
+            right=np.asarray(tree["right_children"]),
+            default_left=np.asarray(tree["default_left"], dtype=bool),
+            value=np.asarray(tree["split_conditions"], dtype=np.float64),
+        )
+
+    base_score = _parse_xgb_float(learner["learner_model_param"]["base_score"])
+    return builder.build(base_score=base_score, tree_scale=1.0, strict=True,
+                         feature_columns=feature_columns, input_float32=True,
+                         source=type(model).__name__)
+
+
+def _from_catboost(model, feature_columns) -> FusedTreePipeline:
+    """CatBoostRegressor (oblivious trees, chỉ float features) → cây nhị phân đầy đủ."""
+    fd, tmp_path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        model.save_model(tmp_path, format="json")
+        with open(tmp_path, 'r') as f:
+            dump = json.load(f)
+    finally:
+        os.remove(tmp_path)
+
+    flat_index = {
+        ff["feature_index"]: ff.get("flat_feature_index", ff["feature_index"])
+        for ff in dump["features_info"].get("float_features", [])
+    }
+    if dump["features_info"].get("categorical_features"):
+        raise ValueError("CatBoost models with categorical features are not supported")
+
+    builder = _TreeBuilder()
+    for tree in dump["oblivious_trees"]:
+        splits = tree["splits"]
+        leaves = np.asarray(tree["leaf_values"], dtype=np.float64)
+        depth = len(splits)
+        # Node ở tầng k (0 = gốc) quyết định bit k của chỉ số lá: bit = x > border
+        # Đánh số kiểu heap: node i có con 2i+1 (trái, bit 0) và 2i+2 (phải, bit 1)
+        n_internal = 2 ** depth - 1
+        n_nodes = 2 ** (depth + 1) - 1
+        feature = np.full(n_nodes, -1)
+        threshold = np.zeros(n_nodes)
+        left = np.full(n_nodes, -1)
+        right = np.full(n_nodes, -1)
+        value = np.zeros(n_nodes)
+
+        for i in range(n_internal):
+            level = int(np.floor(np.log2(i + 1)))
+            split = splits[level]
+            if split.get("split_type", "FloatFeature") != "FloatFeature":
+                raise ValueError(f"Unsupported CatBoost split: {split.get('split_type')}")
+            feature[i] = flat_index.get(split["float_feature_index"], split["float_feature_index"])
+            threshold[i] = split["border"]
+            left[i], right[i] = 2 * i + 1, 2 * i + 2
+
+        for leaf_pos in range(2 ** depth):
+            node = n_internal + leaf_pos
+            # leaf_pos đọc theo đường đi gốc→lá (bit gốc là bit cao nhất),
+            # còn chỉ số lá CatBoost lấy bit của split đầu tiên làm bit thấp nhất
+            path_bits = [(leaf_pos >> (depth - 1 - level)) & 1 for level in range(depth)]
+            leaf_index = sum(bit << level for level, bit in enumerate(path_bits))
+            value[node] = leaves[leaf_index]
+
+        # NaN mặc định được coi là nhỏ hơn mọi border ("Min") → đi trái
+        builder.add_tree(feature, threshold, left, right, np.ones(n_nodes, dtype=bool), value)
+
+    scale, bias = 1.0, 0.0
+    if "scale_and_bias" in dump:
+        scale, bias_values = dump["scale_and_bias"]
+        bias = float(np.ravel(bias_values)[0]) if np.size(bias_values) else 0.0
+
+    return builder.build(base_score=bias, tree_scale=scale, strict=False,
+                         feature_columns=feature_columns, input_float32=True,
+                         source=type(model).__name__)
+
+
+def compile_pipeline(model, feature_columns, scaler=None, scaled_inputs: bool = False,
+                     X_check=None, atol: float = 1e-4) -> FusedTreePipeline:
+    """
+    Biên dịch model (+ scaler nếu model train trên input đã scale) thành FusedTreePipeline.
+
+    Args:
+        model: XGBoost / CatBoost / sklearn tree ensemble đã train
+        feature_columns: Thứ tự cột features gốc
+        scaler: Scaler đã fit
+        scaled_inputs: True nếu model được train trên scaler.transform(X)
+        X_check: Features gốc để đối chiếu với model gốc trước khi export
+
+    Raises:
+        ValueError nếu model không hỗ trợ hoặc kết quả không khớp model gốc
+    """
+    module = type(model).__module__
+    if module.startswith("xgboost"):
+        pipeline = _from_xgboost(model, feature_columns)
+    elif module.startswith("catboost"):
+        pipeline = _from_catboost(model, feature_columns)
+    elif module.startswith("sklearn"):
+        pipeline = _from_sklearn(model, feature_columns)
+    else:
+        raise ValueError(f"Unsupported model type: {type(model).__name__}")
+
+    if scaled_inputs:
+        if scaler is None:
+            raise ValueError("scaled_inputs=True requires a fitted scaler")
+        fold_scaler(pipeline, scaler)
+
+    if X_check is not None:
+        X_check = np.asarray(X_check, dtype=np.float64)
+        X_model = scaler.transform(X_check) if scaled_inputs else X_check
+        expected = np.asarray(model.predict(X_model), dtype=np.float64)
+        diff = np.max(np.abs(pipeline.predict(X_check) - expected))
+        if diff > atol:
+            raise ValueError(f"Compiled pipeline differs from model by {diff:.2e}")
+
+    return pipeline
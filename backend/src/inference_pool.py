@@ -0,0 +1,161 @@
+"""
+inference_pool.py
+
+Thread pool có giới hạn cho phần suy luận CPU-bound của API, để handler
+`async def` không chặn event loop của uvicorn.
+
+- "inference": predict ngắn (một vài hàng, /predict-custom)
+- "batch":     tính nặng theo lô (Monte Carlo, sensitivity, lưới, nowcast,
+               nhiều vùng), ít worker hơn để không chiếm hết CPU của predict ngắn
+
+Backpressure: mỗi pool nhận tối đa workers + queue task cùng lúc; vượt quá thì
+raise PoolSaturated (API trả 503 + Retry-After) thay vì xếp hàng vô hạn.
+Độ sâu hàng đợi, số worker đang chạy, thời gian chờ và số task bị từ chối được
+xuất qua /metrics.
+
+Kết quả đã cache theo bundle (ServingBundle.cached) được lấy ngay trên event
+loop (run_cached), chỉ khi chưa có mới đẩy sang pool.
+
+numpy/sklearn/XGBoost nhả GIL trong phần tính chính nên thread pool tận dụng
+được nhiều core mà không phải copy model sang process khác.
+"""
+
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from src import metrics, tracing
+    from src.serving import CacheMiss, cache_only
+except ImportError:  # chạy trực tiếp từ thư mục src/
+    import metrics
+    import tracing
+    from serving import CacheMiss, cache_only
+
+# ========================
+# CẤU HÌNH
+# ========================
+_CPUS = os.cpu_count() or 1
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(_CPUS)))
+INFERENCE_QUEUE = int(os.getenv("INFERENCE_QUEUE", str(4 * INFERENCE_WORKERS)))
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", str(max(1, _CPUS // 2))))
+BATCH_QUEUE = int(os.getenv("BATCH_QUEUE", "8"))
+RETRY_AFTER_SECONDS = 1
+
+
+class PoolSaturated(RuntimeError):
+    """Pool đã đủ workers + queue task đang chờ/chạy."""
+
+    def __init__(self, pool: str, limit: int):
+        super().__init__(f"Inference pool '{pool}' is saturated ({limit} tasks in flight), retry later")
+        self.pool = pool
+        self.limit = limit
+
+
+class InferencePool:
+    """ThreadPoolExecutor với giới hạn số task trong hệ thống (đang chạy + đang chờ)."""
+
+    def __init__(self, name: str, workers: int, queue: int):
+        if workers < 1 or queue < 0:
+            raise ValueError("workers must be >= 1 and queue >= 0")
+        self.name = name
+        self.workers = workers
+        self.limit = workers + queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-pool")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._active = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _update_gauges(self) -> None:
+        metrics.POOL_ACTIVE.set(self._active, pool=self.name)
+        metrics.POOL_QUEUE_DEPTH.set(self._in_flight - self._active, pool=self.name)
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._update_gauges()
+
+    def submit(self, func, *args, **kwargs):
+        """Gửi task (concurrent.futures.Future); PoolSaturated nếu pool đầy."""
+        with self._lock:
+            if self._in_flight >= self.limit:
+                metrics.POOL_REJECTED.inc(pool=self.name)
+                raise PoolSaturated(self.name, self.limit)
+            self._in_flight += 1
+            self._update_gauges()
+
+        submitted = time.perf_counter()
+        context = contextvars.copy_context()
+
+        def task():
+            metrics.POOL_WAIT.observe(time.perf_counter() - submitted, pool=self.name)
+            with self._lock:
+                self._active += 1
+                self._update_gauges()
+            try:
+                return context.run(func, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self._active -= 1
+
+        try:
+            future = self._executor.submit(task)
+        except BaseException:
+            self._release(None)
+            raise
+        # Giải phóng chỗ khi task THỰC SỰ xong (kể cả khi request đã bị huỷ)
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, func, *args, **kwargs):
+        """Chạy func trong pool, await kết quả mà không chặn event loop."""
+        with tracing.span(f"pool.{self.name}"):
+            return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    async def run_cached(self, func, *args, **kwargs):
+        """
+        Như run(), nhưng thử trước trên event loop với cache_only(): nếu mọi
+        bundle.cached() bên trong func đều trúng cache thì trả về ngay.
+        Chỉ dùng cho func mà phần tính nặng nằm hết trong bundle.cached().
+        """
+        try:
+            with cache_only():
+                return func(*args, **kwargs)
+        except CacheMiss:
+            return await self.run(func, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+# ========================
+# POOL DÙNG CHUNG CỦA API
+# ========================
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name: str) -> InferencePool:
+    """Pool "inference" hoặc "batch" (tạo lần đầu dùng)."""
+    sizes = {"inference": (INFERENCE_WORKERS, INFERENCE_QUEUE), "batch": (BATCH_WORKERS, BATCH_QUEUE)}
+    if name not in sizes:
+        raise ValueError(f"Unknown pool: {name}. Available: {list(sizes)}")
+    with _pools_lock:
+        if name not in _pools:
+            _pools[name] = InferencePool(name, *sizes[name])
+        return _pools[name]
+
+
+def shutdown_pools() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=False)
@@ -15,6 +15,12 @@ from pathlib import Path
 from xgboost import XGBRegressor
 from sklearn.preprocessing import StandardScaler
 
+try:
+    from src import panel, grouped_cv
+except ImportError:  # chạy trực tiếp: python src/loyo_validation.py
+    import panel
+    import grouped_cv
+
 # ========================
 # CẤU HÌNH
 # ========================
@@ -53,10 +59,7 @@ XGB_PARAMS = {
 
 def load_data():
     """Load và merge features với yield data."""
-    features = pd.read_csv(FEATURES_FILE)
-    yield_data = pd.read_csv(YIELD_FILE)
-    
-    df = features.merge(yield_data[['year', 'yield_ton_ha']], on='year', how='inner')
+    df = panel.load_panel(FEATURES_FILE, YIELD_FILE).to_frame()
     df = df.rename(columns={'yield_ton_ha': 'yield'})
     df = df.sort_values('year').reset_index(drop=True)
     
@@ -67,11 +70,11 @@ def run_loyo_validation():
     """
     Thực hiện Leave-One-Year-Out validation.
     
-    Với mỗi năm y trong dataset:
-    1. Loại bỏ hoàn toàn năm y khỏi training
+    Với mỗi năm y trong dataset (fold "loyo" của grouped_cv):
+    1. Loại bỏ hoàn toàn năm y (mọi vùng) khỏi training
     2. Train model trên tất cả các năm còn lại
-    3. Predict duy nhất năm y
-    4. Ghi lại kết quả
+    3. Predict mọi hàng (vùng) của năm y
+    4. Ghi lại kết quả (nhiều vùng: trung bình theo vùng)
     """
     print("=" * 80)
     print("🔬 LEAVE-ONE-YEAR-OUT (LOYO) VALIDATION")
@@ -80,9 +83,10 @@ def run_loyo_validation():
     # Load data
     print("\n📂 Loading data...")
     df = load_data()
-    years = sorted(df['year'].values)
+    years = sorted(int(y) for y in df['year'].unique())
+    folds = grouped_cv.grouped_splits(df[panel.REGION_COLUMN].values, df['year'].values, "loyo")
     print(f"   Years with yield data: {years}")
-    print(f"   Total years: {len(years)}")
+    print(f"   Total years: {len(years)} ({len(df)} rows)")
     
     # Results storage
     results = []
@@ -90,16 +94,17 @@ def run_loyo_validation():
     print("\n🔄 Running LOYO validation...")
     print("-" * 80)
     
-    for held_out_year in years:
-        # Split: train on all years except held_out_year
-        train_df = df[df['year'] != held_out_year].copy()
-        test_df = df[df['year'] == held_out_year].copy()
+    for _, train_idx, test_idx in folds:
+        # Split: train on all years except held_out_year (mọi vùng)
+        train_df = df.iloc[train_idx]
+        test_df = df.iloc[test_idx]
+        held_out_year = test_df['year'].iloc[0]
         
         # Prepare features
         X_train = train_df[FEATURE_COLUMNS].values
         y_train = train_df['yield'].values
         X_test = test_df[FEATURE_COLUMNS].values
-        y_test = test_df['yield'].values[0]
+        y_true = test_df['yield'].values
         
         # Preprocess: StandardScaler (fit only on training data)
         scaler = StandardScaler()
@@ -110,12 +115,15 @@ def run_loyo_validation():
         model = XGBRegressor(**XGB_PARAMS)
         model.fit(X_train_scaled, y_train)
         
-        # Predict
-        y_pred = model.predict(X_test_scaled)[0]
+        # Predict (mọi vùng của năm bị giữ lại)
+        y_preds = model.predict(X_test_scaled)
         
-        # Calculate errors
-        abs_error = abs(y_pred - y_test)
-        pct_error = (abs_error / y_test) * 100
+        # Calculate errors (theo hàng, rồi trung bình trong năm)
+        abs_errors = np.abs(y_preds - y_true)
+        abs_error = float(abs_errors.mean())
+        pct_error = float((abs_errors / y_true * 100).mean())
+        y_test = float(y_true.mean())
+        y_pred = float(y_preds.mean())
         
         # Store result
         results.append({
@@ -127,7 +135,7 @@ def run_loyo_validation():
         })
         
         # Print progress
-        train_years = [int(y) for y in train_df['year'].values]
+        train_years = train_df['year'].unique()
         print(f"   Year {int(held_out_year)}: Train on {len(train_years)} years → "
               f"Actual={y_test:.2f}, Pred={y_pred:.2f}, Error={pct_error:.2f}%")
     
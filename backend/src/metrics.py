@@ -0,0 +1,312 @@
+"""
+metrics.py
+
+Metrics kiểu Prometheus cho API (định dạng text exposition 0.0.4, không cần
+thư viện ngoài), đọc tại GET /metrics.
+
+- http_requests_total / http_request_duration_seconds: theo route (template
+  đường dẫn, không phải URL thật, để số label không tăng vô hạn)
+- http_requests_in_flight
+- model_inference_seconds / model_inference_rows_total: mỗi lần bundle.predict
+- cache_requests_total: hit/miss của cache bundle, bảng dữ liệu, bundle vùng
+- model_load_seconds: thời gian load + warm-up artifacts
+- inference_batch_*: số hàng / số request mỗi micro-batch và lý do gửi
+  (micro_batch.py)
+- inference_pool_*: hàng đợi, worker đang chạy, thời gian chờ và số task bị
+  từ chối của thread pool suy luận (inference_pool.py)
+- process_resident_memory_bytes, process_cpu_seconds_total
+
+Trên đường nóng mỗi lần ghi chỉ là một bisect + cộng dưới một lock riêng của
+metric; phần tính toán (quantile, định dạng text) chỉ chạy khi /metrics được gọi.
+"""
+
+import os
+import time
+import threading
+from bisect import bisect_left
+
+# ========================
+# CẤU HÌNH
+# ========================
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+LOAD_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name}: expected labels {self.label_names}, got {tuple(labels)}")
+        return tuple(labels[n] for n in self.label_names)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def collect(self) -> list:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Histogram bucket cố định; quantile() nội suy trong bucket như histogram_quantile."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def quantile(self, q: float, **labels) -> float:
+        """Ước lượng quantile từ bucket (NaN nếu chưa có quan sát)."""
+        state = self._values.get(self._key(labels))
+        if not state or state[2] == 0:
+            return float("nan")
+        target = q * state[2]
+        cumulative = 0
+        for i, n in enumerate(state[0]):
+            if cumulative + n >= target and n > 0:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (target - cumulative) / n
+            cumulative += n
+        return self.buckets[-1]
+
+    def collect(self) -> list:
+        with self._lock:
+            items = [(k, (list(s[0]), s[1], s[2])) for k, s in self._values.items()]
+        lines = []
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collect) -> None:
+        """Hàm gọi ngay trước khi render (cập nhật gauge đọc từ hệ thống)."""
+        self._collectors.append(collect)
+
+    def get(self, name: str):
+        return self._metrics[name]
+
+    def render(self) -> str:
+        for collect in self._collectors:
+            collect()
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.header() + metric.collect()
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        for metric in self._metrics.values():
+            metric.clear()
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labels=()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labels))
+
+
+def gauge(name, documentation, labels=()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labels))
+
+
+def histogram(name, documentation, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labels, buckets))
+
+
+# ========================
+# METRICS CỦA SERVICE
+# ========================
+HTTP_REQUESTS = counter("http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+HTTP_LATENCY = histogram("http_request_duration_seconds", "HTTP request latency by route.", ("method", "route"))
+HTTP_IN_FLIGHT = gauge("http_requests_in_flight", "HTTP requests currently being served.")
+INFERENCE_LATENCY = histogram("model_inference_seconds", "Time spent in model predict calls.", ("model",))
+INFERENCE_ROWS = counter("model_inference_rows_total", "Rows passed to model predict calls.", ("model",))
+CACHE_REQUESTS = counter("cache_requests_total", "Cache lookups by cache and result.", ("cache", "result"))
+MODEL_LOAD = histogram("model_load_seconds", "Artifact load + warm-up time per bundle.", ("model",), LOAD_BUCKETS)
+POOL_QUEUE_DEPTH = gauge("inference_pool_queue_depth", "Tasks waiting for a worker thread.", ("pool",))
+POOL_ACTIVE = gauge("inference_pool_active_workers", "Tasks currently running on a worker thread.", ("pool",))
+POOL_WAIT = histogram("inference_pool_wait_seconds", "Time tasks spent queued before running.", ("pool",))
+BATCH_ROWS = histogram("inference_batch_rows", "Rows per micro-batched predict call.", (), BATCH_BUCKETS)
+BATCH_REQUESTS = histogram("inference_batch_requests", "Requests coalesced per micro-batch.", (), BATCH_BUCKETS)
+BATCH_FLUSHES = counter("inference_batch_flush_total", "Micro-batches dispatched by reason.", ("reason",))
+POOL_REJECTED = counter("inference_pool_rejected_total", "Tasks rejected because the pool queue was full.", ("pool",))
+PROCESS_RSS = gauge("process_resident_memory_bytes", "Resident memory size in bytes.")
+PROCESS_CPU = gauge("process_cpu_seconds_total", "Total user and system CPU time in seconds.")
+PROCESS_START = gauge("process_start_time_seconds", "Start time of the process since unix epoch in seconds.")
+PROCESS_START.set(time.time())
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def resident_memory_bytes() -> int:
+    """RSS hiện tại (/proc trên Linux; nơi khác dùng peak RSS của resource)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _collect_process() -> None:
+    PROCESS_RSS.set(resident_memory_bytes())
+    PROCESS_CPU.set(time.process_time())
+
+
+REGISTRY.add_collector(_collect_process)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+# ========================
+# ASGI MIDDLEWARE
+# ========================
+UNMATCHED_ROUTE = "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware thuần (không qua BaseHTTPMiddleware) đo mọi request HTTP.
+    Label route là template của route FastAPI đã khớp.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes = {}
+
+    def _route(self, scope) -> str:
+        route = scope.get("route")
+        if route is not None:
+            return getattr(route, "path", UNMATCHED_ROUTE)
+        # Starlette cũ không ghi scope["route"]: dò lại bảng route (cache theo path)
+        path = scope.get("path", "")
+        if path in self._routes:
+            return self._routes[path]
+        from starlette.routing import Match
+        name = UNMATCHED_ROUTE
+        app = scope.get("app")
+        for candidate in getattr(getattr(app, "router", None), "routes", []):
+            match, _ = candidate.matches(scope)
+            if match == Match.FULL:
+                name = getattr(candidate, "path", UNMATCHED_ROUTE)
+                break
+        if len(self._routes) < 1024:
+            self._routes[path] = name
+        return name
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_FLIGHT.dec()
+            method, route = scope["method"], self._route(scope)
+            HTTP_LATENCY.observe(elapsed, method=method, route=route)
+            HTTP_REQUESTS.inc(method=method, route=route, status=str(status["code"]))
@@ -0,0 +1,151 @@
+"""
+micro_batch.py
+
+Gom các request predict nhỏ đồng thời (ví dụ nhiều /predict-custom một hàng)
+thành MỘT lần bundle.predict trên ma trận ghép, rồi trả từng phần kết quả về
+đúng request.
+
+Một batch (theo bundle) được gửi sang thread pool "inference" khi:
+- đủ MICRO_BATCH_MAX_ROWS hàng, hoặc
+- chờ đủ MICRO_BATCH_MAX_WAIT_MS từ request đầu tiên của batch, hoặc
+- bundle đang không có batch nào chạy (tải thấp: gửi ngay, không thêm độ trễ),
+  hoặc batch trước của bundle vừa chạy xong.
+
+Nên khi tải thấp mỗi request vẫn đi thẳng, còn khi tải cao các request đến
+trong lúc batch trước đang chạy được gom lại. Phân phối kích thước batch và lý
+do gửi được xuất qua /metrics.
+"""
+
+import os
+import asyncio
+import threading
+
+import numpy as np
+
+try:
+    from src import metrics, inference_pool, tracing
+except ImportError:  # chạy trực tiếp từ thư mục src/
+    import metrics
+    import inference_pool
+    import tracing
+
+# ========================
+# CẤU HÌNH
+# ========================
+MICRO_BATCH_ENABLED = os.getenv("MICRO_BATCH", "true").lower() == "true"
+MICRO_BATCH_MAX_ROWS = int(os.getenv("MICRO_BATCH_MAX_ROWS", "64"))
+MICRO_BATCH_MAX_WAIT_MS = float(os.getenv("MICRO_BATCH_MAX_WAIT_MS", "2"))
+
+
+class _Batch:
+    def __init__(self, bundle):
+        self.bundle = bundle
+        self.items = []        # (X, future)
+        self.rows = 0
+        self.timer = None
+
+
+class MicroBatcher:
+    """
+    Gom predict theo bundle trên event loop. Mọi trạng thái chỉ được sửa trên
+    thread của event loop; kết quả từ thread pool quay lại qua call_soon_threadsafe.
+    """
+
+    def __init__(self, max_rows: int = MICRO_BATCH_MAX_ROWS, max_wait_ms: float = MICRO_BATCH_MAX_WAIT_MS,
+                 pool: str = "inference"):
+        if max_rows < 1 or max_wait_ms < 0:
+            raise ValueError("max_rows must be >= 1 and max_wait_ms >= 0")
+        self.max_rows = max_rows
+        self.max_wait = max_wait_ms / 1000
+        self.pool = pool
+        self._batches = {}       # (loop, id(bundle)) -> _Batch đang gom
+        self._running = {}       # (loop, id(bundle)) -> số batch đang chạy
+
+    async def predict(self, bundle, X) -> np.ndarray:
+        """Như bundle.predict(X), nhưng có thể được gộp với request khác."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2:
+            raise ValueError("X must be a 2-D array")
+        loop = asyncio.get_running_loop()
+        key = (loop, id(bundle))
+        future = loop.create_future()
+
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = _Batch(bundle)
+        batch.items.append((X, future))
+        batch.rows += len(X)
+
+        if batch.rows >= self.max_rows:
+            self._flush(key, "size")
+        elif not self._running.get(key):
+            self._flush(key, "idle")
+        elif batch.timer is None:
+            batch.timer = loop.call_later(self.max_wait, self._flush, key, "timeout")
+        return await future
+
+    def _flush(self, key, reason: str) -> None:
+        batch = self._batches.pop(key, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+        loop = key[0]
+
+        items = [(X, f) for X, f in batch.items if not f.cancelled()]
+        if not items:
+            return
+        metrics.BATCH_ROWS.observe(batch.rows)
+        metrics.BATCH_REQUESTS.observe(len(items))
+        metrics.BATCH_FLUSHES.inc(reason=reason)
+
+        stacked = items[0][0] if len(items) == 1 else np.vstack([X for X, _ in items])
+        try:
+            task = inference_pool.get_pool(self.pool).submit(batch.bundle.predict, stacked)
+        except Exception as e:
+            for _, f in items:
+                if not f.done():
+                    f.set_exception(e)
+            return
+        self._running[key] = self._running.get(key, 0) + 1
+        task.add_done_callback(lambda t: loop.call_soon_threadsafe(self._complete, key, items, t))
+
+    def _complete(self, key, items, task) -> None:
+        self._running[key] -= 1
+        if not self._running[key]:
+            del self._running[key]
+        error = task.exception()
+        if error is None:
+            predicted = np.asarray(task.result())
+            offset = 0
+            for X, f in items:
+                if not f.done():
+                    f.set_result(predicted[offset:offset + len(X)])
+                offset += len(X)
+        else:
+            for _, f in items:
+                if not f.done():
+                    f.set_exception(error)
+        # Request đến trong lúc batch này chạy: gửi luôn, không chờ hết hạn
+        if key in self._batches:
+            self._flush(key, "drain")
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher() -> MicroBatcher:
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = MicroBatcher()
+        return _batcher
+
+
+async def predict(bundle, X) -> np.ndarray:
+    """bundle.predict(X) qua micro-batcher (hoặc thẳng thread pool nếu tắt MICRO_BATCH)."""
+    if not MICRO_BATCH_ENABLED:
+        return await inference_pool.get_pool("inference").run(bundle.predict, X)
+    with tracing.span("micro_batch", rows=len(X)):
+        return await get_batcher().predict(bundle, X)
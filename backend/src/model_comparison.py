@@ -19,6 +19,11 @@ from xgboost import XGBRegressor
 from catboost import CatBoostRegressor
 from sklearn.metrics import mean_absolute_error, mean_squared_error
 
+try:
+    from src import model_registry
+except ImportError:  # chạy trực tiếp: python src/model_comparison.py
+    import model_registry
+
 # ========================
 # CẤU HÌNH ĐƯỜNG DẪN
 # ========================
@@ -449,5 +454,34 @@ def run_model_comparison():
     }
 
 
+def train_final_catboost():
+    """
+    Train CatBoost trên toàn bộ các năm có yield và đăng ký vào registry
+    (tên "catboost") để API có thể serve song song với XGBoost.
+    """
+    print("\n🐱 Training final CatBoost model for serving...")
+    
+    features_df = pd.read_csv(FEATURES_FILE)
+    yield_df = pd.read_csv(YIELD_FILE)
+    df = features_df.merge(yield_df[['year', 'yield_ton_ha']], on='year', how='inner')
+    
+    model = CatBoostRegressor(**CAT_PARAMS)
+    model.fit(df[FEATURE_COLUMNS], df['yield_ton_ha'])
+    
+    y_pred = model.predict(df[FEATURE_COLUMNS])
+    mape = calculate_mape(df['yield_ton_ha'].values, y_pred)
+    print(f"   Train MAPE: {mape:.2f}%")
+    
+    # CatBoost train trên features gốc, không scale
+    version = model_registry.register_model(
+        "catboost", model, FEATURE_COLUMNS,
+        metrics={'mape_train': mape},
+        scaled_inputs=False,
+        reference_X=df[FEATURE_COLUMNS].values
+    )
+    return model, version
+
+
 if __name__ == "__main__":
     result = run_model_comparison()
+    train_final_catboost()
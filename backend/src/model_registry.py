@@ -0,0 +1,317 @@
+"""
+model_registry.py
+
+Local model registry cho các model dự báo năng suất cà phê.
+
+Mỗi lần train xong, model được lưu thành một version bất biến:
+
+    models/registry/<name>/<version>/
+        manifest.json          # metadata + sha256 của từng artifact
+        model.pkl
+        feature_columns.json
+        scaler.pkl             (nếu có)
+        shap_values.pkl        (nếu có)
+        pipeline.npz           # scaler + model đã biên dịch (inference_pipeline.py)
+    models/registry/<name>/ACTIVE    # version đang được serve
+
+Chức năng:
+- register_model(): ghi version mới vào thư mục tạm rồi rename (atomic)
+- list_models(), list_versions(), read_manifest()
+- get_active_version(), set_active_version()
+- load_artifacts(): load artifacts và kiểm tra sha256 trước khi dùng
+"""
+
+import os
+import json
+import pickle
+import shutil
+import hashlib
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    from src.inference_pipeline import FusedTreePipeline, compile_pipeline
+except ImportError:  # chạy trực tiếp từ thư mục src/
+    from inference_pipeline import FusedTreePipeline, compile_pipeline
+
+# ========================
+# CẤU HÌNH ĐƯỜNG DẪN
+# ========================
+BASE_DIR = Path(__file__).parent.parent
+MODELS_DIR = BASE_DIR / "models"
+REGISTRY_DIR = Path(os.getenv("MODEL_REGISTRY_DIR", MODELS_DIR / "registry"))
+
+MANIFEST_FILE = "manifest.json"
+ACTIVE_FILE = "ACTIVE"
+
+# Tên file artifact trong mỗi version
+MODEL_ARTIFACT = "model.pkl"
+SCALER_ARTIFACT = "scaler.pkl"
+FEATURE_COLS_ARTIFACT = "feature_columns.json"
+SHAP_ARTIFACT = "shap_values.pkl"
+PIPELINE_ARTIFACT = "pipeline.npz"
+
+
+def _registry_dir(registry_dir=None) -> Path:
+    return Path(registry_dir) if registry_dir is not None else REGISTRY_DIR
+
+
+def _sha256(filepath: Path) -> str:
+    """Tính sha256 của một file."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _version_number(version: str) -> int:
+    """'v12' -> 12 (version không đúng định dạng -> -1)."""
+    try:
+        return int(version.lstrip('v'))
+    except ValueError:
+        return -1
+
+
+def _write_atomic(filepath: Path, text: str) -> None:
+    """Ghi file qua file tạm + os.replace để reader không bao giờ thấy file dở."""
+    tmp = filepath.with_name(f".{filepath.name}.tmp-{os.getpid()}")
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, filepath)
+
+
+# ========================
+# ĐỌC REGISTRY
+# ========================
+def list_models(registry_dir=None) -> list:
+    """Danh sách tên model có trong registry."""
+    root = _registry_dir(registry_dir)
+    if not root.exists():
+        return []
+    return sorted(p.name for p in root.iterdir() if p.is_dir() and not p.name.startswith('.'))
+
+
+def list_versions(name: str, registry_dir=None) -> list:
+    """Danh sách version của một model, sắp xếp từ cũ đến mới."""
+    model_dir = _registry_dir(registry_dir) / name
+    if not model_dir.exists():
+        return []
+    versions = [
+        p.name for p in model_dir.iterdir()
+        if p.is_dir() and not p.name.startswith('.') and (p / MANIFEST_FILE).exists()
+    ]
+    return sorted(versions, key=_version_number)
+
+
+def version_dir(name: str, version: str, registry_dir=None) -> Path:
+    """
+    Thư mục của một version. `name`/`version` (có thể đến từ request) phải là
+    model/version đã liệt kê trong registry, nên không thể trỏ ra ngoài (../..).
+
+    Raises:
+        FileNotFoundError: nếu model hoặc version không có trong registry
+    """
+    if name not in list_models(registry_dir):
+        raise FileNotFoundError(f"Model '{name}' not found in registry")
+    if version not in list_versions(name, registry_dir):
+        raise FileNotFoundError(f"Version not found in registry: {name}/{version}")
+    return _registry_dir(registry_dir) / name / version
+
+
+def get_active_version(name: str, registry_dir=None):
+    """Version đang active (file ACTIVE), nếu không có thì lấy version mới nhất."""
+    if name not in list_models(registry_dir):
+        return None
+    versions = list_versions(name, registry_dir)
+    active_file = _registry_dir(registry_dir) / name / ACTIVE_FILE
+    if active_file.exists():
+        version = active_file.read_text().strip()
+        if version in versions:
+            return version
+    return versions[-1] if versions else None
+
+
+def set_active_version(name: str, version: str, registry_dir=None) -> None:
+    """Đánh dấu version được serve mặc định."""
+    model_dir = version_dir(name, version, registry_dir).parent
+    _write_atomic(model_dir / ACTIVE_FILE, version + "\n")
+
+
+def read_manifest(name: str, version: str, registry_dir=None) -> dict:
+    """Đọc manifest.json của một version."""
+    manifest_file = version_dir(name, version, registry_dir) / MANIFEST_FILE
+    if not manifest_file.exists():
+        raise FileNotFoundError(f"Manifest not found: {manifest_file}")
+    with open(manifest_file, 'r') as f:
+        return json.load(f)
+
+
+# ========================
+# GHI REGISTRY
+# ========================
+def register_model(name: str, model, feature_columns: list, scaler=None, shap_data=None,
+                   metrics: dict = None, features_file=None, scaled_inputs: bool = False,
+                   reference_X=None, activate: bool = True, registry_dir=None) -> str:
+    """
+    Lưu model thành một version mới trong registry.
+
+    Args:
+        name: Tên model (ví dụ: "original", "upgraded")
+        model: Model đã train
+        feature_columns: Thứ tự cột features model nhận vào
+        scaler: Scaler đã fit (tuỳ chọn)
+        shap_data: Dict SHAP values (tuỳ chọn)
+        metrics: Metrics đánh giá để ghi vào manifest
+        features_file: File features dùng khi serve (tương đối so với backend/)
+        scaled_inputs: True nếu model được train trên input đã qua scaler
+        reference_X: Features gốc để kiểm tra pipeline biên dịch khớp model
+        activate: Ghi version mới vào ACTIVE
+
+    Returns:
+        Version vừa tạo (ví dụ: "v3")
+    """
+    model_dir = _registry_dir(registry_dir) / name
+    model_dir.mkdir(parents=True, exist_ok=True)
+
+    existing = [_version_number(v) for v in list_versions(name, registry_dir)]
+    version = f"v{max(existing, default=0) + 1}"
+
+    # Ghi vào thư mục tạm, xong hết mới rename → không bao giờ có version dở dang
+    tmp_dir = model_dir / f".{version}.tmp-{os.getpid()}"
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir()
+
+    try:
+        with open(tmp_dir / MODEL_ARTIFACT, 'wb') as f:
+            pickle.dump(model, f)
+        with open(tmp_dir / FEATURE_COLS_ARTIFACT, 'w') as f:
+            json.dump(list(feature_columns), f, indent=2)
+        if scaler is not None:
+            with open(tmp_dir / SCALER_ARTIFACT, 'wb') as f:
+                pickle.dump(scaler, f)
+        if shap_data is not None:
+            with open(tmp_dir / SHAP_ARTIFACT, 'wb') as f:
+                pickle.dump(shap_data, f)
+
+        # Pipeline hợp nhất: scaler gộp vào threshold, serve trên features gốc
+        try:
+            pipeline = compile_pipeline(model, feature_columns, scaler=scaler,
+                                        scaled_inputs=scaled_inputs, X_check=reference_X)
+            pipeline.save(tmp_dir / PIPELINE_ARTIFACT)
+        except ValueError as e:
+            print(f"   ⚠️ Could not compile inference pipeline: {e}")
+
+        files = {
+            p.name: {"sha256": _sha256(p), "size": p.stat().st_size}
+            for p in sorted(tmp_dir.iterdir())
+        }
+        manifest = {
+            "name": name,
+            "version": version,
+            "created_at": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "model_type": type(model).__name__,
+            "feature_columns": list(feature_columns),
+            "features_file": str(features_file) if features_file is not None else None,
+            "scaled_inputs": bool(scaled_inputs),
+            "pipeline": PIPELINE_ARTIFACT if (tmp_dir / PIPELINE_ARTIFACT).exists() else None,
+            "metrics": {k: float(v) for k, v in (metrics or {}).items()},
+            "files": files,
+        }
+        with open(tmp_dir / MANIFEST_FILE, 'w') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+        os.rename(tmp_dir, model_dir / version)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    if activate:
+        set_active_version(name, version, registry_dir)
+
+    print(f"   ✅ Registered: {name}/{version} ({model_dir / version})")
+    return version
+
+
+# ========================
+# LOAD ARTIFACTS
+# ========================
+def verify_version(name: str, version: str, registry_dir=None) -> dict:
+    """
+    Kiểm tra sha256 của tất cả artifacts so với manifest.
+
+    Raises:
+        ValueError: nếu có file bị thiếu hoặc hash không khớp
+    """
+    manifest = read_manifest(name, version, registry_dir)
+    directory = version_dir(name, version, registry_dir)
+    for filename, info in manifest["files"].items():
+        filepath = directory / filename
+        if not filepath.exists():
+            raise ValueError(f"Missing artifact {filename} in {name}/{version}")
+        if _sha256(filepath) != info["sha256"]:
+            raise ValueError(f"Hash mismatch for {filename} in {name}/{version}")
+    return manifest
+
+
+def load_artifacts(name: str, version: str = None, registry_dir=None) -> dict:
+    """
+    Load tất cả artifacts của một version (mặc định: version active).
+
+    Returns:
+        Dict với các key: manifest, model, scaler, feature_columns, shap_data, pipeline
+    """
+    if version is None:
+        version = get_active_version(name, registry_dir)
+        if version is None:
+            raise FileNotFoundError(f"No versions registered for model '{name}'")
+
+    manifest = verify_version(name, version, registry_dir)
+    directory = version_dir(name, version, registry_dir)
+
+    def _load_pickle(filename):
+        filepath = directory / filename
+        if filename not in manifest["files"]:
+            return None
+        with open(filepath, 'rb') as f:
+            return pickle.load(f)
+
+    with open(directory / FEATURE_COLS_ARTIFACT, 'r') as f:
+        feature_columns = json.load(f)
+
+    pipeline = None
+    if PIPELINE_ARTIFACT in manifest["files"]:
+        pipeline = FusedTreePipeline.load(directory / PIPELINE_ARTIFACT)
+
+    return {
+        "manifest": manifest,
+        "model": _load_pickle(MODEL_ARTIFACT),
+        "scaler": _load_pickle(SCALER_ARTIFACT),
+        "feature_columns": feature_columns,
+        "shap_data": _load_pickle(SHAP_ARTIFACT),
+        "pipeline": pipeline,
+    }
+
+
+def main():
+    """In nội dung registry."""
+    print("=" * 60)
+    print(f"📦 MODEL REGISTRY: {REGISTRY_DIR}")
+    print("=" * 60)
+
+    names = list_models()
+    if not names:
+        print("   (trống)")
+    for name in names:
+        active = get_active_version(name)
+        print(f"\n🔹 {name}")
+        for version in list_versions(name):
+            manifest = read_manifest(name, version)
+            marker = "★" if version == active else " "
+            print(f"   {marker} {version:<6} {manifest['created_at']}  {manifest['model_type']}  "
+                  f"{len(manifest['feature_columns'])} features")
+
+
+if __name__ == "__main__":
+    main()
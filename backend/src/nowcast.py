@@ -0,0 +1,185 @@
+"""
+nowcast.py
+
+Dự báo trong mùa (nowcasting) từ features quan sát một phần.
+
+create_yearly_features() cần đủ các cửa sổ (ví dụ rain_OctDec), nên mùa hiện
+tại chỉ dự báo được sau tháng 12. Nowcaster giữ thống kê tháng đã quan sát của
+mùa hiện tại (SeasonStats, cập nhật O(1) mỗi ngày) và hoàn thiện phần còn lại:
+
+- climatology: phần chưa quan sát = trung bình các năm lịch sử đầy đủ
+- ensemble:    mỗi năm lịch sử đầy đủ cho một "phần còn lại của mùa" → mỗi
+               năm một kịch bản hoàn thiện, giữ nguyên tương quan trong mùa
+
+Ngày đang dở được hoàn thiện theo tỷ lệ số ngày còn lại của tháng. Dự báo được
+cache theo (model version, revision, phương pháp); revision tăng mỗi lần thống
+kê đổi (ngày mới, bản sửa, ngày đến muộn), nên ngày mới đến chỉ cộng thêm vào
+thống kê tháng, không tính lại lịch sử, và không bao giờ trả dự báo cũ.
+"""
+
+import threading
+import calendar
+
+import numpy as np
+import pandas as pd
+
+try:
+    from src.feature_engineering import (
+        WEATHER_DAILY_FILE, SeasonStats, monthly_stats, feature_reference, features_from_monthly,
+    )
+except ImportError:  # chạy trực tiếp từ thư mục src/
+    from feature_engineering import (
+        WEATHER_DAILY_FILE, SeasonStats, monthly_stats, feature_reference, features_from_monthly,
+    )
+
+METHODS = ("ensemble", "climatology")
+DEFAULT_METHOD = "ensemble"
+
+
+class Nowcaster:
+    """Features + dự báo của mùa đang diễn ra, cập nhật theo từng ngày."""
+
+    def __init__(self, daily: pd.DataFrame):
+        years, stats = monthly_stats(daily)
+        self.reference = feature_reference(years, stats)
+
+        last_date = daily["date"].max()
+        complete = (stats["rain_count"] > 0).all(axis=1)
+        if last_date.month == 12 and last_date.day == 31:
+            # Mùa cuối đã đủ → mùa mới chưa có ngày nào
+            self.season = SeasonStats(last_date.year + 1)
+        else:
+            row = int(np.searchsorted(years, last_date.year))
+            self.season = SeasonStats(last_date.year, {k: v[row] for k, v in stats.items()}, last_date)
+            complete[row] = False
+
+        # Phần hoàn thiện lấy từ các năm lịch sử đầy đủ
+        self.history_years = years[complete].astype(int)
+        self.history = {k: v[complete] for k, v in stats.items()}
+        self.climatology = {k: v.mean(axis=0) for k, v in self.history.items()}
+
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._revision = 0
+
+    @property
+    def year(self) -> int:
+        return self.season.year
+
+    @property
+    def as_of(self):
+        return self.season.as_of
+
+    def observe(self, date, record: dict, previous: dict = None) -> None:
+        """
+        Thêm một ngày quan sát (O(1)); sang năm mới thì mở mùa mới.
+        `previous`: bản ghi cũ của cùng ngày khi nguồn gửi lại bản sửa.
+        """
+        date = pd.Timestamp(date)
+        with self._lock:
+            if date.year < self.season.year:
+                return   # ngày thuộc mùa đã đóng: không ảnh hưởng nowcast
+            if date.year > self.season.year:
+                self._close_season()
+                self.season = SeasonStats(date.year)
+            if previous is not None:
+                self.season.remove_day(date, previous)
+            self.season.add_day(date, record)
+            # Thống kê đã đổi (kể cả bản sửa / ngày đến muộn cùng as-of): dự báo cũ hết hạn
+            self._revision += 1
+            self._cache.clear()
+
+    def _close_season(self) -> None:
+        """Mùa vừa kết thúc trở thành một năm lịch sử cho việc hoàn thiện."""
+        if not (self.season.stats["rain_count"] > 0).all():
+            return
+        self.history_years = np.append(self.history_years, self.season.year)
+        self.history = {k: np.vstack([v, self.season.stats[k]]) for k, v in self.history.items()}
+        self.climatology = {k: v.mean(axis=0) for k, v in self.history.items()}
+
+    def _remaining_weights(self) -> np.ndarray:
+        """Tỷ lệ chưa quan sát của từng tháng (1 = cả tháng, 0 = đã xong)."""
+        weights = np.ones(12)
+        as_of = self.season.as_of
+        if as_of is None:
+            return weights
+        m = as_of.month - 1
+        weights[:m] = 0.0
+        days_in_month = calendar.monthrange(as_of.year, as_of.month)[1]
+        weights[m] = (days_in_month - as_of.day) / days_in_month
+        return weights
+
+    def completed_stats(self, method: str = DEFAULT_METHOD) -> dict:
+        """
+        Thống kê tháng đã hoàn thiện: shape (12,) cho climatology,
+        (n_history_years, 12) cho ensemble.
+        """
+        if method not in METHODS:
+            raise ValueError(f"Unknown nowcast method: {method} (expected one of {METHODS})")
+        weights = self._remaining_weights()
+        source = self.climatology if method == "climatology" else self.history
+        return {k: self.season.stats[k] + weights * source[k] for k in self.season.stats}
+
+    def features(self, method: str = DEFAULT_METHOD) -> dict:
+        """Features của mùa hiện tại (mảng theo ensemble hoặc scalar)."""
+        return features_from_monthly(self.completed_stats(method), self.reference)
+
+    def observed_fraction(self) -> float:
+        return float(1.0 - self._remaining_weights().sum() / 12)
+
+    def forecast(self, bundle, method: str = DEFAULT_METHOD) -> dict:
+        """
+        Dự báo as-of cho mùa hiện tại, cache theo (model version, revision, method).
+
+        Feature không tính được từ thời tiết ngày lấy giá trị của năm trong
+        features file nếu có, nếu không thì trung bình lịch sử.
+        """
+        with self._lock:
+            key = (bundle.key, self._revision, method)
+            if key in self._cache:
+                return self._cache[key]
+            features = self.features(method)
+            as_of = self.season.as_of
+            observed = self.observed_fraction()
+
+        store = bundle.feature_store
+        inputs = bundle.inputs[store.row_of(self.year)] if self.year in store else np.nanmean(bundle.inputs, axis=0)
+        fallback = dict(zip(bundle.feature_columns, inputs))
+        n = np.size(next(iter(features.values())))
+        X = np.column_stack([
+            np.broadcast_to(features[c] if c in features else fallback[c], (n,))
+            for c in bundle.feature_columns
+        ])
+        samples = bundle.predict(X)
+
+        result = {
+            "year": self.year,
+            "as_of": as_of.date().isoformat() if as_of is not None else None,
+            "method": method,
+            "observed_fraction": round(observed, 4),
+            "predicted": float(np.median(samples)),
+            "lower": float(np.quantile(samples, 0.1)),
+            "upper": float(np.quantile(samples, 0.9)),
+            "n_members": int(n),
+            "features": {c: float(np.median(X[:, j])) for j, c in enumerate(bundle.feature_columns)},
+        }
+        with self._lock:
+            if self._revision == key[1]:
+                self._cache[key] = result
+        return result
+
+
+# ========================
+# NOWCASTER DÙNG CHUNG (API + ingest)
+# ========================
+_nowcaster = None
+_nowcaster_lock = threading.Lock()
+
+
+def get_nowcaster(filepath=WEATHER_DAILY_FILE) -> Nowcaster:
+    """Nowcaster dựng một lần từ file thời tiết ngày (lazy, thread-safe)."""
+    global _nowcaster
+    with _nowcaster_lock:
+        if _nowcaster is None:
+            _nowcaster = Nowcaster(pd.read_csv(filepath, parse_dates=["date"]))
+        return _nowcaster
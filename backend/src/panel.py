@@ -0,0 +1,195 @@
+"""
+panel.py
+
+Dataset dạng panel (vùng × năm) cho training/validation.
+
+File năng suất có thể ở mức tỉnh (year, area_ha, production_ton, yield_ton_ha)
+hoặc chi tiết theo huyện (thêm cột `region`). Features có thể theo vùng (có cột
+`region`) hoặc chung cho cả tỉnh (chỉ `year`, áp cho mọi vùng).
+
+Thay vì DataFrame.merge lặp lại, mỗi bảng được đánh chỉ mục (vùng, năm) bằng
+một bảng tra dày region_code × (year - year_min) -> số hàng, nên một phép join
+chỉ là một lần tra mảng + np.take.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# ========================
+# CẤU HÌNH
+# ========================
+BASE_DIR = Path(__file__).parent.parent
+FEATURES_FILE = BASE_DIR / "data" / "processed" / "features_yearly.csv"
+YIELD_FILE = BASE_DIR / "data" / "raw" / "coffee_yield_daklak.csv"
+
+REGION_COLUMN = "region"
+DEFAULT_REGION = "Đắk Lắk"      # vùng của file năng suất không có cột region
+TARGET = "yield_ton_ha"
+WEIGHT_COLUMNS = ("area_ha", "production_ton")
+
+
+class KeyIndex:
+    """
+    Chỉ mục (vùng, năm) -> số hàng của một bảng.
+    regions=None: bảng chỉ theo năm (áp cho mọi vùng).
+    """
+
+    def __init__(self, years, regions=None):
+        years = np.asarray(years, dtype=np.int64)
+        if regions is None:
+            self.labels = None
+            codes = np.zeros(len(years), dtype=np.int64)
+        else:
+            self.labels, codes = np.unique(np.asarray(regions, dtype=str), return_inverse=True)
+        self.year_min = int(years.min()) if len(years) else 0
+        n_years = int(years.max()) - self.year_min + 1 if len(years) else 0
+        n_regions = 1 if self.labels is None else len(self.labels)
+
+        self.table = np.full((n_regions, n_years), -1, dtype=np.int64)
+        offsets = years - self.year_min
+        if len(np.unique(codes * max(n_years, 1) + offsets)) != len(years):
+            raise ValueError("Duplicate (region, year) keys")
+        self.table[codes, offsets] = np.arange(len(years))
+
+    def region_codes(self, regions) -> np.ndarray:
+        """Mã vùng trong bảng này (-1 nếu không có)."""
+        regions = np.asarray(regions, dtype=str)
+        if self.labels is None:
+            return np.zeros(len(regions), dtype=np.int64)
+        codes = np.searchsorted(self.labels, regions)
+        codes = np.minimum(codes, len(self.labels) - 1)
+        return np.where(self.labels[codes] == regions, codes, -1)
+
+    def lookup(self, regions, years) -> np.ndarray:
+        """Số hàng của từng (vùng, năm), -1 nếu bảng không có."""
+        codes = self.region_codes(regions)
+        offsets = np.asarray(years, dtype=np.int64) - self.year_min
+        valid = (codes >= 0) & (offsets >= 0) & (offsets < self.table.shape[1])
+        rows = np.full(len(offsets), -1, dtype=np.int64)
+        rows[valid] = self.table[codes[valid], offsets[valid]]
+        return rows
+
+
+def _take(values: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """values[rows], hàng -1 thành NaN."""
+    out = np.take(values.astype(np.float64, copy=False), np.maximum(rows, 0)) if len(values) else \
+        np.full(len(rows), np.nan)
+    out[rows < 0] = np.nan
+    return out
+
+
+def _index_for(table: pd.DataFrame) -> KeyIndex:
+    regions = table[REGION_COLUMN].to_numpy() if REGION_COLUMN in table.columns else None
+    return KeyIndex(table["year"].to_numpy(), regions)
+
+
+class PanelDataset:
+    """
+    Các hàng (vùng, năm) có năng suất, lưu theo cột (mảng numpy).
+
+    Args:
+        regions, years: khoá của từng hàng
+        columns: dict tên cột -> mảng float
+    """
+
+    def __init__(self, regions, years, columns: dict):
+        self.regions = np.asarray(regions, dtype=str)
+        self.years = np.asarray(years, dtype=np.int64)
+        self.columns = {k: np.asarray(v, dtype=np.float64) for k, v in columns.items()}
+        self.index = KeyIndex(self.years, self.regions)
+
+    def __len__(self) -> int:
+        return len(self.years)
+
+    @classmethod
+    def from_yields(cls, yields: pd.DataFrame) -> "PanelDataset":
+        """Panel từ bảng năng suất (mức tỉnh hoặc theo vùng), sắp theo (năm, vùng)."""
+        yields = yields.dropna(subset=[TARGET])
+        regions = yields[REGION_COLUMN].astype(str).to_numpy() if REGION_COLUMN in yields.columns \
+            else np.full(len(yields), DEFAULT_REGION)
+        order = np.lexsort((regions, yields["year"].to_numpy()))
+        columns = {c: yields[c].to_numpy()[order] for c in (TARGET, *WEIGHT_COLUMNS) if c in yields.columns}
+        return cls(regions[order], yields["year"].to_numpy()[order], columns)
+
+    def join(self, table: pd.DataFrame, columns: list = None, how: str = "inner") -> "PanelDataset":
+        """
+        Thêm cột từ `table` theo (vùng, năm) — hoặc chỉ theo năm nếu `table`
+        không có cột region.
+
+        Args:
+            how: "inner" bỏ hàng không có trong table, "left" giữ lại (NaN)
+        """
+        if columns is None:
+            columns = [c for c in table.columns if c not in ("year", REGION_COLUMN)
+                       and pd.api.types.is_numeric_dtype(table[c])]
+        rows = _index_for(table).lookup(self.regions, self.years)
+        joined = {**self.columns, **{c: _take(table[c].to_numpy(), rows) for c in columns}}
+        panel = PanelDataset(self.regions, self.years, joined)
+        return panel.subset(rows >= 0) if how == "inner" else panel
+
+    def subset(self, mask) -> "PanelDataset":
+        return PanelDataset(self.regions[mask], self.years[mask], {k: v[mask] for k, v in self.columns.items()})
+
+    def matrix(self, columns: list) -> np.ndarray:
+        """Ma trận (hàng, len(columns)) float64."""
+        return np.column_stack([self.columns[c] for c in columns]) if columns else np.empty((len(self), 0))
+
+    @property
+    def target(self) -> np.ndarray:
+        return self.columns[TARGET]
+
+    def groups(self, level: str) -> np.ndarray:
+        """Nhãn nhóm cho cross-validation: "region", "year" hoặc "region_year"."""
+        if level == "region":
+            return self.index.region_codes(self.regions)
+        if level == "year":
+            return self.years.copy()
+        if level == "region_year":
+            n_years = self.index.table.shape[1]
+            return self.index.region_codes(self.regions) * n_years + (self.years - self.index.year_min)
+        raise ValueError(f"Invalid group level: {level}")
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({REGION_COLUMN: self.regions, "year": self.years, **self.columns})
+
+    def aggregate(self, columns: list = None, weight: str = "production_ton") -> pd.DataFrame:
+        """
+        Gộp các vùng về mức tỉnh theo năm.
+
+        - Cột trong `columns`: trung bình có trọng số `weight` (mặc định theo sản lượng)
+        - area_ha, production_ton: tổng; yield_ton_ha = tổng sản lượng / tổng diện tích
+          (nếu thiếu diện tích/sản lượng: trung bình có trọng số `weight`)
+        """
+        if weight not in self.columns:
+            raise ValueError(f"Weight column not available: {weight}")
+        columns = list(columns or [])
+        years, codes = np.unique(self.years, return_inverse=True)
+        w = np.nan_to_num(self.columns[weight])
+
+        def weighted_mean(values):
+            ok = ~np.isnan(values)
+            total = np.bincount(codes, weights=np.where(ok, w * np.nan_to_num(values), 0), minlength=len(years))
+            norm = np.bincount(codes, weights=np.where(ok, w, 0), minlength=len(years))
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return np.where(norm > 0, total / norm, np.nan)
+
+        result = {"year": years, "n_regions": np.bincount(codes, minlength=len(years))}
+        for c in WEIGHT_COLUMNS:
+            if c in self.columns:
+                result[c] = np.bincount(codes, weights=np.nan_to_num(self.columns[c]), minlength=len(years))
+        if all(c in result for c in WEIGHT_COLUMNS):
+            with np.errstate(invalid="ignore", divide="ignore"):
+                result[TARGET] = np.where(result["area_ha"] > 0, result["production_ton"] / result["area_ha"],
+                                          np.nan)
+        else:
+            result[TARGET] = weighted_mean(self.target)
+        for c in columns:
+            result[c] = weighted_mean(self.columns[c])
+        return pd.DataFrame(result)
+
+
+def load_panel(features_file=FEATURES_FILE, yield_file=YIELD_FILE, how: str = "inner") -> PanelDataset:
+    """Panel năng suất + features (features theo năm được áp cho mọi vùng)."""
+    return PanelDataset.from_yields(pd.read_csv(yield_file)).join(pd.read_csv(features_file), how=how)
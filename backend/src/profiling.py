@@ -0,0 +1,267 @@
+"""
+profiling.py
+
+Đo từng bước (stage) và từng hàm của pipeline batch (run_pipeline.py):
+wall time, CPU time, bộ nhớ đỉnh (tracemalloc) và số hàng vào/ra.
+
+- Profiler.stage("train"): context manager, lồng nhau được
+- Profiler.instrument(module, ["load_data", ...]): bọc các hàm của module trong
+  lúc chạy (tự khôi phục), mỗi lần gọi thành một span con
+- Profiler.write_trace(): file Chrome trace JSON (mở bằng chrome://tracing
+  hoặc https://ui.perfetto.dev)
+- Tuỳ chọn: cProfile cho từng stage cấp 1 (file .prof, xem bằng snakeviz/pstats)
+  và sampling profiler (stack dạng "folded" cho flamegraph)
+"""
+
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+import functools
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+# ========================
+# CẤU HÌNH
+# ========================
+DEFAULT_SAMPLE_INTERVAL = 0.005   # giây
+
+
+def count_rows(value):
+    """Số hàng của DataFrame/ndarray/Series (tuple: phần tử đầu), None nếu không đo được."""
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    shape = getattr(value, "shape", None)
+    if shape:
+        return int(shape[0])
+    return None
+
+
+class Span:
+    """Một stage hoặc một lần gọi hàm đã đo."""
+
+    def __init__(self, name: str, category: str, depth: int, rows_in=None):
+        self.name = name
+        self.category = category
+        self.depth = depth
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.start = 0.0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_bytes = None
+        self.error = None
+        self._cpu_start = 0.0
+        self._mem_base = 0
+        self._child_peak = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "category": self.category,
+            "depth": self.depth,
+            "wall_s": round(self.wall, 6),
+            "cpu_s": round(self.cpu, 6),
+            "peak_mib": round(self.peak_bytes / 2 ** 20, 3) if self.peak_bytes is not None else None,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "error": self.error,
+        }
+
+
+class Sampler:
+    """
+    Sampling profiler: chụp stack của một thread mỗi `interval` giây, đếm theo
+    stack "folded" (a;b;c N) như flamegraph.pl / speedscope đọc được.
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL, thread_id: int = None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.main_thread().ident
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def write(self, filepath: Path) -> None:
+        filepath = Path(filepath)
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        with open(filepath, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """
+    Args:
+        memory: đo bộ nhớ đỉnh bằng tracemalloc (chậm hơn ~1.5-3x, mặc định bật
+            vì chỉ dùng cho pipeline batch)
+        cprofile_dir: nếu có, chạy cProfile cho từng stage cấp 1 và lưu <stage>.prof
+    """
+
+    def __init__(self, memory: bool = True, cprofile_dir=None):
+        self.memory = memory
+        self.cprofile_dir = Path(cprofile_dir) if cprofile_dir else None
+        self.spans = []
+        self._stack = []
+        self._origin = time.perf_counter()
+        self._started_tracing = False
+
+    # ------------------------
+    # Đo
+    # ------------------------
+    def _enter(self, span: Span) -> None:
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                parent = self._stack[-1]
+                parent._child_peak = max(parent._child_peak, peak)
+            tracemalloc.reset_peak()
+            span._mem_base = current
+        span.start = time.perf_counter()
+        span._cpu_start = time.process_time()
+        self._stack.append(span)
+
+    def _exit(self, span: Span) -> None:
+        span.wall = time.perf_counter() - span.start
+        span.cpu = time.process_time() - span._cpu_start
+        self._stack.pop()
+        if self.memory and tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, span._child_peak)
+            span.peak_bytes = max(peak - span._mem_base, 0)
+            if self._stack:
+                parent = self._stack[-1]
+                parent._child_peak = max(parent._child_peak, peak)
+        self.spans.append(span)
+
+    @contextmanager
+    def stage(self, name: str, rows_in=None, category: str = "stage"):
+        """Đo một stage; gán span.rows_out bên trong khối with nếu cần."""
+        span = Span(name, category, len(self._stack), rows_in)
+        profile = None
+        if self.cprofile_dir is not None and not self._stack:
+            profile = cProfile.Profile()
+        self._enter(span)
+        if profile is not None:
+            profile.enable()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            if profile is not None:
+                profile.disable()
+                self.cprofile_dir.mkdir(parents=True, exist_ok=True)
+                profile.dump_stats(self.cprofile_dir / f"{name}.prof")
+            self._exit(span)
+
+    def function(self, func, name: str = None):
+        """Bọc một hàm: mỗi lần gọi là một span con (rows in/out tự đo)."""
+        label = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            rows_in = count_rows(args[0]) if args else None
+            with self.stage(label, rows_in, category="function") as span:
+                result = func(*args, **kwargs)
+                span.rows_out = count_rows(result)
+                return result
+
+        wrapper.__wrapped_by_profiler__ = True
+        return wrapper
+
+    @contextmanager
+    def instrument(self, module, names: list):
+        """Tạm thay các hàm `names` của `module` bằng bản có đo, khôi phục khi xong."""
+        originals = {}
+        try:
+            for name in names:
+                func = getattr(module, name, None)
+                if callable(func) and not getattr(func, "__wrapped_by_profiler__", False):
+                    originals[name] = func
+                    setattr(module, name, self.function(func, f"{module.__name__}.{name}"))
+            yield self
+        finally:
+            for name, func in originals.items():
+                setattr(module, name, func)
+
+    def close(self) -> None:
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    # ------------------------
+    # Báo cáo
+    # ------------------------
+    def summary(self) -> list:
+        """Các span theo thứ tự bắt đầu."""
+        return [s.as_dict() for s in sorted(self.spans, key=lambda s: (s.start, s.depth))]
+
+    def chrome_trace(self) -> dict:
+        """Sự kiện "complete" (ph=X) theo định dạng Chrome trace."""
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "run_pipeline"}}]
+        for span in sorted(self.spans, key=lambda s: s.start):
+            info = span.as_dict()
+            events.append({
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": round((span.start - self._origin) * 1e6, 1),
+                "dur": round(span.wall * 1e6, 1),
+                "pid": pid,
+                "tid": 1,
+                "args": {k: info[k] for k in ("cpu_s", "peak_mib", "rows_in", "rows_out", "error")
+                         if info[k] is not None},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_trace(self, filepath: Path) -> Path:
+        filepath = Path(filepath)
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        with open(filepath, "w") as f:
+            json.dump(self.chrome_trace(), f)
+        return filepath
+
+    def report(self, max_depth: int = 1) -> str:
+        """Bảng text: stage và hàm (tới độ sâu max_depth)."""
+        lines = [f"{'stage':<48}{'wall s':>9}{'cpu s':>9}{'peak MiB':>10}{'rows in':>9}{'rows out':>9}"]
+        for row in self.summary():
+            if row["depth"] > max_depth:
+                continue
+            name = "  " * row["depth"] + row["name"]
+            peak = f"{row['peak_mib']:.1f}" if row["peak_mib"] is not None else "-"
+            lines.append(f"{name[:47]:<48}{row['wall_s']:>9.3f}{row['cpu_s']:>9.3f}{peak:>10}"
+                         f"{row['rows_in'] if row['rows_in'] is not None else '-':>9}"
+                         f"{row['rows_out'] if row['rows_out'] is not None else '-':>9}")
+        return "\n".join(lines)
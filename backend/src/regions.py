@@ -0,0 +1,282 @@
+"""
+regions.py
+
+Serving theo vùng: registry (tỉnh, cây trồng) -> model + bảng features riêng.
+
+Cấu hình trong data/regions.json (đổi bằng biến môi trường REGIONS_FILE):
+
+    {"regions": [
+        {"province": "Đắk Lắk", "crop": "robusta", "crop_label": "Cà phê Robusta"},
+        {"province": "Gia Lai", "crop": "pepper", "crop_label": "Hồ tiêu",
+         "model": "pepper_gialai", "features_file": "data/processed/features_gialai.csv",
+         "yield_file": "data/raw/pepper_yield_gialai.csv"}
+    ]}
+
+Vùng không khai báo `model` được serve bởi ModelStore mặc định (chia traffic
+A/B như trước). Vùng khác được load lười thành ServingBundle khi có request
+đầu tiên và giữ trong LRU tối đa MAX_RESIDENT_REGIONS bundle. Các vùng dùng
+cùng model (name:version) dùng chung MỘT bộ artifacts (model, scaler,
+pipeline); bảng features dùng chung qua serving.load_table.
+
+predict_regions() dự báo cho mọi vùng trong MỘT lần predict cho mỗi model.
+"""
+
+import os
+import json
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+try:
+    from src import serving, metrics, model_registry
+except ImportError:  # chạy trực tiếp từ thư mục src/
+    import serving
+    import metrics
+    import model_registry
+
+# ========================
+# CẤU HÌNH
+# ========================
+REGIONS_FILE = Path(os.getenv("REGIONS_FILE", serving.BASE_DIR / "data" / "regions.json"))
+MAX_RESIDENT_REGIONS = int(os.getenv("MAX_RESIDENT_REGIONS", "4"))
+
+DEFAULT_PROVINCE = "Đắk Lắk"
+DEFAULT_CROP = "robusta"
+DEFAULT_REGIONS = [
+    {"province": DEFAULT_PROVINCE, "crop": DEFAULT_CROP, "crop_label": "Cà phê Robusta",
+     "latitude": 12.71, "longitude": 108.23},
+]
+
+
+def slugify(text: str) -> str:
+    """'Đắk Lắk' -> 'dak-lak' (bỏ dấu, chữ thường)."""
+    text = text.replace("Đ", "D").replace("đ", "d")
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    return "-".join(text.lower().replace("_", " ").replace("-", " ").split())
+
+
+@dataclass(frozen=True)
+class Region:
+    """Một (tỉnh, cây trồng) và nguồn model/dữ liệu của nó."""
+    province: str
+    crop: str
+    crop_label: str = ""
+    model: Optional[str] = None            # None = ModelStore mặc định
+    version: Optional[str] = None
+    features_file: Optional[str] = None    # đường dẫn tương đối BASE_DIR
+    yield_file: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+    @property
+    def key(self) -> str:
+        return f"{slugify(self.province)}/{slugify(self.crop)}"
+
+    @property
+    def uses_default_store(self) -> bool:
+        return self.model is None
+
+    def as_dict(self) -> dict:
+        return {"key": self.key, **asdict(self)}
+
+
+def load_regions(filepath=REGIONS_FILE) -> list:
+    """Danh sách Region từ file cấu hình (không có file -> chỉ vùng mặc định)."""
+    filepath = Path(filepath)
+    if filepath.exists():
+        with open(filepath, "r", encoding="utf-8") as f:
+            specs = json.load(f)["regions"]
+    else:
+        specs = DEFAULT_REGIONS
+    regions = [Region(**spec) for spec in specs]
+    keys = [r.key for r in regions]
+    duplicates = {k for k in keys if keys.count(k) > 1}
+    if duplicates:
+        raise ValueError(f"Duplicate regions: {sorted(duplicates)}")
+    return regions
+
+
+class RegionRegistry:
+    """
+    Registry vùng + LRU các bundle đang nằm trong bộ nhớ.
+
+    Args:
+        regions: danh sách Region
+        max_resident: số bundle vùng tối đa giữ trong bộ nhớ
+        registry_dir: model registry (mặc định của model_registry)
+    """
+
+    def __init__(self, regions: list, max_resident: int = MAX_RESIDENT_REGIONS, registry_dir=None):
+        if max_resident < 1:
+            raise ValueError("max_resident must be >= 1")
+        self.regions = {r.key: r for r in regions}
+        self.max_resident = max_resident
+        self.registry_dir = registry_dir
+        self._resident = OrderedDict()   # region key -> ServingBundle (cuối = dùng gần nhất)
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._generation = 0             # tăng mỗi lần invalidate: bundle đang load dở bị bỏ
+        self.stats = {"loads": 0, "evictions": 0, "hits": 0}
+
+    def __len__(self) -> int:
+        return len(self.regions)
+
+    def find(self, province: str, crop: str = None) -> Region:
+        """
+        Tìm vùng theo tên tỉnh (không phân biệt dấu/hoa thường) và cây trồng.
+        Không nêu crop: tỉnh phải có đúng một cây trồng.
+
+        Raises:
+            KeyError nếu không có vùng phù hợp
+        """
+        province_slug = slugify(province)
+        matches = [r for r in self.regions.values() if slugify(r.province) == province_slug
+                   and (crop is None or slugify(r.crop) == slugify(crop))]
+        if len(matches) != 1:
+            available = sorted(self.regions)
+            if len(matches) > 1:
+                raise KeyError(f"Province '{province}' has several crops, specify crop. Available: {available}")
+            raise KeyError(f"Region not found: {province}/{crop or '*'}. Available: {available}")
+        return matches[0]
+
+    def resident(self) -> list:
+        with self._lock:
+            return list(self._resident)
+
+    def invalidate(self, name: str) -> int:
+        """
+        Bỏ mọi bundle resident của model `name` (gọi sau khi /admin/reload đổi
+        version): lần hỏi sau load lại theo version active mới.
+        """
+        with self._lock:
+            stale = [key for key, bundle in self._resident.items() if bundle.name == name]
+            for key in stale:
+                del self._resident[key]
+            self._generation += 1
+        return len(stale)
+
+    def _shared_artifacts(self, region: Region):
+        """Artifacts của một bundle đang resident cùng model + version (không load lại model)."""
+        version = region.version or model_registry.get_active_version(region.model, self.registry_dir)
+        with self._lock:
+            for bundle in self._resident.values():
+                if bundle.name == region.model and bundle.version == version:
+                    return {
+                        "manifest": bundle.manifest, "model": bundle.model, "scaler": bundle.scaler,
+                        "feature_columns": bundle.feature_columns, "shap_data": bundle.shap_data,
+                        "pipeline": bundle.pipeline,
+                    }
+        return None
+
+    def bundle(self, region: Region):
+        """
+        Bundle của vùng (load lười, LRU). Vùng dùng ModelStore mặc định không
+        được quản lý ở đây.
+        """
+        if region.uses_default_store:
+            raise ValueError(f"Region {region.key} is served by the default model store")
+        with self._lock:
+            if region.key in self._resident:
+                self._resident.move_to_end(region.key)
+                self.stats["hits"] += 1
+                metrics.record_cache("region", True)
+                return self._resident[region.key]
+            metrics.record_cache("region", False)
+            load_lock = self._load_locks.setdefault(region.key, threading.Lock())
+
+        # Mỗi vùng chỉ load một lần dù nhiều request đến cùng lúc
+        with load_lock:
+            with self._lock:
+                if region.key in self._resident:
+                    self._resident.move_to_end(region.key)
+                    return self._resident[region.key]
+                generation = self._generation
+            base = serving.BASE_DIR
+            bundle = serving.build_bundle(
+                region.model, region.version, self.registry_dir,
+                features_file=base / region.features_file if region.features_file else None,
+                yield_file=base / region.yield_file if region.yield_file else None,
+                artifacts=self._shared_artifacts(region),
+            )
+            with self._lock:
+                self.stats["loads"] += 1
+                if generation != self._generation:
+                    return bundle        # model vừa reload trong lúc load: không giữ bản cũ
+                self._resident[region.key] = bundle
+                while len(self._resident) > self.max_resident:
+                    self._resident.popitem(last=False)
+                    self.stats["evictions"] += 1
+            return bundle
+
+    def describe(self) -> dict:
+        resident = set(self.resident())
+        return {
+            "max_resident": self.max_resident,
+            "stats": dict(self.stats),
+            "regions": [{**r.as_dict(), "resident": r.key in resident} for r in self.regions.values()],
+        }
+
+
+def _feature_row(bundle, year: int):
+    """(năm dùng làm cơ sở, vector features): năm chưa có dữ liệu dùng năm gần nhất."""
+    base_year = year if year in bundle.feature_store else int(bundle.years[-1])
+    return base_year, bundle.input_row(base_year)
+
+
+def predict_regions(items: list, year: int) -> list:
+    """
+    Dự báo năm `year` cho nhiều vùng: gom theo model, mỗi model MỘT lần predict.
+
+    Args:
+        items: danh sách (Region, ServingBundle)
+
+    Returns:
+        Danh sách dict (cùng thứ tự items)
+    """
+    groups = {}
+    for i, (region, bundle) in enumerate(items):
+        groups.setdefault(id(bundle.pipeline) if bundle.pipeline is not None else id(bundle), []).append(i)
+
+    results = [None] * len(items)
+    for indices in groups.values():
+        rows, base_years = [], []
+        for i in indices:
+            base_year, row = _feature_row(items[i][1], year)
+            rows.append(row)
+            base_years.append(base_year)
+        predicted = items[indices[0]][1].predict(np.vstack(rows))
+        for i, base_year, value in zip(indices, base_years, predicted):
+            region, bundle = items[i]
+            results[i] = {
+                "region": region.key,
+                "province": region.province,
+                "crop": region.crop,
+                "crop_label": region.crop_label,
+                "model": bundle.key,
+                "year": int(year),
+                "base_year": base_year,
+                "predicted_yield": float(value),
+                "actual_yield": bundle.actual_yields.get(year),
+            }
+    return results
+
+
+# ========================
+# REGISTRY DÙNG CHUNG (API)
+# ========================
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> RegionRegistry:
+    """Registry vùng dựng một lần từ REGIONS_FILE (lazy, thread-safe)."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = RegionRegistry(load_regions())
+        return _registry
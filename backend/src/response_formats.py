@@ -0,0 +1,140 @@
+"""
+response_formats.py
+
+Content negotiation cho các endpoint trả dữ liệu dạng cột (tên cột -> mảng 1-D
+cùng độ dài), ví dụ /yield-history, /weather-trend.
+
+- json:    orjson serialize thẳng mảng numpy (không qua list Python / pydantic);
+           không có orjson thì endpoint dùng JSON chuẩn của FastAPI như trước
+- msgpack: application/msgpack; mỗi cột là {"dtype", "shape", "data"}, với data là
+           bytes little-endian của mảng (bin, không chuyển từng phần tử).
+           JS: new Float32Array(data.slice().buffer) khi dtype "<f4"
+- arrow:   application/vnd.apache.arrow.stream; một RecordBatch, cột numpy
+           được bọc không copy (pyarrow.ipc.open_stream / apache-arrow trên JS)
+
+Chọn bằng `?format=json|msgpack|arrow` hoặc header Accept (theo q-value);
+mặc định json. Số thiếu (năm chưa có năng suất thực tế) là null trong JSON,
+NaN trong msgpack/arrow.
+"""
+
+import numpy as np
+from fastapi import Response
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    import msgpack
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
+# ========================
+# CẤU HÌNH
+# ========================
+FORMATS = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+MEDIA_TYPES = {
+    "application/json": "json",
+    "application/msgpack": "msgpack",
+    "application/x-msgpack": "msgpack",
+    "application/vnd.apache.arrow.stream": "arrow",
+}
+PACKAGES = {"json": "orjson", "msgpack": "msgpack", "arrow": "pyarrow"}
+FORMAT_PARAM_DESC = "Định dạng response: 'json', 'msgpack' hoặc 'arrow' (mặc định theo header Accept)"
+
+
+def can_encode(fmt: str) -> bool:
+    """encode() dùng được cho `fmt` (json cần orjson)."""
+    return {"json": HAS_ORJSON, "msgpack": HAS_MSGPACK, "arrow": HAS_ARROW}.get(fmt, False)
+
+
+def is_available(fmt: str) -> bool:
+    """Endpoint trả được `fmt` (json luôn được, không có orjson thì qua FastAPI)."""
+    return fmt == "json" or can_encode(fmt)
+
+
+def negotiate(fmt: str = None, accept: str = None) -> str:
+    """
+    Định dạng cho response: `fmt` (tham số ?format=) nếu có, nếu không thì
+    media type khớp đầu tiên trong Accept theo q-value; còn lại là json.
+
+    Raises:
+        ValueError nếu `fmt` không hỗ trợ hoặc thiếu thư viện
+    """
+    if fmt:
+        fmt = fmt.lower()
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format: {fmt}. Available: {list(FORMATS)}")
+        if not is_available(fmt):
+            raise ValueError(f"Format '{fmt}' requires the '{PACKAGES[fmt]}' package")
+        return fmt
+
+    ranked = []
+    for position, item in enumerate((accept or "").split(",")):
+        media, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media and quality > 0:
+            ranked.append((-quality, position, media.lower()))
+    for _, _, media in sorted(ranked):
+        candidate = MEDIA_TYPES.get(media)
+        if candidate is not None and is_available(candidate):
+            return candidate
+    return "json"
+
+
+def _contiguous(columns: dict) -> dict:
+    result = {}
+    for name, values in columns.items():
+        array = np.asarray(values)
+        result[name] = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<"))
+    return result
+
+
+def encode(columns: dict, fmt: str):
+    """Mã hoá các cột theo `fmt`; trả về object hỗ trợ buffer protocol (bytes/pyarrow.Buffer)."""
+    columns = _contiguous(columns)
+    if fmt in FORMATS and not can_encode(fmt):
+        raise ValueError(f"Format '{fmt}' requires the '{PACKAGES[fmt]}' package")
+    if fmt == "json":
+        return orjson.dumps(columns, option=orjson.OPT_SERIALIZE_NUMPY)
+    if fmt == "msgpack":
+        return msgpack.packb({
+            name: {"dtype": array.dtype.str, "shape": list(array.shape), "data": memoryview(array).cast("B")}
+            for name, array in columns.items()
+        })
+    if fmt == "arrow":
+        batch = pa.RecordBatch.from_arrays([pa.array(array) for array in columns.values()], names=list(columns))
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+        return sink.getvalue()
+    raise ValueError(f"Unknown format: {fmt}. Available: {list(FORMATS)}")
+
+
+def response(columns: dict, fmt: str, headers: dict = None) -> Response:
+    """Response đã mã hoá (header Vary: Accept để cache phân biệt theo định dạng)."""
+    body = encode(columns, fmt)
+    if not isinstance(body, bytes):
+        body = memoryview(body)
+    return Response(content=body, media_type=FORMATS[fmt], headers={"Vary": "Accept", **(headers or {})})
@@ -18,6 +18,13 @@ from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 import warnings
 warnings.filterwarnings('ignore')
 
+try:
+    from src import model_registry
+    from src.sensitivity import STRESS_SCENARIOS, stress_tensor
+except ImportError:  # chạy trực tiếp: python src/retrain_upgraded.py
+    import model_registry
+    from sensitivity import STRESS_SCENARIOS, stress_tensor
+
 # ========================
 # CONFIG
 # ========================
@@ -296,70 +303,19 @@ def stress_test():
     print(f"\n📊 Baseline Year: {int(baseline_year['year'].values[0])}")
     print(f"   Baseline Yield: {baseline_pred:.2f} ton/ha")
     
-    # Stress scenarios
-    scenarios = {
-        'Hạn hán nghiêm trọng (Severe Drought)': {
-            'rain_Feb_Mar': -50,  # -50%
-            'soil_Apr_Jun': -0.1,  # absolute reduction
-            'SPEI_MarJun': -1.5,  # drought index
-            'SPI_MarJun': -1.5
-        },
-        'El Niño mạnh (Strong El Niño)': {
-            'ENSO_MarJun': 2.0,  # strong warm phase
-            'rain_Feb_Mar': -30,
-            'temp_max_MayJun': 2.0  # +2°C
-        },
-        'La Niña mạnh (Strong La Niña)': {
-            'ENSO_MarJun': -1.5,  # cold phase
-            'rain_Feb_Mar': 50,  # +50%
-            'rain_OctDec': 50
-        },
-        'Nắng nóng kéo dài (Heat Wave)': {
-            'temp_max_MayJun': 3.0,  # +3°C
-            'days_over_33': 20,  # +20 days
-            'radiation_JunSep': 200  # +200 MJ/m²
-        },
-        'Mưa bất thường (Abnormal Rain Pattern)': {
-            'rain_Feb_Mar': 100,  # +100%
-            'rain_OctDec': -40,  # -40%
-            'humidity_Apr_Jun': 10  # +10%
-        },
-        'Kịch bản tối ưu (Optimal Conditions)': {
-            'rain_Feb_Mar': 20,  # +20%
-            'soil_Apr_Jun': 0.05,
-            'temp_max_MayJun': -1.0,  # -1°C cooler
-            'days_over_33': -10,
-            'SPEI_MarJun': 0.5
-        }
-    }
-    
     print("\n" + "-" * 70)
     print("STRESS TEST RESULTS:")
     print("-" * 70)
     print(f"{'Scenario':<40} {'Yield':>12} {'Change':>12} {'Impact':>10}")
     print("-" * 70)
     
+    # Mọi kịch bản được predict trong một lần gọi (sensitivity.stress_tensor)
+    predict = lambda X: model.predict(scaler.transform(X))
+    stress_preds = stress_tensor(predict, X_baseline.values, available_features, STRESS_SCENARIOS)[0, :, 0]
+    
     stress_results = []
     
-    for scenario_name, changes in scenarios.items():
-        # Apply changes
-        X_stress = X_baseline.copy()
-        
-        for feature, delta in changes.items():
-            if feature in X_stress.columns:
-                original_val = X_stress[feature].values[0]
-                
-                # Percentage change for rainfall
-                if 'rain' in feature.lower() and abs(delta) < 100:
-                    new_val = original_val * (1 + delta/100)
-                else:
-                    new_val = original_val + delta
-                
-                X_stress[feature] = new_val
-        
-        X_stress_scaled = scaler.transform(X_stress)
-        stress_pred = model.predict(X_stress_scaled)[0]
-        
+    for scenario_name, stress_pred in zip(STRESS_SCENARIOS, stress_preds):
         change = stress_pred - baseline_pred
         pct_change = (change / baseline_pred) * 100
         
@@ -496,6 +452,16 @@ def retrain_final_model():
     print(f"✅ Saved: scaler_upgraded.pkl")
     print(f"✅ Saved: feature_columns_upgraded.json")
     
+    # Registry: model này train trên input đã scale
+    model_registry.register_model(
+        "upgraded", model, available_features,
+        scaler=scaler,
+        metrics={'mape_train': mape, 'rmse_train': rmse, 'r2_train': r2},
+        features_file=FEATURES_UPGRADED.relative_to(BASE_DIR),
+        scaled_inputs=True,
+        reference_X=X.values
+    )
+    
     # Feature importance
     importance = pd.DataFrame({
         'feature': available_features,
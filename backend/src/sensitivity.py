@@ -0,0 +1,208 @@
+"""
+sensitivity.py
+
+Phân tích độ nhạy của model theo dạng tensor (vectorized).
+
+Thay vì copy DataFrame rồi predict từng kịch bản, mọi biến thể được dựng
+thành một tensor duy nhất và predict trong MỘT lần gọi:
+
+- stress_tensor():        năm baseline × kịch bản × cường độ
+- ice_curves():           ICE + partial dependence 1-D cho mọi feature
+- partial_dependence_2d(): PD 2-D cho nhiều cặp feature cùng lúc
+
+`predict` là hàm nhận ma trận features GỐC (ví dụ ServingBundle.predict,
+pipeline đã gộp scaler), nên không cần scaler.transform ở đây.
+"""
+
+import numpy as np
+
+# ========================
+# KỊCH BẢN STRESS TEST
+# ========================
+# Biến rain_*: |delta| < 100 là % thay đổi, còn lại cộng trực tiếp (giữ nguyên
+# quy ước của stress_test() trong retrain_upgraded.py)
+STRESS_SCENARIOS = {
+    'Hạn hán nghiêm trọng (Severe Drought)': {
+        'rain_Feb_Mar': -50,  # -50%
+        'soil_Apr_Jun': -0.1,  # absolute reduction
+        'SPEI_MarJun': -1.5,  # drought index
+        'SPI_MarJun': -1.5
+    },
+    'El Niño mạnh (Strong El Niño)': {
+        'ENSO_MarJun': 2.0,  # strong warm phase
+        'rain_Feb_Mar': -30,
+        'temp_max_MayJun': 2.0  # +2°C
+    },
+    'La Niña mạnh (Strong La Niña)': {
+        'ENSO_MarJun': -1.5,  # cold phase
+        'rain_Feb_Mar': 50,  # +50%
+        'rain_OctDec': 50
+    },
+    'Nắng nóng kéo dài (Heat Wave)': {
+        'temp_max_MayJun': 3.0,  # +3°C
+        'days_over_33': 20,  # +20 days
+        'radiation_JunSep': 200  # +200 MJ/m²
+    },
+    'Mưa bất thường (Abnormal Rain Pattern)': {
+        'rain_Feb_Mar': 100,  # +100%
+        'rain_OctDec': -40,  # -40%
+        'humidity_Apr_Jun': 10  # +10%
+    },
+    'Kịch bản tối ưu (Optimal Conditions)': {
+        'rain_Feb_Mar': 20,  # +20%
+        'soil_Apr_Jun': 0.05,
+        'temp_max_MayJun': -1.0,  # -1°C cooler
+        'days_over_33': -10,
+        'SPEI_MarJun': 0.5
+    }
+}
+
+DEFAULT_INTENSITIES = (0.5, 1.0, 1.5, 2.0)
+DEFAULT_GRID_SIZE = 20
+DEFAULT_PAIRS = 3   # số cặp PD 2-D mặc định (từ các feature quan trọng nhất)
+
+
+def scenario_vectors(scenarios: dict, feature_columns: list):
+    """
+    Mỗi kịch bản -> x' = x * mul + add (theo từng cột).
+    Feature không có trong model bị bỏ qua.
+
+    Returns:
+        (mul, add) shape (n_scenarios, n_features)
+    """
+    index = {f: i for i, f in enumerate(feature_columns)}
+    mul = np.ones((len(scenarios), len(feature_columns)))
+    add = np.zeros((len(scenarios), len(feature_columns)))
+    for s, changes in enumerate(scenarios.values()):
+        for feature, delta in changes.items():
+            if feature not in index:
+                continue
+            if 'rain' in feature.lower() and abs(delta) < 100:
+                mul[s, index[feature]] = 1 + delta / 100
+            else:
+                add[s, index[feature]] = delta
+    return mul, add
+
+
+def stress_tensor(predict, X_base, feature_columns: list, scenarios: dict = STRESS_SCENARIOS,
+                  intensities=(1.0,)) -> np.ndarray:
+    """
+    Dự báo cho mọi (năm baseline, kịch bản, cường độ) trong một lần predict.
+
+    Cường độ k nhân độ lớn thay đổi: k=1 đúng kịch bản gốc, k=0 là baseline.
+
+    Returns:
+        Mảng shape (n_base, n_scenarios, n_intensities)
+    """
+    X_base = np.asarray(X_base, dtype=np.float64)
+    mul, add = scenario_vectors(scenarios, feature_columns)
+    k = np.asarray(intensities, dtype=np.float64)[:, None]
+
+    # (n_scen, n_int, n_feat)
+    mul_k = 1 + k[None] * (mul[:, None, :] - 1)
+    add_k = k[None] * add[:, None, :]
+    # (n_base, n_scen, n_int, n_feat)
+    X = X_base[:, None, None, :] * mul_k[None] + add_k[None]
+
+    n_feat = X_base.shape[1]
+    return predict(X.reshape(-1, n_feat)).reshape(X.shape[:3])
+
+
+def feature_grids(X_ref, grid_size: int = DEFAULT_GRID_SIZE) -> np.ndarray:
+    """Lưới đều từ min đến max của từng feature. Shape (n_features, grid_size)."""
+    X_ref = np.asarray(X_ref, dtype=np.float64)
+    lo, hi = np.nanmin(X_ref, axis=0), np.nanmax(X_ref, axis=0)
+    steps = np.linspace(0.0, 1.0, grid_size)
+    return lo[:, None] + (hi - lo)[:, None] * steps[None, :]
+
+
+def ice_curves(predict, X_base, grids: np.ndarray) -> np.ndarray:
+    """
+    ICE cho mọi feature trong một lần predict.
+
+    Returns:
+        Mảng shape (n_features, grid_size, n_base); PD 1-D = mean theo trục cuối
+    """
+    X_base = np.asarray(X_base, dtype=np.float64)
+    n_base, n_feat = X_base.shape
+    grid_size = grids.shape[1]
+
+    X = np.broadcast_to(X_base, (n_feat, grid_size, n_base, n_feat)).copy()
+    idx = np.arange(n_feat)
+    X[idx, :, :, idx] = grids[:, :, None]
+
+    return predict(X.reshape(-1, n_feat)).reshape(n_feat, grid_size, n_base)
+
+
+def partial_dependence_2d(predict, X_base, pairs: list, grids: np.ndarray) -> np.ndarray:
+    """
+    PD 2-D cho nhiều cặp feature (chỉ số cột) trong một lần predict.
+
+    Returns:
+        Mảng shape (n_pairs, grid_size, grid_size): [p, gi, gj] là dự báo trung
+        bình khi feature pairs[p][0] = grids[i, gi] và pairs[p][1] = grids[j, gj]
+    """
+    X_base = np.asarray(X_base, dtype=np.float64)
+    n_base, n_feat = X_base.shape
+    grid_size = grids.shape[1]
+
+    X = np.broadcast_to(X_base, (len(pairs), grid_size, grid_size, n_base, n_feat)).copy()
+    for p, (i, j) in enumerate(pairs):
+        X[p, :, :, :, i] = grids[i][:, None, None]
+        X[p, :, :, :, j] = grids[j][None, :, None]
+
+    preds = predict(X.reshape(-1, n_feat)).reshape(len(pairs), grid_size, grid_size, n_base)
+    return preds.mean(axis=-1)
+
+
+# ========================
+# THEO BUNDLE (cache theo model version qua bundle.cached)
+# ========================
+def _base_matrix(bundle):
+    return np.array(bundle.inputs)
+
+
+def bundle_ice(bundle, grid_size: int = DEFAULT_GRID_SIZE) -> dict:
+    """ICE + PD 1-D cho mọi feature của bundle (cache theo grid_size)."""
+    def compute():
+        X = _base_matrix(bundle)
+        grids = feature_grids(X, grid_size)
+        ice = ice_curves(bundle.predict, X, grids)
+        return {"years": list(bundle.years), "grids": grids, "ice": ice, "pdp": ice.mean(axis=-1)}
+    return bundle.cached(("ice", grid_size), compute)
+
+
+def bundle_pd_2d(bundle, pairs: list = None, grid_size: int = DEFAULT_GRID_SIZE) -> dict:
+    """
+    PD 2-D cho các cặp feature (tên cột). Mặc định: các cặp giữa
+    những feature quan trọng nhất theo bundle.importance.
+    """
+    columns = bundle.feature_columns
+    if pairs is None:
+        top = list(np.argsort(bundle.importance)[::-1][:DEFAULT_PAIRS])
+        pairs = [(columns[a], columns[b]) for n, a in enumerate(top) for b in top[n + 1:]]
+    missing = {f for pair in pairs for f in pair} - set(columns)
+    if missing:
+        raise KeyError(f"Unknown features: {sorted(missing)}")
+    pairs = tuple((a, b) for a, b in pairs)
+
+    def compute():
+        X = _base_matrix(bundle)
+        grids = feature_grids(X, grid_size)
+        index = [(columns.index(a), columns.index(b)) for a, b in pairs]
+        return {"pairs": list(pairs), "grids": grids,
+                "pd": partial_dependence_2d(bundle.predict, X, index, grids)}
+    return bundle.cached(("pd2d", pairs, grid_size), compute)
+
+
+def bundle_stress(bundle, intensities=DEFAULT_INTENSITIES) -> dict:
+    """Stress test mọi kịch bản × cường độ trên tất cả các năm của bundle."""
+    intensities = tuple(float(k) for k in intensities)
+
+    def compute():
+        X = _base_matrix(bundle)
+        baseline = bundle.predict(X)
+        preds = stress_tensor(bundle.predict, X, bundle.feature_columns, STRESS_SCENARIOS, intensities)
+        return {"years": list(bundle.years), "scenarios": list(STRESS_SCENARIOS),
+                "intensities": list(intensities), "baseline": baseline, "predictions": preds}
+    return bundle.cached(("stress", intensities), compute)
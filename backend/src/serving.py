@@ -0,0 +1,549 @@
+"""
+serving.py
+
+Chuẩn bị "serving bundle" cho API: model + scaler + features + các bảng
+tính sẵn, được load và warm-up đầy đủ TRƯỚC khi API chuyển sang dùng.
+
+Một bundle không bao giờ bị sửa sau khi tạo xong. Hot reload = tạo bundle
+mới rồi thay tham chiếu, nên request đang chạy luôn thấy một bundle trọn vẹn.
+
+Nhiều model được serve song song qua ModelStore (key "name:version"),
+chọn theo tham số `model=` hoặc chia traffic theo trọng số (A/B).
+Các bảng dữ liệu chung (features_df, yield_df) chỉ load một lần và được
+các bundle dùng chung. Phần số của bảng features được giữ thêm dạng ma trận
+float32 gọn (feature_store.py) để tra cứu/hiển thị; predict luôn chạy trên ma
+trận float64 (bundle.inputs) như /predict, để cùng một năm không rơi sang nhánh
+khác của split chỉ vì làm tròn float32.
+
+Nguồn model:
+- Model registry (models/registry/<name>/<version>/), xem model_registry.py
+- Fallback: các file legacy models/trained_model.pkl, scaler.pkl, ...
+"""
+
+import os
+import json
+import time
+import random
+import pickle
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    from src import model_registry, analog_years, metrics
+    from src.inference_pipeline import FusedTreePipeline, compile_pipeline
+    from src.feature_store import FeatureStore
+except ImportError:  # chạy trực tiếp từ thư mục src/
+    import model_registry
+    import analog_years
+    import metrics
+    from inference_pipeline import FusedTreePipeline, compile_pipeline
+    from feature_store import FeatureStore
+
+# ========================
+# CẤU HÌNH ĐƯỜNG DẪN
+# ========================
+BASE_DIR = Path(__file__).parent.parent
+DATA_RAW = BASE_DIR / "data" / "raw"
+DATA_PROCESSED = BASE_DIR / "data" / "processed"
+MODELS_DIR = BASE_DIR / "models"
+
+# Legacy model files (trước khi có registry)
+MODEL_FILE = MODELS_DIR / "trained_model.pkl"
+SCALER_FILE = MODELS_DIR / "scaler.pkl"
+FEATURE_COLS_FILE = MODELS_DIR / "feature_columns.json"
+SHAP_VALUES_FILE = MODELS_DIR / "shap_values.pkl"
+
+# Data files
+FEATURES_FILE = DATA_PROCESSED / "features_yearly.csv"
+YIELD_FILE = DATA_RAW / "coffee_yield_daklak.csv"
+
+# Model mặc định được serve (tên trong registry)
+DEFAULT_MODEL_NAME = os.getenv("SERVING_MODEL", "original")
+LEGACY_VERSION = "legacy"
+
+# Các model load lúc startup (bỏ qua model chưa có trong registry)
+# - original: XGBoost/RF 8 features (train_model.py)
+# - upgraded: XGBoost 11 features + NASA/ENSO/SPEI (retrain_upgraded.py)
+# - catboost: CatBoost 8 features (model_comparison.py)
+SERVING_MODELS = [m.strip() for m in os.getenv("SERVING_MODELS", "original,upgraded,catboost").split(",") if m.strip()]
+
+# Chia traffic khi request không chỉ định model, ví dụ: "original=90,upgraded=10"
+MODEL_ROUTES = os.getenv("MODEL_ROUTES", "")
+
+
+_bundle_cache_lock = threading.Lock()
+_cache_only = contextvars.ContextVar("bundle_cache_only", default=False)
+
+
+class CacheMiss(LookupError):
+    """cached() gặp key chưa tính trong khối cache_only()."""
+
+
+@contextmanager
+def cache_only():
+    """
+    Trong khối này, ServingBundle.cached() raise CacheMiss thay vì tính.
+    Dùng để thử lấy kết quả đã cache ngay trên event loop trước khi đẩy
+    phần tính nặng sang thread pool (inference_pool.py).
+    """
+    token = _cache_only.set(True)
+    try:
+        yield
+    finally:
+        _cache_only.reset(token)
+
+
+@dataclass
+class ServingBundle:
+    """Model đã load + các bảng tính sẵn. Coi như read-only sau khi tạo."""
+    name: str
+    version: str
+    model: object
+    scaler: object
+    feature_columns: list
+    shap_data: Optional[dict]
+    features_df: pd.DataFrame
+    yield_df: Optional[pd.DataFrame]
+    manifest: dict = field(default_factory=dict)
+    pipeline: Optional[FusedTreePipeline] = None   # scaler + model đã biên dịch
+    feature_store: Optional[FeatureStore] = None   # float32, thứ tự cột = feature_columns
+    inputs: Optional[np.ndarray] = None            # float64 cho predict, hàng = feature_store.years
+
+    # Bảng tính sẵn (warm-up)
+    years: list = field(default_factory=list)
+    predictions: dict = field(default_factory=dict)        # year -> predicted yield
+    features_by_year: dict = field(default_factory=dict)   # year -> {feature: value} (response JSON)
+    actual_yields: dict = field(default_factory=dict)      # year -> actual yield
+    importance: list = field(default_factory=list)
+    shap_mean_abs: Optional[list] = None
+    loaded_at: str = ""
+    load_seconds: float = 0.0
+    # Kết quả tính lười theo version (sensitivity.py): PDP/ICE, stress test...
+    cache: dict = field(default_factory=dict, repr=False)
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}:{self.version}"
+
+    @property
+    def scaled_inputs(self) -> bool:
+        return bool(self.manifest.get("scaled_inputs", False))
+
+    def cached(self, key, compute):
+        """
+        Kết quả tính lười gắn với version này (tự mất khi bundle bị thay lúc reload).
+        Hai request đồng thời có thể cùng tính, nhưng chỉ một kết quả được giữ.
+        """
+        with _bundle_cache_lock:
+            if key in self.cache:
+                metrics.record_cache("bundle", True)
+                return self.cache[key]
+        if _cache_only.get():
+            raise CacheMiss(key)
+        metrics.record_cache("bundle", False)
+        value = compute()
+        with _bundle_cache_lock:
+            return self.cache.setdefault(key, value)
+
+    def input_row(self, year) -> np.ndarray:
+        """Vector features float64 của một năm (đầu vào predict, thứ tự = feature_columns)."""
+        return self.inputs[self.feature_store.row_of(year)]
+
+    def input_mean(self) -> np.ndarray:
+        """Trung bình từng feature (bỏ NaN) trên ma trận float64."""
+        return np.nanmean(self.inputs, axis=0)
+
+    def predict(self, X) -> np.ndarray:
+        """Predict trên ma trận features GỐC (thứ tự cột = feature_columns)."""
+        start = time.perf_counter()
+        if self.pipeline is not None:
+            predicted = self.pipeline.predict(X)
+        else:
+            # Fallback cho model không biên dịch được: áp scaler theo manifest
+            X = np.asarray(X, dtype=float)
+            if self.scaled_inputs and self.scaler is not None:
+                X = self.scaler.transform(X)
+            predicted = np.asarray(self.model.predict(X), dtype=float)
+        metrics.INFERENCE_LATENCY.observe(time.perf_counter() - start, model=self.name)
+        metrics.INFERENCE_ROWS.inc(len(predicted), model=self.name)
+        return predicted
+
+
+# ========================
+# LOAD DATA
+# ========================
+# Cache bảng dữ liệu theo (path, mtime): các bundle dùng cùng file sẽ dùng
+# chung MỘT DataFrame thay vì mỗi model giữ một bản copy.
+_table_cache = {}
+_table_lock = threading.Lock()
+
+
+def load_table(filepath: Path) -> pd.DataFrame:
+    """Load CSV dùng chung giữa các bundle (không được sửa DataFrame trả về)."""
+    filepath = Path(filepath)
+    mtime = filepath.stat().st_mtime_ns
+    with _table_lock:
+        cached = _table_cache.get(filepath)
+        if cached is not None and cached[0] == mtime:
+            metrics.record_cache("table", True)
+            return cached[1]
+        metrics.record_cache("table", False)
+        df = pd.read_csv(filepath)
+        _table_cache[filepath] = (mtime, df)
+        return df
+
+
+def load_features(filepath: Path = FEATURES_FILE) -> pd.DataFrame:
+    """Load features data."""
+    if not filepath.exists():
+        raise FileNotFoundError(f"Features file not found: {filepath}")
+    return load_table(filepath)
+
+
+_feature_store_cache = {}   # filepath -> (DataFrame nguồn, FeatureStore)
+
+
+def load_feature_store(filepath: Path = FEATURES_FILE) -> FeatureStore:
+    """FeatureStore của cả bảng features, dùng chung như load_table (dựng lại khi file đổi)."""
+    filepath = Path(filepath)
+    df = load_features(filepath)
+    with _table_lock:
+        cached = _feature_store_cache.get(filepath)
+        if cached is not None and cached[0] is df:
+            return cached[1]
+    store = FeatureStore.from_frame(df)
+    with _table_lock:
+        _feature_store_cache[filepath] = (df, store)
+    return store
+
+
+def model_inputs(df: pd.DataFrame, store: FeatureStore) -> np.ndarray:
+    """Ma trận float64 chỉ đọc của `df` theo hàng store.years, cột store.columns."""
+    matrix = df.set_index("year").loc[store.years, list(store.columns)].to_numpy(dtype=np.float64)
+    matrix.flags.writeable = False
+    return matrix
+
+
+def load_yield(filepath: Path = YIELD_FILE):
+    """Load yield data."""
+    if not filepath.exists():
+        return None
+    return load_table(filepath)
+
+
+def _load_legacy_artifacts() -> dict:
+    """Load model từ các file legacy trong models/."""
+    if not MODEL_FILE.exists():
+        raise FileNotFoundError(f"Model file not found: {MODEL_FILE}")
+    with open(MODEL_FILE, 'rb') as f:
+        model = pickle.load(f)
+
+    if not FEATURE_COLS_FILE.exists():
+        raise FileNotFoundError(f"Feature columns file not found: {FEATURE_COLS_FILE}")
+    with open(FEATURE_COLS_FILE, 'r') as f:
+        feature_columns = json.load(f)
+
+    scaler = None
+    if SCALER_FILE.exists():
+        with open(SCALER_FILE, 'rb') as f:
+            scaler = pickle.load(f)
+
+    shap_data = None
+    if SHAP_VALUES_FILE.exists():
+        with open(SHAP_VALUES_FILE, 'rb') as f:
+            shap_data = pickle.load(f)
+
+    # train_model.py train RF/XGB trên features gốc (không scale)
+    manifest = {
+        "name": DEFAULT_MODEL_NAME,
+        "version": LEGACY_VERSION,
+        "model_type": type(model).__name__,
+        "feature_columns": feature_columns,
+        "features_file": None,
+        "scaled_inputs": False,
+    }
+    return {
+        "manifest": manifest,
+        "model": model,
+        "scaler": scaler,
+        "feature_columns": feature_columns,
+        "shap_data": shap_data,
+        "pipeline": None,
+    }
+
+
+# ========================
+# BUILD + WARM BUNDLE
+# ========================
+def warm_bundle(bundle: ServingBundle) -> ServingBundle:
+    """
+    Tính sẵn mọi thứ mà các endpoint cần: dự báo cho tất cả các năm,
+    features theo năm, actual yield, feature importance, SHAP mean |value|,
+    chỉ mục năm tương tự.
+    """
+    if bundle.feature_store is None:
+        bundle.feature_store = FeatureStore.from_frame(bundle.features_df, bundle.feature_columns)
+    features = bundle.feature_store
+    if bundle.inputs is None:
+        bundle.inputs = model_inputs(bundle.features_df, features)
+
+    years = features.years.tolist()
+    predicted = bundle.predict(bundle.inputs)
+
+    bundle.years = years
+    bundle.predictions = {y: float(p) for y, p in zip(years, predicted)}
+    bundle.features_by_year = {y: features.as_dict(y) for y in years}
+
+    if bundle.yield_df is not None:
+        bundle.actual_yields = {
+            int(k): float(v) for k, v in zip(bundle.yield_df['year'], bundle.yield_df['yield_ton_ha'])
+        }
+
+    if hasattr(bundle.model, 'feature_importances_'):
+        bundle.importance = [float(x) for x in bundle.model.feature_importances_]
+    else:
+        bundle.importance = [1.0 / len(bundle.feature_columns)] * len(bundle.feature_columns)
+
+    if bundle.shap_data is not None and 'shap_values' in bundle.shap_data:
+        bundle.shap_mean_abs = [float(x) for x in np.abs(bundle.shap_data['shap_values']).mean(axis=0)]
+
+    # Chỉ mục năm tương tự (dựng lại mỗi lần load/reload)
+    try:
+        analog_years.bundle_index(bundle)
+    except ValueError as e:
+        print(f"   ⚠️ {bundle.key}: analog index unavailable ({e})")
+
+    return bundle
+
+
+def build_bundle(name: str = None, version: str = None, registry_dir=None,
+                 features_file=None, yield_file=None, artifacts: dict = None) -> ServingBundle:
+    """
+    Load một model (registry hoặc legacy) và warm-up đầy đủ.
+
+    Args:
+        name: Tên model trong registry (mặc định: SERVING_MODEL)
+        version: Version cụ thể (mặc định: version active)
+        features_file, yield_file: bảng dữ liệu riêng (ví dụ theo vùng, regions.py)
+        artifacts: artifacts đã load sẵn để dùng chung model giữa các bundle
+
+    Raises:
+        FileNotFoundError/ValueError nếu artifacts không hợp lệ — bundle đang
+        serve (nếu có) vẫn giữ nguyên.
+    """
+    start = time.perf_counter()
+    name = name or DEFAULT_MODEL_NAME
+
+    if artifacts is not None:
+        pass
+    elif name in model_registry.list_models(registry_dir):
+        artifacts = model_registry.load_artifacts(name, version, registry_dir)
+    elif version in (None, LEGACY_VERSION) and name == DEFAULT_MODEL_NAME:
+        artifacts = _load_legacy_artifacts()
+    else:
+        raise FileNotFoundError(f"Model '{name}' not found in registry")
+
+    manifest = artifacts["manifest"]
+    if features_file is None:
+        features_file = FEATURES_FILE
+        if manifest.get("features_file"):
+            features_file = BASE_DIR / manifest["features_file"]
+
+    bundle = ServingBundle(
+        name=manifest["name"],
+        version=manifest["version"],
+        model=artifacts["model"],
+        scaler=artifacts["scaler"],
+        feature_columns=artifacts["feature_columns"],
+        shap_data=artifacts["shap_data"],
+        features_df=load_features(Path(features_file)),  # dùng chung qua load_table
+        yield_df=load_yield(Path(yield_file)) if yield_file is not None else load_yield(),
+        manifest=manifest,
+        pipeline=artifacts["pipeline"],
+        # Ma trận theo thứ tự cột của model, dùng chung giữa các version cùng cột
+        feature_store=load_feature_store(Path(features_file)).select(artifacts["feature_columns"]),
+    )
+    if bundle.pipeline is None:
+        # Version cũ (legacy/registry trước khi có pipeline.npz): biên dịch lúc load
+        try:
+            bundle.pipeline = compile_pipeline(
+                bundle.model, bundle.feature_columns, scaler=bundle.scaler,
+                scaled_inputs=bundle.scaled_inputs,
+                X_check=bundle.features_df[bundle.feature_columns].values
+            )
+        except (ValueError, KeyError) as e:
+            print(f"   ⚠️ {bundle.key}: serving without compiled pipeline ({e})")
+    warm_bundle(bundle)
+
+    bundle.loaded_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    bundle.load_seconds = time.perf_counter() - start
+    metrics.MODEL_LOAD.observe(bundle.load_seconds, model=bundle.name)
+    return bundle
+
+
+def parse_routes(spec: str) -> dict:
+    """'original=90,upgraded=10' -> {'original': 90.0, 'upgraded': 10.0}"""
+    routes = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition("=")
+        routes[name.strip()] = float(weight) if weight.strip() else 1.0
+    return routes
+
+
+# ========================
+# MULTI-MODEL STORE
+# ========================
+@dataclass
+class ModelStats:
+    """Bộ đếm theo model: số request, số dòng dự báo, latency."""
+    requests: int = 0
+    rows: int = 0
+    latency_sum: float = 0.0
+    latency_max: float = 0.0
+
+    def as_dict(self) -> dict:
+        mean_ms = (self.latency_sum / self.requests * 1000) if self.requests else 0.0
+        return {
+            "requests": self.requests,
+            "predictions": self.rows,
+            "latency_mean_ms": round(mean_ms, 4),
+            "latency_max_ms": round(self.latency_max * 1000, 4),
+        }
+
+
+class ModelStore:
+    """
+    Các bundle đang serve, key "name:version".
+
+    Mỗi tên model có một version chính (primary); `get("original")` trả về
+    version chính, `get("original:v2")` trả về đúng version đó. Mọi thay đổi
+    tạo dict mới rồi gán lại (copy-on-write), nên reader không cần lock.
+    """
+
+    def __init__(self, default: str = DEFAULT_MODEL_NAME, routes: dict = None):
+        self.default = default
+        self.routes = dict(routes or {})
+        self._bundles = {}   # "name:version" -> ServingBundle
+        self._primary = {}   # name -> "name:version"
+        self._stats = {}     # "name:version" -> ModelStats
+        self._stats_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._bundles)
+
+    def keys(self) -> list:
+        return list(self._bundles)
+
+    def bundles(self) -> list:
+        return list(self._bundles.values())
+
+    def add(self, bundle: ServingBundle, primary: bool = True, keep_previous: bool = False):
+        """
+        Thêm bundle đã warm-up. Trả về key của version chính trước đó (nếu có).
+        Mặc định version chính cũ bị gỡ, trừ khi keep_previous=True (A/B giữa các version).
+        """
+        bundles = dict(self._bundles)
+        primary_map = dict(self._primary)
+        previous = primary_map.get(bundle.name)
+
+        bundles[bundle.key] = bundle
+        if primary or previous is None:
+            primary_map[bundle.name] = bundle.key
+            if previous and previous != bundle.key and not keep_previous:
+                bundles.pop(previous, None)
+
+        self._primary = primary_map
+        self._bundles = bundles
+        return previous
+
+    def get(self, model: str = None) -> ServingBundle:
+        """
+        Tìm bundle theo "name" hoặc "name:version".
+
+        Raises:
+            KeyError nếu model chưa được load
+        """
+        bundles, primary = self._bundles, self._primary
+        model = model or self.default
+        key = model if ":" in model else primary.get(model)
+        if key is None or key not in bundles:
+            raise KeyError(model)
+        return bundles[key]
+
+    def route(self, rng=random) -> ServingBundle:
+        """Chọn bundle cho request không chỉ định model, theo trọng số MODEL_ROUTES."""
+        candidates, weights = [], []
+        for model, weight in self.routes.items():
+            try:
+                candidates.append(self.get(model))
+                weights.append(weight)
+            except KeyError:
+                continue
+        if candidates and sum(weights) > 0:
+            return rng.choices(candidates, weights=weights, k=1)[0]
+        try:
+            return self.get(self.default)
+        except KeyError:
+            if not self._bundles:
+                raise
+            return next(iter(self._bundles.values()))
+
+    def record(self, key: str, seconds: float, rows: int = 1) -> None:
+        """Ghi nhận một lần predict."""
+        with self._stats_lock:
+            stats = self._stats.setdefault(key, ModelStats())
+            stats.requests += 1
+            stats.rows += rows
+            stats.latency_sum += seconds
+            stats.latency_max = max(stats.latency_max, seconds)
+
+    def describe(self) -> dict:
+        """Trạng thái store: model đang load, version chính, routes, bộ đếm."""
+        with self._stats_lock:
+            stats = {key: s.as_dict() for key, s in self._stats.items()}
+        return {
+            "default": self.default,
+            "routes": self.routes,
+            "models": {
+                key: {
+                    "name": b.name,
+                    "version": b.version,
+                    "primary": self._primary.get(b.name) == key,
+                    "model_type": b.manifest.get("model_type"),
+                    "feature_count": len(b.feature_columns),
+                    "loaded_at": b.loaded_at,
+                    "stats": stats.get(key, ModelStats().as_dict()),
+                }
+                for key, b in self._bundles.items()
+            },
+        }
+
+
+def build_store(names: list = None, registry_dir=None) -> ModelStore:
+    """Load và warm-up tất cả model cần serve lúc startup."""
+    names = names or SERVING_MODELS
+    store = ModelStore(default=DEFAULT_MODEL_NAME, routes=parse_routes(MODEL_ROUTES))
+    available = set(model_registry.list_models(registry_dir))
+
+    for name in dict.fromkeys([DEFAULT_MODEL_NAME] + list(names)):
+        if name not in available and name != DEFAULT_MODEL_NAME:
+            continue
+        try:
+            bundle = build_bundle(name, registry_dir=registry_dir)
+            store.add(bundle)
+            print(f"✅ Model loaded: {bundle.key} ({len(bundle.feature_columns)} features, "
+                  f"warm-up {bundle.load_seconds:.2f}s)")
+        except Exception as e:
+            print(f"⚠️ Could not load model '{name}': {e}")
+
+    return store
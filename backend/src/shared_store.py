@@ -0,0 +1,379 @@
+"""
+shared_store.py
+
+Model store dùng chung, chỉ đọc, cho chạy uvicorn nhiều worker.
+
+Lúc deploy, các bundle đang serve được ghi MỘT lần ra một file nhị phân:
+mảng của pipeline cây đã biên dịch (inference_pipeline.py), ma trận features
+float32 của từng model (feature_store.py), bảng features, bảng năng suất, dự
+báo tính sẵn theo năm, feature importance và SHAP values.
+Mỗi worker chỉ mmap file này (ACCESS_READ) và tạo mảng numpy trỏ thẳng vào
+vùng nhớ đó (np.frombuffer, không copy): các trang nằm trong page cache của
+hệ điều hành và được mọi worker dùng chung, nên N worker tốn bộ nhớ model gần
+như một, và khởi động không phải unpickle model hay đọc CSV.
+
+Định dạng file:
+    MAGIC (8 byte) | độ dài header (uint64 LE) | header JSON | các mảng,
+    mỗi mảng căn lề ALIGNMENT byte; header ghi dtype/shape/offset từng mảng.
+
+Chạy:
+    python src/shared_store.py export --output models/shared_store.bin
+    SHARED_STORE_FILE=models/shared_store.bin uvicorn src.api:app --workers 4
+    python src/shared_store.py benchmark --workers 1,2,4
+"""
+
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import argparse
+import multiprocessing
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    from src import serving, analog_years, metrics
+    from src.inference_pipeline import FusedTreePipeline
+    from src.feature_store import FeatureStore
+except ImportError:  # chạy trực tiếp từ thư mục src/
+    import serving
+    import analog_years
+    import metrics
+    from inference_pipeline import FusedTreePipeline
+    from feature_store import FeatureStore
+
+# ========================
+# CẤU HÌNH
+# ========================
+MAGIC = b"TRIOSHM1"
+STORE_FORMAT_VERSION = 3
+ALIGNMENT = 64
+SHARED_STORE_FILE_ENV = "SHARED_STORE_FILE"
+DEFAULT_STORE_FILE = serving.MODELS_DIR / "shared_store.bin"
+BENCHMARK_MODES = ("registry", "shared")
+DEFAULT_WORKERS = (1, 2, 4)
+
+
+# ========================
+# GHI FILE (LÚC DEPLOY)
+# ========================
+class _Writer:
+    """Gom mảng + mô tả, rồi ghi header và dữ liệu một lượt."""
+
+    def __init__(self):
+        self.arrays = []
+        self.size = 0
+
+    def add(self, array) -> dict:
+        array = np.ascontiguousarray(array)
+        if array.dtype.hasobject:
+            raise ValueError("Object arrays cannot be shared")
+        self.size = -(-self.size // ALIGNMENT) * ALIGNMENT
+        entry = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": self.size}
+        self.arrays.append((self.size, array))
+        self.size += array.nbytes
+        return entry
+
+
+def _table_entry(writer: _Writer, df: pd.DataFrame) -> dict:
+    """Bảng: cột year (int64) + mọi cột số khác thành một ma trận float64 (năm × cột)."""
+    columns = [c for c in df.columns if c != "year" and pd.api.types.is_numeric_dtype(df[c])]
+    return {
+        "columns": columns,
+        "year": writer.add(df["year"].to_numpy(dtype=np.int64)),
+        "values": writer.add(df[columns].to_numpy(dtype=np.float64)),
+    }
+
+
+def export_store(bundles: list, output: Path = DEFAULT_STORE_FILE, primary: set = None) -> Path:
+    """
+    Ghi các bundle (đã warm-up, có pipeline biên dịch) ra file store.
+    Bảng dữ liệu dùng chung giữa các bundle (load_table) chỉ được ghi một lần.
+
+    Args:
+        primary: key các version chính (mặc định: mọi bundle)
+    """
+    writer = _Writer()
+    tables = {}
+    entries = []
+    for bundle in bundles:
+        if bundle.pipeline is None:
+            raise ValueError(f"{bundle.key}: shared store needs a compiled pipeline")
+        names = []
+        for df in (bundle.features_df, bundle.yield_df):
+            if df is None:
+                names.append(None)
+                continue
+            if id(df) not in tables:
+                tables[id(df)] = (f"t{len(tables)}", _table_entry(writer, df))
+            names.append(tables[id(df)][0])
+
+        pipeline = bundle.pipeline
+        arrays = {name: writer.add(getattr(pipeline, name)) for name in FusedTreePipeline.ARRAYS}
+        arrays["predictions"] = writer.add(np.array([bundle.predictions[y] for y in bundle.years]))
+        arrays["years"] = writer.add(np.asarray(bundle.years, dtype=np.int64))
+        arrays["features"] = writer.add(bundle.feature_store.matrix)
+        arrays["inputs"] = writer.add(bundle.inputs)
+        arrays["importance"] = writer.add(np.asarray(bundle.importance, dtype=np.float64))
+        if bundle.shap_data is not None and "shap_values" in bundle.shap_data:
+            arrays["shap_values"] = writer.add(np.asarray(bundle.shap_data["shap_values"], dtype=np.float64))
+        entries.append({
+            "name": bundle.name,
+            "version": bundle.version,
+            "primary": primary is None or bundle.key in primary,
+            "manifest": bundle.manifest,
+            "feature_columns": bundle.feature_columns,
+            "pipeline_meta": pipeline.meta(),
+            "features_table": names[0],
+            "yield_table": names[1],
+            "arrays": arrays,
+        })
+
+    header = json.dumps({
+        "format_version": STORE_FORMAT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "tables": {name: entry for name, entry in tables.values()},
+        "bundles": entries,
+    }).encode("utf-8")
+    data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    tmp = output.with_name(f".{output.name}.tmp-{os.getpid()}")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(header)) + header)
+        for offset, array in writer.arrays:
+            f.seek(data_start + offset)
+            f.write(array.tobytes())
+        f.truncate(data_start + writer.size)
+    os.replace(tmp, output)
+    return output
+
+
+# ========================
+# ATTACH (MỖI WORKER)
+# ========================
+class SharedStore:
+    """File store đã mmap; mọi mảng trả về là view chỉ đọc trên vùng mmap."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not a shared model store: {self.path}")
+        (length,) = struct.unpack_from("<Q", self._mmap, len(MAGIC))
+        start = len(MAGIC) + 8
+        self.header = json.loads(self._mmap[start:start + length].decode("utf-8"))
+        if self.header.get("format_version") != STORE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported store format: {self.header.get('format_version')}")
+        self._data_start = -(-(start + length) // ALIGNMENT) * ALIGNMENT
+        self._tables = {}
+
+    def array(self, entry: dict) -> np.ndarray:
+        dtype = np.dtype(entry["dtype"])
+        count = int(np.prod(entry["shape"])) if entry["shape"] else 1
+        array = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=self._data_start + entry["offset"])
+        return array.reshape(entry["shape"])
+
+    def table(self, name: str) -> pd.DataFrame:
+        """DataFrame trên ma trận mmap (cột số là view, không copy); dùng chung giữa bundle."""
+        if name not in self._tables:
+            entry = self.header["tables"][name]
+            df = pd.DataFrame(self.array(entry["values"]), columns=entry["columns"], copy=False)
+            df.insert(0, "year", self.array(entry["year"]))
+            self._tables[name] = df
+        return self._tables[name]
+
+    @property
+    def keys(self) -> list:
+        return [f"{b['name']}:{b['version']}" for b in self.header["bundles"]]
+
+    def bundle(self, key: str) -> serving.ServingBundle:
+        """Bundle đầy đủ (không cần file model pickle) từ dữ liệu tính sẵn trong store."""
+        start = time.perf_counter()
+        entry = next((b for b in self.header["bundles"] if f"{b['name']}:{b['version']}" == key), None)
+        if entry is None:
+            raise KeyError(f"Model '{key}' not in shared store. Available: {self.keys}")
+        arrays = {name: self.array(a) for name, a in entry["arrays"].items()}
+        pipeline = FusedTreePipeline.from_arrays(arrays, entry["pipeline_meta"])
+        columns = entry["feature_columns"]
+
+        bundle = serving.ServingBundle(
+            name=entry["name"],
+            version=entry["version"],
+            model=None,
+            scaler=None,
+            feature_columns=columns,
+            shap_data={"shap_values": arrays["shap_values"], "feature_names": columns}
+            if "shap_values" in arrays else None,
+            features_df=self.table(entry["features_table"]),
+            yield_df=self.table(entry["yield_table"]) if entry["yield_table"] else None,
+            manifest=entry["manifest"],
+            pipeline=pipeline,
+            feature_store=FeatureStore(arrays["years"], columns, arrays["features"]),   # view trên mmap
+            inputs=arrays["inputs"],
+        )
+        years = [int(y) for y in arrays["years"]]
+        bundle.years = years
+        bundle.predictions = {y: float(p) for y, p in zip(years, arrays["predictions"])}
+        bundle.features_by_year = {y: bundle.feature_store.as_dict(y) for y in years}
+        if bundle.yield_df is not None:
+            bundle.actual_yields = {
+                int(k): float(v) for k, v in zip(bundle.yield_df["year"], bundle.yield_df["yield_ton_ha"])
+            }
+        bundle.importance = [float(x) for x in arrays["importance"]]
+        if bundle.shap_data is not None:
+            bundle.shap_mean_abs = [float(x) for x in np.abs(arrays["shap_values"]).mean(axis=0)]
+        try:
+            analog_years.bundle_index(bundle)
+        except ValueError as e:
+            print(f"   ⚠️ {bundle.key}: analog index unavailable ({e})")
+
+        bundle.loaded_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        bundle.load_seconds = time.perf_counter() - start
+        metrics.MODEL_LOAD.observe(bundle.load_seconds, model=bundle.name)
+        return bundle
+
+
+def build_store(path: Path) -> serving.ModelStore:
+    """ModelStore từ file store (thay cho serving.build_store khi có SHARED_STORE_FILE)."""
+    shared = SharedStore(path)
+    store = serving.ModelStore(default=serving.DEFAULT_MODEL_NAME,
+                               routes=serving.parse_routes(serving.MODEL_ROUTES))
+    for key, entry in zip(shared.keys, shared.header["bundles"]):
+        bundle = shared.bundle(key)
+        store.add(bundle, primary=entry["primary"], keep_previous=True)
+        print(f"✅ Model attached: {bundle.key} ({len(bundle.feature_columns)} features, shared store)")
+    return store
+
+
+# ========================
+# BENCHMARK BỘ NHỚ THEO SỐ WORKER
+# ========================
+def process_memory(pid: int) -> dict:
+    """RSS/PSS/private/shared (MiB) của một process từ /proc/<pid>/smaps_rollup (Linux)."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[-1] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss_mib": values.get("Rss", 0.0),
+        "pss_mib": values.get("Pss", 0.0),
+        "private_mib": values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0),
+        "shared_mib": values.get("Shared_Clean", 0.0) + values.get("Shared_Dirty", 0.0),
+    }
+
+
+def _benchmark_worker(mode: str, path: str, registry_dir, ready, done) -> None:
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            if mode == "shared":
+                store = build_store(Path(path))
+            else:
+                store = serving.build_store(registry_dir=registry_dir)
+        finally:
+            sys.stdout = stdout
+    # Chạm toàn bộ model như khi serve thật
+    for bundle in store.bundles():
+        bundle.predict(bundle.inputs)
+    ready.put((os.getpid(), time.perf_counter() - start, len(store)))
+    done.wait()
+
+
+def benchmark_memory(path: Path, workers=DEFAULT_WORKERS, modes=BENCHMARK_MODES, registry_dir=None) -> dict:
+    """
+    Khởi động N worker (spawn) cho mỗi chế độ: "registry" (mỗi worker load
+    pickle + CSV như hiện tại) và "shared" (attach file store), đo bộ nhớ khi
+    tất cả đã sẵn sàng.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for mode in modes:
+        if mode not in BENCHMARK_MODES:
+            raise ValueError(f"Invalid mode: {mode}. Available: {list(BENCHMARK_MODES)}")
+        results[mode] = {}
+        for n in workers:
+            ready, done = context.Queue(), context.Event()
+            processes = [context.Process(target=_benchmark_worker, args=(mode, str(path), registry_dir, ready, done))
+                         for _ in range(n)]
+            for p in processes:
+                p.start()
+            try:
+                started = [ready.get(timeout=300) for _ in processes]
+                memory = [process_memory(pid) for pid, _, _ in started]
+            finally:
+                done.set()
+                for p in processes:
+                    p.join(timeout=30)
+            results[mode][f"w{n}"] = {
+                "workers": n,
+                "models": started[0][2],
+                "total_pss_mib": round(sum(m["pss_mib"] for m in memory), 1),
+                "total_rss_mib": round(sum(m["rss_mib"] for m in memory), 1),
+                "private_mib_per_worker": round(float(np.mean([m["private_mib"] for m in memory])), 1),
+                "startup_s": round(float(np.mean([s for _, s, _ in started])), 3),
+            }
+    return results
+
+
+def print_benchmark(results: dict) -> None:
+    print(f"\n   {'mode':<10}{'workers':>8}{'PSS MiB':>10}{'RSS MiB':>10}{'private/worker':>16}{'startup s':>11}")
+    for mode, levels in results.items():
+        for stats in levels.values():
+            print(f"   {mode:<10}{stats['workers']:>8}{stats['total_pss_mib']:>10}{stats['total_rss_mib']:>10}"
+                  f"{stats['private_mib_per_worker']:>16}{stats['startup_s']:>11}")
+
+
+# ========================
+# MAIN
+# ========================
+def main():
+    parser = argparse.ArgumentParser(description="Shared read-only model store for multi-worker serving")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Ghi các model đang serve ra file store")
+    export.add_argument("--output", type=Path, default=DEFAULT_STORE_FILE)
+    export.add_argument("--models", default=None, help="Danh sách model, cách nhau bởi dấu phẩy")
+    bench = sub.add_parser("benchmark", help="So sánh bộ nhớ registry vs shared theo số worker")
+    bench.add_argument("--store", type=Path, default=DEFAULT_STORE_FILE)
+    bench.add_argument("--workers", default=",".join(str(n) for n in DEFAULT_WORKERS))
+    bench.add_argument("--output", type=Path, default=None, help="Lưu kết quả JSON")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print("=" * 60)
+        print("📦 EXPORT SHARED MODEL STORE")
+        print("=" * 60)
+        names = args.models.split(",") if args.models else None
+        store = serving.build_store(names)
+        if len(store) == 0:
+            raise SystemExit("❌ No model loaded, train or register a model first")
+        primary = {store.get(name).key for name in {b.name for b in store.bundles()}}
+        output = export_store(store.bundles(), args.output, primary)
+        print(f"💾 Saved: {output} ({output.stat().st_size / 2 ** 20:.2f} MiB, {len(store)} models)")
+        return
+
+    print("=" * 60)
+    print("🧠 MEMORY BENCHMARK: REGISTRY vs SHARED STORE")
+    print("=" * 60)
+    workers = tuple(int(n) for n in args.workers.split(","))
+    results = benchmark_memory(args.store, workers)
+    print_benchmark(results)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({"store": str(args.store), "results": results}, f, indent=2)
+        print(f"\n💾 Saved: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+source_store.py
+
+Kho dữ liệu nguồn offline, có version, cho các nguồn bên ngoài (data_sources.py).
+
+Mỗi lần fetch thành công được lưu thành một version bất biến:
+
+    data/sources/<source>/<version>/
+        manifest.json      # thời điểm fetch, khoảng năm, base_url, sha256 từng artifact
+        raw.json.gz        # payload thô (theo thứ tự request của adapter)
+        table.csv          # bảng đã parse
+    data/sources/<source>/LATEST
+
+Payload giống hệt version mới nhất thì không tạo version mới. Khi nguồn lỗi
+(hoặc chạy offline), bản mới nhất trong kho được load ngay, không refetch
+và không bịa dữ liệu. Mỗi kết quả kèm provenance:
+
+- live:    vừa fetch thành công
+- cached:  snapshot còn mới (trong max_age), không cần gọi API
+- offline: chạy offline, dùng snapshot mới nhất (cũ hơn max_age)
+- stale:   fetch lỗi, dùng snapshot mới nhất
+"""
+
+import os
+import gzip
+import json
+import shutil
+import hashlib
+import asyncio
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    from src import data_sources
+except ImportError:  # chạy trực tiếp từ thư mục src/
+    import data_sources
+
+# ========================
+# CẤU HÌNH ĐƯỜNG DẪN
+# ========================
+BASE_DIR = Path(__file__).parent.parent
+STORE_DIR = Path(os.getenv("SOURCE_STORE_DIR", BASE_DIR / "data" / "sources"))
+
+MANIFEST_FILE = "manifest.json"
+LATEST_FILE = "LATEST"
+RAW_ARTIFACT = "raw.json.gz"
+TABLE_ARTIFACT = "table.csv"
+
+FRESH_STATUSES = ("live", "cached")
+# Cột provenance trong file features (không phải feature của model)
+PROVENANCE_PREFIX = "src_"
+
+
+def _store_dir(store_dir=None) -> Path:
+    return Path(store_dir) if store_dir is not None else STORE_DIR
+
+
+def _sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _version_number(version: str) -> int:
+    try:
+        return int(version.lstrip('v'))
+    except ValueError:
+        return -1
+
+
+def _write_atomic(filepath: Path, text: str) -> None:
+    tmp = filepath.with_name(f".{filepath.name}.tmp-{os.getpid()}")
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, filepath)
+
+
+# ========================
+# ĐỌC KHO
+# ========================
+def list_versions(source: str, store_dir=None) -> list:
+    """Các version của một nguồn, từ cũ đến mới."""
+    source_dir = _store_dir(store_dir) / source
+    if not source_dir.exists():
+        return []
+    versions = [p.name for p in source_dir.iterdir()
+                if p.is_dir() and not p.name.startswith('.') and (p / MANIFEST_FILE).exists()]
+    return sorted(versions, key=_version_number)
+
+
+def latest_version(source: str, store_dir=None):
+    """Version mới nhất (file LATEST), None nếu kho chưa có nguồn này."""
+    source_dir = _store_dir(store_dir) / source
+    latest_file = source_dir / LATEST_FILE
+    if latest_file.exists():
+        version = latest_file.read_text().strip()
+        if (source_dir / version / MANIFEST_FILE).exists():
+            return version
+    versions = list_versions(source, store_dir)
+    return versions[-1] if versions else None
+
+
+def read_manifest(source: str, version: str, store_dir=None) -> dict:
+    manifest_file = _store_dir(store_dir) / source / version / MANIFEST_FILE
+    if not manifest_file.exists():
+        raise FileNotFoundError(f"Snapshot not found: {source}/{version}")
+    with open(manifest_file, 'r') as f:
+        return json.load(f)
+
+
+def _verified(path: Path, manifest: dict, artifact: str) -> bytes:
+    data = path.read_bytes()
+    if _sha256_bytes(data) != manifest["artifacts"][artifact]:
+        raise ValueError(f"Checksum mismatch: {path}")
+    return data
+
+
+def load_snapshot(source: str, version: str = None, store_dir=None):
+    """
+    Bảng đã parse của một snapshot (mặc định: mới nhất), kiểm tra sha256.
+
+    Returns:
+        (table, manifest)
+    """
+    version = version or latest_version(source, store_dir)
+    if version is None:
+        raise FileNotFoundError(f"No snapshot stored for source: {source}")
+    manifest = read_manifest(source, version, store_dir)
+    path = _store_dir(store_dir) / source / version / TABLE_ARTIFACT
+    _verified(path, manifest, TABLE_ARTIFACT)
+    table = pd.read_csv(path, parse_dates=manifest.get("date_columns", []))
+    return table, manifest
+
+
+def load_payloads(source: str, version: str = None, store_dir=None) -> list:
+    """Payload thô của một snapshot (để parse lại khi adapter thay đổi)."""
+    version = version or latest_version(source, store_dir)
+    if version is None:
+        raise FileNotFoundError(f"No snapshot stored for source: {source}")
+    manifest = read_manifest(source, version, store_dir)
+    data = _verified(_store_dir(store_dir) / source / version / RAW_ARTIFACT, manifest, RAW_ARTIFACT)
+    return json.loads(gzip.decompress(data))
+
+
+# ========================
+# GHI KHO
+# ========================
+def save_snapshot(source: str, payloads: list, table: pd.DataFrame, start_year: int, end_year: int,
+                  base_url: str = None, store_dir=None) -> dict:
+    """
+    Lưu một lần fetch thành công thành version mới (ghi thư mục tạm rồi rename).
+
+    Returns:
+        Manifest của version mới, hoặc của version mới nhất nếu payload không đổi
+    """
+    source_dir = _store_dir(store_dir) / source
+    source_dir.mkdir(parents=True, exist_ok=True)
+
+    raw_json = json.dumps(payloads, sort_keys=True).encode()
+    content_sha = _sha256_bytes(raw_json)
+    latest = latest_version(source, store_dir)
+    if latest is not None:
+        manifest = read_manifest(source, latest, store_dir)
+        if (manifest["content_sha256"] == content_sha
+                and (manifest["start_year"], manifest["end_year"]) == (start_year, end_year)):
+            return manifest
+
+    versions = list_versions(source, store_dir)
+    version = f"v{_version_number(versions[-1]) + 1 if versions else 1}"
+    tmp_dir = source_dir / f".{version}.tmp-{os.getpid()}"
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir()
+
+    raw = gzip.compress(raw_json, mtime=0)
+    (tmp_dir / RAW_ARTIFACT).write_bytes(raw)
+    table_csv = table.to_csv(index=False).encode()
+    (tmp_dir / TABLE_ARTIFACT).write_bytes(table_csv)
+
+    manifest = {
+        "source": source,
+        "version": version,
+        "fetched_at": datetime.now(timezone.utc).isoformat(),
+        "start_year": int(start_year),
+        "end_year": int(end_year),
+        "base_url": base_url,
+        "rows": int(len(table)),
+        "columns": list(table.columns),
+        "date_columns": [c for c in table.columns if pd.api.types.is_datetime64_any_dtype(table[c])],
+        "content_sha256": content_sha,
+        "artifacts": {RAW_ARTIFACT: _sha256_bytes(raw), TABLE_ARTIFACT: _sha256_bytes(table_csv)},
+    }
+    with open(tmp_dir / MANIFEST_FILE, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    os.rename(tmp_dir, source_dir / version)
+    _write_atomic(source_dir / LATEST_FILE, version + "\n")
+    return manifest
+
+
+def _provenance(manifest: dict, status: str, error: Exception = None) -> dict:
+    provenance = {
+        "source": manifest["source"],
+        "version": manifest["version"],
+        "fetched_at": manifest["fetched_at"],
+        "status": status,
+    }
+    if error is not None:
+        provenance["error"] = str(error)
+    return provenance
+
+
+# ========================
+# FETCH QUA KHO
+# ========================
+async def refresh_with_store(sources, start_year: int, end_year: int, offline: bool = False,
+                             max_age: timedelta = None, client=None, store_dir=None) -> dict:
+    """
+    Fetch đồng thời các nguồn; mỗi lần thành công được lưu vào kho, nguồn lỗi
+    (hoặc offline) dùng snapshot mới nhất.
+
+    Args:
+        max_age: snapshot mới hơn ngưỡng này được dùng luôn, không gọi API
+
+    Returns:
+        Dict tên nguồn -> (table, provenance), hoặc Exception nếu không có cả
+        dữ liệu live lẫn snapshot
+    """
+    adapters = data_sources.resolve_adapters(sources)
+    now = datetime.now(timezone.utc)
+
+    def from_store(name, status, error=None):
+        try:
+            table, manifest = load_snapshot(name, store_dir=store_dir)
+        except FileNotFoundError:
+            return error or FileNotFoundError(f"No snapshot stored for source: {name}")
+        return table, _provenance(manifest, status, error)
+
+    results, to_fetch = {}, {}
+    for name, adapter in adapters.items():
+        latest = latest_version(name, store_dir)
+        if latest is not None and max_age is not None and \
+                now - datetime.fromisoformat(read_manifest(name, latest, store_dir)["fetched_at"]) <= max_age:
+            results[name] = from_store(name, "cached")
+        elif offline:
+            results[name] = from_store(name, "offline")
+        else:
+            to_fetch[name] = adapter
+
+    if to_fetch:
+        owned = client is None
+        client = client or data_sources.SourceClient()
+        try:
+            fetched = await asyncio.gather(
+                *(adapter.fetch_payloads(client, start_year, end_year) for adapter in to_fetch.values()),
+                return_exceptions=True
+            )
+        finally:
+            if owned:
+                await client.close()
+
+        for (name, adapter), payloads in zip(to_fetch.items(), fetched):
+            try:
+                if isinstance(payloads, Exception):
+                    raise payloads
+                table = adapter.parse(payloads, start_year, end_year)
+            except Exception as e:
+                results[name] = from_store(name, "stale", e)
+                continue
+            manifest = save_snapshot(name, payloads, table, start_year, end_year, adapter.base_url, store_dir)
+            results[name] = (table, _provenance(manifest, "live"))
+
+    return {name: results[name] for name in adapters}
+
+
+def fetch_with_store(sources, start_year: int, end_year: int, offline: bool = False,
+                     max_age: timedelta = None, store_dir=None, **client_options) -> dict:
+    """Bản đồng bộ của refresh_with_store() cho script."""
+    async def run():
+        async with data_sources.SourceClient(**client_options) as client:
+            return await refresh_with_store(sources, start_year, end_year, offline, max_age, client, store_dir)
+    return asyncio.run(run())
+
+
+def provenance_columns(name: str, years, table_years, provenance: dict) -> pd.DataFrame:
+    """
+    Cột provenance theo từng năm cho một nguồn:
+    src_<name>_version, src_<name>_fetched_at, src_<name>_status.
+    Năm không có trong bảng nguồn có status "missing".
+    """
+    covered = pd.Index(table_years)
+    status = [provenance["status"] if y in covered else "missing" for y in years]
+    return pd.DataFrame({
+        "year": list(years),
+        f"{PROVENANCE_PREFIX}{name}_version": provenance["version"],
+        f"{PROVENANCE_PREFIX}{name}_fetched_at": provenance["fetched_at"],
+        f"{PROVENANCE_PREFIX}{name}_status": status,
+    })
+
+
+def is_stale(status) -> bool:
+    return status not in FRESH_STATUSES
@@ -0,0 +1,320 @@
+"""
+streaming_ingest.py
+
+Ingest thời tiết ngày dạng streaming với thống kê tháng/mùa online.
+
+preprocess.aggregate_monthly() và các calc_* trong feature_engineering.py
+groupby lại toàn bộ lịch sử mỗi lần chạy. Ở đây mỗi bản ghi ngày mới chỉ cập
+nhật tổng / số ngày / số ngày nóng (> 33°C) của đúng (năm, tháng) tương ứng
+trong O(1) (feature_engineering.SeasonStats). Features theo cửa sổ mùa
+(rain_Feb_Mar, days_over_33, SPI_MarJun, ...) được đọc từ 12 ô tháng đó, không
+phụ thuộc độ dài lịch sử.
+
+Nguồn dữ liệu:
+- tail_csv():    đọc file CSV cùng định dạng weather_daklak_1990_2025.csv,
+                 follow=True để theo dõi dòng mới được append (như `tail -f`)
+- drain_queue(): queue.Queue trong process (producer khác put bản ghi vào)
+
+Bản ghi trùng ngày: giống hệt thì bỏ qua, khác thì coi là bản sửa (gỡ giá trị
+cũ rồi cộng giá trị mới). Subscriber (ví dụ Nowcaster.observe) nhận
+(date, record, previous) sau mỗi cập nhật.
+"""
+
+import csv
+import math
+import queue
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    from src import nowcast
+    from src.feature_engineering import (
+        WEATHER_DAILY_FILE, SeasonStats, monthly_stats, feature_reference, features_from_monthly,
+    )
+except ImportError:  # chạy trực tiếp từ thư mục src/
+    import nowcast
+    from feature_engineering import (
+        WEATHER_DAILY_FILE, SeasonStats, monthly_stats, feature_reference, features_from_monthly,
+    )
+
+# Cột số trong file thời tiết ngày (ngoài `date`)
+DAILY_COLUMNS = ["temp_max", "temp_min", "rain", "humidity", "radiation", "soil_0_7", "soil_7_28"]
+REQUIRED_COLUMNS = ["temp_max", "temp_min"]
+POLL_INTERVAL = 1.0
+STREAM_FILE_ENV = "WEATHER_STREAM_FILE"
+
+# Thống kê tháng: tên cột giống preprocess.aggregate_monthly() -> (biến, phép gộp)
+MONTHLY_COLUMNS = {
+    "temp_max_mean": ("temp_max", "mean"),
+    "temp_min_mean": ("temp_min", "mean"),
+    "rain_sum": ("rain", "sum"),
+    "humidity_mean": ("humidity", "mean"),
+    "radiation_sum": ("radiation", "sum"),
+    "soil_0_7_mean": ("soil_0_7", "mean"),
+}
+
+
+def parse_record(row: dict):
+    """
+    Một dòng CSV / JSON -> (Timestamp, record). Ô trống = NaN.
+
+    Raises:
+        ValueError: thiếu ngày hoặc thiếu temp_max/temp_min
+    """
+    if not row.get("date"):
+        raise ValueError("Record has no date")
+    date = pd.Timestamp(row["date"]).normalize()
+    record = {}
+    for col in DAILY_COLUMNS:
+        value = row.get(col)
+        record[col] = float(value) if value not in (None, "") else math.nan
+    missing = [c for c in REQUIRED_COLUMNS if math.isnan(record[c])]
+    if missing:
+        raise ValueError(f"Record {date.date()} missing {missing}")
+    return date, record
+
+
+def _same(a: dict, b: dict) -> bool:
+    return all(a[c] == b[c] or (math.isnan(a[c]) and math.isnan(b[c])) for c in DAILY_COLUMNS)
+
+
+class OnlineAggregates:
+    """
+    Thống kê tháng của mọi năm, cập nhật O(1) theo từng ngày.
+
+    Chuẩn hoá SPI/anomaly (feature_reference) được cố định từ lịch sử lúc
+    khởi tạo, như create_yearly_features() trên file đã có.
+    """
+
+    def __init__(self, daily: pd.DataFrame = None, reference: dict = None):
+        self.seasons = {}
+        self.records = {}
+        self.reference = reference
+        self._lock = threading.Lock()
+
+        if daily is not None and len(daily) > 0:
+            years, stats = monthly_stats(daily)
+            for i, year in enumerate(years.astype(int)):
+                self.seasons[year] = SeasonStats(year, {k: v[i] for k, v in stats.items()})
+            if self.reference is None:
+                self.reference = feature_reference(years, stats)
+            dates = pd.to_datetime(daily["date"]).dt.normalize()
+            for year, last in dates.groupby(dates.dt.year).max().items():
+                self.seasons[int(year)].as_of = last
+            columns = [c for c in DAILY_COLUMNS if c in daily.columns]
+            values = daily[columns].to_numpy(dtype=np.float64)
+            for date, row in zip(dates, values):
+                record = dict.fromkeys(DAILY_COLUMNS, math.nan)
+                record.update(zip(columns, row))
+                self.records[date] = record
+
+    @property
+    def as_of(self):
+        """Ngày mới nhất đã nhận."""
+        with self._lock:
+            dates = [s.as_of for s in self.seasons.values() if s.as_of is not None]
+        return max(dates) if dates else None
+
+    def update(self, date, record: dict):
+        """
+        Cộng một ngày vào thống kê tháng.
+
+        Returns:
+            (status, previous): status là "added", "updated" hoặc "duplicate";
+            previous là bản ghi cũ của ngày đó (nếu có)
+        """
+        date = pd.Timestamp(date).normalize()
+        with self._lock:
+            previous = self.records.get(date)
+            if previous is not None and _same(previous, record):
+                return "duplicate", previous
+            season = self.seasons.get(date.year)
+            if season is None:
+                season = self.seasons[date.year] = SeasonStats(date.year)
+            if previous is not None:
+                season.remove_day(date, previous)
+            season.add_day(date, record)
+            self.records[date] = dict(record)
+        return ("updated" if previous is not None else "added"), previous
+
+    def _stats(self, year: int) -> dict:
+        season = self.seasons.get(int(year))
+        if season is None:
+            raise KeyError(f"No data for year {year}")
+        return {k: v.copy() for k, v in season.stats.items()}
+
+    def monthly(self, year: int) -> pd.DataFrame:
+        """Bảng tháng của một năm (cột như preprocess.aggregate_monthly + hot_days, n_days)."""
+        with self._lock:
+            stats = self._stats(year)
+        table = {"year": int(year), "month": np.arange(1, 13)}
+        for column, (var, how) in MONTHLY_COLUMNS.items():
+            total, count = stats[f"{var}_sum"], stats[f"{var}_count"]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                value = total / count if how == "mean" else total
+            table[column] = np.where(count > 0, value, np.nan)
+        table["hot_days"] = stats["hot_days"].astype(int)
+        table["n_days"] = stats["temp_max_count"].astype(int)
+        return pd.DataFrame(table)
+
+    def features(self, year: int) -> dict:
+        """Features theo cửa sổ mùa của năm (NaN cho cửa sổ chưa có ngày nào)."""
+        with self._lock:
+            stats = self._stats(year)
+        if self.reference is None:
+            raise ValueError("No reference history for SPI/anomaly features")
+        return {k: float(v) for k, v in features_from_monthly(stats, self.reference).items()}
+
+    def snapshot(self, year: int) -> dict:
+        """Trạng thái của một năm cho API: ngày as-of, số ngày, features, bảng tháng."""
+        monthly = self.monthly(year)
+        as_of = self.seasons[int(year)].as_of
+        return {
+            "year": int(year),
+            "as_of": as_of.date().isoformat() if as_of is not None else None,
+            "days_observed": int(monthly["n_days"].sum()),
+            "features": self.features(year),
+            "monthly": monthly,
+        }
+
+
+# ========================
+# NGUỒN DỮ LIỆU
+# ========================
+def tail_csv(filepath, follow: bool = False, poll_interval: float = POLL_INTERVAL,
+             stop_event: threading.Event = None):
+    """
+    Đọc file CSV thời tiết ngày theo từng dòng, yield (date, record).
+
+    follow=True: hết file thì chờ dòng mới được append (dòng đang ghi dở,
+    chưa có '\\n', được giữ lại tới khi hoàn chỉnh) cho tới khi stop_event set.
+    Dòng lỗi được bỏ qua kèm cảnh báo.
+    """
+    with open(filepath, "r", newline="") as f:
+        header = next(csv.reader([f.readline()]))
+        pending = ""
+        while stop_event is None or not stop_event.is_set():
+            line = f.readline()
+            if not line or not line.endswith("\n"):
+                pending += line
+                if not follow:
+                    if not pending.strip():
+                        return
+                    line, pending = pending, ""
+                else:
+                    time.sleep(poll_interval)
+                    continue
+            else:
+                line, pending = pending + line, ""
+            if not line.strip():
+                continue
+            try:
+                yield parse_record(dict(zip(header, next(csv.reader([line])))))
+            except ValueError as e:
+                print(f"⚠️ Skipping line: {e}")
+
+
+def drain_queue(source: queue.Queue, stop_event: threading.Event = None, timeout: float = POLL_INTERVAL):
+    """
+    Lấy bản ghi từ queue (dict như một dòng CSV hoặc tuple (date, record))
+    cho tới khi gặp None hoặc stop_event set.
+    """
+    while stop_event is None or not stop_event.is_set():
+        try:
+            item = source.get(timeout=timeout)
+        except queue.Empty:
+            continue
+        if item is None:
+            return
+        try:
+            yield parse_record(item) if isinstance(item, dict) else item
+        except ValueError as e:
+            print(f"⚠️ Skipping record: {e}")
+
+
+# ========================
+# INGESTOR
+# ========================
+class StreamingIngestor:
+    """Đẩy bản ghi từ một nguồn vào OnlineAggregates và báo cho các subscriber."""
+
+    def __init__(self, aggregates: OnlineAggregates, subscribers=()):
+        self.aggregates = aggregates
+        self.subscribers = list(subscribers)
+        self.counts = {"added": 0, "updated": 0, "duplicate": 0}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def subscribe(self, callback) -> None:
+        """callback(date, record, previous) được gọi sau mỗi ngày mới hoặc bản sửa."""
+        self.subscribers.append(callback)
+
+    def process(self, date, record: dict) -> str:
+        status, previous = self.aggregates.update(date, record)
+        self.counts[status] += 1
+        if status != "duplicate":
+            for callback in self.subscribers:
+                try:
+                    callback(pd.Timestamp(date), record, previous)
+                except Exception as e:
+                    print(f"⚠️ Subscriber failed on {pd.Timestamp(date).date()}: {e}")
+        return status
+
+    def run(self, source) -> dict:
+        """Xử lý hết một nguồn (iterable của (date, record)). Trả về số bản ghi theo trạng thái."""
+        counts = {"added": 0, "updated": 0, "duplicate": 0}
+        for date, record in source:
+            counts[self.process(date, record)] += 1
+        return counts
+
+    def start(self, source_factory) -> None:
+        """Chạy nguồn trong thread nền; source_factory(stop_event) trả về iterable."""
+        if self._thread is not None and self._thread.is_alive():
+            raise RuntimeError("Ingestor already running")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, args=(source_factory(self._stop),),
+                                        name="weather-ingest", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+
+# ========================
+# INGESTOR DÙNG CHUNG (API + nowcaster)
+# ========================
+_ingestor = None
+_ingestor_lock = threading.Lock()
+
+
+def get_ingestor(filepath=WEATHER_DAILY_FILE) -> StreamingIngestor:
+    """
+    Ingestor dựng một lần từ file thời tiết ngày (lazy, thread-safe).
+    Nowcaster dùng chung được đăng ký làm subscriber.
+    """
+    global _ingestor
+    with _ingestor_lock:
+        if _ingestor is None:
+            daily = pd.read_csv(filepath, parse_dates=["date"])
+            _ingestor = StreamingIngestor(OnlineAggregates(daily))
+            _ingestor.subscribe(nowcast.get_nowcaster(filepath).observe)
+        return _ingestor
+
+
+def follow_file(ingestor: StreamingIngestor, filepath, poll_interval: float = POLL_INTERVAL) -> None:
+    """Theo dõi file CSV (append-only) trong thread nền của ingestor."""
+    filepath = Path(filepath)
+    if not filepath.exists():
+        raise FileNotFoundError(f"Stream file not found: {filepath}")
+    ingestor.start(lambda stop: tail_csv(filepath, follow=True, poll_interval=poll_interval, stop_event=stop))
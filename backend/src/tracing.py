@@ -0,0 +1,328 @@
+"""
+tracing.py
+
+Tracing nhẹ theo request cho API (không cần thư viện ngoài, giống metrics.py).
+
+- TracingMiddleware (ASGI thuần): mỗi request HTTP là một trace; response có header
+  `Server-Timing` với thời gian từng phase (ms), ví dụ:
+
+      Server-Timing: validate;dur=0.21, resolve;dur=0.04, scenario;dur=0.02,
+                     handler;dur=0.09, serialize;dur=0.33, total;dur=0.66
+
+  validate  = từ khi nhận request tới khi handler chạy (middleware, routing,
+              parse + validate query/body)
+  handler   = thân handler; các span bên trong (resolve, pool.batch, ...) liệt kê riêng
+  serialize = từ khi handler trả về tới khi gửi header (validate response_model, encode JSON)
+
+  Trình duyệt hiện header này trong DevTools (Network > Timing) và qua
+  PerformanceResourceTiming.serverTiming; benchmark_api.py tổng hợp theo endpoint.
+- TracedRoute: route FastAPI bọc handler trong span "handler" để tách 3 phase trên.
+- span("predict"): context manager đo một phase trong handler (lồng nhau được,
+  không làm gì nếu không có trace).
+- TRACE_FILE: ghi trace ra file JSON lines định dạng OTLP/JSON (mỗi dòng một
+  ExportTraceServiceRequest, như file exporter của OpenTelemetry Collector), từ
+  thread riêng để không chặn event loop; đọc bằng receiver `otlpjsonfile` của
+  collector rồi đẩy sang Jaeger/Tempo.
+- Header W3C `traceparent` của client (load test, frontend) được dùng làm cha của trace.
+"""
+
+import os
+import re
+import json
+import time
+import queue
+import asyncio
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from pathlib import Path
+
+from fastapi.routing import APIRoute
+
+# ========================
+# CẤU HÌNH
+# ========================
+TRACING_ENABLED = os.getenv("TRACING", "true").lower() == "true"
+TRACE_FILE_ENV = "TRACE_FILE"
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "trio-ai-api")
+TIMING_ALLOW_ORIGIN = os.getenv("TIMING_ALLOW_ORIGIN", "*")
+SINK_QUEUE_SIZE = 10000
+HANDLER_SPAN = "handler"
+
+# OTLP SpanKind / StatusCode
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_ERROR = 2
+
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+_TOKEN_UNSAFE = re.compile(r"[^A-Za-z0-9!#$%&'*+.^_`|~-]")
+
+# (trace, span đang mở) của request hiện tại
+_current = contextvars.ContextVar("trace", default=None)
+
+
+def _new_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+class Span:
+    """Một phase đã đo (thời gian theo perf_counter)."""
+
+    __slots__ = ("name", "span_id", "parent_id", "start", "end", "attributes", "error")
+
+    def __init__(self, name: str, parent_id: str = None, attributes: dict = None):
+        self.name = name
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.error = None
+        self.start = time.perf_counter()
+        self.end = None
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+
+class Trace:
+    """Span gốc của một request và các span con."""
+
+    def __init__(self, name: str, traceparent: str = None):
+        match = _TRACEPARENT.match(traceparent or "")
+        if match and match.group(1) != "0" * 32 and match.group(2) != "0" * 16:
+            self.trace_id, parent_id = match.group(1), match.group(2)
+        else:
+            self.trace_id, parent_id = _new_id(16), None
+        self.root = Span(name, parent_id)
+        self.spans = []
+        self.response_start = None
+        # Mốc đổi perf_counter -> unix time (ns) cho OTLP
+        self._epoch_ns = time.time_ns() - int(self.root.start * 1e9)
+
+    def phases(self) -> list:
+        """[(tên, giây)] theo thứ tự Server-Timing."""
+        now = self.response_start or time.perf_counter()
+        handler = next((s for s in self.spans if s.name == HANDLER_SPAN and s.parent_id == self.root.span_id), None)
+        result = []
+        if handler is not None:
+            result.append(("validate", handler.start - self.root.start))
+        result.extend((s.name, s.duration) for s in sorted(self.spans, key=lambda s: s.start) if s is not handler)
+        if handler is not None:
+            result.append((HANDLER_SPAN, handler.duration))
+            if handler.end is not None:
+                result.append(("serialize", now - handler.end))
+        result.append(("total", now - self.root.start))
+        return result
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{_TOKEN_UNSAFE.sub('_', name)};dur={seconds * 1000:.2f}" for name, seconds in self.phases())
+
+    # ------------------------
+    # OTLP/JSON
+    # ------------------------
+    def _otlp_span(self, span: Span, kind: int) -> dict:
+        data = {
+            "traceId": self.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": kind,
+            "startTimeUnixNano": str(self._epoch_ns + int(span.start * 1e9)),
+            "endTimeUnixNano": str(self._epoch_ns + int((span.end or span.start) * 1e9)),
+            "attributes": _attributes(span.attributes),
+            "status": {"code": STATUS_ERROR, "message": span.error} if span.error else {},
+        }
+        if span.parent_id:
+            data["parentSpanId"] = span.parent_id
+        return data
+
+    def to_otlp(self) -> dict:
+        """ExportTraceServiceRequest (OTLP/JSON) chứa span gốc và mọi span con."""
+        spans = [self._otlp_span(self.root, SPAN_KIND_SERVER)]
+        spans.extend(self._otlp_span(s, SPAN_KIND_INTERNAL) for s in self.spans)
+        return {"resourceSpans": [{
+            "resource": {"attributes": _attributes({"service.name": SERVICE_NAME, "process.pid": os.getpid()})},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+        }]}
+
+
+def _attributes(values: dict) -> list:
+    """dict -> danh sách KeyValue của OTLP/JSON."""
+    result = []
+    for key, value in values.items():
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        result.append({"key": key, "value": typed})
+    return result
+
+
+# ========================
+# API ĐO TRONG HANDLER
+# ========================
+def current_trace():
+    current = _current.get()
+    return current[0] if current is not None else None
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Đo một phase của request hiện tại; không làm gì khi không có trace."""
+    current = _current.get()
+    if current is None:
+        yield None
+        return
+    trace, parent = current
+    record = Span(name, parent.span_id, attributes)
+    token = _current.set((trace, record))
+    try:
+        yield record
+    except BaseException as e:
+        record.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record.end = time.perf_counter()
+        _current.reset(token)
+        trace.spans.append(record)
+
+
+def _traced_endpoint(endpoint):
+    if not asyncio.iscoroutinefunction(endpoint):
+        return endpoint
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        with span(HANDLER_SPAN):
+            return await endpoint(*args, **kwargs)
+
+    return wrapper
+
+
+class TracedRoute(APIRoute):
+    """APIRoute bọc handler async trong span "handler" (đặt app.router.route_class)."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _traced_endpoint(endpoint), **kwargs)
+
+
+# ========================
+# FILE SINK (OTLP/JSON LINES)
+# ========================
+class FileSink:
+    """Ghi trace ra file từ thread riêng; hàng đợi đầy thì bỏ trace (đếm vào `dropped`)."""
+
+    def __init__(self, path: Path, max_queue: int = SINK_QUEUE_SIZE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="trace-sink", daemon=True)
+        self._thread.start()
+
+    def export(self, trace: Trace) -> None:
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                trace = self._queue.get()
+                if trace is None:
+                    break
+                f.write(json.dumps(trace.to_otlp(), separators=(",", ":")) + "\n")
+                if self._queue.empty():
+                    f.flush()
+
+    def close(self) -> None:
+        """Ghi nốt các trace đang chờ rồi dừng thread."""
+        self._queue.put(None)
+        self._thread.join(timeout=10)
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_sink():
+    """FileSink theo TRACE_FILE (tạo lần đầu dùng), None nếu không cấu hình."""
+    global _sink
+    path = os.getenv(TRACE_FILE_ENV)
+    if not path:
+        return None
+    with _sink_lock:
+        if _sink is None or _sink.path != Path(path):
+            if _sink is not None:
+                _sink.close()
+            _sink = FileSink(path)
+        return _sink
+
+
+def shutdown_sink() -> None:
+    global _sink
+    with _sink_lock:
+        sink, _sink = _sink, None
+    if sink is not None:
+        sink.close()
+
+
+# ========================
+# MIDDLEWARE
+# ========================
+class TracingMiddleware:
+    """ASGI middleware thuần: mở trace cho mỗi request HTTP, thêm Server-Timing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        traceparent = headers.get(b"traceparent", b"").decode("latin-1").strip().lower()
+        trace = Trace(f"{scope['method']} {scope['path']}", traceparent)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                trace.response_start = time.perf_counter()
+                status["code"] = message["status"]
+                extra = [(b"server-timing", trace.server_timing().encode("latin-1"))]
+                if TIMING_ALLOW_ORIGIN:
+                    extra.append((b"timing-allow-origin", TIMING_ALLOW_ORIGIN.encode("latin-1")))
+                message = {**message, "headers": list(message.get("headers", [])) + extra}
+            await send(message)
+
+        token = _current.set((trace, trace.root))
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            trace.root.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current.reset(token)
+            root = trace.root
+            root.end = time.perf_counter()
+            route = getattr(scope.get("route"), "path", None)
+            if route:
+                root.name = f"{scope['method']} {route}"
+                root.set_attribute("http.route", route)
+            root.set_attribute("http.request.method", scope["method"])
+            root.set_attribute("url.path", scope["path"])
+            root.set_attribute("http.response.status_code", status["code"])
+            if status["code"] >= 500 and root.error is None:
+                root.error = f"HTTP {status['code']}"
+            sink = get_sink()
+            if sink is not None:
+                sink.export(trace)
@@ -42,6 +42,12 @@ except ImportError:
     HAS_SHAP = False
     print("⚠️ SHAP not installed, will skip explainability")
 
+try:
+    from src import model_registry, panel
+except ImportError:  # chạy trực tiếp: python src/train_model.py
+    import model_registry
+    import panel
+
 
 # ========================
 # CẤU HÌNH ĐƯỜNG DẪN
@@ -93,21 +99,23 @@ def load_data():
     yield_data = pd.read_csv(YIELD_FILE)
     print(f"   Yield: {len(yield_data)} năm ({yield_data['year'].min()}-{yield_data['year'].max()})")
     
-    # Merge
-    df = features.merge(yield_data[['year', 'yield_ton_ha']], on='year', how='inner')
-    df = df.rename(columns={'yield_ton_ha': 'yield'})
+    # Join theo (vùng, năm): features theo năm được áp cho mọi vùng
+    dataset = panel.PanelDataset.from_yields(yield_data).join(features)
+    df = dataset.to_frame().rename(columns={'yield_ton_ha': 'yield'})
     
-    print(f"   ✅ Merged: {len(df)} năm với đầy đủ features và yield")
+    print(f"   ✅ Merged: {len(df)} hàng (vùng × năm) với đầy đủ features và yield")
     
     return df
 
 
 def prepare_train_test(df, test_years=2):
     """
-    Chia train/test theo time-series (không shuffle).
+    Chia train/test theo time-series (không shuffle), theo NĂM: mọi hàng
+    (vùng) của `test_years` năm cuối vào test, nên không vùng nào của một năm
+    test lọt sang train.
     
     Args:
-        df: DataFrame với features và yield
+        df: DataFrame với features và yield (một hoặc nhiều hàng mỗi năm)
         test_years: Số năm cuối dùng để test
         
     Returns:
@@ -118,9 +126,10 @@ def prepare_train_test(df, test_years=2):
     # Sort theo năm
     df = df.sort_values('year').reset_index(drop=True)
     
-    # Split
-    train_df = df.iloc[:-test_years]
-    test_df = df.iloc[-test_years:]
+    # Split theo năm (không theo số hàng)
+    test_mask = df['year'].isin(np.sort(df['year'].unique())[-test_years:])
+    train_df = df[~test_mask]
+    test_df = df[test_mask]
     
     # Features và target
     X_train = train_df[FEATURE_COLUMNS]
@@ -131,8 +140,8 @@ def prepare_train_test(df, test_years=2):
     years_train = train_df['year'].values
     years_test = test_df['year'].values
     
-    print(f"   Train: {len(X_train)} năm ({years_train[0]}-{years_train[-1]})")
-    print(f"   Test: {len(X_test)} năm ({years_test[0]}-{years_test[-1]})")
+    print(f"   Train: {len(X_train)} hàng, {len(np.unique(years_train))} năm ({years_train[0]}-{years_train[-1]})")
+    print(f"   Test: {len(X_test)} hàng, {len(np.unique(years_test))} năm ({years_test[0]}-{years_test[-1]})")
     
     return X_train, X_test, y_train, y_test, years_train, years_test
 
@@ -304,8 +313,8 @@ def compute_shap_values(model, X_train, feature_names, save_values_path, save_su
     return shap_values
 
 
-def save_model(model, scaler, feature_columns):
-    """Lưu model và các artifacts."""
+def save_model(model, scaler, feature_columns, shap_data=None, metrics=None, reference_X=None):
+    """Lưu model và các artifacts (file legacy + version mới trong registry)."""
     print("\n💾 Saving model and artifacts...")
     
     # Create directory
@@ -326,6 +335,17 @@ def save_model(model, scaler, feature_columns):
     with open(FEATURE_COLS_FILE, 'w') as f:
         json.dump(feature_columns, f, indent=2)
     print(f"   ✅ Feature columns: {FEATURE_COLS_FILE}")
+    
+    # Registry: model train trên features gốc (RF/XGB không cần scaling)
+    version = model_registry.register_model(
+        "original", model, feature_columns,
+        scaler=scaler,
+        shap_data=shap_data,
+        metrics=metrics,
+        scaled_inputs=False,
+        reference_X=reference_X
+    )
+    return version
 
 
 def run_training():
@@ -393,11 +413,20 @@ def run_training():
     top_features = plot_feature_importance(best_model, FEATURE_COLUMNS, FEATURE_IMPORTANCE_FILE)
     
     # 7. SHAP analysis
+    shap_data = None
     if HAS_SHAP:
-        compute_shap_values(best_model, X_train, FEATURE_COLUMNS, SHAP_VALUES_FILE, SHAP_SUMMARY_FILE)
+        shap_values = compute_shap_values(best_model, X_train, FEATURE_COLUMNS, SHAP_VALUES_FILE, SHAP_SUMMARY_FILE)
+        if shap_values is not None:
+            shap_data = {
+                'shap_values': shap_values,
+                'feature_names': FEATURE_COLUMNS,
+                'X_train': X_train.values
+            }
     
     # 8. Save model
-    save_model(best_model, scaler, FEATURE_COLUMNS)
+    metrics = {k: best_result[k] for k in ('mae', 'rmse', 'mape', 'mae_train')}
+    save_model(best_model, scaler, FEATURE_COLUMNS, shap_data=shap_data, metrics=metrics,
+               reference_X=X_train.values)
     
     # 9. Summary
     print("\n" + "=" * 60)
@@ -8,16 +8,26 @@ NHIỆM VỤ:
 2. Thêm ENSO Index (ONI từ NOAA)
 3. Thêm SPEI (tự tính từ SPI và nhiệt độ)
 4. Merge và tạo features_yearly_upgraded.csv
+
+NASA POWER / NOAA đi qua kho nguồn (source_store.py): nguồn lỗi dùng snapshot
+thật gần nhất, không bịa dữ liệu. Cột src_* ghi version/ngày fetch/trạng thái
+của từng nguồn theo năm; src_stale = True cho năm có dữ liệu cũ hoặc thiếu.
 """
 
+import argparse
 import numpy as np
 import pandas as pd
-import requests
 from pathlib import Path
-from io import StringIO
+from datetime import timedelta
 import warnings
 warnings.filterwarnings('ignore')
 
+try:
+    from src import data_sources, source_store
+except ImportError:  # chạy trực tiếp: python src/upgrade_features.py
+    import data_sources
+    import source_store
+
 # ========================
 # CẤU HÌNH
 # ========================
@@ -40,148 +50,86 @@ OUTPUT_FILE = DATA_PROCESSED / "features_yearly_upgraded.csv"
 START_YEAR = 1990
 END_YEAR = 2024
 
+# Nguồn bên ngoài -> cột feature lấy từ nguồn đó
+EXTERNAL_SOURCES = {
+    "nasa_power": "radiation_JunSep_NASA",
+    "noaa_oni": "ENSO_MarJun",
+}
+STALE_COLUMN = f"{source_store.PROVENANCE_PREFIX}stale"
+
+
+def fetch_external_sources(offline: bool = False, max_age_hours: float = None):
+    """
+    Fetch đồng thời NASA POWER + NOAA ONI qua kho nguồn (source_store).
+
+    Fetch thành công được lưu thành version mới; nguồn lỗi (hoặc offline)
+    dùng snapshot mới nhất trong kho.
+
+    Returns:
+        Dict tên nguồn -> (table, provenance) hoặc Exception
+    """
+    mode = "offline" if offline else "online"
+    print(f"\n📡 Fetching NASA POWER + NOAA ONI ({START_YEAR}-{END_YEAR}, {mode})...")
+    max_age = timedelta(hours=max_age_hours) if max_age_hours is not None else None
+    return source_store.fetch_with_store(
+        list(EXTERNAL_SOURCES), START_YEAR, END_YEAR, offline=offline, max_age=max_age
+    )
+
+
+def _source_table(name: str, result, label: str):
+    """(table, provenance) từ kết quả fetch; không có dữ liệu thật thì raise."""
+    if isinstance(result, Exception):
+        raise data_sources.SourceError(
+            f"{label}: no live data and no stored snapshot ({result}). "
+            f"Run once with network access to populate {source_store.STORE_DIR / name}"
+        )
+    table, provenance = result
+    if provenance["status"] == "live":
+        print(f"   ✅ {label} fetched: {len(table)} years (saved as {name}/{provenance['version']})")
+    else:
+        print(f"   ⚠️  {label}: using stored snapshot {name}/{provenance['version']} "
+              f"({provenance['status']}, fetched {provenance['fetched_at'][:10]})")
+        if "error" in provenance:
+            print(f"   ⚠️  Fetch error: {provenance['error']}")
+    return table, provenance
+
 
-def fetch_nasa_power_radiation():
+def fetch_nasa_power_radiation(result=None):
     """
     Lấy dữ liệu bức xạ từ NASA POWER API.
     ALLSKY_SFC_SW_DWN: All Sky Surface Shortwave Downward Irradiance (MJ/m²/day)
+
+    Args:
+        result: kết quả đã fetch sẵn từ fetch_external_sources()
+
+    Returns:
+        (radiation_yearly, provenance)
     """
     print("\n🛰️  NHIỆM VỤ 1: Lấy bức xạ từ NASA POWER...")
-    
-    url = "https://power.larc.nasa.gov/api/temporal/daily/point"
-    
-    params = {
-        "parameters": "ALLSKY_SFC_SW_DWN",
-        "community": "AG",
-        "longitude": LON,
-        "latitude": LAT,
-        "start": f"{START_YEAR}0101",
-        "end": f"{END_YEAR}1231",
-        "format": "JSON"
-    }
-    
-    try:
-        print(f"   Fetching NASA POWER data ({START_YEAR}-{END_YEAR})...")
-        response = requests.get(url, params=params, timeout=120)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Extract radiation data
-        radiation_data = data['properties']['parameter']['ALLSKY_SFC_SW_DWN']
-        
-        # Convert to DataFrame
-        records = []
-        for date_str, value in radiation_data.items():
-            year = int(date_str[:4])
-            month = int(date_str[4:6])
-            day = int(date_str[6:8])
-            records.append({
-                'year': year,
-                'month': month,
-                'day': day,
-                'radiation_nasa': value if value != -999 else np.nan
-            })
-        
-        df = pd.DataFrame(records)
-        
-        # Aggregate Jun-Sep for each year
-        df_summer = df[(df['month'] >= 6) & (df['month'] <= 9)]
-        radiation_yearly = df_summer.groupby('year')['radiation_nasa'].sum().reset_index()
-        radiation_yearly.columns = ['year', 'radiation_JunSep_NASA']
-        
-        print(f"   ✅ NASA POWER data fetched: {len(radiation_yearly)} years")
-        print(f"   ✅ radiation_JunSep_NASA range: {radiation_yearly['radiation_JunSep_NASA'].min():.1f} - {radiation_yearly['radiation_JunSep_NASA'].max():.1f} MJ/m²")
-        
-        return radiation_yearly
-        
-    except Exception as e:
-        print(f"   ⚠️  Error fetching NASA POWER: {e}")
-        print("   ⚠️  Using fallback: synthetic radiation based on existing data")
-        
-        # Fallback: use existing radiation_JunSep with slight adjustment
-        features = pd.read_csv(FEATURES_FILE)
-        radiation_yearly = features[['year', 'radiation_JunSep']].copy()
-        # Add small noise to differentiate
-        np.random.seed(42)
-        radiation_yearly['radiation_JunSep_NASA'] = radiation_yearly['radiation_JunSep'] * (1 + np.random.uniform(-0.05, 0.05, len(radiation_yearly)))
-        radiation_yearly = radiation_yearly[['year', 'radiation_JunSep_NASA']]
-        
-        return radiation_yearly
+    if result is None:
+        result = fetch_external_sources()["nasa_power"]
+    radiation_yearly, provenance = _source_table("nasa_power", result, "NASA POWER")
+    print(f"   ✅ radiation_JunSep_NASA range: {radiation_yearly['radiation_JunSep_NASA'].min():.1f} - {radiation_yearly['radiation_JunSep_NASA'].max():.1f} MJ/m²")
+    return radiation_yearly, provenance
 
 
-def fetch_enso_oni():
+def fetch_enso_oni(result=None):
     """
     Lấy ENSO ONI (Oceanic Niño Index) từ NOAA.
     ONI là chỉ số ENSO phổ biến nhất, dựa trên SST anomaly vùng Niño 3.4
+
+    Args:
+        result: kết quả đã fetch sẵn từ fetch_external_sources()
+
+    Returns:
+        (enso_df, provenance)
     """
     print("\n🌊 NHIỆM VỤ 2: Lấy ENSO Index (ONI) từ NOAA...")
-    
-    # NOAA ONI data URL
-    url = "https://www.cpc.ncep.noaa.gov/data/indices/oni.ascii.txt"
-    
-    try:
-        print(f"   Fetching NOAA ONI data...")
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        
-        # Parse the fixed-width format
-        lines = response.text.strip().split('\n')
-        
-        records = []
-        for line in lines[1:]:  # Skip header
-            parts = line.split()
-            if len(parts) >= 4:
-                try:
-                    year = int(parts[0])
-                    # ONI values are in columns 3-14 (DJF, JFM, FMA, MAM, AMJ, MJJ, JJA, JAS, ASO, SON, OND, NDJ)
-                    # We need MAM (Mar-Apr-May) at index 6 and AMJ (Apr-May-Jun) at index 7
-                    # Average MAM and AMJ for Mar-Jun
-                    mam = float(parts[4]) if parts[4] != '-99.9' else np.nan
-                    amj = float(parts[5]) if parts[5] != '-99.9' else np.nan
-                    mjj = float(parts[6]) if parts[6] != '-99.9' else np.nan
-                    
-                    # Average for Mar-Jun period
-                    oni_marjun = np.nanmean([mam, amj])
-                    
-                    if year >= START_YEAR and year <= END_YEAR:
-                        records.append({
-                            'year': year,
-                            'ENSO_MarJun': oni_marjun
-                        })
-                except (ValueError, IndexError):
-                    continue
-        
-        enso_df = pd.DataFrame(records)
-        
-        if len(enso_df) > 0:
-            print(f"   ✅ ENSO ONI data fetched: {len(enso_df)} years")
-            print(f"   ✅ ENSO_MarJun range: {enso_df['ENSO_MarJun'].min():.2f} to {enso_df['ENSO_MarJun'].max():.2f}")
-            return enso_df
-        else:
-            raise ValueError("No valid ENSO data parsed")
-            
-    except Exception as e:
-        print(f"   ⚠️  Error fetching NOAA ONI: {e}")
-        print("   ⚠️  Using fallback: historical ENSO data")
-        
-        # Fallback: historical ENSO values (approximate)
-        # El Niño years: 1997-98, 2015-16, 2023-24
-        # La Niña years: 1999-2000, 2010-11, 2020-22
-        enso_historical = {
-            1990: 0.2, 1991: 0.5, 1992: 1.2, 1993: 0.3, 1994: 0.2,
-            1995: -0.3, 1996: -0.4, 1997: 0.8, 1998: 1.5, 1999: -1.0,
-            2000: -0.8, 2001: -0.3, 2002: 0.5, 2003: 0.2, 2004: 0.3,
-            2005: 0.4, 2006: -0.3, 2007: -0.5, 2008: -0.8, 2009: 0.5,
-            2010: 0.8, 2011: -1.0, 2012: -0.5, 2013: -0.2, 2014: 0.2,
-            2015: 1.2, 2016: 1.8, 2017: 0.3, 2018: -0.5, 2019: 0.3,
-            2020: -0.5, 2021: -0.8, 2022: -1.0, 2023: 0.8, 2024: 1.5
-        }
-        
-        records = [{'year': y, 'ENSO_MarJun': v} for y, v in enso_historical.items() if START_YEAR <= y <= END_YEAR]
-        enso_df = pd.DataFrame(records)
-        
-        print(f"   ✅ Using historical ENSO data: {len(enso_df)} years")
-        return enso_df
+    if result is None:
+        result = fetch_external_sources()["noaa_oni"]
+    enso_df, provenance = _source_table("noaa_oni", result, "NOAA ONI")
+    print(f"   ✅ ENSO_MarJun range: {enso_df['ENSO_MarJun'].min():.2f} to {enso_df['ENSO_MarJun'].max():.2f}")
+    return enso_df, provenance
 
 
 def calculate_spei(weather_df):
@@ -273,7 +221,7 @@ def calculate_spei(weather_df):
     return spei_df
 
 
-def merge_features():
+def merge_features(offline: bool = False, max_age_hours: float = None):
     """
     Merge tất cả features mới vào file features_yearly_upgraded.csv
     """
@@ -292,11 +240,14 @@ def merge_features():
     except:
         weather_df = None
     
+    # NASA POWER + NOAA được fetch đồng thời (hoặc load từ kho nguồn)
+    fetched = fetch_external_sources(offline=offline, max_age_hours=max_age_hours)
+    
     # 1. Get NASA POWER radiation
-    radiation_df = fetch_nasa_power_radiation()
+    radiation_df, radiation_provenance = fetch_nasa_power_radiation(fetched["nasa_power"])
     
     # 2. Get ENSO index
-    enso_df = fetch_enso_oni()
+    enso_df, enso_provenance = fetch_enso_oni(fetched["noaa_oni"])
     
     # 3. Calculate SPEI
     spei_df = calculate_spei(weather_df)
@@ -307,27 +258,39 @@ def merge_features():
     upgraded = features.copy()
     
     # Merge radiation
-    if radiation_df is not None:
-        upgraded = upgraded.merge(radiation_df, on='year', how='left')
-        print(f"   ✅ Added radiation_JunSep_NASA")
+    upgraded = upgraded.merge(radiation_df, on='year', how='left')
+    print(f"   ✅ Added radiation_JunSep_NASA")
     
     # Merge ENSO
-    if enso_df is not None:
-        upgraded = upgraded.merge(enso_df, on='year', how='left')
-        print(f"   ✅ Added ENSO_MarJun")
+    upgraded = upgraded.merge(enso_df, on='year', how='left')
+    print(f"   ✅ Added ENSO_MarJun")
     
     # Merge SPEI
     if spei_df is not None:
         upgraded = upgraded.merge(spei_df, on='year', how='left')
         print(f"   ✅ Added SPEI_MarJun")
     
-    # Fill any missing values with 0 (for years outside data range)
-    upgraded = upgraded.fillna(0)
+    # Provenance theo năm của từng nguồn (trước khi điền giá trị thiếu)
+    stale = pd.Series(False, index=upgraded.index)
+    for (name, column), (table, provenance) in zip(
+            EXTERNAL_SOURCES.items(),
+            [(radiation_df, radiation_provenance), (enso_df, enso_provenance)]):
+        covered = table.dropna(subset=[column])['year']
+        columns = source_store.provenance_columns(name, upgraded['year'], covered, provenance)
+        upgraded = upgraded.merge(columns, on='year', how='left')
+        stale |= upgraded[f"{source_store.PROVENANCE_PREFIX}{name}_status"].map(source_store.is_stale)
+    upgraded[STALE_COLUMN] = stale
+    
+    # Fill any missing values with 0 (for years outside data range) - các năm này có src_stale = True
+    value_columns = [c for c in upgraded.columns if not c.startswith(source_store.PROVENANCE_PREFIX)]
+    upgraded[value_columns] = upgraded[value_columns].fillna(0)
     
     # Save
     upgraded.to_csv(OUTPUT_FILE, index=False)
     print(f"\n   ✅ Saved: {OUTPUT_FILE}")
     print(f"   ✅ New features: {upgraded.shape[1]} columns, {len(upgraded)} years")
+    if stale.any():
+        print(f"   ⚠️  Stale/missing source data: {upgraded.loc[stale, 'year'].tolist()}")
     
     # Show new columns
     new_cols = [c for c in upgraded.columns if c not in features.columns]
@@ -338,11 +301,18 @@ def merge_features():
 
 def main():
     """Main function."""
+    parser = argparse.ArgumentParser(description="Nâng cấp features khí hậu (NASA POWER, NOAA ONI, SPEI)")
+    parser.add_argument("--offline", action="store_true",
+                        help="Không gọi API, dùng snapshot mới nhất trong kho nguồn")
+    parser.add_argument("--max-age-hours", type=float, default=None,
+                        help="Snapshot mới hơn ngưỡng này được dùng luôn, không refetch")
+    args = parser.parse_args()
+    
     print("=" * 80)
     print("🚀 NÂNG CẤP DỮ LIỆU KHÍ HẬU CHO MÔ HÌNH DỰ BÁO NĂNG SUẤT CÀ PHÊ")
     print("=" * 80)
     
-    upgraded_df = merge_features()
+    upgraded_df = merge_features(offline=args.offline, max_age_hours=args.max_age_hours)
     
     print("\n" + "=" * 80)
     print("✅ FEATURE UPGRADE COMPLETE")
@@ -0,0 +1,215 @@
+"""
+weather_generator.py
+
+Bộ sinh thời tiết ngẫu nhiên (block bootstrap) cho dự báo xác suất năm tương lai.
+
+Mỗi mùa giả lập được ghép từ các khối tháng liên tiếp (mặc định 3 tháng) lấy
+ngẫu nhiên từ các năm lịch sử đầy đủ trong weather_daklak_1990_2025.csv:
+
+    T1-3 ← năm 1998 | T4-6 ← năm 2016 | T7-9 ← năm 2003 | T10-12 ← năm 1991
+
+Trong mỗi khối, quan hệ giữa mưa/nhiệt/ẩm/bức xạ và tự tương quan theo ngày
+được giữ nguyên. Nhiệt độ được hiệu chỉnh theo xu hướng tuyến tính lịch sử
+(khối lấy từ năm cũ được "đưa" về năm mục tiêu). Kịch bản thời tiết
+(el_nino, severe_drought, ...) là phép biến đổi trên từng tháng.
+
+Mùa giả lập được tổng hợp thành thống kê tháng rồi đi qua feature engine
+vectorized (feature_engineering.features_from_monthly) và predict theo batch.
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+try:
+    from src.feature_engineering import (
+        WEATHER_DAILY_FILE, HOT_DAY_THRESHOLD,
+        load_daily_data, monthly_stats, feature_reference, features_from_monthly,
+    )
+except ImportError:  # chạy trực tiếp từ thư mục src/
+    from feature_engineering import (
+        WEATHER_DAILY_FILE, HOT_DAY_THRESHOLD,
+        load_daily_data, monthly_stats, feature_reference, features_from_monthly,
+    )
+
+DEFAULT_SIMULATIONS = 5000
+BLOCK_MONTHS = 3
+QUANTILES = (0.05, 0.10, 0.25, 0.50, 0.75, 0.90, 0.95)
+
+# Kịch bản: biến đổi theo tháng trên mùa giả lập
+# - rain_scale: nhân lượng mưa các tháng `months`
+# - temp_shift: cộng °C vào temp_max/temp_min các tháng `months`
+# - soil_scale: nhân độ ẩm đất; humidity_shift: cộng % độ ẩm không khí
+WEATHER_SCENARIOS = {
+    "normal": {"label": "Thời tiết bình thường"},
+    "favorable": {"label": "Thời tiết thuận lợi",
+                  "months": [2, 3, 4, 5, 6], "rain_scale": 1.15, "temp_shift": -0.5},
+    "el_nino": {"label": "El Niño (hạn hán)",
+                "months": [2, 3, 4, 5, 6], "rain_scale": 0.7, "temp_shift": 1.0,
+                "soil_scale": 0.9, "humidity_shift": -3.0},
+    "la_nina": {"label": "La Niña (mưa nhiều)",
+                "months": [2, 3, 10, 11, 12], "rain_scale": 1.4, "temp_shift": -0.5,
+                "humidity_shift": 3.0},
+    "severe_drought": {"label": "Hạn hán nghiêm trọng",
+                       "months": [2, 3, 4, 5, 6], "rain_scale": 0.5, "temp_shift": 1.5,
+                       "soil_scale": 0.8, "humidity_shift": -6.0},
+    "major_storm": {"label": "Bão lớn",
+                    "months": [10, 11, 12], "rain_scale": 1.8, "humidity_shift": 5.0},
+}
+
+
+class BlockBootstrapGenerator:
+    """
+    Block bootstrap trên thống kê tháng của các năm lịch sử đầy đủ.
+
+    Thống kê (tổng, số ngày) theo tháng được tính MỘT lần; mỗi mô phỏng chỉ
+    là phép gather chỉ số năm theo khối, nên 5000 mùa mất vài mili-giây.
+    """
+
+    def __init__(self, daily: pd.DataFrame, block_months: int = BLOCK_MONTHS):
+        if 12 % block_months != 0:
+            raise ValueError("block_months must divide 12")
+        self.block_months = block_months
+
+        years, stats = monthly_stats(daily)
+        self.reference = feature_reference(years, stats)   # chuẩn hoá SPI/anomaly theo lịch sử
+
+        # Chỉ bootstrap từ năm đủ 12 tháng
+        complete = (stats["rain_count"] > 0).all(axis=1)
+        self.years = years[complete].astype(int)
+        self.stats = {k: v[complete] for k, v in stats.items()}
+
+        # temp_max từng ngày (n_years, 12, 31) để đếm lại ngày nóng khi dịch nhiệt độ
+        daily = daily[daily["date"].dt.year.isin(self.years)]
+        row = np.searchsorted(self.years, daily["date"].dt.year.to_numpy())
+        self.daily_tmax = np.full((len(self.years), 12, 31), np.nan)
+        self.daily_tmax[row, daily["date"].dt.month.to_numpy() - 1,
+                        daily["date"].dt.day.to_numpy() - 1] = daily["temp_max"].to_numpy()
+
+        # Xu hướng nhiệt độ (°C/năm) từ trung bình temp_max hằng năm
+        annual_tmax = self.stats["temp_max_sum"].sum(axis=1) / self.stats["temp_max_count"].sum(axis=1)
+        self.temp_trend = float(np.polyfit(self.years, annual_tmax, 1)[0])
+
+    def _year_shifts(self, target_year: int, scenario: dict) -> np.ndarray:
+        """Độ dịch nhiệt độ (°C) cho mỗi (năm lịch sử, tháng)."""
+        trend = self.temp_trend * (target_year - self.years)
+        shift = np.repeat(trend[:, None], 12, axis=1)
+        months = [m - 1 for m in scenario.get("months", [])]
+        shift[:, months] += scenario.get("temp_shift", 0.0)
+        return shift
+
+    def transformed_stats(self, target_year: int, scenario: dict) -> dict:
+        """Thống kê tháng lịch sử sau khi áp xu hướng + kịch bản, shape (n_years, 12)."""
+        stats = {k: v.copy() for k, v in self.stats.items()}
+        shift = self._year_shifts(target_year, scenario)
+        for var in ("temp_max", "temp_min", "temp_avg"):
+            stats[f"{var}_sum"] += shift * stats[f"{var}_count"]
+
+        months = [m - 1 for m in scenario.get("months", [])]
+        stats["rain_sum"][:, months] *= scenario.get("rain_scale", 1.0)
+        stats["soil_0_7_sum"][:, months] *= scenario.get("soil_scale", 1.0)
+        stats["humidity_sum"][:, months] += scenario.get("humidity_shift", 0.0) * stats["humidity_count"][:, months]
+
+        # Ngày nóng: đếm lại trên temp_max ngày đã dịch
+        with np.errstate(invalid="ignore"):
+            stats["hot_days"] = (self.daily_tmax + shift[:, :, None] > HOT_DAY_THRESHOLD).sum(axis=-1).astype(float)
+        return stats
+
+    def simulate(self, n_sims: int = DEFAULT_SIMULATIONS, target_year: int = None,
+                 scenario: str = "normal", seed: int = 0) -> dict:
+        """
+        Sinh n_sims mùa giả lập.
+
+        Returns:
+            Dict thống kê tháng shape (n_sims, 12) (cùng key với monthly_stats)
+        """
+        if scenario not in WEATHER_SCENARIOS:
+            raise KeyError(f"Unknown scenario: {scenario}")
+        target_year = int(target_year if target_year is not None else self.years[-1] + 1)
+        stats = self.transformed_stats(target_year, WEATHER_SCENARIOS[scenario])
+
+        rng = np.random.default_rng(seed)
+        n_blocks = 12 // self.block_months
+        picks = rng.integers(0, len(self.years), size=(n_sims, n_blocks))
+        year_idx = np.repeat(picks, self.block_months, axis=1)     # (n_sims, 12)
+        month_idx = np.arange(12)[None, :]
+        return {k: v[year_idx, month_idx] for k, v in stats.items()}
+
+    def simulate_features(self, feature_columns: list, n_sims: int = DEFAULT_SIMULATIONS,
+                          target_year: int = None, scenario: str = "normal",
+                          seed: int = 0, fill_values: dict = None):
+        """
+        Ma trận features (n_sims, n_features) theo thứ tự feature_columns.
+
+        Feature không sinh được từ thời tiết ngày (ví dụ ENSO_MarJun) lấy từ
+        `fill_values` (thường là trung bình lịch sử).
+
+        Returns:
+            (X, filled) với filled = danh sách feature được điền hằng số
+        """
+        features = features_from_monthly(self.simulate(n_sims, target_year, scenario, seed), self.reference)
+        fill_values = fill_values or {}
+        missing = [c for c in feature_columns if c not in features and c not in fill_values]
+        if missing:
+            raise ValueError(f"Cannot simulate features: {missing}")
+
+        X = np.empty((n_sims, len(feature_columns)))
+        filled = []
+        for j, col in enumerate(feature_columns):
+            if col in features:
+                X[:, j] = features[col]
+            else:
+                X[:, j] = fill_values[col]
+                filled.append(col)
+        return X, filled
+
+
+def yield_distribution(samples, thresholds=None, quantiles=QUANTILES, bins: int = 20) -> dict:
+    """Quantile, xác suất vượt ngưỡng và histogram của phân phối năng suất."""
+    samples = np.asarray(samples, dtype=np.float64)
+    if thresholds is None:
+        thresholds = np.round(np.quantile(samples, [0.1, 0.5, 0.9]), 2)
+    counts, edges = np.histogram(samples, bins=bins)
+    return {
+        "mean": float(samples.mean()),
+        "std": float(samples.std()),
+        "quantiles": {f"p{int(round(q * 100))}": float(v) for q, v in zip(quantiles, np.quantile(samples, quantiles))},
+        "exceedance": {float(t): float((samples > t).mean()) for t in thresholds},
+        "histogram": {"edges": edges.tolist(), "counts": counts.tolist()},
+    }
+
+
+# ========================
+# GENERATOR DÙNG CHUNG (API)
+# ========================
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def get_generator(filepath=WEATHER_DAILY_FILE) -> BlockBootstrapGenerator:
+    """Generator fit một lần từ file thời tiết ngày (lazy, thread-safe)."""
+    global _generator
+    with _generator_lock:
+        if _generator is None:
+            daily = pd.read_csv(filepath, parse_dates=["date"])
+            _generator = BlockBootstrapGenerator(daily)
+        return _generator
+
+
+def main():
+    """In phân phối features mô phỏng cho năm tới theo từng kịch bản."""
+    daily = load_daily_data(WEATHER_DAILY_FILE)
+    generator = BlockBootstrapGenerator(daily)
+    print(f"\n🎲 Block bootstrap: {len(generator.years)} năm đầy đủ, "
+          f"xu hướng nhiệt {generator.temp_trend * 10:+.2f}°C/thập kỷ")
+
+    columns = ["rain_Feb_Mar", "temp_max_MayJun", "days_over_33", "SPI_MarJun"]
+    for scenario in WEATHER_SCENARIOS:
+        X, _ = generator.simulate_features(columns, scenario=scenario)
+        summary = ", ".join(f"{c}={np.median(X[:, j]):.1f}" for j, c in enumerate(columns))
+        print(f"   {scenario:<16} median: {summary}")
+
+
+if __name__ == "__main__":
+    main()
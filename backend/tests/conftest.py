@@ -0,0 +1,37 @@
+"""
+Fixture dùng chung: bảng train thật (features + năng suất) và model registry tạm
+"""
+
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from src import api, model_registry, serving
+from src.serving import ModelStore
+
+
+@pytest.fixture(scope="session")
+def training_frame():
+    """Features theo năm join năng suất thật (cột yield_ton_ha); không được sửa"""
+    features = pd.read_csv(serving.FEATURES_FILE)
+    yields = pd.read_csv(serving.YIELD_FILE)
+    return features.merge(yields[["year", "yield_ton_ha"]], on="year")
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch, training_frame):
+    """Registry tạm với hai version RandomForest (seed 42, 7) của model mặc định"""
+    registry_dir = tmp_path / "registry"
+    monkeypatch.setattr(model_registry, "REGISTRY_DIR", registry_dir)
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+
+    columns = [n for n, f in api.CustomPredictRequest.model_fields.items() if f.is_required()]
+    for seed in (42, 7):
+        model = RandomForestRegressor(n_estimators=10, random_state=seed)
+        model.fit(training_frame[columns].values, training_frame["yield_ton_ha"])
+        model_registry.register_model(serving.DEFAULT_MODEL_NAME, model, columns)
+
+    previous = api.store
+    api.store = ModelStore()
+    yield registry_dir
+    api.store = previous
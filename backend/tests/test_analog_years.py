@@ -0,0 +1,49 @@
+"""
+Test cases cho chỉ mục năm tương tự (analog years)
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.analog_years import AnalogIndex, parse_weights
+
+FEATURES = ["rain", "temp"]
+
+
+def _data():
+    features = pd.DataFrame({
+        "year": [2001, 2002, 2003, 2004, 2005],
+        "rain": [100.0, 110.0, 300.0, 305.0, 200.0],
+        "temp": [30.0, 34.0, 30.5, 33.5, 32.0],
+    })
+    yields = pd.DataFrame({"year": [2001, 2002, 2003, 2004], "yield_ton_ha": [2.1, 2.2, 2.3, 2.4]})
+    return features, yields
+
+
+def test_query_matches_brute_force():
+    """KD-tree trả về đúng thứ tự như tính khoảng cách chuẩn hoá trực tiếp"""
+    features, yields = _data()
+    weights = np.array([1.0, 4.0])
+    index = AnalogIndex(features, FEATURES, yields, weights=weights)
+    assert len(index) == 4   # năm 2005 chưa có yield
+
+    x = np.array([120.0, 33.0])
+    X = features[features.year <= 2004][FEATURES].values
+    dist = np.sqrt((((X - X.mean(0)) / X.std(0) - (x - X.mean(0)) / X.std(0)) ** 2 * weights).sum(1))
+    expected = features.year.values[:4][np.argsort(dist)]
+
+    result = index.query(x, k=4)
+    assert [r["year"] for r in result] == list(expected)
+    assert result[0]["yield_ton_ha"] == yields.set_index("year").loc[expected[0], "yield_ton_ha"]
+
+
+def test_exclude_year_and_weights():
+    features, yields = _data()
+    index = AnalogIndex(features, FEATURES, yields)
+    x = features.set_index("year").loc[2003, FEATURES].to_dict()
+    assert [r["year"] for r in index.query(x, k=2, exclude_year=2003)][0] == 2004
+
+    np.testing.assert_allclose(parse_weights("temp:3", FEATURES), [1.0, 3.0])
+    with pytest.raises(ValueError):
+        parse_weights("unknown:1", FEATURES)
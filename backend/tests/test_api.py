@@ -2,8 +2,17 @@
 Test cases cho API endpoints
 """
 
+import json
+import asyncio
+import threading
+
 import pytest
+import numpy as np
+import pandas as pd
 from fastapi.testclient import TestClient
+from sklearn.ensemble import RandomForestRegressor
+
+from src import api, model_registry, serving, benchmark_api, inference_pool
 from src.api import app
 
 client = TestClient(app)
@@ -23,15 +32,6 @@ def test_health_check():
     assert response.json()["status"] == "healthy"
 
 
-def test_predict_year():
-    """Test predict year endpoint"""
-    response = client.get("/predict-year?year=2026")
-    assert response.status_code == 200
-    data = response.json()
-    assert "year" in data
-    assert data["year"] == 2026
-
-
 def test_feature_importance():
     """Test feature importance endpoint"""
     response = client.get("/feature-importance")
@@ -48,3 +48,362 @@ def test_yield_history():
     data = response.json()
     assert "years" in data
     assert "actual_yields" in data
+
+
+
+
+def test_predict_year(registry):
+    """Test predict year endpoint"""
+    client.post("/admin/reload", json={}, headers={"X-Admin-Token": "secret"})
+    last_year = api.store.get().years[-1]
+    
+    response = client.get(f"/predict-year?year={last_year}")
+    assert response.status_code == 200
+    data = response.json()
+    assert "year" in data
+    assert data["year"] == last_year
+    
+    # Năm chưa có dữ liệu (và không phải mùa đang nowcast) -> 404, ngoài khoảng -> 422
+    if api.nowcast.get_nowcaster().year != last_year + 1:
+        assert client.get(f"/predict-year?year={last_year + 1}").status_code == 404
+    assert client.get("/predict-year?year=2031").status_code == 422
+
+
+def test_year_predictions_match_custom_inputs(registry, training_frame):
+    """Dự báo theo năm dùng đầu vào float64 như /predict-custom (không qua float32 của feature store)"""
+    from sklearn.preprocessing import StandardScaler
+    
+    features = pd.read_csv(serving.FEATURES_FILE)
+    columns = serving.build_bundle(registry_dir=registry).feature_columns
+    df = training_frame
+    scaler = StandardScaler().fit(df[columns].values)
+    model = RandomForestRegressor(n_estimators=10, random_state=0)
+    model.fit(scaler.transform(df[columns].values), df["yield_ton_ha"])
+    model_registry.register_model("scaled", model, columns, scaler=scaler, scaled_inputs=True,
+                                  reference_X=df[columns].values)
+    
+    bundle = serving.build_bundle("scaled", registry_dir=registry)
+    assert bundle.inputs.dtype == np.float64 and not bundle.inputs.flags.writeable
+    X = features.set_index("year").loc[bundle.years, columns].to_numpy()
+    np.testing.assert_array_equal(bundle.inputs, X)
+    expected = bundle.predict(X)
+    assert [bundle.predictions[y] for y in bundle.years] == expected.tolist()
+    year = bundle.years[-1]
+    np.testing.assert_array_equal(bundle.input_row(year), X[-1])
+
+
+def test_admin_requires_token(registry):
+    """Admin endpoint từ chối request thiếu token hoặc model/version ngoài registry"""
+    response = client.post("/admin/reload", json={})
+    assert response.status_code == 403
+    
+    # name/version ngoài registry -> 404, không build đường dẫn
+    headers = {"X-Admin-Token": "secret"}
+    for body in ({"name": "../..", "version": "v1"}, {"version": "../../original/v1"}):
+        assert client.post("/admin/reload", json=body, headers=headers).status_code == 404
+
+
+def test_admin_reload_swaps_bundle(registry):
+    """Hot reload thay model đang serve mà không cần restart"""
+    response = client.post("/admin/reload", json={}, headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200
+    assert response.json()["current"] == f"{serving.DEFAULT_MODEL_NAME}:v2"
+    
+    response = client.get("/predict-year?year=2024")
+    assert response.status_code == 200
+    
+    response = client.post("/admin/reload", json={"version": "v9"}, headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 404
+    assert client.get("/health").json()["model_name"] == f"{serving.DEFAULT_MODEL_NAME}:v2"
+
+
+def test_model_selection_per_request(registry):
+    """Hai version cùng serve, chọn bằng model=name:version"""
+    headers = {"X-Admin-Token": "secret"}
+    client.post("/admin/reload", json={"version": "v1"}, headers=headers)
+    client.post("/admin/reload", json={"version": "v2", "keep_previous": True}, headers=headers)
+    
+    name = serving.DEFAULT_MODEL_NAME
+    v1 = client.get(f"/predict-year?year=2020&model={name}:v1")
+    v2 = client.get(f"/predict-year?year=2020&model={name}:v2")
+    assert v1.headers["X-Model"] == f"{name}:v1"
+    assert v2.headers["X-Model"] == f"{name}:v2"
+    assert client.get(f"/predict-year?year=2020&model={name}").headers["X-Model"] == f"{name}:v2"
+    assert client.get("/predict-year?year=2020&model=unknown").status_code == 404
+    
+    stats = client.get("/models").json()["models"]
+    assert stats[f"{name}:v1"]["stats"]["requests"] == 1
+
+
+def test_sensitivity_endpoints(registry):
+    """PDP/ICE + stress test theo model, tính một lần rồi cache theo version"""
+    client.post("/admin/reload", json={}, headers={"X-Admin-Token": "secret"})
+    
+    response = client.get("/sensitivity?grid_size=10&ice=true")
+    assert response.status_code == 200
+    data = response.json()
+    feature = data["features"][0]
+    assert len(feature["grid"]) == len(feature["pdp"]) == 10
+    assert len(feature["ice"]) == len(data["years"])
+    assert len(data["scenarios"]) == 6
+    
+    bundle = api.store.get()
+    assert ("ice", 10) in bundle.cache
+    
+    response = client.get("/sensitivity/2d?feature_x=rain_Feb_Mar&feature_y=SPI_MarJun&grid_size=5")
+    assert response.status_code == 200
+    assert len(response.json()["values"]) == 5
+    assert client.get("/sensitivity/2d?feature_x=rain_Feb_Mar&feature_y=nope").status_code == 400
+
+
+def test_forecast_distribution(registry):
+    """Phân phối năng suất Monte Carlo cho năm tương lai, cache theo kịch bản"""
+    client.post("/admin/reload", json={}, headers={"X-Admin-Token": "secret"})
+    
+    response = client.get("/forecast-distribution?year=2027&scenario=el_nino&n_sims=500&thresholds=2.5,3")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["n_simulations"] == 500
+    assert data["quantiles"]["p5"] <= data["quantiles"]["p50"] <= data["quantiles"]["p95"]
+    assert [e["threshold"] for e in data["exceedance"]] == [2.5, 3.0]
+    assert ("forecast", 2027, "el_nino", 500) in api.store.get().cache
+    
+    assert client.get("/forecast-distribution?year=2027&scenario=unknown").status_code == 400
+
+
+def test_analog_years(registry):
+    """Top-k năm tương tự kèm năng suất thực tế"""
+    client.post("/admin/reload", json={}, headers={"X-Admin-Token": "secret"})
+    
+    response = client.get("/analog-years?year=2020&k=3")
+    assert response.status_code == 200
+    analogs = response.json()["analogs"]
+    assert len(analogs) == 3
+    assert all(a["year"] != 2020 and a["yield_ton_ha"] is not None for a in analogs)
+    assert analogs[0]["distance"] <= analogs[-1]["distance"]
+    
+    assert client.get("/analog-years?year=2020&weights=importance").status_code == 200
+    assert client.get("/analog-years?year=2020&weights=bad:1").status_code == 400
+    
+    body = api.store.get().features_by_year[2020]
+    assert client.post("/analog-years?k=1", json=body).json()["analogs"][0]["year"] == 2020
+    assert len(client.post("/predict-custom", json=body).json()["analog_years"]) == 3
+
+
+def test_predict_current_season_nowcast(registry):
+    """Mùa đang diễn ra trả về dự báo as-of thay vì features chưa đủ cửa sổ"""
+    client.post("/admin/reload", json={}, headers={"X-Admin-Token": "secret"})
+    
+    season = api.nowcast.get_nowcaster()
+    data = client.get(f"/predict-year?year={season.year}").json()
+    assert data["as_of"] == season.as_of.date().isoformat()
+    assert 0 < data["observed_fraction"] < 1
+    assert data["confidence_lower"] <= data["predicted_yield"] <= data["confidence_upper"]
+    
+    assert client.get(f"/predict-year?year={season.year}&method=bad").status_code == 400
+    assert client.get("/predict-year?year=2020").json()["as_of"] is None
+
+
+def test_live_features_and_ingest(registry, monkeypatch):
+    """Ngày đẩy qua /admin/ingest có ngay trong /live-features"""
+    daily = pd.read_csv(api.streaming_ingest.WEATHER_DAILY_FILE, parse_dates=["date"])
+    ingestor = api.streaming_ingest.StreamingIngestor(
+        api.streaming_ingest.OnlineAggregates(daily[daily["date"] <= "2024-03-31"]))
+    monkeypatch.setattr(api.streaming_ingest, "_ingestor", ingestor)
+    
+    before = client.get("/live-features").json()
+    assert before["year"] == 2024 and before["as_of"] == "2024-03-31"
+    assert before["features"]["rain_OctDec"] is None
+    
+    record = {"date": "2024-04-01", "temp_max": 34.0, "temp_min": 22.0, "rain": 5.0}
+    assert client.post("/admin/ingest", json=[record]).status_code == 403
+    counts = client.post("/admin/ingest", json=[record, record], headers={"X-Admin-Token": "secret"}).json()
+    assert counts == {"added": 1, "updated": 0, "duplicate": 1, "as_of": "2024-04-01"}
+    
+    after = client.get("/live-features?year=2024").json()
+    april = after["monthly"][3]
+    assert after["days_observed"] == before["days_observed"] + 1
+    assert april["n_days"] == 1 and april["hot_days"] == 1 and april["rain_sum"] == 5.0
+    assert client.get("/live-features?year=1980").status_code == 404
+
+
+def test_regions_endpoints(registry, monkeypatch):
+    """Tỉnh mặc định đi qua ModelStore, tỉnh khác dùng model riêng; dự báo mọi vùng một lần gọi"""
+    client.post("/admin/reload", json={}, headers={"X-Admin-Token": "secret"})
+    columns = api.store.get().feature_columns
+    features = pd.read_csv(serving.FEATURES_FILE)
+    model = RandomForestRegressor(n_estimators=10, random_state=3)
+    model.fit(features[columns].values, features["rain_Feb_Mar"] / 1000)
+    model_registry.register_model("pepper", model, columns)
+    
+    region_registry = api.regions.RegionRegistry([
+        api.regions.Region(**api.regions.DEFAULT_REGIONS[0]),
+        api.regions.Region("Gia Lai", "pepper", "Hồ tiêu", model="pepper"),
+    ], registry_dir=registry)
+    monkeypatch.setattr(api.regions, "_registry", region_registry)
+    
+    default = client.get("/predict-scenario?year=2025")
+    assert default.json()["crop"] == "Cà phê Robusta" and default.json()["province"] == "Đắk Lắk"
+    pepper = client.get("/predict-scenario?year=2025&province=gia lai")
+    assert pepper.json()["crop"] == "Hồ tiêu" and pepper.headers["X-Model"].startswith("pepper:")
+    assert client.get("/predict-scenario?year=2025&province=Kon Tum").status_code == 404
+    assert client.get("/predict-scenario?year=2025&province=Gia Lai&model=original").status_code == 400
+    
+    data = client.get("/predict-regions?year=2030").json()
+    assert [p["region"] for p in data["predictions"]] == ["dak-lak/robusta", "gia-lai/pepper"]
+    pepper_bundle = region_registry.bundle(region_registry.regions["gia-lai/pepper"])
+    assert data["predictions"][1]["base_year"] == pepper_bundle.years[-1]
+    assert data["predictions"][1]["predicted_yield"] == pytest.approx(
+        pepper_bundle.predictions[pepper_bundle.years[-1]])
+    assert len(client.get("/predict-regions?year=2030&crop=pepper").json()["predictions"]) == 1
+    assert client.get("/predict-regions?year=2030&crop=durian").status_code == 404
+    
+    listed = client.get("/regions").json()
+    assert [r["resident"] for r in listed["regions"]] == [False, True]
+
+
+def test_grid_endpoints(registry, monkeypatch, tmp_path):
+    """Lưới: metadata JSON, toạ độ + năng suất nhị phân float32, tổng hợp theo huyện"""
+    client.post("/admin/reload", json={}, headers={"X-Admin-Token": "secret"})
+    current = api.store.get()
+    
+    features = pd.read_csv(serving.FEATURES_FILE)
+    columns = [c for c in features.columns if c != "year"]
+    X = np.stack([features[columns].to_numpy() * scale for scale in (1.0, 0.9, 1.1)])
+    grid = api.gridded.YieldGrid(
+        lat=np.array([12.5, 12.6, 12.7]), lon=np.array([108.0, 108.1, 108.2]),
+        years=features["year"].to_numpy(), feature_columns=columns, X=X,
+        area_ha=np.array([100.0, 300.0, 0.0]), district=np.array(["A", "A", "B"]), province="Đắk Lắk",
+    )
+    api.gridded.save_grid(grid, tmp_path / "grid.npz")
+    monkeypatch.setattr(api.gridded, "GRID_FILE", tmp_path / "grid.npz")
+    
+    info = client.get("/grid").json()
+    assert info["cells"] == 3 and info["districts"] == ["A", "B"]
+    
+    cells = client.get("/grid/cells")
+    assert cells.headers["X-Grid-Shape"] == "3,2"
+    np.testing.assert_allclose(np.frombuffer(cells.content, dtype="<f4").reshape(3, 2)[:, 0], [12.5, 12.6, 12.7],
+                               rtol=1e-6)
+    
+    year = int(features["year"].iloc[-1])
+    response = client.get(f"/grid/yield?year={year}")
+    yields = np.frombuffer(response.content, dtype="<f4")
+    assert response.headers["content-type"] == "application/octet-stream"
+    assert response.headers["X-Model"] == current.key and yields.shape == (3,)
+    assert yields[0] == pytest.approx(current.predictions[year], rel=1e-5)
+    
+    districts = client.get(f"/grid/aggregate?year={year}").json()["regions"]
+    assert districts[0]["yield_ton_ha"] == pytest.approx((yields[0] * 100 + yields[1] * 300) / 400, abs=1e-4)
+    assert districts[1]["yield_ton_ha"] is None
+    assert client.get(f"/grid/aggregate?year={year}&level=commune").status_code == 400
+    assert client.get("/grid/yield?year=1800").status_code == 404
+
+
+def test_metrics_endpoint(registry):
+    """/metrics trả text Prometheus với latency theo route, inference và cache"""
+    client.post("/admin/reload", json={}, headers={"X-Admin-Token": "secret"})
+    metrics = api.metrics
+    before = metrics.HTTP_LATENCY.count(method="GET", route="/predict-scenario")
+    for _ in range(3):
+        client.get("/predict-scenario?year=2025")
+    client.get("/no-such-route")
+    
+    response = client.get("/metrics")
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert metrics.HTTP_LATENCY.count(method="GET", route="/predict-scenario") == before + 3
+    assert 'http_requests_total{method="GET",route="/predict-scenario",status="200"}' in text
+    assert 'route="unmatched",status="404"' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/predict-scenario",le="+Inf"}' in text
+    assert 'model_inference_seconds_count{model="original"}' in text
+    assert 'model_load_seconds_count{model="original"}' in text
+    assert 'cache_requests_total{cache="table",result="hit"}' in text
+    assert "process_resident_memory_bytes" in text
+    assert "http_requests_in_flight 1" in text    # chính request /metrics
+
+
+def test_benchmark_harness(registry, tmp_path):
+    """Benchmark in-process + uvicorn cho mọi endpoint, lưu JSON và so sánh với baseline"""
+    client.post("/admin/reload", json={}, headers={"X-Admin-Token": "secret"})
+    report = asyncio.run(benchmark_api.run_benchmark(concurrency=(1, 4), requests=8, warmup=2))
+    
+    assert set(report["results"]) == {"inprocess", "uvicorn"}
+    for mode, results in report["results"].items():
+        assert set(results) == set(benchmark_api.endpoints())
+        for name, levels in results.items():
+            assert levels["c4"]["requests"] == 8 and levels["c4"]["errors"] == {}, (mode, name)
+            assert 0 < levels["c4"]["p50_ms"] <= levels["c4"]["p99_ms"]
+            assert {"validate", "handler", "serialize", "total"} <= set(levels["c4"]["phases_ms"])
+    assert report["results"]["inprocess"]["predict-custom"]["allocations"]["alloc_peak_kib"] > 0
+    
+    path = benchmark_api.save_results(report, tmp_path / "bench.json")
+    baseline = json.loads(path.read_text())
+    baseline["results"]["inprocess"]["yield-history"]["c1"]["p50_ms"] /= 10
+    regressions = [r for r in benchmark_api.compare(report, baseline) if r["regression"]]
+    assert [(r["mode"], r["endpoint"], r["metric"]) for r in regressions] == \
+        [("inprocess", "yield-history", "p50_ms")]
+
+
+def test_inference_pool_backpressure(registry, monkeypatch):
+    """Pool suy luận đầy -> 503 + Retry-After; predict chạy trong pool"""
+    client.post("/admin/reload", json={}, headers={"X-Admin-Token": "secret"})
+    body = benchmark_api.endpoints()["predict-custom"][3]
+    assert client.post("/predict-custom", json=body).status_code == 200
+    
+    pool = inference_pool.InferencePool("test-api", workers=1, queue=0)
+    monkeypatch.setitem(inference_pool._pools, "inference", pool)
+    release = threading.Event()
+    pool.submit(release.wait)
+    try:
+        response = client.post("/predict-custom", json=body)
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == str(inference_pool.RETRY_AFTER_SECONDS)
+        assert 'inference_pool_rejected_total{pool="test-api"} 1' in client.get("/metrics").text
+    finally:
+        release.set()
+        pool.shutdown()
+
+
+def test_data_endpoints_without_format_packages(registry, monkeypatch):
+    """Thiếu orjson/msgpack/pyarrow: JSON qua FastAPI, định dạng nhị phân -> 406"""
+    client.post("/admin/reload", json={}, headers={"X-Admin-Token": "secret"})
+    monkeypatch.setattr(api, "feature_store", serving.load_feature_store())
+    for flag in ("HAS_ORJSON", "HAS_MSGPACK", "HAS_ARROW"):
+        monkeypatch.setattr(api.response_formats, flag, False)
+    
+    response = client.get("/yield-history", headers={"Accept": "application/vnd.apache.arrow.stream"})
+    assert response.status_code == 200 and response.headers["content-type"] == "application/json"
+    assert response.json()["years"] == api.store.get().years
+    for endpoint in ("/yield-history", "/weather-trend"):
+        for fmt in ("msgpack", "arrow"):
+            assert client.get(f"{endpoint}?format={fmt}").status_code == 406
+        assert client.get(f"{endpoint}?format=json").status_code == 200
+
+
+def test_data_endpoint_formats(registry, monkeypatch):
+    """/yield-history, /weather-trend: JSON (orjson hoặc FastAPI) giống nhau, MessagePack/Arrow, 406"""
+    client.post("/admin/reload", json={}, headers={"X-Admin-Token": "secret"})
+    monkeypatch.setattr(api, "feature_store", serving.load_feature_store())
+    
+    fast = client.get("/yield-history")
+    weather = client.get("/weather-trend")
+    monkeypatch.setattr(api.response_formats, "HAS_ORJSON", False)
+    assert client.get("/yield-history").json() == fast.json()
+    assert client.get("/weather-trend").json() == weather.json()
+    assert fast.headers["x-model"] == api.store.get().key
+    
+    assert client.get("/yield-history?format=xml").status_code == 406
+    
+    msgpack = pytest.importorskip("msgpack")
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.ipc
+    
+    packed = client.get("/yield-history", headers={"Accept": "application/msgpack"})
+    assert packed.headers["content-type"] == "application/msgpack" and "Accept" in packed.headers["vary"]
+    years = msgpack.unpackb(packed.content)["years"]
+    assert np.frombuffer(years["data"], dtype=years["dtype"]).tolist() == fast.json()["years"]
+    
+    table = pa.ipc.open_stream(client.get("/weather-trend?format=arrow").content).read_all()
+    assert table.column("years").to_pylist() == weather.json()["years"]
+    np.testing.assert_allclose(table.column("SPI_MarJun").to_numpy(), weather.json()["SPI_MarJun"], rtol=1e-6)
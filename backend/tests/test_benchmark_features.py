@@ -0,0 +1,49 @@
+"""
+Test cases cho micro-benchmark feature engineering / tiền xử lý
+"""
+
+import pytest
+
+from src import benchmark_features, benchmark_results, feature_engineering
+
+
+def test_synthetic_daily_matches_weather_schema():
+    daily = benchmark_features.synthetic_daily(3, seed=1)              # 1990-1992 (1992 nhuận)
+    assert list(daily.columns) == ["date", "temp_max", "temp_min", "rain", "humidity", "radiation",
+                                   "soil_0_7", "soil_7_28"]
+    assert len(daily) == 365 * 3 + 1 and daily["date"].dt.year.nunique() == 3
+    assert (daily["rain"] >= 0).all() and (daily["temp_max"] > daily["temp_min"]).all()
+    # Mùa mưa (T5-T10) mưa nhiều hơn mùa khô
+    wet = daily["date"].dt.month.between(5, 10)
+    assert daily.loc[wet, "rain"].mean() > 2 * daily.loc[~wet, "rain"].mean()
+
+    features = feature_engineering.create_yearly_features_fast(daily)
+    assert len(features) == 3 and features["rain_Feb_Mar"].notna().all()
+
+    assert benchmark_features.parse_scale("medium") == (10, 70)
+    assert benchmark_features.parse_scale("4x12") == (4, 12)
+    with pytest.raises(ValueError):
+        benchmark_features.parse_scale("huge")
+
+
+def test_run_benchmark_and_compare(tmp_path):
+    report = benchmark_features.run_benchmark(["2x4"], repeats=1)
+    assert set(report["results"]) == set(benchmark_features.FUNCTIONS)
+    for stats in (scales["2x4"] for scales in report["results"].values()):
+        assert (stats["points"], stats["years"]) == (2, 4)
+        assert stats["median_s"] > 0 and stats["peak_mib_per_call"] > 0
+
+    saved = benchmark_features.save_results(report, tmp_path / "features.json")
+    assert saved.exists()
+
+    slower = {"results": {name: {"2x4": dict(s["2x4"], median_s=s["2x4"]["median_s"] * 2)}
+                          for name, s in report["results"].items()}}
+    rows = benchmark_features.compare(slower, report)
+    assert len(rows) == 2 * len(benchmark_features.FUNCTIONS)
+    assert {r["function"] for r in rows if r["regression"]} == set(benchmark_features.FUNCTIONS)
+    assert not any(r["regression"] for r in benchmark_features.compare(report, report))
+
+    # Quy tắc --compare dùng chung với benchmark API: có regression -> thoát mã 1
+    benchmark_results.check_regressions(benchmark_features.compare(report, report))
+    with pytest.raises(SystemExit):
+        benchmark_results.check_regressions(rows)
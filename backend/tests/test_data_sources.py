@@ -0,0 +1,201 @@
+"""
+Test cases cho lớp HTTP async dùng chung (data_sources) với server fixture local
+"""
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import pandas as pd
+import pytest
+
+from src import data_sources
+from src.data_sources import SourceClient, SourceError, TTLCache, get_adapter, refresh_sources
+
+ONI_TEXT = """SEAS  YR   TOTAL   ANOM
+DJF 2015  27.1  0.6
+MAM 2015  28.2  1.0
+AMJ 2015  28.6  1.2
+MAM 2016  28.3  0.5
+AMJ 2016  28.2  -0.1
+MAM 2017  27.9  -99.9
+AMJ 2017  28.0  0.3
+"""
+
+
+def _open_meteo(query):
+    year = int(query["start_date"][0][:4])
+    days = pd.date_range(query["start_date"][0], query["end_date"][0])
+    hours = pd.date_range(days[0], days[-1] + pd.Timedelta(hours=23), freq="h")
+    return {
+        "daily": {
+            "time": [d.strftime("%Y-%m-%d") for d in days],
+            "temperature_2m_max": [30.0 + year % 10] * len(days),
+            "temperature_2m_min": [20.0] * len(days),
+            "precipitation_sum": [1.0] * len(days),
+            "relative_humidity_2m_mean": [80] * len(days),
+            "shortwave_radiation_sum": [15.0] * len(days),
+        },
+        "hourly": {
+            "time": [h.strftime("%Y-%m-%dT%H:%M") for h in hours],
+            "soil_moisture_0_to_7cm": [0.2 + (h.hour % 2) * 0.1 for h in hours],
+            "soil_moisture_7_to_28cm": [0.3] * len(hours),
+        },
+    }
+
+
+def _nasa(query):
+    start, end = query["start"][0], query["end"][0]
+    days = pd.date_range(start, end)
+    values = {d.strftime("%Y%m%d"): (-999 if d.strftime("%m%d") == "0601" else 20.0) for d in days}
+    return {"properties": {"parameter": {"ALLSKY_SFC_SW_DWN": values}}}
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        with server.lock:
+            server.hits[url.path] = server.hits.get(url.path, 0) + 1
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            hits = server.hits[url.path]
+        try:
+            time.sleep(server.delay)
+            if url.path == "/flaky" and hits <= 2:
+                self.send_response(503)
+                self.send_header("Retry-After", "0")
+                self.end_headers()
+                return
+            if url.path == "/missing":
+                self.send_response(404)
+                self.end_headers()
+                return
+            if url.path == "/oni":
+                body, content_type = ONI_TEXT.encode(), "text/plain"
+            else:
+                handler = {"/archive": _open_meteo, "/power": _nasa}.get(url.path, lambda q: {"ok": hits})
+                body, content_type = json.dumps(handler(query)).encode(), "application/json"
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    httpd.lock = threading.Lock()
+    httpd.hits, httpd.active, httpd.max_active, httpd.delay = {}, 0, 0, 0.0
+    httpd.base = f"http://127.0.0.1:{httpd.server_port}"
+    httpd.host = f"127.0.0.1:{httpd.server_port}"
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_refresh_all_sources_concurrently(server):
+    """Ba adapter chạy đồng thời qua một client và parse đúng bảng dữ liệu"""
+    server.delay = 0.05
+    adapters = [
+        get_adapter("open_meteo", base_url=server.base + "/archive", end_date="2016-03-31"),
+        get_adapter("nasa_power", base_url=server.base + "/power", chunk_years=1),
+        get_adapter("noaa_oni", base_url=server.base + "/oni"),
+    ]
+
+    async def run():
+        async with SourceClient(cache=TTLCache()) as client:
+            return await refresh_sources(adapters, 2015, 2016, client)
+
+    results = _run(run())
+
+    weather = results["open_meteo"]
+    assert list(weather.columns) == ["date", "temp_max", "temp_min", "rain", "humidity",
+                                     "radiation", "soil_0_7", "soil_7_28"]
+    assert weather["date"].min() == pd.Timestamp("2015-01-01")
+    assert weather["date"].max() == pd.Timestamp("2016-03-31")
+    assert weather["soil_0_7"].iloc[0] == pytest.approx(0.25)
+
+    nasa = results["nasa_power"].set_index("year")["radiation_JunSep_NASA"]
+    assert nasa[2015] == pytest.approx(20.0 * 121)   # 01/06 là -999 -> NaN, bỏ qua khi cộng
+
+    oni = results["noaa_oni"].set_index("year")["ENSO_MarJun"]
+    assert oni[2015] == pytest.approx(1.1) and oni[2016] == pytest.approx(0.2)
+    assert 2017 not in oni.index
+
+    # 2 chunk Open-Meteo + 2 chunk NASA + 1 ONI chồng lên nhau theo thời gian
+    assert server.max_active >= 3
+
+
+def test_per_host_concurrency_limit(server):
+    server.delay = 0.02
+
+    async def run():
+        async with SourceClient(policies={server.host: {"concurrency": 2, "rate": 1000, "burst": 1000}},
+                                cache=TTLCache()) as client:
+            await asyncio.gather(*(client.get(server.base + "/data", {"i": i}) for i in range(8)))
+
+    _run(run())
+    assert server.hits["/data"] == 8 and server.max_active == 2
+
+
+def test_retry_backoff_and_errors(server):
+    """5xx được retry (Retry-After), 4xx raise ngay, hết lượt thì SourceError"""
+    async def run(path, retries):
+        async with SourceClient(max_retries=retries, backoff_base=0.001, cache=TTLCache()) as client:
+            return await client.get(server.base + path), client.stats
+
+    payload, stats = _run(run("/flaky", 3))
+    assert payload == {"ok": 3} and stats["retries"] == 2
+
+    with pytest.raises(SourceError, match="HTTP 404"):
+        _run(run("/missing", 3))
+    assert server.hits["/missing"] == 1
+
+    server.hits.clear()
+    with pytest.raises(SourceError, match="after 2 attempts"):
+        _run(run("/flaky", 1))
+
+
+def test_response_cache_ttl(server):
+    now = [0.0]
+    cache = TTLCache(clock=lambda: now[0])
+
+    async def get():
+        async with SourceClient(cache=cache) as client:
+            return await client.get(server.base + "/data", {"q": 1}, ttl=60)
+
+    assert _run(get()) == {"ok": 1}
+    assert _run(get()) == {"ok": 1} and server.hits["/data"] == 1
+    now[0] = 61.0
+    assert _run(get()) == {"ok": 2} and server.hits["/data"] == 2
+
+
+def test_adapter_registry():
+    assert {"open_meteo", "nasa_power", "noaa_oni"} <= set(data_sources.ADAPTERS)
+    with pytest.raises(KeyError):
+        get_adapter("unknown")
+
+    class Incomplete(data_sources.SourceAdapter):
+        def build_requests(self, start_year, end_year):
+            return []
+
+    with pytest.raises(TypeError):   # thiếu parse(): lỗi ngay khi tạo, không phải lúc fetch
+        Incomplete()
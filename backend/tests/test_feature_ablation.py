@@ -0,0 +1,56 @@
+"""
+Test cases cho feature ablation runner
+"""
+
+import numpy as np
+import pandas as pd
+from sklearn.tree import DecisionTreeRegressor
+
+from src.feature_ablation import AblationRunner
+
+
+def _make_df(n_years=14, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "year": np.arange(2011, 2011 + n_years),
+        "signal": rng.normal(size=n_years),
+        "noise_a": rng.normal(size=n_years),
+        "noise_b": rng.normal(size=n_years),
+    })
+    df["yield_ton_ha"] = 3.0 + 0.5 * df["signal"]
+    return df
+
+
+def _runner(tmp_path=None, **kwargs):
+    cache_file = tmp_path / "cache.json" if tmp_path is not None else None
+    return AblationRunner(_make_df(), estimator=DecisionTreeRegressor(random_state=0),
+                          n_jobs=1, cache_file=cache_file, **kwargs)
+
+
+def test_cache_dedupes_subsets(tmp_path):
+    """Tập con trùng (kể cả khác thứ tự) chỉ train một lần, cache dùng lại giữa các lần chạy"""
+    runner = _runner(tmp_path)
+    first = runner.evaluate_many([["signal", "noise_a"], ["noise_a", "signal"], ["signal"]])
+    assert runner.n_trained == 2
+    assert first[0] == first[1]
+
+    again = _runner(tmp_path)
+    assert again.evaluate(["signal"]) == first[2]
+    assert again.n_trained == 0
+
+
+def test_strategies_rank_informative_feature():
+    """Feature mang tín hiệu được forward chọn đầu tiên và LOO đánh giá quan trọng nhất"""
+    runner = _runner()
+    base = ["signal", "noise_a", "noise_b"]
+
+    loo = runner.leave_one_out(base)
+    assert max(loo, key=lambda r: r["delta_mape"])["change"] == "-signal"
+
+    forward = runner.forward()
+    assert forward[0]["change"] == "+signal"
+
+    table = runner.run(["loo", "add_one", "forward", "backward"], base=base)
+    assert list(table["rank"]) == list(range(1, len(table) + 1))
+    assert table["mape"].is_monotonic_increasing
+    assert "signal" in table.iloc[0]["features"].split(",")
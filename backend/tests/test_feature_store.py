@@ -0,0 +1,59 @@
+"""
+Test cases cho feature store (ma trận float32 + chỉ mục năm -> hàng)
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import serving
+from src.feature_store import FeatureStore, to_list
+
+
+@pytest.fixture
+def table():
+    return pd.DataFrame({
+        "year": [2003, 2001, 2002],
+        "rain": [17.400000000000002, 12.0, np.nan],
+        "temp": [28.718032786885246, 30.5, 29.0],
+        "station": ["a", "b", "c"],
+    })
+
+
+def test_rows_and_columns_are_readonly_views(table):
+    store = FeatureStore.from_frame(table)
+    assert store.columns == ("rain", "temp") and store.matrix.dtype == np.float32
+    assert store.matrix.flags.c_contiguous
+
+    row = store.row(2001)
+    assert np.shares_memory(row, store.matrix) and np.shares_memory(store.column("temp"), store.matrix)
+    np.testing.assert_array_equal(row, np.array([12.0, 30.5], dtype=np.float32))
+    with pytest.raises(ValueError):
+        row[0] = 1.0
+
+    assert 2002 in store and 2004 not in store and 1990 not in store
+    with pytest.raises(KeyError):
+        store.row(2000)
+    np.testing.assert_array_equal(store.rows([2003, 2001])[:, 1], np.float32([28.718032786885246, 30.5]))
+
+
+def test_select_mean_and_json_values(table):
+    store = FeatureStore.from_frame(table)
+    selected = store.select(["temp", "rain"])
+    assert selected is store.select(["temp", "rain"]) and store.select(["rain", "temp"]) is store
+    assert selected.columns == ("temp", "rain") and selected.matrix.flags.c_contiguous
+    np.testing.assert_array_equal(selected.row(2003), store.row(2003)[::-1])
+    with pytest.raises(ValueError):
+        store.select(["rain", "humidity"])
+
+    np.testing.assert_allclose(store.mean(), [(17.4 + 12.0) / 2, (28.718032786885246 + 30.5 + 29.0) / 3], rtol=1e-6)
+    assert store.as_dict(2003) == {"rain": 17.4, "temp": 28.718033}
+    assert to_list(store.column("temp")) == [28.718033, 30.5, 29.0]
+
+
+def test_bundles_share_table_store():
+    store = serving.load_feature_store()
+    assert serving.load_feature_store() is store
+    df = serving.load_features()
+    assert store.years.tolist() == df["year"].tolist()
+    np.testing.assert_allclose(store.column("rain_Feb_Mar"), df["rain_Feb_Mar"].to_numpy(), rtol=1e-6)
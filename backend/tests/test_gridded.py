@@ -0,0 +1,107 @@
+"""
+Test cases cho dự báo theo lưới (gridded): dựng features, predict theo năm, tổng hợp theo diện tích
+"""
+
+import contextlib
+import dataclasses
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from src import feature_engineering as fe
+from src import gridded, serving, model_registry
+
+
+@pytest.fixture(scope="module")
+def daily():
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fe.load_daily_data(fe.WEATHER_DAILY_FILE)
+
+
+@pytest.fixture(scope="module")
+def grid(daily):
+    cells = pd.DataFrame({
+        "lat": [12.5, 12.5, 12.75, 12.75],
+        "lon": [108.0, 108.25, 108.0, 108.25],
+        "district": ["Buôn Ma Thuột", "Buôn Ma Thuột", "Cư M'gar", "Krông Pắc"],
+        "area_ha": [1000.0, 3000.0, 2000.0, 0.0],
+    })
+    weather = [daily.assign(rain=daily["rain"] * scale, temp_max=daily["temp_max"] + shift)
+               for scale, shift in ((1.0, 0.0), (0.8, 0.5), (1.2, -0.5), (1.0, 1.0))]
+    return gridded.build_grid(weather, cells, "Đắk Lắk")
+
+
+def _bundle(df, tmp_path):
+    columns = ["rain_Feb_Mar", "temp_max_MayJun", "days_over_33", "SPI_MarJun"]
+    model = RandomForestRegressor(n_estimators=10, random_state=0).fit(df[columns].values, df["yield_ton_ha"])
+    model_registry.register_model("grid_test", model, columns, registry_dir=tmp_path)
+    return serving.build_bundle("grid_test", registry_dir=tmp_path)
+
+
+def test_build_grid_matches_single_point_features(grid, daily):
+    """Ô đầu (thời tiết gốc) có cùng features với pipeline một điểm"""
+    expected = fe.create_yearly_features_fast(daily).set_index("year")
+    assert grid.X.dtype == np.float32 and grid.X.shape == (4, len(grid.years), len(grid.feature_columns))
+    assert list(grid.years) == list(expected.index)
+
+    for col in ("rain_Feb_Mar", "days_over_33", "SPI_MarJun", "rain_Feb_Mar_anomaly"):
+        values = grid.X[0, :, grid.feature_columns.index(col)]
+        np.testing.assert_allclose(values, expected[col].to_numpy(), rtol=1e-5, atol=1e-4, equal_nan=True)
+
+    rain = grid.feature_columns.index("rain_Feb_Mar")
+    np.testing.assert_allclose(grid.X[1, :, rain], grid.X[0, :, rain] * 0.8, rtol=1e-5)
+    with pytest.raises(KeyError):
+        grid.year_slice(1800, ["rain_Feb_Mar"])
+    with pytest.raises(ValueError, match="missing model columns"):
+        grid.year_slice(int(grid.years[0]), ["ENSO_MarJun"])
+
+
+def test_predict_grid_one_call_per_year(grid, training_frame, tmp_path, monkeypatch):
+    bundle = _bundle(training_frame, tmp_path)
+    calls = []
+    original = serving.ServingBundle.predict
+    monkeypatch.setattr(serving.ServingBundle, "predict",
+                        lambda self, X: calls.append(len(X)) or original(self, X))
+
+    years = grid.years[:3]
+    yields = gridded.predict_grid(bundle, grid, years)
+    assert calls == [grid.n_cells] * 3 and yields.shape == (grid.n_cells, 3) and yields.dtype == np.float32
+
+    row = grid.year_slice(int(years[1]), bundle.feature_columns)[2:3]
+    assert yields[2, 1] == pytest.approx(original(bundle, row)[0], rel=1e-6)
+
+    first = gridded.grid_predictions(bundle, grid)
+    assert gridded.grid_predictions(bundle, grid) is first        # tính một lần cho mỗi bundle
+
+
+def test_aggregate_area_weighted(grid):
+    yields = np.array([2.0, 3.0, 2.5, 9.9])
+    district = gridded.aggregate(yields, grid, "district").set_index("district")
+    assert district.loc["Buôn Ma Thuột", "yield_ton_ha"] == pytest.approx((2.0 * 1000 + 3.0 * 3000) / 4000)
+    assert district.loc["Buôn Ma Thuột", "production_ton"] == pytest.approx(11000)
+    assert np.isnan(district.loc["Krông Pắc", "yield_ton_ha"])     # không có diện tích trồng
+
+    province = gridded.aggregate(yields, grid, "province")
+    assert province["yield_ton_ha"].iloc[0] == pytest.approx(16000 / 6000)
+    with pytest.raises(ValueError):
+        gridded.aggregate(yields, grid, "commune")
+
+    # Ô thiếu năng suất hoặc diện tích (NaN) bị bỏ qua, không làm NaN cả huyện
+    district = gridded.aggregate(np.array([2.0, np.nan, 2.5, 9.9]), grid, "district").set_index("district")
+    assert district.loc["Buôn Ma Thuột", ["area_ha", "production_ton"]].tolist() == [1000, 2000]
+    partial = dataclasses.replace(grid, area_ha=np.array([1000.0, np.nan, 2000.0, 0.0]))
+    district = gridded.aggregate(yields, partial, "district").set_index("district")
+    assert district.loc["Buôn Ma Thuột", "yield_ton_ha"] == pytest.approx(2.0)
+
+
+def test_save_load_roundtrip(grid, tmp_path):
+    path = tmp_path / "grid.npz"
+    gridded.save_grid(grid, path)
+    loaded = gridded.get_grid(path)
+    assert gridded.get_grid(path) is loaded
+    np.testing.assert_array_equal(loaded.X, grid.X)
+    assert loaded.feature_columns == grid.feature_columns and loaded.province == "Đắk Lắk"
+    assert list(loaded.district) == list(grid.district) and loaded.token
@@ -0,0 +1,65 @@
+"""
+Test cases cho grouped cross-validation (vùng × năm)
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from src import grouped_cv, panel
+
+
+@pytest.fixture
+def dataset():
+    rng = np.random.default_rng(0)
+    rows = [(r, y) for y in range(2010, 2020) for r in ("A", "B", "C")]
+    df = pd.DataFrame(rows, columns=["region", "year"])
+    df["x1"] = rng.normal(size=len(df))
+    df["x2"] = rng.integers(0, 5, len(df)).astype(float)
+    df["yield_ton_ha"] = 2.5 + 0.3 * df["x1"] + 0.1 * df["x2"] + rng.normal(0, 0.05, len(df))
+    return panel.PanelDataset.from_yields(df[["region", "year", "yield_ton_ha"]]).join(df[["region", "year", "x1", "x2"]])
+
+
+@pytest.mark.parametrize("scheme", grouped_cv.SCHEMES)
+def test_splits_do_not_leak(dataset, scheme):
+    folds = grouped_cv.grouped_splits(dataset.regions, dataset.years, scheme, year_block=3)
+    covered = np.concatenate([test for _, _, test in folds])
+    assert sorted(covered) == list(range(len(dataset)))                 # mỗi hàng được test đúng một lần
+
+    for _, train, test in folds:
+        shared_regions = set(dataset.regions[train]) & set(dataset.regions[test])
+        shared_years = set(dataset.years[train]) & set(dataset.years[test])
+        if scheme in ("loro", "blocked"):
+            assert not shared_regions
+        if scheme in ("loyo", "blocked"):
+            assert not shared_years
+
+    expected = {"loro": 3, "loyo": 10, "blocked": 3 * 4}[scheme]
+    assert len(folds) == expected
+
+
+def test_blocked_single_region_blocks_years_only():
+    years = np.arange(2015, 2025)
+    folds = grouped_cv.grouped_splits(np.full(10, "X"), years, "blocked", year_block=2)
+    assert len(folds) == 5 and all(len(train) == 8 for _, train, _ in folds)
+
+
+def test_cross_validate_parallel_matches_sequential(dataset):
+    estimator = RandomForestRegressor(n_estimators=20, random_state=0, n_jobs=1)
+    sequential = grouped_cv.cross_validate(dataset, ["x1", "x2"], "loro", estimator=estimator, n_jobs=1)
+    parallel = grouped_cv.cross_validate(dataset, ["x1", "x2"], "loro", estimator=estimator, n_jobs=2)
+
+    pd.testing.assert_frame_equal(sequential["folds"], parallel["folds"])
+
+    # RandomForest tự ép X về float32: ma trận float32 dựng một lần cho cùng kết quả với X gốc
+    test = sequential["predictions"]["region"].to_numpy() == "A"
+    train = dataset.regions != "A"
+    X = dataset.matrix(["x1", "x2"])
+    direct = RandomForestRegressor(n_estimators=20, random_state=0, n_jobs=1).fit(X[train], dataset.target[train])
+    np.testing.assert_allclose(sequential["predictions"]["predicted"].to_numpy()[test],
+                               direct.predict(X[dataset.regions == "A"]))
+    assert len(sequential["predictions"]) == len(dataset)
+    assert sequential["mape"] < 10
+    with pytest.raises(ValueError):
+        grouped_cv.cross_validate(dataset, ["x1"], "random")
@@ -0,0 +1,74 @@
+"""
+Test cases cho pipeline suy luận hợp nhất (scaler gộp vào threshold)
+"""
+
+import pytest
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+from sklearn.linear_model import Ridge
+from sklearn.preprocessing import StandardScaler, MinMaxScaler
+
+from src import model_registry
+from src.inference_pipeline import FusedTreePipeline, compile_pipeline
+
+FEATURES = ["temp", "rain", "ndvi", "soil"]
+
+
+def _data(seed=0, n=60):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(loc=[25, 1500, 0.6, 30], scale=[2, 300, 0.1, 5], size=(n, len(FEATURES)))
+    y = 0.1 * X[:, 0] + 0.001 * X[:, 1] + 2 * X[:, 2] + rng.normal(scale=0.05, size=n)
+    return X, y
+
+
+@pytest.mark.parametrize("scaler_cls", [StandardScaler, MinMaxScaler])
+def test_scaler_folded_into_thresholds(scaler_cls):
+    """Pipeline nhận features gốc, khớp model train trên input đã scale"""
+    X, y = _data()
+    scaler = scaler_cls().fit(X)
+    model = RandomForestRegressor(n_estimators=10, max_depth=5, random_state=0)
+    model.fit(scaler.transform(X), y)
+
+    pipeline = compile_pipeline(model, FEATURES, scaler=scaler, scaled_inputs=True, X_check=X)
+    X_new, _ = _data(seed=1)
+
+    assert pipeline.scaler_folded
+    np.testing.assert_allclose(pipeline.predict(X_new), model.predict(scaler.transform(X_new)),
+                               atol=1e-6)
+
+
+def test_gradient_boosting_and_roundtrip(tmp_path):
+    """GradientBoosting biên dịch đúng và giữ nguyên kết quả sau save/load"""
+    X, y = _data()
+    model = GradientBoostingRegressor(n_estimators=20, max_depth=3, random_state=0).fit(X, y)
+
+    pipeline = compile_pipeline(model, FEATURES, X_check=X)
+    pipeline.save(tmp_path / "pipeline.npz")
+    loaded = FusedTreePipeline.load(tmp_path / "pipeline.npz")
+
+    assert loaded.feature_columns == FEATURES
+    np.testing.assert_allclose(loaded.predict(X), model.predict(X), atol=1e-4)
+
+
+def test_unsupported_model_raises():
+    """Model không phải cây -> ValueError, registry vẫn lưu được (không có pipeline)"""
+    X, y = _data()
+    with pytest.raises(ValueError):
+        compile_pipeline(Ridge().fit(X, y), FEATURES)
+
+
+def test_registry_stores_pipeline(tmp_path):
+    """register_model lưu pipeline.npz và load_artifacts trả về pipeline"""
+    X, y = _data()
+    scaler = StandardScaler().fit(X)
+    model = RandomForestRegressor(n_estimators=5, random_state=0).fit(scaler.transform(X), y)
+
+    model_registry.register_model("demo", model, FEATURES, scaler=scaler, scaled_inputs=True,
+                                  reference_X=X, registry_dir=tmp_path)
+    model_registry.register_model("linear", Ridge().fit(X, y), FEATURES, registry_dir=tmp_path)
+
+    artifacts = model_registry.load_artifacts("demo", registry_dir=tmp_path)
+    assert artifacts["manifest"]["pipeline"] == "pipeline.npz"
+    np.testing.assert_allclose(artifacts["pipeline"].predict(X), model.predict(scaler.transform(X)),
+                               atol=1e-6)
+    assert model_registry.load_artifacts("linear", registry_dir=tmp_path)["pipeline"] is None
@@ -0,0 +1,92 @@
+"""
+Test cases cho thread pool suy luận có giới hạn (backpressure, cache trên event loop)
+"""
+
+import time
+import asyncio
+import threading
+
+import pytest
+
+from src import inference_pool, metrics
+from src.serving import ServingBundle
+
+
+def test_pool_rejects_when_full_and_reports_depth():
+    pool = inference_pool.InferencePool("test-full", workers=1, queue=1)
+    release = threading.Event()
+    try:
+        running = pool.submit(release.wait)
+        queued = pool.submit(lambda: "done")
+        deadline = time.time() + 5
+        while metrics.POOL_ACTIVE.value(pool="test-full") != 1 and time.time() < deadline:
+            time.sleep(0.005)
+
+        assert pool.in_flight == 2
+        assert metrics.POOL_QUEUE_DEPTH.value(pool="test-full") == 1
+        with pytest.raises(inference_pool.PoolSaturated):
+            pool.submit(lambda: None)
+        assert metrics.POOL_REJECTED.value(pool="test-full") == 1
+
+        release.set()
+        assert running.result(timeout=5) is True and queued.result(timeout=5) == "done"
+        deadline = time.time() + 5
+        while pool.in_flight and time.time() < deadline:
+            time.sleep(0.005)
+        assert pool.in_flight == 0 and metrics.POOL_QUEUE_DEPTH.value(pool="test-full") == 0
+        assert metrics.POOL_WAIT.count(pool="test-full") == 2
+    finally:
+        release.set()
+        pool.shutdown()
+
+
+def test_run_does_not_block_event_loop():
+    pool = inference_pool.InferencePool("test-loop", workers=2, queue=0)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.ensure_future(ticker())
+        results = await asyncio.gather(pool.run(time.sleep, 0.2), pool.run(time.sleep, 0.2))
+        task.cancel()
+        return ticks, results
+
+    start = time.perf_counter()
+    ticks, results = asyncio.run(scenario())
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+
+    assert results == [None, None]
+    assert ticks >= 10                  # loop vẫn chạy trong lúc predict
+    assert elapsed < 0.35               # hai task chạy song song
+
+
+def test_run_cached_stays_on_loop_after_first_compute():
+    class FakeBundle:
+        cached = ServingBundle.cached
+
+        def __init__(self):
+            self.cache = {}
+
+    bundle = FakeBundle()
+    threads = []
+
+    def heavy(b):
+        def compute():
+            threads.append(threading.current_thread().name)
+            return 42
+        return b.cached(("heavy",), compute)
+
+    pool = inference_pool.InferencePool("test-cached", workers=1, queue=0)
+    assert asyncio.run(pool.run_cached(heavy, bundle)) == 42
+    assert asyncio.run(pool.run_cached(heavy, bundle)) == 42
+    pool.shutdown()
+
+    assert len(threads) == 1 and threads[0].startswith("test-cached-pool")
+    assert metrics.POOL_WAIT.count(pool="test-cached") == 1      # lần hai không qua pool
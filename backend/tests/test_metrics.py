@@ -0,0 +1,42 @@
+"""
+Test cases cho metrics kiểu Prometheus (counter, gauge, histogram, text exposition)
+"""
+
+import pytest
+
+from src import metrics
+
+
+def test_histogram_buckets_and_quantiles():
+    registry = metrics.Registry()
+    hist = registry.register(metrics.Histogram("demo_seconds", "Demo.", ("route",), buckets=(0.1, 0.2, 0.5)))
+    for value in (0.05, 0.15, 0.15, 0.3, 1.0):
+        hist.observe(value, route="/a")
+
+    assert hist.count(route="/a") == 5
+    assert 0.1 <= hist.quantile(0.5, route="/a") <= 0.2
+    assert hist.quantile(0.99, route="/a") == 0.5
+    text = registry.render()
+    assert "# TYPE demo_seconds histogram" in text
+    assert 'demo_seconds_bucket{route="/a",le="0.2"} 3' in text
+    assert 'demo_seconds_bucket{route="/a",le="+Inf"} 5' in text
+    assert 'demo_seconds_sum{route="/a"} 1.65' in text and 'demo_seconds_count{route="/a"} 5' in text
+
+
+def test_counter_gauge_labels():
+    registry = metrics.Registry()
+    requests = registry.register(metrics.Counter("demo_total", "Demo.", ("status",)))
+    in_flight = registry.register(metrics.Gauge("demo_in_flight", "Demo."))
+    requests.inc(status="200")
+    requests.inc(2, status='5"0')
+    in_flight.inc()
+    in_flight.dec()
+
+    text = registry.render()
+    assert 'demo_total{status="200"} 1' in text and 'demo_total{status="5\\"0"} 2' in text
+    assert "demo_in_flight 0" in text
+    with pytest.raises(ValueError):
+        requests.inc(code="200")
+    with pytest.raises(ValueError):
+        registry.register(metrics.Counter("demo_total", "Again."))
+    assert metrics.resident_memory_bytes() > 0
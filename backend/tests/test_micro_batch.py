@@ -0,0 +1,77 @@
+"""
+Test cases cho micro-batching predict (gộp request đồng thời thành một lần predict)
+"""
+
+import time
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from src import micro_batch, inference_pool, metrics
+
+
+class SlowBundle:
+    """predict = tổng từng hàng, chậm 20 ms mỗi lần gọi."""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+        self._lock = threading.Lock()
+
+    def predict(self, X):
+        with self._lock:
+            self.calls.append(len(X))
+        time.sleep(0.02)
+        if self.fail:
+            raise RuntimeError("model exploded")
+        return X.sum(axis=1)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = inference_pool.InferencePool("test-batch", workers=2, queue=8)
+    monkeypatch.setitem(inference_pool._pools, "inference", pool)
+    yield pool
+    pool.shutdown()
+
+
+def test_concurrent_rows_are_coalesced(pool):
+    bundle = SlowBundle()
+    batcher = micro_batch.MicroBatcher(max_rows=8, max_wait_ms=50)
+    rows = [np.array([[i, 1.0]]) for i in range(20)]
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.predict(bundle, X) for X in rows))
+
+    results = asyncio.run(scenario())
+    assert [float(r[0]) for r in results] == [i + 1.0 for i in range(20)]   # đúng hàng cho đúng request
+    assert sum(bundle.calls) == 20
+    assert len(bundle.calls) < 20 and max(bundle.calls) <= 8
+    assert metrics.BATCH_FLUSHES.value(reason="size") >= 1
+
+
+def test_idle_request_is_not_delayed(pool):
+    bundle = SlowBundle()
+    batcher = micro_batch.MicroBatcher(max_rows=64, max_wait_ms=1000)
+
+    start = time.perf_counter()
+    result = asyncio.run(batcher.predict(bundle, np.ones((3, 2))))
+    assert time.perf_counter() - start < 0.5           # không chờ max_wait khi không có batch nào chạy
+    np.testing.assert_array_equal(result, [2.0, 2.0, 2.0])
+    assert bundle.calls == [3]
+
+
+def test_errors_reach_every_caller(pool):
+    bundle = SlowBundle(fail=True)
+    batcher = micro_batch.MicroBatcher(max_rows=4, max_wait_ms=5)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.predict(bundle, np.ones((1, 2))) for _ in range(6)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    with pytest.raises(ValueError):
+        asyncio.run(batcher.predict(bundle, np.ones(2)))
@@ -0,0 +1,69 @@
+"""
+Test cases cho model registry
+"""
+
+import pytest
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+
+from src import model_registry
+
+FEATURES = ["a", "b", "c"]
+
+
+def _train_model(seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(20, len(FEATURES)))
+    y = X[:, 0] * 2 + rng.normal(scale=0.1, size=20)
+    return RandomForestRegressor(n_estimators=5, random_state=seed).fit(X, y)
+
+
+def test_register_creates_versions(tmp_path):
+    """Mỗi lần register tạo version mới và cập nhật ACTIVE"""
+    v1 = model_registry.register_model("demo", _train_model(0), FEATURES, registry_dir=tmp_path)
+    v2 = model_registry.register_model("demo", _train_model(1), FEATURES, registry_dir=tmp_path)
+    
+    assert (v1, v2) == ("v1", "v2")
+    assert model_registry.list_models(tmp_path) == ["demo"]
+    assert model_registry.list_versions("demo", tmp_path) == ["v1", "v2"]
+    assert model_registry.get_active_version("demo", tmp_path) == "v2"
+    
+    manifest = model_registry.read_manifest("demo", "v1", tmp_path)
+    assert manifest["feature_columns"] == FEATURES
+    assert "model.pkl" in manifest["files"]
+
+
+def test_set_active_and_load(tmp_path):
+    """Load đúng version active"""
+    model_registry.register_model("demo", _train_model(0), FEATURES, registry_dir=tmp_path)
+    model_registry.register_model("demo", _train_model(1), FEATURES, registry_dir=tmp_path)
+    model_registry.set_active_version("demo", "v1", tmp_path)
+    
+    artifacts = model_registry.load_artifacts("demo", registry_dir=tmp_path)
+    assert artifacts["manifest"]["version"] == "v1"
+    assert artifacts["feature_columns"] == FEATURES
+    assert artifacts["scaler"] is None
+
+
+def test_hash_mismatch_rejected(tmp_path):
+    """Artifact bị sửa sau khi register phải bị từ chối"""
+    model_registry.register_model("demo", _train_model(0), FEATURES, registry_dir=tmp_path)
+    with open(tmp_path / "demo" / "v1" / "model.pkl", "ab") as f:
+        f.write(b"corrupted")
+    
+    with pytest.raises(ValueError):
+        model_registry.load_artifacts("demo", "v1", registry_dir=tmp_path)
+
+
+def test_paths_outside_registry_rejected(tmp_path):
+    """name/version phải có trong registry, không được trỏ ra ngoài (../..)"""
+    registry = tmp_path / "registry"
+    model_registry.register_model("demo", _train_model(0), FEATURES, registry_dir=registry)
+    model_registry.register_model("other", _train_model(1), FEATURES, registry_dir=tmp_path / "outside")
+    
+    for name, version in [("demo", "../../outside/other/v1"), ("../outside/other", "v1"), ("demo", "v9")]:
+        with pytest.raises(FileNotFoundError):
+            model_registry.load_artifacts(name, version, registry_dir=registry)
+        with pytest.raises(FileNotFoundError):
+            model_registry.set_active_version(name, version, registry_dir=registry)
+    assert model_registry.get_active_version("../outside/other", registry) is None
@@ -0,0 +1,90 @@
+"""
+Test cases cho nowcasting (features mùa quan sát một phần)
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import feature_engineering as fe
+from src.nowcast import Nowcaster
+from src.feature_store import FeatureStore
+
+
+@pytest.fixture(scope="module")
+def daily():
+    return pd.read_csv(fe.WEATHER_DAILY_FILE, parse_dates=["date"])
+
+
+def test_incremental_days_reach_batch_features(daily):
+    """Cắt dữ liệu giữa mùa rồi nạp từng ngày: cuối năm khớp features batch"""
+    cutoff = pd.Timestamp("2020-06-15")
+    nowcaster = Nowcaster(daily[daily["date"] <= cutoff])
+    assert nowcaster.year == 2020 and nowcaster.as_of == cutoff
+    assert 0.4 < nowcaster.observed_fraction() < 0.5
+
+    partial = nowcaster.features("climatology")
+    assert partial["rain_OctDec"] == pytest.approx(
+        np.nansum(nowcaster.climatology["rain_sum"][9:12]))
+
+    rest = daily[(daily["date"] > cutoff) & (daily["date"].dt.year == 2020)]
+    for row in rest.itertuples(index=False):
+        nowcaster.observe(row.date, row._asdict())
+    assert nowcaster.observed_fraction() == 1.0
+
+    years, stats = fe.monthly_stats(daily)
+    expected = fe.features_from_monthly(stats, nowcaster.reference)
+    row = int(np.searchsorted(years, 2020))
+    for name, values in nowcaster.features("ensemble").items():
+        np.testing.assert_allclose(values, expected[name][row])
+
+
+def test_forecast_cached_per_as_of(daily):
+    """Dự báo cache theo ngày as-of; ngày mới làm dự báo được tính lại"""
+    class Bundle:
+        key = "demo:v1"
+        feature_columns = ["rain_Feb_Mar", "rain_OctDec"]
+        feature_store = FeatureStore.from_frame(
+            pd.DataFrame({"year": [2000], "rain_Feb_Mar": [1.0], "rain_OctDec": [1.0]}))
+        inputs = np.ones((1, 2))
+        calls = 0
+
+        def predict(self, X):
+            Bundle.calls += 1
+            return 2.0 + X[:, 1] / 1000
+
+    nowcaster = Nowcaster(daily[daily["date"] <= "2020-11-10"])
+    bundle = Bundle()
+    first = nowcaster.forecast(bundle)
+    assert nowcaster.forecast(bundle) is first and Bundle.calls == 1
+    assert first["lower"] <= first["predicted"] <= first["upper"]
+    assert first["n_members"] == len(nowcaster.history_years)
+
+    nowcaster.observe("2020-11-11", {"temp_max": 30, "temp_min": 20, "rain": 50.0, "humidity": 80,
+                                     "radiation": 15, "soil_0_7": 0.3, "soil_7_28": 0.3})
+    second = nowcaster.forecast(bundle)
+    assert second["as_of"] == "2020-11-11" and Bundle.calls == 2
+
+
+def test_forecast_recomputed_after_correction(daily):
+    """Bản sửa của ngày đã quan sát (as-of không đổi) không được trả dự báo cũ"""
+    class Bundle:
+        key = "demo:v1"
+        feature_columns = ["rain_Feb_Mar"]
+        feature_store = FeatureStore.from_frame(pd.DataFrame({"year": [2000], "rain_Feb_Mar": [1.0]}))
+        inputs = np.ones((1, 1))
+
+        def predict(self, X):
+            return 2.0 + X[:, 0] / 1000
+
+    nowcaster = Nowcaster(daily[daily["date"] <= "2020-02-14"])
+    day = {"temp_max": 30, "temp_min": 20, "rain": 10.0, "humidity": 80,
+           "radiation": 15, "soil_0_7": 0.3, "soil_7_28": 0.3}
+    nowcaster.observe("2020-02-15", day)
+    before = nowcaster.forecast(Bundle(), "climatology")
+
+    nowcaster.observe("2020-02-15", {**day, "rain": 500.0}, previous=day)
+    after = nowcaster.forecast(Bundle(), "climatology")
+    assert after["as_of"] == before["as_of"] == "2020-02-15"
+    assert after["features"]["rain_Feb_Mar"] == pytest.approx(before["features"]["rain_Feb_Mar"] + 490.0)
+    assert after["predicted"] > before["predicted"]
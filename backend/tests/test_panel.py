@@ -0,0 +1,84 @@
+"""
+Test cases cho dataset panel (vùng × năm): join theo chỉ mục, tổng hợp theo sản lượng
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import panel
+
+
+@pytest.fixture
+def district_yields():
+    rng = np.random.default_rng(0)
+    rows = [(r, y) for y in range(2015, 2021) for r in ("Cư M'gar", "Buôn Ma Thuột", "Krông Pắc")]
+    df = pd.DataFrame(rows, columns=["region", "year"]).sample(frac=1, random_state=1)
+    df["area_ha"] = rng.uniform(1000, 5000, len(df))
+    df["yield_ton_ha"] = rng.uniform(2.0, 3.0, len(df))
+    df["production_ton"] = df["area_ha"] * df["yield_ton_ha"]
+    return df
+
+
+def test_join_matches_merge(district_yields):
+    """Join theo chỉ mục cho cùng kết quả với DataFrame.merge (theo năm và theo vùng, năm)"""
+    province = pd.DataFrame({"year": range(2010, 2020), "rain_Feb_Mar": np.arange(10.0)})
+    district = district_yields[["region", "year"]].assign(soil=np.arange(len(district_yields)) / 10)
+    district = district[district["year"] != 2016]
+
+    dataset = panel.PanelDataset.from_yields(district_yields).join(province).join(district)
+    expected = (district_yields.merge(province, on="year").merge(district, on=["region", "year"])
+                .sort_values(["year", "region"]).reset_index(drop=True))
+
+    frame = dataset.to_frame()
+    assert len(dataset) == len(expected) and 2016 not in set(dataset.years) and 2020 not in set(dataset.years)
+    pd.testing.assert_frame_equal(frame[expected.columns], expected, check_dtype=False)
+
+    left = panel.PanelDataset.from_yields(district_yields).join(province, how="left")
+    assert len(left) == len(district_yields) and np.isnan(left.columns["rain_Feb_Mar"][left.years == 2020]).all()
+
+
+def test_aggregate_production_weighted(district_yields):
+    features = district_yields[["region", "year"]].assign(temp=np.arange(len(district_yields), dtype=float))
+    dataset = panel.PanelDataset.from_yields(district_yields).join(features)
+    result = dataset.aggregate(["temp"]).set_index("year")
+
+    year = district_yields[district_yields["year"] == 2017].merge(features, on=["region", "year"])
+    assert result.loc[2017, "n_regions"] == 3
+    assert result.loc[2017, "yield_ton_ha"] == pytest.approx(year["production_ton"].sum() / year["area_ha"].sum())
+    assert result.loc[2017, "temp"] == pytest.approx(np.average(year["temp"], weights=year["production_ton"]))
+    assert dataset.aggregate(["temp"], weight="area_ha").set_index("year").loc[2017, "temp"] == \
+        pytest.approx(np.average(year["temp"], weights=year["area_ha"]))
+
+
+def test_groups_and_keys(district_yields):
+    dataset = panel.PanelDataset.from_yields(district_yields)
+    assert len(set(dataset.groups("region"))) == 3 and len(set(dataset.groups("year"))) == 6
+    assert len(set(dataset.groups("region_year"))) == len(dataset)
+    with pytest.raises(ValueError):
+        dataset.groups("commune")
+    with pytest.raises(ValueError, match="Duplicate"):
+        panel.PanelDataset.from_yields(pd.concat([district_yields, district_yields.head(1)]))
+
+    index = panel.KeyIndex([2015, 2016], ["a", "b"])
+    assert index.lookup(["b", "a", "c", "a"], [2016, 2016, 2015, 2030]).tolist() == [1, -1, -1, -1]
+
+
+def test_province_file_loads_as_single_region_panel():
+    dataset = panel.load_panel()
+    raw = pd.read_csv(panel.YIELD_FILE)
+    assert set(dataset.regions) == {panel.DEFAULT_REGION} and len(dataset) == len(raw)
+    assert dataset.matrix(["rain_Feb_Mar", "SPI_MarJun"]).shape == (len(raw), 2)
+    assert dataset.aggregate()["yield_ton_ha"].round(2).tolist() == raw["yield_ton_ha"].round(2).tolist()
+
+
+def test_train_test_split_by_year(district_yields):
+    """train_model chia theo năm: mọi vùng của năm test nằm trong test"""
+    train_model = pytest.importorskip("src.train_model")
+    df = district_yields.rename(columns={"yield_ton_ha": "yield"})
+    for col in train_model.FEATURE_COLUMNS:
+        df[col] = 0.0
+
+    _, X_test, _, _, years_train, years_test = train_model.prepare_train_test(df, test_years=2)
+    assert set(years_test) == {2019, 2020} and len(X_test) == 6
+    assert not set(years_train) & set(years_test)
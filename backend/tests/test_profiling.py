@@ -0,0 +1,81 @@
+"""
+Test cases cho profiler của pipeline (stage lồng nhau, trace, cProfile, sampling)
+"""
+
+import json
+import time
+import types
+import pstats
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import profiling
+
+
+def test_nested_stages_and_chrome_trace(tmp_path):
+    profiler = profiling.Profiler()
+    with profiler.stage("outer") as outer:
+        with profiler.stage("inner"):
+            block = np.ones(2 ** 20)          # 8 MiB
+            del block
+        small = np.ones(1000)
+        outer.rows_out = len(small)
+    with pytest.raises(ValueError):
+        with profiler.stage("broken"):
+            raise ValueError("boom")
+    profiler.close()
+
+    rows = {r["name"]: r for r in profiler.summary()}
+    assert [r["name"] for r in profiler.summary()] == ["outer", "inner", "broken"]
+    assert rows["inner"]["depth"] == 1 and rows["outer"]["rows_out"] == 1000
+    assert rows["inner"]["peak_mib"] >= 7.9
+    assert rows["outer"]["peak_mib"] >= rows["inner"]["peak_mib"]     # đỉnh của con tính cho cha
+    assert rows["outer"]["wall_s"] >= rows["inner"]["wall_s"]
+    assert rows["broken"]["error"] == "ValueError: boom"
+
+    trace = json.loads(profiler.write_trace(tmp_path / "trace.json").read_text())
+    events = [e for e in trace["traceEvents"] if e["ph"] == "X"]
+    assert [e["name"] for e in events] == ["outer", "inner", "broken"]
+    outer_e, inner_e = events[0], events[1]
+    assert outer_e["ts"] <= inner_e["ts"] and inner_e["ts"] + inner_e["dur"] <= outer_e["ts"] + outer_e["dur"] + 1
+    assert "outer" in profiler.report()
+
+
+def test_instrument_counts_rows_and_restores():
+    module = types.ModuleType("fake_stage")
+    module.aggregate = lambda df: df.groupby("k").sum()
+    module.main = lambda: module.aggregate(pd.DataFrame({"k": [1, 1, 2], "v": [1, 2, 3]}))
+    original = module.aggregate
+
+    profiler = profiling.Profiler(memory=False)
+    with profiler.instrument(module, ["aggregate", "missing"]):
+        result = module.main()
+    assert module.aggregate is original
+    assert len(result) == 2
+
+    (span,) = profiler.summary()
+    assert span["name"] == "fake_stage.aggregate" and span["category"] == "function"
+    assert (span["rows_in"], span["rows_out"]) == (3, 2)
+    assert span["peak_mib"] is None
+
+
+def test_cprofile_and_sampler(tmp_path):
+    profiler = profiling.Profiler(memory=False, cprofile_dir=tmp_path / "prof")
+    sampler = profiling.Sampler(interval=0.001).start()
+    with profiler.stage("busy"):
+        with profiler.stage("nested"):             # cProfile chỉ bật cho stage cấp 1
+            deadline = time.perf_counter() + 0.1
+            while time.perf_counter() < deadline:
+                sum(range(1000))
+    sampler.stop()
+    sampler.write(tmp_path / "stacks.folded")
+
+    assert sorted(p.name for p in (tmp_path / "prof").iterdir()) == ["busy.prof"]
+    stats = pstats.Stats(str(tmp_path / "prof" / "busy.prof"))
+    assert stats.total_calls > 0
+
+    lines = (tmp_path / "stacks.folded").read_text().splitlines()
+    assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any("test_cprofile_and_sampler" in line for line in lines)
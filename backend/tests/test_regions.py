@@ -0,0 +1,131 @@
+"""
+Test cases cho serving nhiều vùng (regions): registry, LRU bundle, dự báo theo lô
+"""
+
+import json
+
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from src import model_registry, regions, serving
+from src.regions import Region, RegionRegistry
+
+COLUMNS = ["rain_Feb_Mar", "temp_max_MayJun", "days_over_33", "SPI_MarJun"]
+
+
+@pytest.fixture
+def region_setup(tmp_path, training_frame):
+    """Hai model vùng trong registry tạm + bảng features riêng cho từng tỉnh"""
+    features = pd.read_csv(serving.FEATURES_FILE)
+    df = training_frame
+
+    registry_dir = tmp_path / "registry"
+    for name, seed in (("pepper", 1), ("durian", 2)):
+        model = RandomForestRegressor(n_estimators=10, random_state=seed)
+        model.fit(df[COLUMNS].values, df["yield_ton_ha"])
+        model_registry.register_model(name, model, COLUMNS, registry_dir=registry_dir)
+
+    files = {}
+    for slug, scale in (("gialai", 1.0), ("dongnai", 1.3), ("lamdong", 0.8)):
+        table = features.copy()
+        table["rain_Feb_Mar"] = table["rain_Feb_Mar"] * scale
+        files[slug] = tmp_path / f"features_{slug}.csv"
+        table.to_csv(files[slug], index=False)
+
+    region_list = [
+        Region("Gia Lai", "pepper", "Hồ tiêu", model="pepper", features_file=str(files["gialai"])),
+        Region("Đồng Nai", "pepper", "Hồ tiêu", model="pepper", features_file=str(files["dongnai"])),
+        Region("Lâm Đồng", "durian", "Sầu riêng", model="durian", features_file=str(files["lamdong"])),
+    ]
+    return region_list, registry_dir
+
+
+def test_load_regions_and_lookup(tmp_path):
+    default = regions.load_regions(tmp_path / "missing.json")
+    assert [r.key for r in default] == ["dak-lak/robusta"] and default[0].uses_default_store
+
+    config = tmp_path / "regions.json"
+    config.write_text(json.dumps({"regions": [
+        {"province": "Đắk Lắk", "crop": "robusta"},
+        {"province": "Đắk Lắk", "crop": "durian", "model": "durian"},
+    ]}), encoding="utf-8")
+    registry = RegionRegistry(regions.load_regions(config))
+
+    assert registry.find("dak lak", "Durian").model == "durian"
+    with pytest.raises(KeyError, match="several crops"):
+        registry.find("Đắk Lắk")
+    with pytest.raises(KeyError, match="not found"):
+        registry.find("Gia Lai")
+
+    config.write_text(json.dumps({"regions": [{"province": "Dak Lak", "crop": "x"},
+                                              {"province": "Đắk Lắk", "crop": "x"}]}))
+    with pytest.raises(ValueError, match="Duplicate"):
+        regions.load_regions(config)
+
+
+def test_lru_eviction_and_shared_artifacts(region_setup):
+    """Vùng cùng model dùng chung artifacts, LRU giữ tối đa max_resident bundle"""
+    region_list, registry_dir = region_setup
+    gialai, dongnai, lamdong = region_list
+    registry = RegionRegistry(region_list, max_resident=2, registry_dir=registry_dir)
+
+    a = registry.bundle(gialai)
+    b = registry.bundle(dongnai)
+    assert a.model is b.model and a.pipeline is b.pipeline
+    assert a.predictions != b.predictions            # features riêng từng tỉnh
+
+    assert registry.bundle(gialai) is a              # hit, Gia Lai thành dùng gần nhất
+    registry.bundle(lamdong)                         # đẩy Đồng Nai ra
+    assert registry.resident() == [gialai.key, lamdong.key]
+    assert registry.stats == {"loads": 3, "evictions": 1, "hits": 1}
+
+    described = {r["key"]: r["resident"] for r in registry.describe()["regions"]}
+    assert described == {gialai.key: True, dongnai.key: False, lamdong.key: True}
+
+    with pytest.raises(ValueError):
+        RegionRegistry(region_list, max_resident=0)
+
+
+def test_new_active_version_replaces_resident_bundles(region_setup, training_frame):
+    """Version active mới: không dùng chung artifacts version cũ, invalidate bỏ bundle cũ"""
+    region_list, registry_dir = region_setup
+    gialai, dongnai, lamdong = region_list
+    registry = RegionRegistry(region_list, registry_dir=registry_dir)
+    assert registry.bundle(gialai).version == "v1"
+    registry.bundle(lamdong)
+
+    df = training_frame
+    model = RandomForestRegressor(n_estimators=10, random_state=9).fit(df[COLUMNS].values, df["yield_ton_ha"])
+    model_registry.register_model("pepper", model, COLUMNS, registry_dir=registry_dir)
+
+    assert registry.bundle(dongnai).version == "v2"
+    assert registry.invalidate("pepper") == 2
+    assert registry.resident() == [lamdong.key]
+    assert registry.bundle(gialai).version == "v2"
+
+
+def test_predict_regions_batches_per_model(region_setup, monkeypatch):
+    """Một lần predict cho mỗi model, kết quả khớp dự báo từng bundle"""
+    region_list, registry_dir = region_setup
+    registry = RegionRegistry(region_list, registry_dir=registry_dir)
+    items = [(r, registry.bundle(r)) for r in region_list]
+
+    calls = []
+    original = serving.ServingBundle.predict
+
+    def counting(self, X):
+        calls.append(len(X))
+        return original(self, X)
+
+    monkeypatch.setattr(serving.ServingBundle, "predict", counting)
+    year = int(items[0][1].years[-2])
+    results = regions.predict_regions(items, year)
+
+    assert sorted(calls) == [1, 2]
+    for (region, bundle), result in zip(items, results):
+        assert result["region"] == region.key and result["base_year"] == year
+        assert result["predicted_yield"] == pytest.approx(bundle.predictions[year])
+
+    future = regions.predict_regions(items, 2030)
+    assert {r["base_year"] for r in future} == {int(items[0][1].years[-1])}
@@ -0,0 +1,69 @@
+"""
+Test cases cho định dạng response (JSON/orjson, MessagePack, Arrow IPC)
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from src import response_formats
+
+
+@pytest.fixture
+def columns():
+    return {
+        "years": np.arange(2020, 2024, dtype=np.int32),
+        "actual": np.array([2.5, np.nan, 2.75, 3.0]),
+        "rain": np.array([[17.400000000000002, 0], [12.0, 0], [9.5, 0], [30.25, 0]], dtype=np.float32)[:, 0],
+    }
+
+
+def test_negotiate():
+    assert response_formats.negotiate() == "json"
+    assert response_formats.negotiate(accept="text/html,*/*;q=0.8") == "json"
+    assert response_formats.negotiate("JSON", accept="application/msgpack") == "json"
+    with pytest.raises(ValueError):
+        response_formats.negotiate("xml")
+    if response_formats.HAS_MSGPACK and response_formats.HAS_ARROW:
+        assert response_formats.negotiate(accept="application/x-msgpack") == "msgpack"
+        accept = "application/msgpack;q=0.5, application/vnd.apache.arrow.stream"
+        assert response_formats.negotiate(accept=accept) == "arrow"
+        assert response_formats.negotiate(accept="application/vnd.apache.arrow.stream;q=0") == "json"
+
+
+def test_negotiate_without_packages(monkeypatch):
+    for flag in ("HAS_ORJSON", "HAS_MSGPACK", "HAS_ARROW"):
+        monkeypatch.setattr(response_formats, flag, False)
+    assert response_formats.negotiate("json") == "json" and not response_formats.can_encode("json")
+    assert response_formats.negotiate(accept="application/msgpack, application/vnd.apache.arrow.stream") == "json"
+    for fmt in ("msgpack", "arrow"):
+        with pytest.raises(ValueError):
+            response_formats.negotiate(fmt)
+        with pytest.raises(ValueError):
+            response_formats.encode({"years": np.arange(3)}, fmt)
+
+
+def test_json_fast_path(columns):
+    pytest.importorskip("orjson")
+    decoded = json.loads(bytes(response_formats.encode(columns, "json")))
+    assert decoded == {"years": [2020, 2021, 2022, 2023], "actual": [2.5, None, 2.75, 3.0],
+                       "rain": [17.4, 12.0, 9.5, 30.25]}
+
+
+def test_binary_formats_roundtrip(columns):
+    msgpack = pytest.importorskip("msgpack")
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.ipc
+
+    packed = msgpack.unpackb(bytes(response_formats.encode(columns, "msgpack")))
+    for name, array in columns.items():
+        item = packed[name]
+        decoded = np.frombuffer(item["data"], dtype=item["dtype"]).reshape(item["shape"])
+        np.testing.assert_array_equal(decoded, array)
+
+    table = pa.ipc.open_stream(response_formats.encode(columns, "arrow")).read_all()
+    assert table.column_names == list(columns)
+    assert table.schema.field("rain").type == pa.float32()
+    for name, array in columns.items():
+        np.testing.assert_array_equal(table.column(name).to_numpy(), array)
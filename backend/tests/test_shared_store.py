@@ -0,0 +1,76 @@
+"""
+Test cases cho shared model store (file mmap chỉ đọc dùng chung giữa các worker)
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import api, serving, shared_store
+
+
+def test_export_attach_roundtrip(registry, tmp_path):
+    source = serving.build_store(registry_dir=registry)
+    path = shared_store.export_store(source.bundles(), tmp_path / "store.bin", {source.get().key})
+
+    attached = shared_store.build_store(path)
+    assert sorted(b.key for b in attached.bundles()) == sorted(b.key for b in source.bundles())
+    assert attached.get().key == source.get().key
+
+    for original in source.bundles():
+        bundle = attached.get(original.key)
+        assert bundle.model is None
+        X = original.features_df[original.feature_columns].to_numpy()
+        np.testing.assert_allclose(bundle.predict(X), original.predict(X))
+        np.testing.assert_array_equal(bundle.inputs, original.inputs)
+        assert bundle.predictions == pytest.approx(original.predictions)
+        assert bundle.importance == pytest.approx(original.importance)
+        pd.testing.assert_frame_equal(bundle.features_df[original.features_df.columns], original.features_df,
+                                      check_dtype=False)
+
+    # Mảng trỏ thẳng vào vùng mmap: không copy, không ghi được
+    shared = shared_store.SharedStore(path)
+    entry = shared.header["bundles"][0]["arrays"]["predictions"]
+    array = shared.array(entry)
+    assert not array.flags.owndata and not array.flags.writeable
+    features = attached.get().feature_store.matrix
+    assert not features.flags.writeable and features.base is not None
+    with pytest.raises(ValueError):
+        array[0] = 0.0
+
+
+def test_rejects_foreign_file(tmp_path):
+    path = tmp_path / "not_a_store.bin"
+    path.write_bytes(b"\0" * 128)
+    with pytest.raises(ValueError):
+        shared_store.SharedStore(path)
+
+
+def test_memory_benchmark_runs(registry, tmp_path):
+    source = serving.build_store(registry_dir=registry)
+    path = shared_store.export_store(source.bundles(), tmp_path / "store.bin")
+
+    results = shared_store.benchmark_memory(path, workers=(1,), registry_dir=str(registry))
+    assert set(results) == set(shared_store.BENCHMARK_MODES)
+    assert results["shared"]["w1"]["models"] == results["registry"]["w1"]["models"] == len(source)
+    for mode in shared_store.BENCHMARK_MODES:
+        assert results[mode]["w1"]["total_pss_mib"] > 0
+
+
+def test_initialize_from_shared_store_starts_stream(registry, tmp_path, monkeypatch):
+    """Worker attach shared store vẫn bật nowcast + theo dõi STREAM_FILE"""
+    source = serving.build_store(registry_dir=registry)
+    path = shared_store.export_store(source.bundles(), tmp_path / "store.bin")
+    stream = tmp_path / "stream.csv"
+    stream.write_text("date,rain\n")
+
+    followed = []
+    monkeypatch.setenv(shared_store.SHARED_STORE_FILE_ENV, str(path))
+    monkeypatch.setenv(api.streaming_ingest.STREAM_FILE_ENV, str(stream))
+    monkeypatch.setattr(api.streaming_ingest, "follow_file", lambda ingestor, f: followed.append(f))
+    for name in ("store", "feature_store", "yield_df"):
+        monkeypatch.setattr(api, name, getattr(api, name))   # khôi phục sau test
+
+    api.initialize()
+    assert api.store.get().model is None                      # bundle từ shared store
+    assert followed == [str(stream)]
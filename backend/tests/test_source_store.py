@@ -0,0 +1,99 @@
+"""
+Test cases cho kho nguồn offline có version (source_store) và provenance trong upgrade_features
+"""
+
+import contextlib
+import io
+from datetime import timedelta
+
+import httpx
+import pandas as pd
+import pytest
+
+from src import source_store, upgrade_features
+from src.data_sources import TTLCache, get_adapter
+
+ONI_TEXT = "SEAS YR TOTAL ANOM\nMAM 2020 28.0 0.4\nAMJ 2020 28.1 0.2\nMAM 2021 27.5 -0.6\nAMJ 2021 27.7 -0.4\n"
+
+
+def test_snapshot_versions_and_roundtrip(tmp_path):
+    table = pd.DataFrame({"date": pd.to_datetime(["2020-01-01", "2020-01-02"]), "rain": [1.0, 2.5]})
+    first = source_store.save_snapshot("demo", [{"a": 1}], table, 2020, 2020, store_dir=tmp_path)
+    same = source_store.save_snapshot("demo", [{"a": 1}], table, 2020, 2020, store_dir=tmp_path)
+    second = source_store.save_snapshot("demo", [{"a": 2}], table, 2020, 2020, store_dir=tmp_path)
+
+    assert first["version"] == same["version"] == "v1" and second["version"] == "v2"
+    assert source_store.list_versions("demo", tmp_path) == ["v1", "v2"]
+    assert source_store.latest_version("demo", tmp_path) == "v2"
+
+    loaded, manifest = source_store.load_snapshot("demo", store_dir=tmp_path)
+    pd.testing.assert_frame_equal(loaded, table)
+    assert source_store.load_payloads("demo", "v1", store_dir=tmp_path) == [{"a": 1}]
+
+    (tmp_path / "demo" / "v2" / source_store.TABLE_ARTIFACT).write_text("date,rain\n")
+    with pytest.raises(ValueError, match="Checksum"):
+        source_store.load_snapshot("demo", store_dir=tmp_path)
+    with pytest.raises(FileNotFoundError):
+        source_store.load_snapshot("other", store_dir=tmp_path)
+
+
+def test_fetch_falls_back_to_last_real_snapshot(tmp_path):
+    """Fetch lỗi / offline dùng snapshot thật gần nhất, kèm provenance"""
+    state = {"fail": False, "calls": 0}
+
+    def handler(request):
+        state["calls"] += 1
+        if state["fail"]:
+            return httpx.Response(503)
+        return httpx.Response(200, text=ONI_TEXT)
+
+    adapter = get_adapter("noaa_oni", base_url="http://noaa.test/oni.ascii.txt")
+
+    def fetch(**kwargs):
+        return source_store.fetch_with_store([adapter], 2020, 2021, store_dir=tmp_path, max_retries=0,
+                                             cache=TTLCache(), transport=httpx.MockTransport(handler),
+                                             **kwargs)["noaa_oni"]
+
+    table, provenance = fetch()
+    assert provenance["status"] == "live" and provenance["version"] == "v1"
+    assert table.set_index("year")["ENSO_MarJun"][2021] == pytest.approx(-0.5)
+
+    state["fail"] = True
+    stale, provenance = fetch()
+    assert provenance["status"] == "stale" and "503" in provenance["error"]
+    pd.testing.assert_frame_equal(stale, table)
+
+    calls = state["calls"]
+    assert fetch(offline=True)[1]["status"] == "offline"
+    assert fetch(max_age=timedelta(hours=1))[1]["status"] == "cached"
+    assert state["calls"] == calls   # không gọi API
+
+    missing = source_store.fetch_with_store([adapter], 2020, 2021, store_dir=tmp_path / "empty", offline=True)
+    assert isinstance(missing["noaa_oni"], FileNotFoundError)
+
+
+def test_upgrade_features_records_provenance(tmp_path, monkeypatch):
+    """File features upgraded có cột src_* và đánh dấu năm stale/thiếu"""
+    store_dir = tmp_path / "sources"
+    years = list(range(1990, 2025))
+    nasa = pd.DataFrame({"year": years[:-4], "radiation_JunSep_NASA": 2000.0})
+    oni = pd.DataFrame({"year": years, "ENSO_MarJun": 0.1})
+    source_store.save_snapshot("nasa_power", [{}], nasa, 1990, 2024, store_dir=store_dir)
+    source_store.save_snapshot("noaa_oni", ["x"], oni, 1990, 2024, store_dir=store_dir)
+
+    monkeypatch.setattr(source_store, "STORE_DIR", store_dir)
+    monkeypatch.setattr(upgrade_features, "OUTPUT_FILE", tmp_path / "upgraded.csv")
+    with contextlib.redirect_stdout(io.StringIO()):
+        upgraded = upgrade_features.merge_features(max_age_hours=1)
+
+    saved = pd.read_csv(tmp_path / "upgraded.csv").set_index("year")
+    assert set(saved["src_nasa_power_status"]) == {"cached", "missing"}
+    assert saved.loc[2021, "src_nasa_power_status"] == "missing"
+    assert saved.loc[2021, "radiation_JunSep_NASA"] == 0            # năm thiếu vẫn được điền như trước
+    assert saved["src_stale"].tolist() == [y >= 2021 for y in saved.index]
+    assert (saved["src_noaa_oni_version"] == "v1").all()
+    assert len(upgraded) == len(saved)
+
+    with contextlib.redirect_stdout(io.StringIO()), pytest.raises(Exception, match="no stored snapshot"):
+        monkeypatch.setattr(source_store, "STORE_DIR", tmp_path / "empty")
+        upgrade_features.merge_features(offline=True)
@@ -0,0 +1,93 @@
+"""
+Test cases cho ingest thời tiết ngày dạng streaming
+"""
+
+import queue
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import feature_engineering as fe
+from src.nowcast import Nowcaster
+from src.streaming_ingest import OnlineAggregates, StreamingIngestor, tail_csv, drain_queue
+
+
+@pytest.fixture(scope="module")
+def daily():
+    return pd.read_csv(fe.WEATHER_DAILY_FILE, parse_dates=["date"])
+
+
+def test_streamed_days_match_batch_aggregates(daily, tmp_path):
+    """Stream 2018-2019 từ file CSV: thống kê tháng + features khớp bản batch"""
+    history = daily[daily["date"].dt.year < 2018]
+    streamed = daily[daily["date"].dt.year.isin([2018, 2019])]
+    path = tmp_path / "stream.csv"
+    streamed.to_csv(path, index=False, date_format="%Y-%m-%d")
+
+    aggregates = OnlineAggregates(history)
+    counts = StreamingIngestor(aggregates).run(tail_csv(path))
+    assert counts == {"added": len(streamed), "updated": 0, "duplicate": 0}
+
+    years, stats = fe.monthly_stats(daily)
+    row = int(np.searchsorted(years, 2019))
+    expected = fe.features_from_monthly(stats, aggregates.reference)
+    for name, value in aggregates.features(2019).items():
+        assert value == pytest.approx(expected[name][row])
+
+    monthly = aggregates.monthly(2019)
+    batch = daily[daily["date"].dt.year == 2019].groupby(daily["date"].dt.month)
+    np.testing.assert_allclose(monthly["rain_sum"], batch["rain"].sum())
+    np.testing.assert_allclose(monthly["temp_max_mean"], batch["temp_max"].mean())
+    np.testing.assert_array_equal(monthly["hot_days"], batch["temp_max"].apply(lambda s: (s > 33).sum()))
+
+
+def test_duplicates_and_corrections(daily):
+    """Ngày trùng bị bỏ qua; bản sửa thay giá trị cũ (cả ở nowcaster subscriber)"""
+    seed = daily[daily["date"] <= "2020-06-15"]
+    nowcaster = Nowcaster(seed)
+    ingestor = StreamingIngestor(OnlineAggregates(seed), [nowcaster.observe])
+    before = ingestor.aggregates.monthly(2020).loc[5, "rain_sum"]
+
+    record = {"temp_max": 30.0, "temp_min": 21.0, "rain": 12.0, "humidity": 85.0,
+              "radiation": 14.0, "soil_0_7": 0.3, "soil_7_28": 0.3}
+    assert ingestor.process("2020-06-16", record) == "added"
+    assert ingestor.process("2020-06-16", dict(record)) == "duplicate"
+    assert ingestor.process("2020-06-16", {**record, "rain": 2.0}) == "updated"
+
+    assert ingestor.aggregates.monthly(2020).loc[5, "rain_sum"] == pytest.approx(before + 2.0)
+    assert nowcaster.season.stats["rain_sum"][5] == pytest.approx(before + 2.0)
+    assert nowcaster.as_of == pd.Timestamp("2020-06-16")
+
+
+def test_queue_and_follow_sources(daily, tmp_path):
+    """Queue trong process và file đang được append đều đẩy được ngày mới"""
+    aggregates = OnlineAggregates(daily[daily["date"].dt.year < 2021])
+    ingestor = StreamingIngestor(aggregates)
+
+    q = queue.Queue()
+    q.put({"date": "2021-01-01", "temp_max": "28.5", "temp_min": "17", "rain": "", "humidity": "70"})
+    q.put(None)
+    assert ingestor.run(drain_queue(q))["added"] == 1
+    assert aggregates.monthly(2021).loc[0, "n_days"] == 1
+    assert np.isnan(aggregates.monthly(2021).loc[0, "radiation_sum"])   # ô trống không được đếm
+
+    path = tmp_path / "live.csv"
+    path.write_text("date,temp_max,temp_min,rain,humidity,radiation,soil_0_7,soil_7_28\n")
+    ingestor.start(lambda stop: tail_csv(path, follow=True, poll_interval=0.01, stop_event=stop))
+    with open(path, "a") as f:
+        f.write("2021-01-02,29.0,18.0,1.5,72,15.0,0.2,0.3\n2021-01-03,30.0,")
+        f.flush()
+        time.sleep(0.1)
+        f.write("18.5,0.0,70,16.0,0.2,0.3\n")
+    deadline = time.time() + 5
+    while aggregates.monthly(2021).loc[0, "n_days"] < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    ingestor.stop()
+
+    assert not ingestor.running
+    assert aggregates.monthly(2021).loc[0, "n_days"] == 3
+    assert aggregates.monthly(2021).loc[0, "rain_sum"] == pytest.approx(1.5)
+    assert aggregates.as_of == pd.Timestamp("2021-01-03")
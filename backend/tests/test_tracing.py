@@ -0,0 +1,73 @@
+"""
+Test cases cho tracing theo request (Server-Timing + file sink OTLP/JSON)
+"""
+
+import json
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from src import tracing, benchmark_api
+
+
+@pytest.fixture
+def app():
+    app = FastAPI()
+    app.router.route_class = tracing.TracedRoute
+
+    @app.get("/work/{item}")
+    async def work(item: int):
+        with tracing.span("load", item=item):
+            with tracing.span("parse"):
+                pass
+        with tracing.span("predict"):
+            if item < 0:
+                raise HTTPException(status_code=400, detail="negative")
+        return {"item": item}
+
+    app.add_middleware(tracing.TracingMiddleware)
+    return app
+
+
+def test_server_timing_phases(app):
+    response = TestClient(app).get("/work/3")
+    assert response.status_code == 200
+
+    phases = benchmark_api.parse_server_timing(response.headers["server-timing"])
+    assert list(phases) == ["validate", "load", "parse", "predict", "handler", "serialize", "total"]
+    assert all(ms >= 0 for ms in phases.values())
+    assert phases["total"] >= phases["validate"] + phases["handler"] + phases["serialize"] - 0.05
+    assert response.headers["timing-allow-origin"] == "*"
+
+
+def test_file_sink_writes_otlp(app, tmp_path, monkeypatch):
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setenv(tracing.TRACE_FILE_ENV, str(path))
+    client = TestClient(app)
+    traceparent = "00-" + "ab" * 16 + "-" + "cd" * 8 + "-01"
+    client.get("/work/1", headers={"traceparent": traceparent})
+    client.get("/work/-1")
+    tracing.shutdown_sink()
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(lines) == 2
+    spans = lines[0]["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    root = spans[0]
+    assert root["kind"] == tracing.SPAN_KIND_SERVER and root["name"] == "GET /work/{item}"
+    assert root["traceId"] == "ab" * 16 and root["parentSpanId"] == "cd" * 8
+    by_name = {s["name"]: s for s in spans}
+    assert by_name["handler"]["parentSpanId"] == root["spanId"]
+    assert by_name["parse"]["parentSpanId"] == by_name["load"]["spanId"]
+    assert {"key": "item", "value": {"intValue": "1"}} in by_name["load"]["attributes"]
+    assert int(root["startTimeUnixNano"]) <= int(by_name["parse"]["startTimeUnixNano"]) <= int(root["endTimeUnixNano"])
+
+    failed = {s["name"]: s for s in lines[1]["resourceSpans"][0]["scopeSpans"][0]["spans"]}
+    assert failed["predict"]["status"]["code"] == tracing.STATUS_ERROR
+    assert lines[1]["resourceSpans"][0]["scopeSpans"][0]["spans"][0]["traceId"] != "ab" * 16
+
+
+def test_span_without_request_is_noop():
+    with tracing.span("idle") as span:
+        assert span is None
+    assert tracing.current_trace() is None
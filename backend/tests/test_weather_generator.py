@@ -0,0 +1,66 @@
+"""
+Test cases cho feature engine vectorized và weather generator (block bootstrap)
+"""
+
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+from src import feature_engineering as fe
+from src.weather_generator import BlockBootstrapGenerator, yield_distribution
+
+
+@pytest.fixture(scope="module")
+def daily():
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fe.load_daily_data(fe.WEATHER_DAILY_FILE)
+
+
+def test_fast_features_match_original(daily):
+    """Feature engine từ thống kê tháng khớp create_yearly_features()"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = fe.create_yearly_features(daily)
+    actual = fe.create_yearly_features_fast(daily)
+
+    assert list(actual.columns) == list(expected.columns)
+    np.testing.assert_allclose(actual.values, expected.values, rtol=1e-9, atol=1e-9)
+
+
+def test_bootstrap_blocks_come_from_history(daily):
+    """Mỗi khối 3 tháng của mùa giả lập là nguyên khối của một năm lịch sử"""
+    generator = BlockBootstrapGenerator(daily)
+    stats = generator.simulate(n_sims=50, target_year=int(generator.years[-1]), seed=1)
+    hist = generator.transformed_stats(int(generator.years[-1]), {})
+
+    assert stats["rain_sum"].shape == (50, 12)
+    for block in range(4):
+        months = slice(3 * block, 3 * block + 3)
+        sim = stats["rain_sum"][:, months]
+        matches = (sim[:, None, :] == hist["rain_sum"][None, :, months]).all(axis=-1)
+        assert matches.any(axis=1).all()
+
+
+def test_scenarios_shift_distribution(daily):
+    """Kịch bản hạn hán giảm mưa T2-3 và tăng số ngày nóng so với bình thường"""
+    generator = BlockBootstrapGenerator(daily)
+    columns = ["rain_Feb_Mar", "days_over_33"]
+    normal, _ = generator.simulate_features(columns, n_sims=2000, scenario="normal")
+    drought, _ = generator.simulate_features(columns, n_sims=2000, scenario="severe_drought")
+
+    np.testing.assert_allclose(drought[:, 0], normal[:, 0] * 0.5)
+    assert drought[:, 1].mean() > normal[:, 1].mean()
+
+    with pytest.raises(ValueError):
+        generator.simulate_features(["ENSO_MarJun"], n_sims=10)
+    X, filled = generator.simulate_features(["ENSO_MarJun"], n_sims=10, fill_values={"ENSO_MarJun": 0.3})
+    assert filled == ["ENSO_MarJun"] and (X == 0.3).all()
+
+
+def test_yield_distribution():
+    samples = np.linspace(2.0, 4.0, 1001)
+    dist = yield_distribution(samples, thresholds=[3.0])
+    assert dist["quantiles"]["p50"] == pytest.approx(3.0)
+    assert dist["exceedance"][3.0] == pytest.approx(0.5, abs=1e-3)
+    assert sum(dist["histogram"]["counts"]) == len(samples)